@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入性能基准测试
+分阶段测量导入流程的吞吐量（条/秒）和峰值内存：
+- parse：iter_json_documents 流式解析；
+- clean：clean_and_validate_data；
+- process：process_document（清洗并组装bulk动作）；
+- serialize：serialize_bulk_entry 序列化为NDJSON；
+- import：ESImporter.import_data 端到端导入（默认发送到内置的模拟ES服务）。
+
+每个阶段在新启动的子进程中运行，峰值内存只统计该阶段本身，互不影响。
+指定 --baseline 时与之前保存的报告比较，吞吐量下降超过 --max-regression 时返回非零退出码。
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from import_to_es import (BaseImporter, ESImporter, iter_json_documents, serialize_bulk_entry, JSON_ENCODER,
+                          log_json_encoder, configure_logging)
+from stub_es_server import StubESServer
+from zabbix_doc_generator import SampleProfile, ZabbixDocumentGenerator, write_documents
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['parse', 'clean', 'process', 'serialize', 'import']
+
+TARGET_INDEX = 'u2performance_benchmark'
+
+
+def read_memory_kb(field):
+    """
+    读取 /proc/self/status 中的内存项（kB），不支持时返回None
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_memory():
+    """
+    重置进程的峰值内存（VmHWM），只在Linux上有效
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory_kb():
+    peak = read_memory_kb('VmHWM')
+    if peak is None:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak //= 1024
+    return peak
+
+
+def prepare_sources(json_file_path, options):
+    return [doc.get('_source', {}) for doc in iter_json_documents(json_file_path)]
+
+
+def prepare_documents(json_file_path, options):
+    return list(iter_json_documents(json_file_path))
+
+
+def prepare_actions(json_file_path, options):
+    importer = BaseImporter()
+    actions = []
+    for doc in iter_json_documents(json_file_path):
+        es_doc = importer.process_document(doc, TARGET_INDEX)
+        if es_doc:
+            actions.append(es_doc)
+    return actions
+
+
+def run_parse(json_file_path, options):
+    count = 0
+    for _ in iter_json_documents(json_file_path):
+        count += 1
+    return count, os.path.getsize(json_file_path)
+
+
+def run_clean(sources, options):
+    importer = BaseImporter()
+    for source in sources:
+        importer.clean_and_validate_data(source)
+    return len(sources), None
+
+
+def run_process(documents, options):
+    importer = BaseImporter()
+    for doc in documents:
+        importer.process_document(doc, TARGET_INDEX)
+    return len(documents), None
+
+
+def run_serialize(actions, options):
+    total_bytes = 0
+    for es_doc in actions:
+        total_bytes += len(serialize_bulk_entry(es_doc, TARGET_INDEX))
+    return len(actions), total_bytes
+
+
+def run_import(json_file_path, options):
+    importer = ESImporter(es_host=options['es_host'], es_port=options['es_port'],
+                          max_connections=max(10, options['workers']))
+    if importer.es.indices.exists(index=TARGET_INDEX):
+        importer.es.indices.delete(index=TARGET_INDEX)
+    success = importer.import_data(
+        json_file_path,
+        batch_size=options['batch_size'],
+        target_index=TARGET_INDEX,
+        workers=options['workers'],
+        clean_workers=options['clean_workers'],
+        batch_bytes=options['batch_bytes']
+    )
+    if not success:
+        raise RuntimeError("端到端导入失败")
+    count = importer.es.count(index=TARGET_INDEX)['count']
+    return count, os.path.getsize(json_file_path)
+
+
+STAGE_FUNCTIONS = {
+    'parse': (None, run_parse),
+    'clean': (prepare_sources, run_clean),
+    'process': (prepare_documents, run_process),
+    'serialize': (prepare_actions, run_serialize),
+    'import': (None, run_import),
+}
+
+
+def run_stage(stage, json_file_path, options):
+    """
+    在子进程中执行一个阶段，准备数据的时间和内存不计入结果
+    """
+    if not options['verbose']:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    prepare, run = STAGE_FUNCTIONS[stage]
+    data = prepare(json_file_path, options) if prepare else json_file_path
+
+    rss_before = read_memory_kb('VmRSS')
+    peak_reset = reset_peak_memory()
+    started = time.perf_counter()
+    docs, total_bytes = run(data, options)
+    seconds = time.perf_counter() - started
+    peak = peak_memory_kb()
+
+    result = {
+        'stage': stage,
+        'docs': docs,
+        'seconds': round(seconds, 3),
+        'docs_per_sec': round(docs / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(peak / 1024, 1)
+    }
+    if peak_reset and rss_before is not None:
+        result['stage_peak_mb'] = round(max(peak - rss_before, 0) / 1024, 1)
+    if total_bytes:
+        result['mb_per_sec'] = round(total_bytes / 1024 / 1024 / seconds, 2) if seconds else None
+    return result
+
+
+def run_benchmarks(json_file_path, stages, options, repeat=1):
+    """
+    依次在独立的子进程中运行各阶段，repeat大于1时取吞吐量最高的一次
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for stage in stages:
+        best = None
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_stage, stage, json_file_path, options).result()
+            if best is None or (result['docs_per_sec'] or 0) > (best['docs_per_sec'] or 0):
+                best = result
+        logger.info(format_result(best))
+        results.append(best)
+    return results
+
+
+def format_result(result):
+    line = (f"{result['stage']:<10} {result['docs']:>10} 条 {result['seconds']:>9.3f} 秒 "
+            f"{result['docs_per_sec'] or 0:>12.1f} 条/秒")
+    if result.get('mb_per_sec'):
+        line += f" {result['mb_per_sec']:>8.2f} MB/秒"
+    if 'stage_peak_mb' in result:
+        line += f"  阶段峰值内存 {result['stage_peak_mb']:.1f} MB"
+    line += f"  进程峰值内存 {result['peak_rss_mb']:.1f} MB"
+    return line
+
+
+def compare_with_baseline(results, baseline_path, max_regression):
+    """
+    与基线报告比较，返回吞吐量下降超过阈值的阶段列表
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    baseline = {result['stage']: result for result in report['results']}
+    if report.get('json_encoder', JSON_ENCODER) != JSON_ENCODER:
+        logger.warning(f"基线使用 {report['json_encoder']} 序列化，本次使用 {JSON_ENCODER}，"
+                       f"序列化和导入阶段的结果不可直接比较")
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['stage'])
+        if not previous or not previous.get('docs_per_sec') or not result.get('docs_per_sec'):
+            continue
+        change = result['docs_per_sec'] / previous['docs_per_sec'] - 1
+        logger.info(f"{result['stage']:<10} 基线 {previous['docs_per_sec']:.1f} 条/秒, 本次 "
+                    f"{result['docs_per_sec']:.1f} 条/秒 ({change:+.1%})")
+        if change < -max_regression:
+            regressions.append(result['stage'])
+    return regressions
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description='导入性能基准测试')
+    parser.add_argument('--file', '-f', help='使用已有的数据文件，不指定时按 --count 生成')
+    parser.add_argument('--count', '-n', type=int, default=100000, help='生成的记录数')
+    parser.add_argument('--sample', default='222.json', help='生成数据使用的样本文件')
+    parser.add_argument('--hosts', type=int, default=500, help='生成数据的主机数量')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='要运行的阶段')
+    parser.add_argument('--repeat', type=int, default=1, help='每个阶段运行次数，取最好的一次')
+    parser.add_argument('--batch-size', type=int, default=1000, help='端到端导入的批次大小')
+    parser.add_argument('--workers', type=int, default=1, help='端到端导入的并发bulk请求数')
+    parser.add_argument('--clean-workers', type=int, default=1, help='端到端导入的清洗进程数')
+    parser.add_argument('--batch-bytes', type=int, help='端到端导入按字节切分批次')
+    parser.add_argument('--es-host', help='对真实ES做端到端导入，不指定时使用模拟服务')
+    parser.add_argument('--es-port', type=int, default=9200, help='真实ES端口')
+    parser.add_argument('--latency-ms', type=float, default=0, help='模拟服务每个bulk请求的延迟（毫秒）')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='模拟服务整个bulk请求返回429的比例')
+    parser.add_argument('--item-reject-rate', type=float, default=0.0, help='模拟服务单条文档返回429的比例')
+    parser.add_argument('--report', '-o', help='把结果保存为JSON报告')
+    parser.add_argument('--baseline', help='与之前保存的JSON报告比较')
+    parser.add_argument('--max-regression', type=float, default=0.15, help='允许的最大吞吐量下降比例')
+    parser.add_argument('--verbose', action='store_true', help='输出导入过程的日志')
+
+    args = parser.parse_args()
+
+    temp_dir = None
+    stub = None
+    log_json_encoder()
+    try:
+        json_file_path = args.file
+        if not json_file_path:
+            temp_dir = tempfile.TemporaryDirectory(prefix='es_benchmark_')
+            json_file_path = os.path.join(temp_dir.name, 'benchmark.ndjson')
+            generator = ZabbixDocumentGenerator(SampleProfile(args.sample), hosts=args.hosts)
+            write_documents(generator.generate(args.count), json_file_path)
+            logger.info(f"已生成测试数据: {args.count} 条, "
+                        f"{os.path.getsize(json_file_path) / 1024 / 1024:.2f} MB")
+
+        options = {
+            'es_host': args.es_host,
+            'es_port': args.es_port,
+            'batch_size': args.batch_size,
+            'workers': args.workers,
+            'clean_workers': args.clean_workers,
+            'batch_bytes': args.batch_bytes,
+            'verbose': args.verbose
+        }
+        if 'import' in args.stages and not args.es_host:
+            stub = StubESServer(latency_ms=args.latency_ms, reject_rate=args.reject_rate,
+                                item_reject_rate=args.item_reject_rate).start()
+            options['es_host'], options['es_port'] = stub.host, stub.port
+
+        results = run_benchmarks(json_file_path, args.stages, options, repeat=args.repeat)
+        if stub:
+            logger.info(f"模拟服务统计: {json.dumps(stub.state.stats, ensure_ascii=False)}")
+
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'file': os.path.abspath(args.file) if args.file else None,
+                    'count': results[0]['docs'] if results else 0,
+                    'json_encoder': JSON_ENCODER,
+                    'options': options,
+                    'results': results
+                }, f, ensure_ascii=False, indent=2)
+            logger.info(f"报告已保存: {args.report}")
+
+        if args.baseline:
+            regressions = compare_with_baseline(results, args.baseline, args.max_regression)
+            if regressions:
+                logger.error(f"以下阶段吞吐量下降超过 {args.max_regression:.0%}: {', '.join(regressions)}")
+                sys.exit(1)
+
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+    finally:
+        if stub:
+            stub.stop()
+        if temp_dir:
+            temp_dir.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式存储转换工具
+把导出的JSON文件（如 222.json）转换为按列保存的NumPy文件目录，离线分析时直接内存映射加载：
+- 字段类型来自 INDEX_BODY 的映射：long 存为 int64，double 存为 float64，date 存为 datetime64[ms]；
+- hostname、appname、moname 等字符串维度字段做字典编码，只保存 int32 编码和一份去重后的字典；
+- 每条记录先经过 clean_document 清洗，与导入ES的数据一致。
+
+目录结构：
+    meta.json          格式标记、行数、列类型和文件名
+    <列名>.npy         数值列或字典编码列
+    <列名>.dict.json   字典编码列的字典
+    <列名>.valid.npy   整数列中存在缺失值时的有效位
+"""
+
+import os
+import re
+import json
+import shutil
+import logging
+import argparse
+import sys
+from import_to_es import INDEX_BODY, clean_document, iter_json_documents, configure_logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+
+# meta.json中的格式标记，据此判断输出目录是否为之前生成的列式存储
+STORE_FORMAT = 'columnar-store'
+
+# 每次追加写入的行数
+CHUNK_ROWS = 65536
+
+# 复制临时文件时每次读取的元素数
+COPY_BLOCK = 1 << 20
+
+# 文档ID列名
+ID_COLUMN = '_id'
+
+# ES映射类型对应的列类型
+MAPPING_KINDS = {
+    'long': 'int64',
+    'integer': 'int64',
+    'double': 'float64',
+    'float': 'float64',
+    'date': 'datetime64[ms]',
+}
+
+
+def column_kind(field):
+    """
+    根据索引映射确定列类型，未映射或字符串类型的字段按字典编码保存
+    """
+    mapping = INDEX_BODY['mappings']['properties'].get(field, {})
+    return MAPPING_KINDS.get(mapping.get('type'), 'dictionary')
+
+
+def column_file_name(field):
+    """
+    列名转换为安全的文件名，如 @timestamp -> _timestamp
+    """
+    return re.sub(r'[^0-9A-Za-z_]', '_', field)
+
+
+def to_datetime64(values):
+    """
+    把ISO时间字符串列表转换为datetime64[ms]数组，无法解析的值为NaT
+    """
+    texts = [value.rstrip('Z') if isinstance(value, str) else 'NaT' for value in values]
+    try:
+        return np.array(texts, dtype='datetime64[ms]')
+    except ValueError:
+        result = np.full(len(texts), np.datetime64('NaT'), dtype='datetime64[ms]')
+        for i, text in enumerate(texts):
+            try:
+                result[i] = np.datetime64(text, 'ms')
+            except ValueError:
+                logger.warning(f"无法解析时间字段: {values[i]}")
+        return result
+
+
+class _ColumnWriter:
+    """
+    单列的追加写入：先顺序写入临时文件，结束时复制为.npy
+    """
+
+    def __init__(self, store_path, field, kind, start_row):
+        self.field = field
+        self.kind = kind
+        self.file_name = column_file_name(field)
+        self.part_path = os.path.join(store_path, self.file_name + '.part')
+        self.valid_path = os.path.join(store_path, self.file_name + '.valid.part')
+        self.dtype = np.dtype('int32' if kind == 'dictionary' else kind)
+        self.codes = {}
+        self.is_json = None
+        self.has_missing = False
+        self.part = open(self.part_path, 'wb')
+        self.valid = open(self.valid_path, 'wb') if self.dtype.kind == 'i' and kind != 'dictionary' else None
+
+        # 字段首次出现之前的行补为缺失值
+        if start_row:
+            self.append([None] * start_row)
+
+    def encode(self, value):
+        """
+        字典编码：首次出现的值分配新编码。
+        字符串列出现其他类型的值时把字典转为JSON编码，已有编码不变
+        """
+        if self.is_json is None:
+            self.is_json = not isinstance(value, str)
+        elif not self.is_json and not isinstance(value, str):
+            self.codes = {json.dumps(key, ensure_ascii=False): code for key, code in self.codes.items()}
+            self.is_json = True
+        key = json.dumps(value, ensure_ascii=False) if self.is_json else str(value)
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.codes)
+        return code
+
+    def append(self, values):
+        """
+        追加一批值，None表示缺失
+        """
+        if self.kind == 'dictionary':
+            array = np.array([-1 if value is None else self.encode(value) for value in values], dtype=self.dtype)
+        elif self.kind == 'datetime64[ms]':
+            array = to_datetime64(values)
+        elif self.dtype.kind == 'f':
+            array = np.array([np.nan if value is None else value for value in values], dtype=self.dtype)
+        else:
+            valid = np.array([value is not None for value in values], dtype=bool)
+            self.has_missing = self.has_missing or not valid.all()
+            array = np.array([0 if value is None else value for value in values], dtype=self.dtype)
+            valid.tofile(self.valid)
+        array.tofile(self.part)
+
+    def finish(self, store_path, rows):
+        """
+        生成最终的.npy文件，返回该列在meta.json中的描述
+        """
+        self.part.close()
+        meta = {'kind': self.kind, 'file': self.file_name + '.npy'}
+        copy_to_npy(self.part_path, os.path.join(store_path, meta['file']), self.dtype, rows)
+
+        if self.valid is not None:
+            self.valid.close()
+            if self.has_missing:
+                meta['valid'] = self.file_name + '.valid.npy'
+                copy_to_npy(self.valid_path, os.path.join(store_path, meta['valid']), np.dtype(bool), rows)
+            else:
+                os.remove(self.valid_path)
+
+        if self.kind == 'dictionary':
+            meta['dictionary'] = self.file_name + '.dict.json'
+            meta['json'] = bool(self.is_json)
+            with open(os.path.join(store_path, meta['dictionary']), 'w', encoding='utf-8') as f:
+                json.dump(list(self.codes), f, ensure_ascii=False)
+        return meta
+
+
+def copy_to_npy(part_path, npy_path, dtype, rows):
+    """
+    把临时文件中的原始数据分块复制到.npy文件，内存占用与文件大小无关
+    """
+    target = np.lib.format.open_memmap(npy_path, mode='w+', dtype=dtype, shape=(rows,))
+    with open(part_path, 'rb') as f:
+        position = 0
+        while position < rows:
+            block = np.fromfile(f, dtype=dtype, count=min(COPY_BLOCK, rows - position))
+            target[position:position + len(block)] = block
+            position += len(block)
+    target.flush()
+    del target
+    os.remove(part_path)
+
+
+def is_store_directory(path):
+    """
+    判断目录是否为之前生成的列式存储（meta.json中有格式标记）
+    """
+    try:
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f).get('format') == STORE_FORMAT
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def prepare_store_directory(store_path, overwrite=False):
+    """
+    准备输出目录：不存在或为空目录时直接使用，之前生成的列式存储清空后重建；
+    其他已存在的路径只有overwrite为True时才删除，避免输错路径时误删数据
+    """
+    if os.path.isdir(store_path):
+        if not os.listdir(store_path):
+            return
+        if not overwrite and not is_store_directory(store_path):
+            raise FileExistsError(f"输出目录 {store_path} 不为空且不是列式存储，确认要覆盖时请指定 --overwrite")
+        shutil.rmtree(store_path)
+    elif os.path.exists(store_path):
+        if not overwrite:
+            raise FileExistsError(f"输出路径 {store_path} 已存在且不是目录，确认要覆盖时请指定 --overwrite")
+        os.remove(store_path)
+    os.makedirs(store_path)
+
+
+class ColumnarStoreWriter:
+    """
+    按块把清洗后的文档追加为列式存储
+    """
+
+    def __init__(self, store_path, chunk_rows=CHUNK_ROWS, kinds=None, overwrite=False):
+        """
+        kinds指定映射之外字段的列类型，如 {'count': 'int64'}，未指定的字段按 INDEX_BODY 的映射确定
+        输出目录的处理见 prepare_store_directory，overwrite为True时删除任何已存在的同名路径
+        """
+        if np is None:
+            raise ImportError("列式存储需要numpy，请先执行 pip install numpy")
+
+        self.store_path = store_path
+        self.chunk_rows = chunk_rows
+        self.kinds = kinds or {}
+        self.columns = {}
+        self.pending = []
+        self.rows = 0
+        self.sources = []
+
+        prepare_store_directory(store_path, overwrite)
+
+    def add(self, source, doc_id=None):
+        """
+        添加一条清洗后的文档
+        """
+        if doc_id is not None:
+            source = dict(source, **{ID_COLUMN: doc_id})
+        self.pending.append(source)
+        if len(self.pending) >= self.chunk_rows:
+            self.flush()
+
+    def add_file(self, json_file_path):
+        """
+        读取并清洗一个导出文件中的全部记录，返回写入的记录数
+        """
+        count = 0
+        for doc in iter_json_documents(json_file_path):
+            cleaned = clean_document(doc.get('_source', {}))
+            if cleaned:
+                self.add(cleaned, doc.get('_id'))
+                count += 1
+        self.sources.append(os.path.abspath(json_file_path))
+        logger.info(f"已转换 {json_file_path}: {count} 条记录")
+        return count
+
+    def flush(self):
+        """
+        把缓冲区中的行写入各列的临时文件
+        """
+        if not self.pending:
+            return
+
+        for source in self.pending:
+            for field in source:
+                if field not in self.columns:
+                    kind = 'dictionary' if field == ID_COLUMN else self.kinds.get(field) or column_kind(field)
+                    self.columns[field] = _ColumnWriter(self.store_path, field, kind, self.rows)
+
+        for field, writer in self.columns.items():
+            writer.append([source.get(field) for source in self.pending])
+
+        self.rows += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        """
+        完成写入并生成meta.json
+        """
+        self.flush()
+        meta = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'rows': self.rows,
+            'sources': self.sources,
+            'columns': {field: writer.finish(self.store_path, self.rows) for field, writer in self.columns.items()}
+        }
+        with open(os.path.join(self.store_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        return meta
+
+
+class ColumnarStore:
+    """
+    只读打开列式存储，各列以内存映射方式按需加载
+    """
+
+    def __init__(self, store_path):
+        if np is None:
+            raise ImportError("列式存储需要numpy，请先执行 pip install numpy")
+
+        self.store_path = store_path
+        with open(os.path.join(store_path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.rows = self.meta['rows']
+        self._arrays = {}
+        self._dictionaries = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, field):
+        return field in self.meta['columns']
+
+    @property
+    def columns(self):
+        return list(self.meta['columns'])
+
+    def kind(self, field):
+        return self.meta['columns'][field]['kind']
+
+    def _load(self, file_name):
+        array = self._arrays.get(file_name)
+        if array is None:
+            array = self._arrays[file_name] = np.load(os.path.join(self.store_path, file_name), mmap_mode='r')
+        return array
+
+    def column(self, field):
+        """
+        返回列的原始数组，字典编码列返回int32编码（-1表示缺失）
+        """
+        return self._load(self.meta['columns'][field]['file'])
+
+    def dictionary(self, field):
+        """
+        返回字典编码列的字典（object数组，下标即编码）
+        """
+        values = self._dictionaries.get(field)
+        if values is None:
+            column_meta = self.meta['columns'][field]
+            with open(os.path.join(self.store_path, column_meta['dictionary']), encoding='utf-8') as f:
+                entries = json.load(f)
+            if column_meta.get('json'):
+                entries = [json.loads(entry) for entry in entries]
+            values = np.empty(len(entries), dtype=object)
+            values[:] = entries
+            self._dictionaries[field] = values
+        return values
+
+    def valid(self, field, rows=None):
+        """
+        返回列的有效位数组，rows指定时只计算这些行
+        """
+        column_meta = self.meta['columns'][field]
+        array = self.column(field)
+        if rows is not None:
+            array = array[rows]
+        if column_meta['kind'] == 'dictionary':
+            return array >= 0
+        if 'valid' in column_meta:
+            valid = self._load(column_meta['valid'])
+            return valid if rows is None else valid[rows]
+        if array.dtype.kind == 'f':
+            return ~np.isnan(array)
+        if array.dtype.kind == 'M':
+            return ~np.isnat(array)
+        return np.ones(np.shape(array), dtype=bool)
+
+    def values(self, field, rows=None):
+        """
+        返回解码后的列值，字典编码列缺失处为None
+        """
+        array = self.column(field)
+        if rows is not None:
+            array = array[rows]
+        if self.kind(field) != 'dictionary':
+            return np.asarray(array)
+        dictionary = np.append(self.dictionary(field), None)
+        return dictionary[array]
+
+    def document(self, row, fields=None):
+        """
+        还原一行对应的文档（_source），缺失字段不输出；fields指定时只还原这些字段
+        """
+        source = {}
+        for field, column_meta in self.meta['columns'].items():
+            if field == ID_COLUMN or (fields is not None and field not in fields):
+                continue
+            value = self.column(field)[row]
+            if column_meta['kind'] == 'dictionary':
+                if value >= 0:
+                    source[field] = self.dictionary(field)[value]
+            elif column_meta['kind'] == 'datetime64[ms]':
+                if not np.isnat(value):
+                    source[field] = np.datetime_as_string(value, unit='ms') + 'Z'
+            elif 'valid' in column_meta and not self._load(column_meta['valid'])[row]:
+                continue
+            elif value.dtype.kind == 'f':
+                if not np.isnan(value):
+                    source[field] = float(value)
+            else:
+                source[field] = int(value)
+        return source
+
+    def document_id(self, row):
+        """
+        返回一行对应的文档ID，没有ID时返回None
+        """
+        if ID_COLUMN not in self:
+            return None
+        code = self.column(ID_COLUMN)[row]
+        return self.dictionary(ID_COLUMN)[code] if code >= 0 else None
+
+
+def convert_files(json_file_paths, store_path, chunk_rows=CHUNK_ROWS, overwrite=False):
+    """
+    把一个或多个导出文件转换为一个列式存储目录
+    """
+    writer = ColumnarStoreWriter(store_path, chunk_rows=chunk_rows, overwrite=overwrite)
+    for json_file_path in json_file_paths:
+        writer.add_file(json_file_path)
+    return writer.close()
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description='把导出的JSON文件转换为列式存储')
+    parser.add_argument('--file', '-f', nargs='+', required=True, help='JSON文件路径，可指定多个')
+    parser.add_argument('--output', '-o', required=True,
+                        help='列式存储目录，可以是空目录或之前生成的列式存储（会被覆盖）')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='每次写入的行数')
+    parser.add_argument('--overwrite', action='store_true', help='输出路径已存在且不是列式存储时仍然删除并覆盖')
+
+    args = parser.parse_args()
+
+    for json_file_path in args.file:
+        if not os.path.exists(json_file_path):
+            logger.error(f"文件不存在: {json_file_path}")
+            sys.exit(1)
+
+    try:
+        meta = convert_files(args.file, args.output, chunk_rows=args.chunk_rows, overwrite=args.overwrite)
+        size = sum(os.path.getsize(os.path.join(args.output, name)) for name in os.listdir(args.output))
+        dictionary_columns = [field for field, column in meta['columns'].items() if column['kind'] == 'dictionary']
+        logger.info(f"转换完成: {meta['rows']} 行, {len(meta['columns'])} 列"
+                    f"（字典编码 {len(dictionary_columns)} 列）, 共 {size / 1024 / 1024:.2f} MB -> {args.output}")
+
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
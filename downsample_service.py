@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间序列降采样服务
+hostperf、QPS图表不再用top_hits取回每台主机数百个原始点再在浏览器里处理，而是请求本服务：
+- 按 (主机, KPI, 时间范围) 从ES一次取回原始点（composite聚合按 (hostname, clock) 翻页，多台主机合并为一次翻页），
+  原始序列短时间缓存，同一范围换宽度或算法时不再查询ES；
+- 按图表的像素宽度降采样，每台主机最多返回 width 个点：
+  lttb    Largest-Triangle-Three-Buckets，点数远多于宽度时先按时间做min/max预选（MinMaxLTTB），保持形状；
+  minmax  按时间等分为约 width/2 个桶，保留每个桶的最小值和最大值，尖峰不会被平滑掉；
+  两种算法都用NumPy向量化计算；
+- 降采样结果按 (主机, KPI, 时间范围, 宽度, 算法) 缓存，时间范围对齐到 --snap-seconds，
+  已经结束的范围长期缓存，包含最新数据的范围只缓存 --tail-ttl 秒。
+
+响应大小和图表渲染时间只与宽度和主机数有关，与选择的时间范围长短无关。
+
+接口：
+    GET  /series?host=<主机>&host=<主机>&kpi=<KPI>&start=<开始>&end=<结束>&width=800&method=lttb
+    POST /series  {"hosts": [...], "kpi": "...", "start": ..., "end": ..., "width": 800, "method": "minmax"}
+    GET  /stats   缓存统计
+    GET  /health
+时间为秒级时间戳或ISO时间，end默认为当前时间；返回的点为 [毫秒时间戳, 值]。
+"""
+
+import gzip
+import json
+import time
+import logging
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from elasticsearch import TransportError
+from import_to_es import ESImporter
+from es_cache_proxy import TTLCache
+from export_series import parse_time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 点数超过 宽度*该倍数 时，LTTB之前先按时间做min/max预选，0表示总是执行完整的LTTB
+MINMAX_RATIO = 4
+
+# 单次请求允许的最大宽度
+MAX_WIDTH = 10000
+
+# 每次翻页取回的 (主机, 时间) 组合数
+DEFAULT_PAGE_SIZE = 10000
+
+# 多台主机合并为一次翻页时，每次最多包含的主机数
+HOSTS_PER_FETCH = 200
+
+# 响应超过该字节数且客户端支持时用gzip压缩
+GZIP_MIN_BYTES = 1024
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets，返回选中点的下标
+    首尾两点固定，其余点按数量均分为 n_out-2 个桶，每个桶选与上一个选中点、下一个桶的平均点组成的三角形面积最大的点。
+    各桶的平均点用前缀和一次算出，桶内的面积按向量计算
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = x - x[0]
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    x_sum = np.concatenate(([0.0], np.cumsum(x)))
+    y_sum = np.concatenate(([0.0], np.cumsum(y)))
+    avg_x = (x_sum[edges[1:]] - x_sum[edges[:-1]]) / counts
+    avg_y = (y_sum[edges[1:]] - y_sum[edges[:-1]]) / counts
+    # 最后一个桶的"下一个桶"是终点
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        low, high = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[low:high] - y[a]) - (x[a] - x[low:high]) * (next_y[i] - y[a]))
+        a = low + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(x, y, buckets, start, end):
+    """
+    把 [start, end) 按时间等分为buckets个桶，返回每个桶中最小值和最大值所在点的下标（以及首尾两点），按时间排序
+    x须已按时间排序，同一个桶的点是连续的一段，用reduceat逐段求最值
+    """
+    n = len(x)
+    if n <= 2 * buckets + 2:
+        return np.arange(n)
+    span = max(end - start, 1)
+    bucket = np.clip(((x - start) * buckets // span).astype(np.int64), 0, buckets - 1)
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    segment = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+
+    def first_in_segment(mask):
+        candidates = np.flatnonzero(mask)
+        owners = segment[candidates]
+        return candidates[np.concatenate(([True], owners[1:] != owners[:-1]))]
+
+    lowest = first_in_segment(y == np.minimum.reduceat(y, starts)[segment])
+    highest = first_in_segment(y == np.maximum.reduceat(y, starts)[segment])
+    return np.unique(np.concatenate((lowest, highest, [0, n - 1])))
+
+
+def downsample_indices(x, y, width, method, start, end, minmax_ratio=MINMAX_RATIO):
+    """
+    按算法选出不超过width个点的下标
+    """
+    if method == 'minmax':
+        return minmax_indices(x, y, max(1, (width - 2) // 2), start, end)
+    if minmax_ratio and len(x) > width * minmax_ratio:
+        candidates = minmax_indices(x, y, width * minmax_ratio // 2, start, end)
+        return candidates[lttb_indices(x[candidates], y[candidates], width)]
+    return lttb_indices(x, y, width)
+
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+
+class DownsamplingService:
+    """
+    取回、降采样并缓存序列，与HTTP服务器无关
+    """
+
+    def __init__(self, es, index, cache, series_cache, snap_seconds=60, settle_seconds=300, ttl=3600, tail_ttl=10,
+                 page_size=DEFAULT_PAGE_SIZE, fetch_workers=4, minmax_ratio=MINMAX_RATIO):
+        if np is None:
+            raise ImportError("降采样服务需要numpy，请先执行 pip install numpy")
+        self.es = es
+        self.index = index
+        self.cache = cache
+        self.series_cache = series_cache
+        self.snap_seconds = snap_seconds
+        self.settle_seconds = settle_seconds
+        self.ttl = ttl
+        self.tail_ttl = tail_ttl
+        self.page_size = page_size
+        self.fetch_workers = fetch_workers
+        self.minmax_ratio = minmax_ratio
+
+    def snap_range(self, start, end):
+        """
+        开始时间向前、结束时间向后对齐，只差几秒的请求使用同一缓存
+        """
+        if not self.snap_seconds:
+            return start, end
+        snap = self.snap_seconds
+        return start // snap * snap, -(-end // snap) * snap
+
+    def ttl_for(self, end):
+        """
+        已经结束的范围长期缓存，包含最新数据的范围只短时间缓存
+        """
+        return self.ttl if end <= time.time() - self.settle_seconds else self.tail_ttl
+
+    def fetch_series(self, hosts, kpi, start, end):
+        """
+        用composite聚合按 (hostname, clock) 翻页取回多台主机的原始点，同一时刻有多条记录时取平均值
+        返回 {主机: (clock数组, value数组)}，按时间排序
+        """
+        composite = {
+            'size': self.page_size,
+            'sources': [{'hostname': {'terms': {'field': 'hostname'}}}, {'clock': {'terms': {'field': 'clock'}}}]
+        }
+        body = {
+            'size': 0,
+            'query': {'bool': {'filter': [
+                {'terms': {'hostname': hosts}},
+                {'term': {'kpi': kpi}},
+                {'range': {'clock': {'gte': start, 'lt': end}}}
+            ]}},
+            'aggs': {'points': {'composite': composite, 'aggs': {'value': {'avg': {'field': 'value'}}}}}
+        }
+        points = {host: ([], []) for host in hosts}
+        while True:
+            result = self.es.search(index=self.index, body=body, request_timeout=120)['aggregations']['points']
+            for bucket in result['buckets']:
+                value = bucket['value']['value']
+                if value is None:
+                    continue
+                clocks, values = points.setdefault(bucket['key']['hostname'], ([], []))
+                clocks.append(bucket['key']['clock'])
+                values.append(value)
+            if not result.get('after_key') or len(result['buckets']) < self.page_size:
+                break
+            composite['after'] = result['after_key']
+        return {host: (np.asarray(clocks, dtype=np.float64), np.asarray(values, dtype=np.float64))
+                for host, (clocks, values) in points.items()}
+
+    def raw_series(self, hosts, kpi, start, end, ttl):
+        """
+        先查原始序列缓存，缺少的主机分组并行取回
+        """
+        series = {}
+        missing = []
+        for host in hosts:
+            cached = self.series_cache.get((host, kpi, start, end))
+            if cached is None:
+                missing.append(host)
+            else:
+                series[host] = cached
+        if not missing:
+            return series
+
+        chunks = [missing[i:i + HOSTS_PER_FETCH] for i in range(0, len(missing), HOSTS_PER_FETCH)]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.fetch_workers, len(chunks)))) as executor:
+            for fetched in executor.map(lambda chunk: self.fetch_series(chunk, kpi, start, end), chunks):
+                for host, points in fetched.items():
+                    self.series_cache.put((host, kpi, start, end), points, ttl)
+                    series[host] = points
+        return series
+
+    def query(self, hosts, kpi, start, end=None, width=800, method='lttb'):
+        """
+        返回各主机降采样后的序列
+        """
+        if not hosts:
+            raise ValueError("请指定主机")
+        if not kpi:
+            raise ValueError("请指定KPI")
+        if method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f"不支持的降采样算法: {method}，可选 {', '.join(DOWNSAMPLE_METHODS)}")
+        width = int(width)
+        if not 4 <= width <= MAX_WIDTH:
+            raise ValueError(f"宽度应在 4 到 {MAX_WIDTH} 之间: {width}")
+        start = parse_time(start)
+        end = parse_time(end) if end is not None else int(time.time())
+        if start is None or start >= end:
+            raise ValueError("开始时间应早于结束时间")
+
+        start, end = self.snap_range(start, end)
+        ttl = self.ttl_for(end)
+        hosts = list(dict.fromkeys(hosts))
+        results = {}
+        missing = []
+        for host in hosts:
+            cached = self.cache.get((host, kpi, start, end, width, method))
+            if cached is None:
+                missing.append(host)
+            else:
+                results[host] = cached
+
+        if missing:
+            series = self.raw_series(missing, kpi, start, end, ttl)
+            for host in missing:
+                x, y = series[host]
+                indices = downsample_indices(x, y, width, method, start, end, self.minmax_ratio)
+                points = np.column_stack(((x[indices] * 1000).astype(np.int64), y[indices])).tolist()
+                results[host] = (len(x), [[int(clock), value] for clock, value in points])
+                self.cache.put((host, kpi, start, end, width, method), results[host], ttl)
+
+        return {
+            'kpi': kpi,
+            'start': start,
+            'end': end,
+            'width': width,
+            'method': method,
+            'series': [{'host': host, 'raw_points': results[host][0], 'points': results[host][1]} for host in hosts]
+        }
+
+    def stats(self):
+        return {'downsampled': self.cache.stats(), 'raw_series': self.series_cache.stats()}
+
+
+class DownsampleRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP请求处理
+    """
+    protocol_version = 'HTTP/1.1'
+    service = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        gzipped = len(body) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = gzip.compress(body, compresslevel=5)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw) if raw.strip() else {}
+
+    def handle_request(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+        try:
+            if path == '/series':
+                if self.command == 'POST':
+                    request = self.read_body()
+                    hosts = request.get('hosts') or ([request['host']] if request.get('host') else [])
+                else:
+                    request = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                    hosts = [host for value in parse_qs(url.query).get('host', []) for host in value.split(',') if host]
+                started = time.time()
+                response = self.service.query(hosts, request.get('kpi'), request.get('start'), request.get('end'),
+                                              request.get('width', 800), request.get('method', 'lttb'))
+                response['took'] = int((time.time() - started) * 1000)
+                logger.info(f"{self.command} /series {len(hosts)} 台主机 {response['took']}ms")
+                self.send_json(200, response)
+            elif path == '/stats':
+                self.send_json(200, self.service.stats())
+            elif path == '/health':
+                self.send_json(200, {'status': 'ok'})
+            else:
+                self.send_json(404, {'error': f"不支持的请求: {self.command} {path}"})
+        except (ValueError, KeyError) as e:
+            self.send_json(400, {'error': str(e)})
+        except TransportError as e:
+            status = e.status_code if isinstance(e.status_code, int) else 502
+            self.send_json(status, e.info if isinstance(e.info, dict) else {'error': str(e)})
+        except Exception as e:
+            logger.error(f"处理请求失败: {self.command} {self.path}: {e}")
+            self.send_json(500, {'error': str(e)})
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='时间序列降采样服务')
+    parser.add_argument('--host', default='localhost', help='ES主机地址')
+    parser.add_argument('--port', type=int, default=9200, help='ES端口')
+    parser.add_argument('--user', help='ES用户名')
+    parser.add_argument('--password', help='ES密码')
+    parser.add_argument('--index', '-i', default='u2performance_for_test', help='索引、别名或通配符')
+    parser.add_argument('--listen-host', default='127.0.0.1', help='服务监听地址')
+    parser.add_argument('--listen-port', type=int, default=8090, help='服务监听端口')
+    parser.add_argument('--cache-size', type=int, default=20000, help='最多缓存的降采样序列数（每台主机一条）')
+    parser.add_argument('--series-cache-size', type=int, default=2000, help='最多缓存的原始序列数（每台主机一条）')
+    parser.add_argument('--ttl', type=int, default=3600, help='已结束时间范围的缓存时间（秒）')
+    parser.add_argument('--tail-ttl', type=int, default=10, help='包含最新数据的时间范围的缓存时间（秒）')
+    parser.add_argument('--snap-seconds', type=int, default=60, help='时间范围对齐的秒数，0表示不对齐')
+    parser.add_argument('--settle-seconds', type=int, default=300, help='数据写入多少秒后视为不再变化')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='取回原始点时每页的组合数')
+    parser.add_argument('--fetch-workers', type=int, default=4, help='并行取回原始点的请求数')
+    parser.add_argument('--minmax-ratio', type=int, default=MINMAX_RATIO,
+                        help='点数超过 宽度*该倍数 时LTTB前先做min/max预选，0表示总是执行完整的LTTB')
+
+    args = parser.parse_args()
+
+    try:
+        importer = ESImporter(es_host=args.host, es_port=args.port, es_user=args.user, es_password=args.password,
+                              max_connections=max(10, args.fetch_workers))
+        DownsampleRequestHandler.service = DownsamplingService(
+            importer.es, args.index, TTLCache(args.cache_size), TTLCache(args.series_cache_size),
+            snap_seconds=args.snap_seconds,
+            settle_seconds=args.settle_seconds,
+            ttl=args.ttl,
+            tail_ttl=args.tail_ttl,
+            page_size=args.page_size,
+            fetch_workers=args.fetch_workers,
+            minmax_ratio=args.minmax_ratio
+        )
+        server = ThreadingHTTPServer((args.listen_host, args.listen_port), DownsampleRequestHandler)
+        logger.info(f"降采样服务已启动: http://{args.listen_host}:{args.listen_port} -> {args.host}:{args.port}/{args.index}")
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        logger.info("降采样服务已停止")
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
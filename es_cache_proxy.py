@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Elasticsearch查询缓存代理
+放在antd-admin与ES之间，缓存仪表盘 /_search 请求的聚合结果：
+- 规范化DSL，并把clock时间范围对齐到桶边界，使只差几秒的请求命中同一缓存；
+- 聚合结果保存在有容量上限和过期时间的LRU缓存中；
+- 已经结束的历史部分（按天对齐）从缓存读取，只向ES查询之后的最新部分，再合并为一个响应；
+  只有能精确合并的聚合才拆分，否则整体查询。
+
+使用时把 .roadhogrc.js 中 "/api/es" 的 target 指向本代理即可。
+"""
+
+import copy
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+import sys
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+from elasticsearch import Elasticsearch, TransportError
+from import_to_es import BaseImporter, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# 两个时间段的结果可以精确合并的聚合类型：计数、求和与最值直接相加或取最值，直方图按key相加；
+# terms只有两部分都返回了全部取值时才能精确合并，否则各自的前N个合起来不是整体的前N个（见merge_buckets）
+MERGEABLE_METRICS = {'min', 'max', 'sum', 'value_count', 'stats'}
+MERGEABLE_BUCKETS = {'terms', 'histogram', 'date_histogram'}
+
+# 按clock排序的命中类聚合：两部分的clock范围不重叠，按排序方向拼接两部分即为整体的顺序
+ORDERED_HITS = {'top_hits', 'top_metrics'}
+
+# 历史部分按天对齐，缓存键在一天内保持不变
+HISTORY_INTERVAL = 86400
+
+
+class IncompleteTermsError(Exception):
+    """
+    terms结果只包含前size个取值，两个时间段的结果无法精确合并
+    """
+
+
+# date_histogram间隔单位对应的毫秒数
+INTERVAL_UNITS_MS = {'ms': 1, 's': 1000, 'm': 60000, 'h': 3600000, 'd': 86400000}
+
+
+class TTLCache:
+    """
+    线程安全的LRU缓存，每个条目有独立的过期时间
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+def normalize_dsl(dsl):
+    """
+    DSL规范化为与字段顺序无关的字符串，作为缓存键
+    """
+    return json.dumps(dsl, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def find_clock_ranges(node):
+    """
+    找出DSL查询部分中所有clock字段上的range条件
+    """
+    found = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'range' and isinstance(value, dict) and isinstance(value.get('clock'), dict):
+                found.append(value['clock'])
+            else:
+                found.extend(find_clock_ranges(value))
+    elif isinstance(node, list):
+        for item in node:
+            found.extend(find_clock_ranges(item))
+    return found
+
+
+def snap_clock_range(clock_range, interval):
+    """
+    把clock范围对齐到桶边界：gte向下取整，lte向上取到桶末尾
+    """
+    gte = clock_range.get('gte')
+    lte = clock_range.get('lte')
+    if isinstance(gte, (int, float)):
+        clock_range['gte'] = int(gte // interval * interval)
+    if isinstance(lte, (int, float)):
+        clock_range['lte'] = int(math.ceil((lte + 1) / interval) * interval - 1)
+
+
+def agg_type(spec):
+    """
+    返回聚合定义的类型名和参数
+    """
+    for key, value in spec.items():
+        if key not in ('aggs', 'aggregations', 'meta'):
+            return key, value
+    return None, None
+
+
+def sub_aggs(spec):
+    return spec.get('aggs') or spec.get('aggregations') or {}
+
+
+def clock_sort_order(params):
+    """
+    top_hits/top_metrics的第一排序字段是clock时返回排序方向（asc/desc），否则返回None
+    """
+    sort = params.get('sort')
+    if isinstance(sort, list):
+        sort = sort[0] if sort else None
+    if isinstance(sort, str):
+        return 'asc' if sort == 'clock' else None
+    if not isinstance(sort, dict) or len(sort) != 1:
+        return None
+    field, order = next(iter(sort.items()))
+    if isinstance(order, dict):
+        order = order.get('order', 'asc')
+    if field != 'clock' or order not in ('asc', 'desc'):
+        return None
+    return order
+
+
+def splits_cleanly(kind, params, split_at):
+    """
+    clock上的直方图桶边界与split_at对齐时，每个桶只落在历史部分或最新部分之一，
+    桶内的子聚合不需要合并，任何类型都可以直接使用
+    """
+    if split_at is None or params.get('field') != 'clock' or params.get('offset') or params.get('time_zone'):
+        return False
+    if kind == 'histogram':
+        interval = params.get('interval')
+    elif kind == 'date_histogram':
+        # clock是long字段，date_histogram把它当作毫秒时间戳分桶
+        interval = bucket_interval_ms(params)
+    else:
+        return False
+    return isinstance(interval, (int, float)) and interval > 0 and split_at % interval == 0
+
+
+def cardinality_source(aggs, params):
+    """
+    返回同一层中与cardinality字段相同的terms聚合名称：terms包含全部取值时，合并后的取值数就是cardinality
+    """
+    if 'field' not in params or 'missing' in params or 'script' in params:
+        return None
+    for name, spec in aggs.items():
+        kind, terms = agg_type(spec)
+        if kind == 'terms' and terms.get('field') == params['field'] and terms.get('min_doc_count', 1) == 1 and \
+                not any(key in terms for key in ('missing', 'include', 'exclude', 'script')):
+            return name
+    return None
+
+
+def is_mergeable(aggs, split_at=None):
+    """
+    判断聚合树中的每个聚合是否都可以由两个时间段（以split_at为界）的结果精确合并
+    terms还要求两部分的结果都包含全部取值，在合并时检查（见merge_buckets）
+    """
+    for spec in aggs.values():
+        kind, params = agg_type(spec)
+        if kind in MERGEABLE_METRICS:
+            continue
+        if kind in ORDERED_HITS and clock_sort_order(params) and not params.get('from'):
+            continue
+        if kind == 'cardinality' and cardinality_source(aggs, params):
+            continue
+        if kind not in MERGEABLE_BUCKETS:
+            return False
+        if kind == 'terms' and params.get('min_doc_count', 1) > 1:
+            # 两部分各自不足min_doc_count的取值合起来可能满足条件
+            return False
+        order = params.get('order')
+        if kind == 'terms' and order and not all(
+                key in ('_key', '_count') for item in (order if isinstance(order, list) else [order]) for key in item):
+            return False
+        if kind != 'terms' and order:
+            return False
+        if kind == 'date_histogram' and bucket_interval_ms(params) is None:
+            return False
+        if splits_cleanly(kind, params, split_at):
+            continue
+        if not is_mergeable(sub_aggs(spec), split_at):
+            return False
+    return True
+
+
+def bucket_interval_ms(params):
+    """
+    解析date_histogram的固定间隔（毫秒），日历间隔返回None
+    """
+    interval = params.get('fixed_interval') or params.get('interval')
+    if isinstance(interval, (int, float)):
+        return int(interval)
+    if not isinstance(interval, str):
+        return None
+    for unit in ('ms', 's', 'm', 'h', 'd'):
+        number = interval[:-len(unit)]
+        if interval.endswith(unit) and number.isdigit():
+            return int(number) * INTERVAL_UNITS_MS[unit]
+    return None
+
+
+def empty_like(result, kind=None):
+    """
+    按已有的聚合结果生成doc_count为0时的空结果，用于补齐直方图中缺失的桶
+    kind为聚合类型，用于区分空桶中为0（sum、计数）和为null（min、max）的指标
+    """
+    if not isinstance(result, dict):
+        return result
+    if kind == 'sum':
+        return {'value': 0.0}
+    if kind in ('value_count', 'cardinality'):
+        return {'value': 0}
+    if kind in ('min', 'max'):
+        return {'value': None}
+    if 'top' in result:
+        return {'top': []}
+    if 'buckets' in result:
+        empty = {'buckets': []}
+        for key in ('doc_count_error_upper_bound', 'sum_other_doc_count'):
+            if key in result:
+                empty[key] = 0
+        return empty
+    if 'hits' in result:
+        return {'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []}}
+    if 'count' in result:
+        return {'count': 0, 'min': None, 'max': None, 'avg': None, 'sum': 0.0}
+    if 'value' in result:
+        return {'value': 0 if isinstance(result['value'], int) else None}
+    return {}
+
+
+def empty_bucket_like(template, key, key_as_string=None, aggs=None):
+    """
+    以template为模板生成一个空桶，aggs为桶内子聚合的定义
+    """
+    aggs = aggs or {}
+    bucket = {'key': key, 'doc_count': 0}
+    if key_as_string is not None:
+        bucket['key_as_string'] = key_as_string
+    for name, value in template.items():
+        if name not in ('key', 'key_as_string', 'doc_count'):
+            bucket[name] = empty_like(value, agg_type(aggs[name])[0] if name in aggs else None)
+    return bucket
+
+
+def total_value(total):
+    return total['value'] if isinstance(total, dict) else total
+
+
+def merge_metric(kind, a, b):
+    """
+    合并两个指标聚合结果
+    """
+    if kind == 'stats':
+        count = a['count'] + b['count']
+        values_min = [v for v in (a['min'], b['min']) if v is not None]
+        values_max = [v for v in (a['max'], b['max']) if v is not None]
+        total = (a['sum'] or 0) + (b['sum'] or 0)
+        return {
+            'count': count,
+            'min': min(values_min) if values_min else None,
+            'max': max(values_max) if values_max else None,
+            'avg': total / count if count else None,
+            'sum': total
+        }
+    values = [v for v in (a.get('value'), b.get('value')) if v is not None]
+    if kind == 'min':
+        return {'value': min(values) if values else None}
+    if kind == 'max':
+        return {'value': max(values) if values else None}
+    return {'value': sum(values)}
+
+
+def merge_ordered_hits(kind, params, a, b):
+    """
+    合并按clock排序的top_hits/top_metrics：a为历史部分，clock都小于最新部分b，
+    升序时a在前、降序时b在前，拼接后取前size个
+    """
+    if clock_sort_order(params) == 'desc':
+        a, b = b, a
+    if kind == 'top_metrics':
+        return {'top': (a['top'] + b['top'])[:params.get('size', 1)]}
+    total = total_value(a['hits']['total']) + total_value(b['hits']['total'])
+    return {
+        'hits': {
+            'total': {'value': total, 'relation': 'eq'},
+            'max_score': None,
+            'hits': (a['hits']['hits'] + b['hits']['hits'])[:params.get('size', 3)]
+        }
+    }
+
+
+def check_complete_terms(params, *results):
+    """
+    terms的任一部分有未返回的取值（sum_other_doc_count大于0）时无法精确合并，抛出IncompleteTermsError
+    """
+    if any(result.get('sum_other_doc_count') or result.get('doc_count_error_upper_bound') for result in results):
+        raise IncompleteTermsError(f"terms聚合 {params.get('field')} 的取值数超过size {params.get('size', 10)}")
+
+
+def merge_buckets(kind, params, spec, a, b, split_at=None):
+    """
+    按key合并两个分桶聚合结果，子聚合递归合并
+    """
+    if kind == 'terms':
+        check_complete_terms(params, a, b)
+    clean = splits_cleanly(kind, params, split_at)
+    merged = OrderedDict()
+    for bucket in a['buckets'] + b['buckets']:
+        key = bucket['key']
+        if key not in merged:
+            merged[key] = bucket
+            continue
+        existing = merged[key]
+        if clean:
+            # 桶只落在一个部分中，另一部分的同一个key只能是extended_bounds补出的空桶
+            if not existing['doc_count']:
+                merged[key] = bucket
+            continue
+        combined = dict(existing)
+        combined['doc_count'] = existing['doc_count'] + bucket['doc_count']
+        combined.update(merge_aggregations(sub_aggs(spec), existing, bucket, split_at))
+        merged[key] = combined
+    buckets = list(merged.values())
+
+    if kind == 'terms':
+        order = params.get('order') or [{'_count': 'desc'}, {'_key': 'asc'}]
+        for item in reversed(order if isinstance(order, list) else [order]):
+            field, direction = next(iter(item.items()))
+            attr = 'doc_count' if field == '_count' else 'key'
+            buckets.sort(key=lambda bucket: bucket[attr], reverse=direction == 'desc')
+        size = params.get('size', 10)
+        dropped = sum(bucket['doc_count'] for bucket in buckets[size:])
+        return {
+            'doc_count_error_upper_bound': a.get('doc_count_error_upper_bound', 0) +
+                                           b.get('doc_count_error_upper_bound', 0),
+            'sum_other_doc_count': a.get('sum_other_doc_count', 0) + b.get('sum_other_doc_count', 0) + dropped,
+            'buckets': buckets[:size]
+        }
+
+    buckets.sort(key=lambda bucket: bucket['key'])
+    if params.get('min_doc_count', 0) == 0 and len(buckets) > 1:
+        buckets = fill_histogram_gaps(kind, params, buckets, sub_aggs(spec))
+    return {'buckets': buckets}
+
+
+def fill_histogram_gaps(kind, params, buckets, aggs=None):
+    """
+    min_doc_count为0时补齐两个时间段之间缺失的空桶，与ES直接查询的结果一致
+    """
+    if kind == 'histogram':
+        interval = params['interval']
+    else:
+        interval = bucket_interval_ms(params)
+    filled = [buckets[0]]
+    for bucket in buckets[1:]:
+        key = filled[-1]['key'] + interval
+        while key < bucket['key']:
+            key_as_string = None
+            if 'key_as_string' in bucket:
+                key_as_string = datetime.fromtimestamp(key / 1000, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            filled.append(empty_bucket_like(bucket, key, key_as_string, aggs))
+            key += interval
+        filled.append(bucket)
+    return filled
+
+
+def merge_aggregations(aggs, a, b, split_at=None):
+    """
+    按聚合定义合并两个时间段的聚合结果
+    """
+    merged = {}
+    for name, spec in aggs.items():
+        if name not in a or name not in b:
+            merged[name] = a.get(name, b.get(name))
+            continue
+        kind, params = agg_type(spec)
+        if kind in MERGEABLE_METRICS:
+            merged[name] = merge_metric(kind, a[name], b[name])
+        elif kind in ORDERED_HITS:
+            merged[name] = merge_ordered_hits(kind, params, a[name], b[name])
+        elif kind == 'cardinality':
+            source = cardinality_source(aggs, params)
+            terms_params = agg_type(aggs[source])[1]
+            check_complete_terms(terms_params, a[source], b[source])
+            merged[name] = {'value': len({bucket['key'] for bucket in a[source]['buckets'] + b[source]['buckets']})}
+        else:
+            merged[name] = merge_buckets(kind, params, spec, a[name], b[name], split_at)
+    return merged
+
+
+def merge_responses(dsl, historical, tail, split_at=None):
+    """
+    合并历史部分与最新部分的搜索响应，split_at为最新部分的起始clock
+    """
+    historical = copy.deepcopy(historical)
+    tail = copy.deepcopy(tail)
+    total = total_value(historical['hits']['total']) + total_value(tail['hits']['total'])
+    return {
+        'took': historical.get('took', 0) + tail.get('took', 0),
+        'timed_out': historical.get('timed_out', False) or tail.get('timed_out', False),
+        '_shards': tail.get('_shards', historical.get('_shards')),
+        'hits': {'total': {'value': total, 'relation': 'eq'}, 'max_score': None, 'hits': []},
+        'aggregations': merge_aggregations(sub_aggs(dsl), historical.get('aggregations', {}),
+                                           tail.get('aggregations', {}), split_at)
+    }
+
+
+class CachingSearchProxy:
+    """
+    /_search缓存逻辑，与HTTP服务器无关
+    """
+
+    def __init__(self, es, cache, snap_interval=3600, settle_seconds=300, ttl=3600, tail_ttl=10,
+                 history_interval=HISTORY_INTERVAL):
+        self.es = es
+        self.cache = cache
+        self.snap_interval = snap_interval
+        self.settle_seconds = settle_seconds
+        self.ttl = ttl
+        self.tail_ttl = tail_ttl
+        self.history_interval = history_interval
+        # 拆分后发现无法精确合并的查询，在ttl内直接整体查询
+        self.unmergeable = TTLCache(cache.max_entries)
+
+    def closed_until(self):
+        """
+        返回历史部分的结束位置（clock秒）：已结束settle_seconds秒以上，并向前对齐到history_interval，
+        使历史部分的缓存键在整个对齐单位内保持不变；之后到当前时间的部分由最新部分的查询返回
+        """
+        interval = self.history_interval or self.snap_interval or 3600
+        return int((time.time() - self.settle_seconds) // interval * interval)
+
+    def fetch(self, path, params, dsl, ttl):
+        """
+        从缓存或ES获取一个查询结果
+        """
+        key = (path, normalize_dsl(params), normalize_dsl(dsl))
+        response = self.cache.get(key)
+        if response is None:
+            response = self.es.transport.perform_request('POST', path, params=params, body=dsl)
+            self.cache.put(key, response, ttl)
+        return response
+
+    def search(self, path, params, dsl):
+        """
+        执行一个搜索请求，返回响应字典
+        """
+        dsl = copy.deepcopy(dsl or {})
+        clock_ranges = find_clock_ranges(dsl.get('query', {}))
+        if self.snap_interval:
+            for clock_range in clock_ranges:
+                snap_clock_range(clock_range, self.snap_interval)
+
+        closed_until = self.closed_until()
+        if len(clock_ranges) != 1:
+            return self.fetch(path, params, dsl, self.tail_ttl)
+
+        clock_range = clock_ranges[0]
+        gte = clock_range.get('gte')
+        lte = clock_range.get('lte')
+        if not isinstance(gte, int) or not isinstance(lte, int):
+            return self.fetch(path, params, dsl, self.tail_ttl)
+        if lte < closed_until:
+            # 整个范围都已结束，整体长期缓存
+            return self.fetch(path, params, dsl, self.ttl)
+
+        aggs = sub_aggs(dsl)
+        if gte >= closed_until or dsl.get('size', 10) != 0 or not aggs or not is_mergeable(aggs, closed_until):
+            return self.fetch(path, params, dsl, self.tail_ttl)
+        unmergeable_key = (path, normalize_dsl(params), normalize_dsl(dsl))
+        if self.unmergeable.get(unmergeable_key):
+            return self.fetch(path, params, dsl, self.tail_ttl)
+
+        # 历史部分与最新部分分别查询，历史部分长期缓存
+        historical_dsl = copy.deepcopy(dsl)
+        find_clock_ranges(historical_dsl['query'])[0]['lte'] = closed_until - 1
+        tail_dsl = copy.deepcopy(dsl)
+        find_clock_ranges(tail_dsl['query'])[0]['gte'] = closed_until
+
+        historical = self.fetch(path, params, historical_dsl, self.ttl)
+        tail = self.fetch(path, params, tail_dsl, self.tail_ttl)
+        try:
+            return merge_responses(dsl, historical, tail, closed_until)
+        except IncompleteTermsError as e:
+            logger.info(f"无法精确合并，改为整体查询: {e}")
+            self.unmergeable.put(unmergeable_key, True, self.ttl)
+            return self.fetch(path, params, dsl, self.tail_ttl)
+
+
+class ProxyRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP请求处理：/_search走缓存，其余请求直接转发到ES
+    """
+    protocol_version = 'HTTP/1.1'
+    proxy = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw) if raw.strip() else None
+
+    def handle_request(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+        params = dict(parse_qsl(url.query))
+        try:
+            body = self.read_body()
+            if path == '/_cache/stats':
+                self.send_json(200, self.proxy.cache.stats())
+            elif path.endswith('/_search') and self.command in ('GET', 'POST'):
+                started = time.time()
+                response = self.proxy.search(path, params, body)
+                logger.info(f"{self.command} {path} {int((time.time() - started) * 1000)}ms")
+                self.send_json(200, response)
+            else:
+                response = self.proxy.es.transport.perform_request(self.command, path, params=params, body=body)
+                if isinstance(response, bool):
+                    # HEAD请求只返回是否存在
+                    self.send_json(200 if response else 404, {})
+                else:
+                    self.send_json(200, response)
+        except TransportError as e:
+            status = e.status_code if isinstance(e.status_code, int) else 502
+            self.send_json(status, e.info if isinstance(e.info, dict) else {'error': str(e)})
+        except Exception as e:
+            logger.error(f"处理请求失败: {self.command} {self.path}: {e}")
+            self.send_json(500, {'error': str(e)})
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+    do_DELETE = handle_request
+    do_HEAD = handle_request
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description='Elasticsearch查询缓存代理')
+    parser.add_argument('--host', default='localhost', help='ES主机地址')
+    parser.add_argument('--port', type=int, default=9200, help='ES端口')
+    parser.add_argument('--user', help='ES用户名')
+    parser.add_argument('--password', help='ES密码')
+    parser.add_argument('--listen-host', default='127.0.0.1', help='代理监听地址')
+    parser.add_argument('--listen-port', type=int, default=8080, help='代理监听端口')
+    parser.add_argument('--cache-size', type=int, default=512, help='最多缓存的查询结果数')
+    parser.add_argument('--ttl', type=int, default=3600, help='历史桶结果的缓存时间（秒）')
+    parser.add_argument('--tail-ttl', type=int, default=10, help='包含最新数据的结果的缓存时间（秒）')
+    parser.add_argument('--snap-interval', type=int, default=3600, help='clock范围对齐的桶大小（秒），0表示不对齐')
+    parser.add_argument('--settle-seconds', type=int, default=300, help='桶结束多少秒后视为不再变化')
+    parser.add_argument('--history-interval', type=int, default=HISTORY_INTERVAL,
+                        help='历史部分结束位置的对齐单位（秒），默认按天对齐，之后的部分实时查询')
+
+    args = parser.parse_args()
+
+    try:
+        es_config = BaseImporter.build_es_config(args.host, args.port, args.user, args.password)
+        es = Elasticsearch([es_config])
+        if not es.ping():
+            raise ConnectionError("无法连接到Elasticsearch")
+
+        ProxyRequestHandler.proxy = CachingSearchProxy(
+            es, TTLCache(args.cache_size),
+            snap_interval=args.snap_interval,
+            settle_seconds=args.settle_seconds,
+            ttl=args.ttl,
+            tail_ttl=args.tail_ttl,
+            history_interval=args.history_interval
+        )
+        server = ThreadingHTTPServer((args.listen_host, args.listen_port), ProxyRequestHandler)
+        logger.info(f"缓存代理已启动: http://{args.listen_host}:{args.listen_port} -> {args.host}:{args.port}")
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        logger.info("缓存代理已停止")
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按主机导出时间序列
+用composite聚合按 (hostname或appcode, 小时) 分页取出全部组合，代替 group_by_device 的 terms 聚合：
+- 不再受 terms size 1000 的限制，超出的主机不会被丢弃；
+- 每页用 after_key 取下一页，结果逐页写入CSV或列式存储（columnar_store.py的格式），内存占用与数据量无关；
+- 时间范围按小时对齐切分为多个时间段，各时间段独立翻页，同时进行中的分页请求数固定为 --concurrency；
+- 连接沿用 ESImporter 的配置（连接池、超时、重试），与导入的吞吐量一致。
+
+每行包含分组字段、小时的起始时间（@timestamp和clock）、文档数以及value的min/max/avg和该小时的最新值（last）。
+行在每个时间段内按 (分组, 小时) 排序，时间段之间按完成顺序写出。
+"""
+
+import csv
+import time
+import queue
+import logging
+import argparse
+import threading
+import sys
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from import_to_es import ESImporter
+from columnar_store import ColumnarStoreWriter
+from local_query_engine import parse_interval_ms
+
+logger = logging.getLogger(__name__)
+
+# 输出的指标列及其在列式存储中的类型
+SERIES_KINDS = {
+    'count': 'int64',
+    'min': 'float64',
+    'max': 'float64',
+    'avg': 'float64',
+    'last': 'float64',
+}
+
+# composite中时间来源的名称
+TIME_SOURCE = 'hour'
+
+DEFAULT_PAGE_SIZE = 1000
+
+# 每页取回后写出之前最多缓存的页数（每个并发请求）
+QUEUED_PAGES_PER_REQUEST = 2
+
+# 每写出多少页记录一次进度
+PROGRESS_PAGES = 50
+
+
+def parse_time(value):
+    """
+    时间参数转换为秒级时间戳：整数按秒处理，否则按ISO格式解析（不带时区时按UTC）
+    """
+    if value is None:
+        return None
+    if str(value).lstrip('-').isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def format_hour(seconds):
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def split_windows(start, end, interval, partitions):
+    """
+    把 [start, end) 按间隔对齐切分为最多partitions个时间段，同一个桶不会跨两个时间段
+    时间段之间的边界对齐到桶边界，第一个时间段仍从start开始，不包含start之前的数据
+    """
+    first = start // interval * interval
+    buckets = max(1, -(-(end - first) // interval))
+    step = -(-buckets // max(1, partitions)) * interval
+    return [(max(low, start), min(low + step, end)) for low in range(first, end, step)]
+
+
+class CsvSeriesWriter:
+    """
+    逐页追加写入CSV
+    """
+
+    def __init__(self, path, columns):
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=columns)
+        self.writer.writeheader()
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnarSeriesWriter:
+    """
+    逐页追加写入列式存储，可以用 ColumnarStore 内存映射读取，或用 local_query_engine.py 查询
+    """
+
+    def __init__(self, path, columns, overwrite=False):
+        self.writer = ColumnarStoreWriter(path, kinds=SERIES_KINDS, overwrite=overwrite)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.writer.add(row)
+
+    def close(self):
+        self.writer.close()
+
+
+SERIES_WRITERS = {
+    'csv': CsvSeriesWriter,
+    'columns': ColumnarSeriesWriter,
+}
+
+
+class SeriesExporter:
+    """
+    按时间段并行、时间段内按after_key顺序翻页导出 (分组, 小时) 序列
+    """
+
+    def __init__(self, es, index, group_field='hostname', interval='1h', page_size=DEFAULT_PAGE_SIZE, concurrency=4,
+                 kpis=None, value_field='value', time_field='clock'):
+        self.es = es
+        self.index = index
+        self.group_field = group_field
+        self.interval = parse_interval_ms({'fixed_interval': interval}) // 1000
+        if self.interval <= 0:
+            raise ValueError(f"导出间隔不能小于1秒: {interval}")
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.kpis = kpis
+        self.value_field = value_field
+        self.time_field = time_field
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def columns(self):
+        return [self.group_field, '@timestamp', self.time_field] + list(SERIES_KINDS)
+
+    def filters(self, start=None, end=None):
+        filters = []
+        if start is not None or end is not None:
+            bounds = {'gte': start} if start is not None else {}
+            if end is not None:
+                bounds['lt'] = end
+            filters.append({'range': {self.time_field: bounds}})
+        if self.kpis:
+            filters.append({'terms': {'kpi': self.kpis}})
+        return filters
+
+    def time_bounds(self):
+        """
+        未指定时间范围时，取索引中时间字段的最小值和最大值
+        """
+        body = {'size': 0, 'aggs': {'bounds': {'stats': {'field': self.time_field}}}}
+        filters = self.filters()
+        if filters:
+            body['query'] = {'bool': {'filter': filters}}
+        bounds = self.es.search(index=self.index, body=body, request_timeout=120)['aggregations']['bounds']
+        if not bounds.get('count'):
+            return None, None
+        return int(bounds['min']), int(bounds['max']) + 1
+
+    def page_query(self, window, after=None):
+        # 时间来源用与范围过滤相同的秒级字段分桶，时间段边界与桶边界对齐
+        composite = {
+            'size': self.page_size,
+            'sources': [
+                {self.group_field: {'terms': {'field': self.group_field}}},
+                {TIME_SOURCE: {'histogram': {'field': self.time_field, 'interval': self.interval}}}
+            ]
+        }
+        if after:
+            composite['after'] = after
+        return {
+            'size': 0,
+            'query': {'bool': {'filter': self.filters(*window)}},
+            'aggs': {
+                'series': {
+                    'composite': composite,
+                    'aggs': {
+                        'value_stats': {'stats': {'field': self.value_field}},
+                        'latest': {'top_metrics': {'metrics': {'field': self.value_field},
+                                                   'sort': {self.time_field: 'desc'}}}
+                    }
+                }
+            }
+        }
+
+    def to_row(self, bucket):
+        clock = int(bucket['key'][TIME_SOURCE])
+        stats = bucket['value_stats']
+        top = bucket['latest'].get('top') or []
+        return {
+            self.group_field: bucket['key'][self.group_field],
+            '@timestamp': format_hour(clock),
+            self.time_field: clock,
+            'count': bucket['doc_count'],
+            'min': stats.get('min'),
+            'max': stats.get('max'),
+            'avg': stats.get('avg'),
+            'last': top[0]['metrics'].get(self.value_field) if top else None
+        }
+
+    def iter_window(self, window):
+        """
+        顺序翻页取出一个时间段的全部组合，每次产出一页的行
+        """
+        after = None
+        while not self.stop.is_set():
+            response = self.es.search(index=self.index, body=self.page_query(window, after), request_timeout=120)
+            with self.lock:
+                self.requests += 1
+            result = response['aggregations']['series']
+            buckets = result['buckets']
+            if buckets:
+                yield [self.to_row(bucket) for bucket in buckets]
+            after = result.get('after_key')
+            if not after or len(buckets) < self.page_size:
+                return
+
+    def export_window(self, window, pages):
+        for rows in self.iter_window(window):
+            # 写出跟不上时在这里等待，缓存的页数不超过队列长度
+            while not self.stop.is_set():
+                try:
+                    pages.put(rows, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    def export(self, writer, start=None, end=None, partitions=None):
+        """
+        导出 [start, end) 内的全部序列，返回统计信息
+        """
+        if start is None or end is None:
+            low, high = self.time_bounds()
+            start = low if start is None else start
+            end = high if end is None else end
+        if start is None or end is None or start >= end:
+            logger.warning("时间范围内没有数据")
+            return {'rows': 0, 'pages': 0, 'requests': 0, 'windows': 0, 'seconds': 0}
+
+        windows = split_windows(start, end, self.interval, partitions or self.concurrency * 4)
+        logger.info(f"导出 {format_hour(start)} ~ {format_hour(end)}，按 {self.group_field} 和 {self.interval} 秒分组，"
+                    f"{len(windows)} 个时间段，{self.concurrency} 个并发请求，每页 {self.page_size} 个组合")
+
+        started = time.time()
+        rows_written = 0
+        pages_written = 0
+        pages = queue.Queue(maxsize=self.concurrency * QUEUED_PAGES_PER_REQUEST)
+        self.stop.clear()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.export_window, window, pages) for window in windows]
+            try:
+                while True:
+                    failed = next((future for future in futures if future.done() and future.exception()), None)
+                    if failed:
+                        raise failed.exception()
+                    try:
+                        rows = pages.get(timeout=0.2)
+                    except queue.Empty:
+                        if all(future.done() for future in futures) and pages.empty():
+                            break
+                        continue
+                    writer.write_rows(rows)
+                    rows_written += len(rows)
+                    pages_written += 1
+                    if pages_written % PROGRESS_PAGES == 0:
+                        elapsed = time.time() - started
+                        logger.info(f"已导出 {rows_written} 行（{pages_written} 页），{rows_written / elapsed:.0f} 行/秒")
+                for future in futures:
+                    future.result()
+            except BaseException:
+                self.stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+
+        seconds = time.time() - started
+        return {'rows': rows_written, 'pages': pages_written, 'requests': self.requests, 'windows': len(windows),
+                'seconds': round(seconds, 3), 'rows_per_sec': round(rows_written / seconds, 1) if seconds else None}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='按主机（或应用）和小时导出时间序列')
+    parser.add_argument('--output', '-o', required=True, help='输出文件（CSV）或目录（列式存储，可以是空目录或之前生成的列式存储）')
+    parser.add_argument('--format', choices=list(SERIES_WRITERS), help='输出格式，默认按输出路径判断：.csv 为CSV，否则为列式存储')
+    parser.add_argument('--index', '-i', default='u2performance_for_test', help='索引、别名或通配符')
+    parser.add_argument('--host', default='localhost', help='ES主机地址')
+    parser.add_argument('--port', type=int, default=9200, help='ES端口')
+    parser.add_argument('--user', help='ES用户名')
+    parser.add_argument('--password', help='ES密码')
+    parser.add_argument('--group-by', default='hostname', help='分组字段，如 hostname、appcode')
+    parser.add_argument('--interval', default='1h', help='时间间隔，如 1h、30m、1d')
+    parser.add_argument('--kpi', nargs='+', help='只导出这些KPI')
+    parser.add_argument('--start', help='开始时间（秒级时间戳或ISO时间，包含），默认为索引中最早的数据')
+    parser.add_argument('--end', help='结束时间（秒级时间戳或ISO时间，不包含），默认为索引中最晚的数据之后')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='每页的组合数')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时进行的分页请求数')
+    parser.add_argument('--partitions', type=int, help='时间段数，默认为并发数的4倍')
+    parser.add_argument('--overwrite', action='store_true', help='列式存储的输出路径已存在且不是列式存储时仍然删除并覆盖')
+
+    args = parser.parse_args()
+
+    try:
+        output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'columns')
+        importer = ESImporter(es_host=args.host, es_port=args.port, es_user=args.user, es_password=args.password,
+                              max_connections=max(10, args.concurrency))
+        exporter = SeriesExporter(importer.es, args.index, group_field=args.group_by, interval=args.interval,
+                                  page_size=args.page_size, concurrency=args.concurrency, kpis=args.kpi)
+
+        writer_options = {'overwrite': args.overwrite} if output_format == 'columns' else {}
+        writer = SERIES_WRITERS[output_format](args.output, exporter.columns, **writer_options)
+        try:
+            stats = exporter.export(writer, parse_time(args.start), parse_time(args.end), args.partitions)
+        finally:
+            writer.close()
+
+        logger.info(f"导出完成: {stats['rows']} 行，{stats['requests']} 次请求，耗时 {stats['seconds']} 秒"
+                    + (f"，{stats['rows_per_sec']} 行/秒" if stats.get('rows_per_sec') else '') + f" -> {args.output}")
+
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -5,42 +5,2061 @@ Elasticsearch数据导入脚本
 用于将222.json文件中的数据导入到本地Elasticsearch的指定索引u2performance_for_test
 """
 
+import io
 import json
 import re
+import glob
+import gzip
+import codecs
+import hashlib
+import math
+import random
+import time
+import threading
+import asyncio
+import bisect
+import multiprocessing
 import logging
-from datetime import datetime
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+from datetime import datetime, timedelta, timezone
+from collections import deque, OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from elasticsearch import Elasticsearch, NotFoundError
+from elasticsearch import ConnectionError as ESConnectionError
+try:
+    from elasticsearch import AsyncElasticsearch
+except ImportError:
+    # 异步模式需要安装 elasticsearch[async]（依赖aiohttp）
+    AsyncElasticsearch = None
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时使用标准库json序列化bulk请求体
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    # 读取.zst压缩文件需要安装zstandard
+    zstandard = None
 import argparse
 import sys
 import os
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('es_import.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
-class ESImporter:
-    def __init__(self, es_host='localhost', es_port=9200, es_user=None, es_password=None):
+# 导入命令的日志文件
+LOG_FILE = 'es_import.log'
+
+
+def configure_logging(log_file=None):
+    """
+    配置命令行工具的日志：输出到控制台，指定log_file时同时写入文件
+    只在各工具的main中调用，导入本模块不会创建日志文件
+    """
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.insert(0, logging.FileHandler(log_file))
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=handlers
+    )
+
+# 流式读取时每次从文件读取的字符数
+READ_CHUNK_SIZE = 1 << 20
+
+# JSON数组中单个元素的最大字符数，超过时仍无法解析则认为文件格式有误，避免一直缓存到文件末尾
+MAX_DOCUMENT_CHARS = 16 << 20
+
+# 按扩展名流式解压的输入文件，以及目录中会被导入的文件类型
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+INPUT_SUFFIXES = ('.json', '.ndjson', '.jsonl')
+
+
+class _ForwardReader(io.RawIOBase):
+    """
+    把只能顺序读取的解压流包装为原始流，支持向前定位（读取并丢弃），供io.BufferedReader使用
+    向后定位只能落在BufferedReader的缓冲区内
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("压缩流不支持从末尾定位")
+        if offset < self.position:
+            raise io.UnsupportedOperation("压缩流不支持向后定位")
+        while self.position < offset:
+            data = self.stream.read(min(offset - self.position, READ_CHUNK_SIZE))
+            if not data:
+                break
+            self.position += len(data)
+        return self.position
+
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+        super().close()
+
+
+def is_compressed_input(json_file_path):
+    return json_file_path.endswith(COMPRESSED_SUFFIXES)
+
+
+def open_input_file(json_file_path):
+    """
+    以二进制方式打开输入文件，.gz和.zst文件边读边解压，不生成临时文件
+    返回的文件对象中的偏移为解压后的字节偏移
+    """
+    if json_file_path.endswith('.gz'):
+        return gzip.open(json_file_path, 'rb')
+    if json_file_path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("读取.zst文件需要安装zstandard: pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(json_file_path, 'rb'), read_across_frames=True,
+                                                            closefd=True)
+        return io.BufferedReader(_ForwardReader(reader), buffer_size=READ_CHUNK_SIZE)
+    return open(json_file_path, 'rb')
+
+
+def expand_input_paths(patterns):
+    """
+    把命令行给出的文件、目录和通配符展开为文件列表（去重并保持顺序）
+    目录中递归查找 .json/.ndjson/.jsonl 及其 .gz/.zst 压缩文件，按路径排序
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matched = []
+            for root, _, names in os.walk(pattern):
+                for name in names:
+                    base = name[:-len(os.path.splitext(name)[1])] if is_compressed_input(name) else name
+                    if base.endswith(INPUT_SUFFIXES):
+                        matched.append(os.path.join(root, name))
+            paths.extend(sorted(matched))
+        elif any(char in pattern for char in '*?['):
+            paths.extend(path for path in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(path))
+        else:
+            paths.append(pattern)
+    return list(dict.fromkeys(paths))
+
+
+def iter_json_documents(json_file_path, chunk_size=READ_CHUNK_SIZE, start_offset=0, with_offsets=False,
+                        max_document_chars=MAX_DOCUMENT_CHARS):
+    """
+    增量解析JSON文件，逐条产出文档
+    支持JSON数组格式（如222.json）和NDJSON格式（每行一个JSON对象），.gz/.zst文件边读边解压，
+    内存占用只与单条文档大小有关，与文件大小无关
+    with_offsets为True时产出(文档结束处的字节偏移, 文档)；
+    start_offset传入之前产出的偏移时从该位置继续解析，用于断点续传
+    数组元素缓存超过max_document_chars个字符仍无法解析时抛出ValueError
+    """
+    decoder = json.JSONDecoder()
+    with open_input_file(json_file_path) as f:
+        # 跳过UTF-8 BOM，根据第一个非空白字符判断文件格式
+        if f.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+            f.seek(0)
+        data_start = f.tell()
+        first_char = f.read(1)
+        while first_char and first_char.isspace():
+            first_char = f.read(1)
+        if not first_char:
+            return
+
+        if first_char != b'[':
+            # NDJSON格式：逐行解析
+            f.seek(start_offset or data_start)
+            offset = f.tell()
+            for line in f:
+                line_start = offset
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    doc = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"字节偏移 {line_start} 处的行不是合法的JSON: {e}")
+                yield (offset, doc) if with_offsets else doc
+            return
+
+        # JSON数组格式：按块读取，逐个解码数组元素
+        if start_offset:
+            f.seek(start_offset)
+        text_decoder = codecs.getincrementaldecoder('utf-8')()
+        buf = ''
+        pos = 0
+        # mark为buf中已计算字节偏移的位置，mark_offset为其对应的文件字节偏移
+        mark = 0
+        mark_offset = f.tell()
+        eof = False
+        while True:
+            # 跳过空白和元素间的逗号
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ','):
+                pos += 1
+
+            need_more = False
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError("JSON数组不完整，缺少结束符 ']'")
+                need_more = True
+            elif buf[pos] == ']':
+                return
+            else:
+                try:
+                    doc, end = decoder.raw_decode(buf, pos)
+                except ValueError as e:
+                    if eof:
+                        raise
+                    if len(buf) - pos > max_document_chars:
+                        # 只有with_offsets时才跟踪字节偏移
+                        where = f"字节偏移 {mark_offset + len(buf[mark:pos].encode('utf-8'))} 处的" if with_offsets else ''
+                        raise ValueError(f"{where}数组元素超过 {max_document_chars} 个字符仍无法解析，文件格式可能有误: {e}")
+                    # 当前元素跨越了块边界，继续读取
+                    need_more = True
+                else:
+                    if end >= len(buf) and not eof:
+                        # 数值等标量可能在块边界被截断，确认其后还有内容再产出
+                        need_more = True
+                    else:
+                        pos = end
+                        if with_offsets:
+                            mark_offset += len(buf[mark:end].encode('utf-8'))
+                            mark = end
+                            yield mark_offset, doc
+                        else:
+                            yield doc
+
+            if need_more:
+                raw = f.read(chunk_size)
+                eof = not raw
+                if with_offsets:
+                    mark_offset += len(buf[mark:pos].encode('utf-8'))
+                    mark = 0
+                buf = buf[pos:] + text_decoder.decode(raw, final=eof)
+                pos = 0
+
+
+def derive_document_id(source):
+    """
+    根据原始_source内容计算稳定的文档ID，重复导入同一条记录时ID不变
+    """
+    payload = json.dumps(source, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+# 正则表达式模式（模块加载时编译一次）
+IP_PATTERN = re.compile(r'^(\d{1,3}\.){3}\d{1,3}$')
+TIMESTAMP_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+HOSTNAME_CLEAN_PATTERN = re.compile(r'[^\w\-\.]')
+DANGEROUS_CHARS_PATTERN = re.compile(r'[<>"\']')
+CONTROL_CHARS_PATTERN = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+
+# 字段处理函数返回该值时表示丢弃该字段
+SKIP_FIELD = object()
+
+
+def _clean_generic(key, value, str_value):
+    """
+    其他字段的通用处理：字符串移除控制字符，其余类型原样保留
+    """
+    if isinstance(value, str):
+        return CONTROL_CHARS_PATTERN.sub('', str_value).strip()
+    return value
+
+
+def _clean_ip(key, value, str_value):
+    """
+    IP字段：格式正确时保留，否则按通用字段处理
+    """
+    if IP_PATTERN.match(str_value):
+        return str_value
+    return _clean_generic(key, value, str_value)
+
+
+def _clean_hostname(key, value, str_value):
+    """
+    主机名字段：特殊字符替换为下划线
+    """
+    return HOSTNAME_CLEAN_PATTERN.sub('_', str_value)
+
+
+def _clean_timestamp(key, value, str_value):
+    """
+    时间戳字段：ISO格式时保留，否则按通用字段处理
+    """
+    if TIMESTAMP_PATTERN.match(str_value):
+        return str_value
+    return _clean_generic(key, value, str_value)
+
+
+def _clean_numeric(key, value, str_value):
+    """
+    数值字段：转换为int或float，无法转换时丢弃
+    """
+    try:
+        if '.' in str_value:
+            return float(value)
+        return int(value)
+    except (ValueError, TypeError):
+        logger.warning(f"无法转换数值字段 {key}: {value}")
+        return SKIP_FIELD
+
+
+def _clean_text(key, value, str_value):
+    """
+    文本字段：移除潜在的危险字符
+    """
+    return DANGEROUS_CHARS_PATTERN.sub('', str_value).strip()
+
+
+def _clean_list(key, value, str_value):
+    """
+    数组字段：逐项转为字符串，非数组时按通用字段处理
+    """
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if item]
+    return _clean_generic(key, value, str_value)
+
+
+# 字段名 -> 处理函数的查找表，未列出的字段使用_clean_generic
+FIELD_HANDLERS = {}
+FIELD_HANDLERS.update(dict.fromkeys(['hostip', 'keyword'], _clean_ip))
+FIELD_HANDLERS.update(dict.fromkeys(['hostname', 'moname'], _clean_hostname))
+FIELD_HANDLERS.update(dict.fromkeys(['@timestamp'], _clean_timestamp))
+FIELD_HANDLERS.update(dict.fromkeys(['process_val', 'value', 'ns', 'clock', 'ts', '__PROCESS_TIME__', 'itemid'],
+                                    _clean_numeric))
+FIELD_HANDLERS.update(dict.fromkeys(['agent', 'mngtorg', 'type', 'componetype', 'appname', 'bizarea', 'vendor'],
+                                    _clean_text))
+FIELD_HANDLERS.update(dict.fromkeys(['kpi'], _clean_list))
+
+
+# 清洗缓存的默认条目数，按 (字段名, 原始字符串) 计
+CLEAN_CACHE_SIZE = 100000
+
+# 只缓存取值种类有限的维度字段；@timestamp等每条记录都不同的字段缓存后只会挤掉这些维度字段
+CACHED_FIELDS = frozenset([
+    'hostname', 'hostip', 'keyword', 'moname', 'mo', 'appname', 'appcode', 'bizarea', 'agent',
+    'branchname', 'branchnamecn', 'mngtorg', 'mngtorgcode', 'vendor', 'type', 'componetype',
+    'component', 'componetid', 'componenttypeid', 'kpiid', 'kpiname', '@version', 'subcomponet', 'subcompontid'
+])
+
+_CACHE_MISS = object()
+
+
+class CleaningCache:
+    """
+    维度字段清洗结果的缓存，键为 (字段名, 原始值)
+    主机名、应用名、机构等维度字段的取值种类很少，命中时不再执行正则替换；
+    清洗结果经sys.intern驻留，同一批次中相同的取值共用一个字符串对象
+    条目数超过max_entries时淘汰最久未使用的条目；按字段统计命中次数，用于评估缓存大小
+    导入服务在多个请求线程中清洗，只有查找、插入和淘汰在锁内进行，未命中时的清洗在锁外执行
+    """
+
+    def __init__(self, max_entries=CLEAN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.counts = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def clean(self, key, value, handler):
+        """
+        返回handler(key, value, value)的结果，value必须是字符串
+        """
+        entries = self.entries
+        cache_key = (key, value)
+        with self.lock:
+            counts = self.counts.get(key)
+            if counts is None:
+                counts = self.counts[key] = [0, 0]
+            cleaned_value = entries.get(cache_key, _CACHE_MISS)
+            if cleaned_value is not _CACHE_MISS:
+                entries.move_to_end(cache_key)
+                counts[0] += 1
+                return cleaned_value
+            counts[1] += 1
+
+        # 清洗结果只取决于取值，多个线程同时未命中时各自清洗，结果相同
+        cleaned_value = handler(key, value, value)
+        if type(cleaned_value) is str:
+            cleaned_value = sys.intern(cleaned_value)
+        with self.lock:
+            entries[cache_key] = cleaned_value
+            entries.move_to_end(cache_key)
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+        return cleaned_value
+
+    def take_counts(self):
+        """
+        返回上次调用以来各字段的 {字段名: [命中, 未命中]} 和淘汰次数，并清零计数
+        """
+        with self.lock:
+            counts, evictions = self.counts, self.evictions
+            self.counts = {}
+            self.evictions = 0
+        return counts, evictions
+
+
+# 当前进程使用的清洗缓存，为None时不缓存
+CLEANING_CACHE = CleaningCache()
+
+
+def configure_cleaning_cache(max_entries=CLEAN_CACHE_SIZE):
+    """
+    设置当前进程的清洗缓存大小，max_entries为0时关闭缓存；也用作清洗进程池的初始化函数
+    """
+    global CLEANING_CACHE
+    CLEANING_CACHE = CleaningCache(max_entries) if max_entries else None
+
+
+def take_cleaning_cache_counts():
+    """
+    取出当前进程清洗缓存的命中计数，未开启缓存时返回空计数
+    """
+    if CLEANING_CACHE is None:
+        return {}, 0
+    return CLEANING_CACHE.take_counts()
+
+
+def clean_document(doc_source):
+    """
+    数据清洗和验证，按字段名查表分派到对应的处理函数
+    维度字段（CACHED_FIELDS）的字符串取值经CLEANING_CACHE缓存，字段名经sys.intern驻留
+    """
+    cache = CLEANING_CACHE
+    cleaned_data = {}
+    get_handler = FIELD_HANDLERS.get
+    intern = sys.intern
+    
+    for key, value in doc_source.items():
+        if value is None or value == "" or value == "undefined":
+            continue
+        
+        key = intern(key)
+        if cache is not None and type(value) is str and key in CACHED_FIELDS:
+            cleaned_value = cache.clean(key, value, get_handler(key, _clean_generic))
+        else:
+            cleaned_value = get_handler(key, _clean_generic)(key, value, str(value))
+        if cleaned_value is not SKIP_FIELD:
+            cleaned_data[key] = cleaned_value
+    
+    return cleaned_data
+
+
+# 压缩模式可以删除的冗余字段 -> 与之重复的保留字段，只有取值确实相同时才删除
+# subcomponet/subcompontid 取值为 "undefined"，在清洗时已经被丢弃
+COMPACT_RULES = {
+    'process_val': ('value',),
+    'keyword': ('hostip',),
+    'kpi': ('kpiid', 'kpiname'),
+    # 仪表盘的_source中使用branchnamecn，因此保留branchnamecn、删除mngtorg
+    'mngtorg': ('branchnamecn',),
+}
+
+
+def compact_document(source, fields=tuple(COMPACT_RULES)):
+    """
+    删除与其他字段重复的冗余字段，fields为要删除的字段名（COMPACT_RULES的键）
+    """
+    for field in fields:
+        if field not in source:
+            continue
+        kept = [source.get(name) for name in COMPACT_RULES[field]]
+        if source[field] == (kept if len(kept) > 1 else kept[0]):
+            del source[field]
+    return source
+
+
+# 按时间分区时索引名中的日期格式，与仪表盘ESFindIndex的day/month索引一致，按UTC日期划分
+PARTITION_FORMATS = {'day': '%Y.%m.%d', 'month': '%Y.%m'}
+DEFAULT_PARTITION_PREFIX = 'u2performance-'
+
+# (索引名模式, 小时起点) -> 分区索引名
+_PARTITION_NAMES = {}
+
+
+def is_partitioned_index(target_index):
+    """
+    目标索引名中包含strftime日期格式（如 u2performance-%Y.%m.%d）时按时间分区
+    """
+    return '%' in target_index
+
+
+def partition_prefix(index_pattern):
+    return index_pattern.split('%', 1)[0]
+
+
+def partition_read_alias(index_pattern):
+    """
+    分区索引默认的读别名: 去掉前缀末尾的分隔符，如 u2performance-%Y.%m.%d -> u2performance
+    """
+    return partition_prefix(index_pattern).rstrip('-_.')
+
+
+def document_clock(source):
+    """
+    文档的采集时间（UTC秒），优先取clock，其次取@timestamp，都没有时返回None
+    """
+    clock = source.get('clock')
+    if isinstance(clock, (int, float)):
+        return int(clock)
+    timestamp = source.get('@timestamp')
+    if isinstance(timestamp, str):
+        try:
+            return int(datetime.strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            pass
+    return None
+
+
+def partition_index_name(index_pattern, source):
+    """
+    根据文档的采集时间确定分区索引名，没有采集时间的文档写入导入当天的分区
+    """
+    clock = document_clock(source)
+    if clock is None:
+        clock = int(time.time())
+    key = (index_pattern, clock - clock % 3600)
+    index_name = _PARTITION_NAMES.get(key)
+    if index_name is None:
+        index_name = _PARTITION_NAMES[key] = datetime.fromtimestamp(key[1], timezone.utc).strftime(index_pattern)
+    return index_name
+
+
+def partition_template_body(index_pattern, read_alias, body=None):
+    """
+    分区索引的索引模板：映射和配置取自body（默认INDEX_BODY），新建的分区自动加入读别名
+    """
+    body = body or INDEX_BODY
+    return {
+        'index_patterns': [f"{partition_prefix(index_pattern)}*"],
+        'settings': body['settings'],
+        'mappings': body['mappings'],
+        'aliases': {read_alias: {}}
+    }
+
+
+def partition_end(start, date_format):
+    """
+    分区的结束时间（下一个分区的起点），date_format为分区索引名中的日期格式
+    """
+    if '%d' in date_format:
+        return start + timedelta(days=1)
+    if '%m' in date_format:
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start.replace(year=start.year + 1)
+
+
+def expired_partitions(index_names, index_pattern, cutoff):
+    """
+    从index_names中找出整个分区都早于cutoff（日期）的分区索引
+    名称不符合分区格式的索引（如汇总索引）不会被选中
+    """
+    prefix = partition_prefix(index_pattern)
+    date_format = index_pattern[len(prefix):]
+    expired = []
+    for index_name in sorted(index_names):
+        if not index_name.startswith(prefix):
+            continue
+        try:
+            start = datetime.strptime(index_name[len(prefix):], date_format)
+        except ValueError:
+            continue
+        if partition_end(start, date_format).date() <= cutoff:
+            expired.append(index_name)
+    return expired
+
+
+def build_es_document(doc, target_index='u2performance_for_test', stable_id=False, compact=None):
+    """
+    将导出文件中的一条记录转换为bulk动作
+    stable_id为True时，没有_id的记录根据内容生成稳定的ID，保证重复导入幂等
+    compact指定时删除其中列出的冗余字段（见COMPACT_RULES）
+    target_index包含日期格式时按采集时间写入对应的分区索引
+    """
+    # 使用指定的索引名称，而不是从文档中获取
+    doc_id = doc.get('_id')
+    source = doc.get('_source', {})
+    if not doc_id and stable_id:
+        doc_id = derive_document_id(source)
+    
+    # 数据清洗
+    cleaned_source = clean_document(source)
+    if compact:
+        compact_document(cleaned_source, compact)
+    
+    # 添加导入时间戳
+    cleaned_source['import_timestamp'] = datetime.now().isoformat()
+    
+    # 构建ES文档 (移除_type字段，因为ES 8.x不支持)
+    es_doc = {
+        '_index': partition_index_name(target_index, cleaned_source) if '%' in target_index else target_index,
+        '_source': cleaned_source
+    }
+    
+    # 如果有ID，则添加
+    if doc_id:
+        es_doc['_id'] = doc_id
+    
+    return es_doc
+
+
+def process_document_batch(docs, target_index='u2performance_for_test', stable_id=False, compact=None):
+    """
+    处理一批原始记录，供进程池中的清洗进程调用
+    """
+    processed_docs = []
+    for doc in docs:
+        try:
+            processed_docs.append(build_es_document(doc, target_index, stable_id, compact))
+        except Exception as e:
+            logger.error(f"处理文档失败: {type(e).__name__}: {e}")
+    return processed_docs
+
+
+# 索引映射配置
+INDEX_BODY = {
+    "mappings": {
+        "properties": {
+            "hostip": {"type": "ip"},
+            "hostname": {"type": "keyword"},
+            "process_val": {"type": "double"},
+            "value": {"type": "double"},
+            "ns": {"type": "long"},
+            "clock": {"type": "long"},
+            "ts": {"type": "long"},
+            "__PROCESS_TIME__": {"type": "long"},
+            "itemid": {"type": "long"},
+            "@timestamp": {"type": "date"},
+            "import_timestamp": {"type": "date"},
+            "agent": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+            "mngtorg": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+            "type": {"type": "keyword"},
+            "componetype": {"type": "keyword"},
+            "appname": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+            "bizarea": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+            "vendor": {"type": "keyword"},
+            "kpi": {"type": "keyword"},
+            "moname": {"type": "text", "fields": {"keyword": {"type": "keyword"}}}
+        }
+    },
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "refresh_interval": "1s"
+    }
+}
+
+
+# 小时汇总索引的映射配置
+ROLLUP_INDEX_BODY = {
+    "mappings": {
+        "properties": {
+            "hostname": {"type": "keyword"},
+            "hostip": {"type": "ip"},
+            "appcode": {"type": "keyword"},
+            "kpiid": {"type": "keyword"},
+            "kpiname": {"type": "keyword"},
+            "clock": {"type": "long"},
+            "@timestamp": {"type": "date"},
+            "min": {"type": "double"},
+            "max": {"type": "double"},
+            "avg": {"type": "double"},
+            "sum": {"type": "double"},
+            "count": {"type": "long"},
+            "last": {"type": "double"},
+            "last_clock": {"type": "long"}
+        }
+    },
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "refresh_interval": "1s"
+    }
+}
+
+# 批量加载模式下临时使用的索引设置：关闭刷新、不写副本、translog异步落盘
+BULK_LOAD_SETTINGS = {
+    'index.refresh_interval': '-1',
+    'index.number_of_replicas': 0,
+    'index.translog.durability': 'async'
+}
+
+# 预热索引时执行的查询，与仪表盘的聚合方式一致
+WARMUP_QUERY = {
+    "size": 0,
+    "aggs": {
+        "group_by_device": {
+            "terms": {"field": "hostname", "size": 1000},
+            "aggs": {
+                "time_series": {"histogram": {"field": "clock", "interval": 3600, "min_doc_count": 0}}
+            }
+        }
+    }
+}
+
+class ImportCheckpoint:
+    """
+    断点续传进度文件（与数据文件同目录的sidecar文件）
+    记录已被ES确认的连续批次所对应的文件字节偏移，续传时直接从该偏移开始解析
+    """
+
+    def __init__(self, json_file_path, target_index, checkpoint_path=None):
+        self.path = checkpoint_path or f"{json_file_path}.checkpoint"
+        self.json_file_path = os.path.abspath(json_file_path)
+        self.target_index = target_index
+        self.offset = 0
+        self.read = 0
+        self.completed = False
+        # 已发出但尚未确认的批次: 批次号 -> (结束偏移, 累计读取数)
+        self._pending = {}
+        # 已完成但前面还有未完成批次的结果: 批次号 -> 是否已确认（成功，或失败的记录都已写入死信文件）
+        self._finished = {}
+        self._next_batch = 1
+        self._blocked = False
+
+    def load(self):
+        """
+        读取进度文件，返回是否可以从中断处继续
+        """
+        if not os.path.exists(self.path):
+            logger.info(f"未找到进度文件 {self.path}，从头开始导入")
+            return False
+        
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"进度文件 {self.path} 无法读取，从头开始导入: {e}")
+            return False
+        
+        if state.get('file') != self.json_file_path or state.get('index') != self.target_index:
+            logger.warning(f"进度文件 {self.path} 与本次导入的文件或索引不一致，从头开始导入")
+            return False
+        # 压缩文件的偏移为解压后的偏移，可能大于文件大小
+        compressed = is_compressed_input(self.json_file_path)
+        if not compressed and state.get('offset', 0) > os.path.getsize(self.json_file_path):
+            logger.warning(f"进度文件 {self.path} 中的偏移超出文件大小，从头开始导入")
+            return False
+        
+        self.offset = state.get('offset', 0)
+        self.read = state.get('read', 0)
+        self.completed = state.get('completed', False)
+        return True
+
+    def save(self):
+        """
+        原子地写入进度文件
+        """
+        state = {
+            'file': self.json_file_path,
+            'index': self.target_index,
+            'offset': self.offset,
+            'read': self.read,
+            'completed': self.completed,
+            'updated': datetime.now().isoformat()
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def track(self, batches, stats):
+        """
+        包装批次生成器，记录每个批次结束处的文件偏移
+        批次号与run_batches中的编号一致，都从1开始
+        """
+        for batch_no, batch in enumerate(batches, 1):
+            self._pending[batch_no] = (stats['offset'], stats['read'])
+            yield batch
+
+    def batch_done(self, batch_no, success, failed, dead_lettered=0):
+        """
+        批次完成回调：按批次顺序推进进度，失败的记录都已写入死信文件的批次视为已确认，
+        遇到有记录失败且未写入死信文件的批次后不再推进
+        """
+        self._finished[batch_no] = failed <= dead_lettered
+        advanced = False
+        while not self._blocked and self._next_batch in self._finished:
+            if not self._finished.pop(self._next_batch):
+                # 续传时从失败批次重新开始，其后已成功的批次会以相同ID再次写入
+                self._blocked = True
+                break
+            self.offset, self.read = self._pending.pop(self._next_batch)
+            self._next_batch += 1
+            advanced = True
+        
+        if advanced:
+            self.save()
+
+    def finish(self, stats):
+        """
+        导入结束时调用，所有批次都已确认时标记为已完成
+        """
+        if self._blocked or self._pending:
+            logger.warning(f"导入存在失败批次，进度停在字节偏移 {self.offset}，可使用 --resume 继续")
+            return
+        self.offset = stats.get('offset', self.offset)
+        self.read = stats.get('read', self.read)
+        self.completed = True
+        self.save()
+
+
+# bulk请求被拒绝时的重试参数，与原先传给helpers.bulk的max_retries/initial_backoff/max_backoff相同
+BULK_MAX_RETRIES = 3
+BULK_INITIAL_BACKOFF = 2
+BULK_MAX_BACKOFF = 600
+
+# 可重试的失败：集群繁忙、网关/节点暂时不可用，以及对应的错误类型；其余失败直接写入死信文件
+TRANSIENT_STATUSES = (429, 502, 503, 504)
+TRANSIENT_ERROR_TYPES = ('es_rejected_execution_exception', 'circuit_breaking_exception',
+                         'unavailable_shards_exception', 'process_cluster_event_timeout_exception')
+
+# 默认的死信文件，只在有记录最终失败时创建
+DEFAULT_DEAD_LETTER_FILE = 'es_import.dead.ndjson'
+
+# 单个bulk请求的字节数上限，低于ES默认的http.max_content_length(100mb)
+MAX_BULK_BYTES = 90 * 1024 * 1024
+
+
+# bulk请求体使用的JSON序列化库，序列化阶段的吞吐量取决于它
+JSON_ENCODER = 'orjson' if orjson is not None else 'json'
+
+
+def log_json_encoder():
+    """
+    启动时记录使用的JSON序列化库，便于对照不同环境的导入和基准测试结果
+    """
+    if orjson is not None:
+        logger.info(f"bulk请求体序列化: orjson {getattr(orjson, '__version__', '')}".rstrip())
+    else:
+        logger.info("bulk请求体序列化: 标准库json（未安装orjson，序列化较慢，可执行 pip install orjson）")
+
+
+def encode_json(obj):
+    """
+    序列化为紧凑的UTF-8 JSON（bytes），安装了orjson时使用orjson
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson不支持的类型（如超过64位的整数）交给标准库处理
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# 各索引的动作行前缀，避免每条文档都构造并序列化动作字典
+_ACTION_PREFIXES = {}
+
+
+def serialize_bulk_entry(es_doc, target_index='u2performance_for_test'):
+    """
+    把一个bulk动作序列化为NDJSON格式的动作行和文档行（bytes）
+    """
+    index = es_doc.get('_index', target_index)
+    prefix = _ACTION_PREFIXES.get(index)
+    if prefix is None:
+        prefix = _ACTION_PREFIXES[index] = b'{"index":{"_index":' + encode_json(index)
+    doc_id = es_doc.get('_id')
+    if doc_id:
+        return b''.join((prefix, b',"_id":', encode_json(doc_id), b'}}\n', encode_json(es_doc['_source']), b'\n'))
+    return b''.join((prefix, b'}}\n', encode_json(es_doc['_source']), b'\n'))
+
+
+def is_transient_item(item_result):
+    """
+    判断bulk响应中的单条结果是否为暂时性失败（可重试）
+    """
+    if item_result.get('status') in TRANSIENT_STATUSES:
+        return True
+    error = item_result.get('error')
+    return isinstance(error, dict) and error.get('type') in TRANSIENT_ERROR_TYPES
+
+
+def is_transient_error(error):
+    """
+    判断整个bulk请求抛出的异常是否可重试：连接失败或超时、429/502/503/504
+    请求过大（413）不是暂时性失败，由BulkBatchRun拆小后重发
+    """
+    if isinstance(error, ESConnectionError):
+        return True
+    return getattr(error, 'status_code', None) in TRANSIENT_STATUSES
+
+
+def jittered_backoff(rejections):
+    """
+    第rejections次被拒绝后的等待秒数：指数退避，并在后一半区间内随机，
+    避免多个发送线程（或进程）在同一时刻一起重试
+    """
+    backoff = min(BULK_INITIAL_BACKOFF * 2 ** (rejections - 1), BULK_MAX_BACKOFF)
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class DeadLetterWriter:
+    """
+    死信文件：最终导入失败的记录按NDJSON追加写入，每行包含原索引、_id、清洗后的_source和失败原因，
+    可以用 replay 子命令重新导入。文件在第一次写入时创建；
+    每次写入在一次追加中完成，多个线程和多文件导入的多个进程可以共用同一个文件
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def to_record(entry, status, error):
+        """
+        把序列化后的bulk条目（动作行和文档行）还原为死信记录
+        """
+        action_line, source_line = entry.split(b'\n', 2)[:2]
+        action = json.loads(action_line)['index']
+        record = {'_index': action.get('_index')}
+        if action.get('_id'):
+            record['_id'] = action['_id']
+        record['_source'] = json.loads(source_line)
+        record['status'] = status
+        record['error'] = error
+        record['failed_at'] = datetime.now(timezone.utc).isoformat()
+        return record
+
+    def write(self, entries, status, error):
+        """
+        写入一组失败原因相同的条目
+        """
+        self.write_records([self.to_record(entry, status, error) for entry in entries])
+
+    def write_failures(self, failures):
+        """
+        写入bulk响应中永久失败的(条目, 结果)列表，每条使用各自的失败原因
+        """
+        self.write_records([self.to_record(entry, result.get('status'), result.get('error'))
+                            for entry, result in failures])
+
+    def write_records(self, records):
+        """
+        一次追加写入并同步到磁盘，返回时记录已经持久化，断点续传的进度可以越过这些记录
+        """
+        data = b''.join(encode_json(record) + b'\n' for record in records)
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.count += len(records)
+
+
+def iter_dead_letter_batches(dead_letter_path, batch_size=1000, indices=None):
+    """
+    读取死信文件，按batch_size组成可以直接发送的bulk批次（保留原索引和_id，不再清洗）
+    同一索引中_id相同的记录只发送第一条，同一记录被重复写入死信文件时不会重复导入
+    indices为集合时记录涉及的索引，用于重新导入后刷新
+    """
+    batch = []
+    seen = set()
+    for record in iter_json_documents(dead_letter_path):
+        if not record.get('_index') or not isinstance(record.get('_source'), dict):
+            logger.warning(f"跳过无效的死信记录: {str(record)[:200]}")
+            continue
+        if record.get('_id'):
+            key = (record['_index'], record['_id'])
+            if key in seen:
+                continue
+            seen.add(key)
+        if indices is not None:
+            indices.add(record['_index'])
+        batch.append({'_index': record['_index'], '_id': record.get('_id'), '_source': record['_source']})
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BulkBatchSizer:
+    """
+    默认的请求切分方式：每个批次的全部文档拼接为一个请求体整体发送
+    出现暂时性失败（429/es_rejected_execution_exception等）时按带随机抖动的指数退避，重试时直接复用已序列化的条目
+    多个发送线程共享同一个实例
+    """
+
+    def __init__(self):
+        self.rejections = 0
+        self._lock = threading.Lock()
+
+    def take(self, entries, max_entries=None):
+        """
+        取出待发送队列中的全部条目（指定max_entries时最多取这么多条），返回(请求体, 取出的条目列表)
+        """
+        if max_entries is None or max_entries >= len(entries):
+            chunk = list(entries)
+            entries.clear()
+        else:
+            chunk = [entries.popleft() for _ in range(max_entries)]
+        return b''.join(chunk), chunk
+
+    def on_success(self, took_ms):
+        with self._lock:
+            self.rejections = 0
+
+    def on_too_large(self, request_bytes):
+        """
+        请求过大（413）时调用，默认切分方式只由BulkBatchRun拆小当前批次
+        """
+
+    def on_rejected(self):
+        """
+        请求被拒绝时返回本次应等待的秒数
+        """
+        with self._lock:
+            self.rejections += 1
+            backoff = jittered_backoff(self.rejections)
+        logger.warning(f"bulk请求被拒绝，{backoff:.1f} 秒后重试")
+        return backoff
+
+    def split_response(self, chunk, response):
+        """
+        处理一次bulk响应，返回(成功数, 需要重试的条目, 失败的(条目, 结果)列表)
+        """
+        success = 0
+        failures = []
+        retry_entries = []
+        for entry, item in zip(chunk, response['items']):
+            result = next(iter(item.values()))
+            if result.get('status', 500) < 300:
+                success += 1
+            elif is_transient_item(result):
+                retry_entries.append(entry)
+            else:
+                failures.append((entry, result))
+                logger.error(f"导入失败: {item}")
+        
+        if retry_entries:
+            # 部分条目被拒绝说明集群已经有压力，不再增大请求
+            return success, retry_entries, failures
+        self.on_success(response.get('took', 0))
+        return success, retry_entries, failures
+
+
+class AdaptiveBatchSizer(BulkBatchSizer):
+    """
+    按字节数切分bulk请求，并根据ES的响应动态调整请求大小
+    ES返回的took低于目标延迟时逐步增大，超过目标延迟时缩小；
+    出现暂时性失败时减半并按带随机抖动的指数退避
+    """
+
+    def __init__(self, target_bytes, target_latency_ms=1000, min_bytes=None, max_bytes=MAX_BULK_BYTES):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes or max(16 * 1024, target_bytes // 16)
+        self.target_bytes = min(max(target_bytes, self.min_bytes), self.max_bytes)
+        self.target_latency_ms = target_latency_ms
+
+    def take(self, entries, max_entries=None):
+        """
+        从待发送队列头部取出若干条序列化后的文档，总字节数不超过当前目标（至少取一条），
+        指定max_entries时条数也不超过它；返回(请求体, 取出的条目列表)
+        """
+        chunk = [entries.popleft()]
+        size = len(chunk[0])
+        limit = self.target_bytes
+        while entries and size + len(entries[0]) <= limit and (max_entries is None or len(chunk) < max_entries):
+            entry = entries.popleft()
+            chunk.append(entry)
+            size += len(entry)
+        return b''.join(chunk), chunk
+
+    def on_success(self, took_ms):
+        """
+        请求成功后根据ES返回的took调整请求大小
+        """
+        with self._lock:
+            self.rejections = 0
+            if took_ms < self.target_latency_ms / 2:
+                self.target_bytes = min(int(self.target_bytes * 1.25), self.max_bytes)
+            elif took_ms > self.target_latency_ms:
+                self.target_bytes = max(int(self.target_bytes * 0.8), self.min_bytes)
+
+    def on_rejected(self):
+        """
+        请求被拒绝或过大时缩小请求，返回本次应等待的秒数
+        """
+        with self._lock:
+            self.target_bytes = max(self.target_bytes // 2, self.min_bytes)
+            self.rejections += 1
+            backoff = jittered_backoff(self.rejections)
+        logger.warning(f"bulk请求被拒绝，{backoff:.1f} 秒后重试，请求大小调整为 {self.target_bytes} 字节")
+        return backoff
+
+    def on_too_large(self, request_bytes):
+        """
+        请求过大（413）：ES的请求大小上限不会变化，之后的请求都不超过这次请求的一半
+        """
+        with self._lock:
+            self.max_bytes = max(request_bytes // 2, 1)
+            self.min_bytes = min(self.min_bytes, self.max_bytes)
+            self.target_bytes = min(self.target_bytes, self.max_bytes)
+        logger.warning(f"bulk请求过大（{request_bytes} 字节），请求大小上限调整为 {self.max_bytes} 字节")
+
+
+class HourlyRollup:
+    """
+    导入时按 hostname/appcode/kpiid 和小时汇总指标值（min/max/avg/last/count）
+    小时的划分与仪表盘中interval为3600的clock直方图一致
+    """
+
+    def __init__(self, interval=3600):
+        self.interval = interval
+        # (hostname, appcode, kpiid, 小时起点) -> 汇总值
+        self.buckets = {}
+
+    def add(self, source):
+        """
+        把一条清洗后的文档计入对应的小时汇总
+        """
+        value = source.get('value', source.get('process_val'))
+        clock = source.get('clock')
+        hostname = source.get('hostname')
+        if not isinstance(value, (int, float)) or not isinstance(clock, int) or not hostname:
+            return
+        
+        bucket_clock = clock - clock % self.interval
+        key = (hostname, source.get('appcode'), source.get('kpiid'), bucket_clock)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = {
+                'hostip': source.get('hostip'),
+                'kpiname': source.get('kpiname'),
+                'min': value,
+                'max': value,
+                'sum': value,
+                'count': 1,
+                'last': value,
+                'last_clock': clock
+            }
+            return
+        
+        bucket['min'] = min(bucket['min'], value)
+        bucket['max'] = max(bucket['max'], value)
+        bucket['sum'] += value
+        bucket['count'] += 1
+        if clock >= bucket['last_clock']:
+            bucket['last'] = value
+            bucket['last_clock'] = clock
+
+    def merge(self, other):
+        """
+        合并另一个HourlyRollup的汇总（如多文件导入时其他导入进程的结果）
+        """
+        for key, other_bucket in other.buckets.items():
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = dict(other_bucket)
+                continue
+            bucket['min'] = min(bucket['min'], other_bucket['min'])
+            bucket['max'] = max(bucket['max'], other_bucket['max'])
+            bucket['sum'] += other_bucket['sum']
+            bucket['count'] += other_bucket['count']
+            if other_bucket['last_clock'] >= bucket['last_clock']:
+                bucket['last'] = other_bucket['last']
+                bucket['last_clock'] = other_bucket['last_clock']
+
+    def track(self, batches):
+        """
+        包装批次生成器，在批次发送前计入汇总
+        """
+        for batch in batches:
+            for es_doc in batch:
+                self.add(es_doc['_source'])
+            yield batch
+
+    def iter_actions(self, index_name):
+        """
+        生成汇总文档的bulk动作，_id由维度和小时确定，重复导入同一批数据时覆盖而不是重复
+        """
+        for (hostname, appcode, kpiid, bucket_clock), bucket in self.buckets.items():
+            source = {
+                'hostname': hostname,
+                'appcode': appcode,
+                'kpiid': kpiid,
+                'clock': bucket_clock,
+                '@timestamp': datetime.fromtimestamp(bucket_clock, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                'avg': bucket['sum'] / bucket['count']
+            }
+            source.update(bucket)
+            yield {
+                '_index': index_name,
+                '_id': f"{hostname}|{appcode}|{kpiid}|{bucket_clock}",
+                '_source': {key: value for key, value in source.items() if value is not None}
+            }
+
+    def iter_batches(self, index_name, batch_size=1000):
+        """
+        按batch_size分批产出汇总文档
+        """
+        batch = []
+        for action in self.iter_actions(index_name):
+            batch.append(action)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class HighWatermark:
+    """
+    增量同步的高水位：目标索引中每个来源（默认itemid，即一台主机的一个监控项）已导入的最大采集时间
+    不晚于水位的原始记录在清洗前即被跳过；本轮导入的记录在commit()后才提高水位，
+    因此同一文件内顺序不严格的记录不会被误跳过
+    """
+
+    def __init__(self, key_field='itemid', time_field='clock'):
+        self.key_field = key_field
+        # key_field可以是 xxx.keyword 形式的聚合字段，原始记录中取 xxx
+        self.source_key = key_field[:-len('.keyword')] if key_field.endswith('.keyword') else key_field
+        self.time_field = time_field
+        self.marks = {}
+        self.pending = {}
+        self.skipped = 0
+
+    def load(self, es, index_name, page_size=1000):
+        """
+        用composite聚合分页查询每个来源的最大采集时间，索引不存在时水位为空
+        """
+        composite = {'size': page_size, 'sources': [{'key': {'terms': {'field': self.key_field}}}]}
+        body = {'size': 0, 'aggs': {'sources': {'composite': composite,
+                                                'aggs': {'latest': {'max': {'field': self.time_field}}}}}}
+        while True:
+            try:
+                response = es.search(index=index_name, body=body, request_timeout=600)
+            except NotFoundError:
+                break
+            result = response.get('aggregations', {}).get('sources')
+            if not result or not result['buckets']:
+                break
+            for bucket in result['buckets']:
+                latest = bucket['latest']['value']
+                if latest is not None:
+                    self.marks[str(bucket['key']['key'])] = int(latest)
+            if not result.get('after_key'):
+                break
+            composite['after'] = result['after_key']
+        logger.info(f"增量同步: {len(self.marks)} 个来源（{self.key_field}）的 {self.time_field} 水位")
+        return self
+
+    def is_new(self, doc):
+        """
+        判断一条原始记录是否晚于其来源的水位，缺少来源或时间字段的记录总是导入
+        """
+        source = doc.get('_source', {})
+        key = source.get(self.source_key)
+        value = source.get(self.time_field)
+        if key is None or value is None:
+            return True
+        try:
+            value = int(value)
+        except (ValueError, TypeError):
+            return True
+        key = str(key)
+        mark = self.marks.get(key)
+        if mark is not None and value <= mark:
+            self.skipped += 1
+            return False
+        if value > self.pending.get(key, value - 1):
+            self.pending[key] = value
+        return True
+
+    def commit(self):
+        """
+        把本轮导入的记录计入水位，之后再读到不晚于这些记录的数据时跳过
+        """
+        marks = self.marks
+        for key, value in self.pending.items():
+            if value > marks.get(key, value - 1):
+                marks[key] = value
+        self.pending = {}
+
+
+def tail_json_lines(json_file_path, poll_interval=1.0, start_offset=0, stop_event=None):
+    """
+    跟踪持续追加的NDJSON文件，产出(行结束处的字节偏移, 文档)
+    读到文件末尾时产出None（供调用方发送未满的批次），然后每隔poll_interval秒检查新数据；
+    只处理以换行结束的完整行，文件被截断或替换（轮转）时从头开始读取
+    """
+    offset = start_offset
+    pending = b''
+    f = None
+    inode = None
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if f is None:
+                f = open(json_file_path, 'rb')
+                inode = os.fstat(f.fileno()).st_ino
+                f.seek(offset)
+            
+            chunk = f.readline()
+            if chunk:
+                pending += chunk
+                if not pending.endswith(b'\n'):
+                    continue
+                line, pending = pending, b''
+                line_start = offset
+                offset += len(line)
+                if line_start == 0 and line.startswith(codecs.BOM_UTF8):
+                    line = line[len(codecs.BOM_UTF8):]
+                line = line.strip()
+                if not line:
+                    continue
+                if line_start == 0 and line.startswith(b'['):
+                    raise ValueError(f"跟踪模式只支持NDJSON格式: {json_file_path}")
+                try:
+                    yield offset, json.loads(line)
+                except ValueError as e:
+                    logger.error(f"字节偏移 {line_start} 处的行不是合法的JSON，已跳过: {e}")
+                continue
+            
+            yield None
+            time.sleep(poll_interval)
+            try:
+                stat = os.stat(json_file_path)
+            except FileNotFoundError:
+                continue
+            if stat.st_ino != inode or stat.st_size < offset + len(pending):
+                logger.info(f"文件被截断或替换，从头开始读取: {json_file_path}")
+                f.close()
+                f = None
+                offset = 0
+                pending = b''
+    finally:
+        if f is not None:
+            f.close()
+
+
+class SampleDeduplicator:
+    """
+    按 (mo, kpiid, clock) 去除整个数据流中重复的采样（如相互重叠的导出文件）
+    使用固定大小的Bloom过滤器，内存只与预计的采样数有关；误判率为error_rate，
+    即约有该比例的新采样会被误认为重复而丢弃
+    shared为True时过滤器保存在共享内存中，传给导入进程池的初始化函数后，
+    多文件导入的所有导入进程共用同一个过滤器，相互重叠的文件之间也能去重
+    """
+
+    KEY_FIELDS = ('mo', 'kpiid', 'clock')
+
+    def __init__(self, capacity=10000000, error_rate=0.0001, shared=False):
+        self.capacity = capacity
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        size = (self.bits + 7) // 8
+        if shared:
+            self.buffer = multiprocessing.RawArray('B', size)
+            self.total = multiprocessing.RawValue('q', 0)
+            self.lock = multiprocessing.Lock()
+        else:
+            self.buffer = bytearray(size)
+            self.total = None
+            self.lock = threading.Lock()
+        self.array = memoryview(self.buffer).cast('B')
+        # 本进程检查的采样数和丢弃的重复数
+        self.seen = 0
+        self.duplicates = 0
+        logger.info(f"采样去重: 预计 {capacity} 条, 误判率 {error_rate}, 占用内存 "
+                    f"{size / 1024 / 1024:.1f} MB{'（导入进程共享）' if shared else ''}")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['array']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.array = memoryview(self.buffer).cast('B')
+
+    def add(self, key):
+        """
+        记录一个键，返回该键是否可能已经出现过
+        """
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        array = self.array
+        present = True
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.bits
+            mask = 1 << (position & 7)
+            if not array[position >> 3] & mask:
+                array[position >> 3] |= mask
+                present = False
+        return present
+
+    def is_duplicate(self, source):
+        """
+        判断一条清洗后的文档是否为重复采样，缺少键字段的文档不参与去重
+        """
+        values = [source.get(field) for field in self.KEY_FIELDS]
+        if any(value is None for value in values):
+            return False
+        self.seen += 1
+        if self.add('\x1f'.join(map(str, values)).encode('utf-8')):
+            self.duplicates += 1
+            return True
+        return False
+
+    def track(self, batches):
+        """
+        包装批次迭代器，去掉重复采样，整批都重复时不产出该批次
+        每个批次在锁内检查，多个导入进程同时遇到同一采样时只保留一条
+        """
+        for batch in batches:
+            with self.lock:
+                seen = self.seen
+                kept = [doc for doc in batch if not self.is_duplicate(doc['_source'])]
+                added = self.seen - seen
+                if self.total is not None:
+                    self.total.value += added
+                    total = self.total.value
+                else:
+                    total = self.seen
+            if total > self.capacity >= total - added:
+                logger.warning(f"采样数超过去重容量 {self.capacity}，误判率将升高，请增大 --dedupe-capacity")
+            if kept:
+                yield kept
+
+
+# 导入流程的各阶段：读取解析、清洗、序列化、bulk请求往返、ES报告的处理时间(took)、退避等待、限速等待
+METRIC_STAGES = ('read', 'clean', 'serialize', 'bulk', 'es_took', 'backoff', 'throttle')
+
+# bulk请求延迟（秒）、请求体大小（字节）和文档数的直方图分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024,
+                64 * 1024 * 1024)
+DOCS_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+class Histogram:
+    """
+    固定分桶的直方图，分桶含义与Prometheus相同（le为上界，含等于）
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self):
+        """
+        返回[(上界, 累计次数)]，最后一项的上界为+Inf
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in self.cumulative()}
+        }
+
+
+class IngestMetrics:
+    """
+    导入过程的分阶段耗时、计数和bulk请求直方图，多个线程共享同一个实例
+    导入结束后可以输出为JSON报告，导入期间也可以通过Prometheus文本格式的HTTP接口查看
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stage_seconds = dict.fromkeys(METRIC_STAGES, 0.0)
+        self.counters = {
+            'documents_read': 0,
+            'documents_indexed': 0,
+            'documents_failed': 0,
+            'bulk_requests': 0,
+            'bulk_retries': 0,
+            'bulk_bytes': 0,
+            'documents_dead_lettered': 0,
+            'clean_cache_hits': 0,
+            'clean_cache_misses': 0,
+            'clean_cache_evictions': 0
+        }
+        # 各字段的清洗缓存计数 {字段名: [命中, 未命中]}
+        self.clean_cache = {}
+        self.request_latency = Histogram(LATENCY_BUCKETS)
+        self.request_bytes = Histogram(SIZE_BUCKETS)
+        self.request_docs = Histogram(DOCS_BUCKETS)
+
+    def __getstate__(self):
+        # 多文件导入时各导入进程的指标传回主进程汇总，锁不能序列化
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def merge(self, other):
+        """
+        把另一个IngestMetrics（如其他导入进程的指标）累加到本实例，开始时间取较早的一个
+        """
+        with self._lock:
+            self.started = min(self.started, other.started)
+            for stage, seconds in other.stage_seconds.items():
+                self.stage_seconds[stage] += seconds
+            for name, value in other.counters.items():
+                self.counters[name] += value
+            for field, (hits, misses) in other.clean_cache.items():
+                total = self.clean_cache.setdefault(field, [0, 0])
+                total[0] += hits
+                total[1] += misses
+            self.request_latency.merge(other.request_latency)
+            self.request_bytes.merge(other.request_bytes)
+            self.request_docs.merge(other.request_docs)
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def add_cache_counts(self, counts, evictions=0):
+        """
+        累加清洗缓存的命中计数，counts为 {字段名: [命中, 未命中]}
+        """
+        with self._lock:
+            for field, (hits, misses) in counts.items():
+                total = self.clean_cache.setdefault(field, [0, 0])
+                total[0] += hits
+                total[1] += misses
+                self.counters['clean_cache_hits'] += hits
+                self.counters['clean_cache_misses'] += misses
+            self.counters['clean_cache_evictions'] += evictions
+
+    def cache_hit_rate(self):
+        """
+        清洗缓存的总命中率，没有查询过缓存时返回None
+        """
+        lookups = self.counters['clean_cache_hits'] + self.counters['clean_cache_misses']
+        return self.counters['clean_cache_hits'] / lookups if lookups else None
+
+    def observe_request(self, seconds, size, docs, took_ms=None):
+        """
+        记录一次bulk请求的往返时间、请求体大小、文档数和ES返回的took
+        """
+        with self._lock:
+            self.stage_seconds['bulk'] += seconds
+            if took_ms is not None:
+                self.stage_seconds['es_took'] += took_ms / 1000
+            self.counters['bulk_requests'] += 1
+            self.counters['bulk_bytes'] += size
+            self.request_latency.observe(seconds)
+            self.request_bytes.observe(size)
+            self.request_docs.observe(docs)
+
+    def to_dict(self):
+        with self._lock:
+            elapsed = time.time() - self.started
+            return {
+                'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                'elapsed_seconds': round(elapsed, 3),
+                'docs_per_second': round(self.counters['documents_indexed'] / elapsed, 1) if elapsed else None,
+                'stage_seconds': {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()},
+                'counters': dict(self.counters),
+                'clean_cache': {field: {'hits': hits, 'misses': misses,
+                                        'hit_rate': round(hits / (hits + misses), 4)}
+                                for field, (hits, misses) in sorted(self.clean_cache.items())},
+                'histograms': {
+                    'bulk_request_seconds': self.request_latency.to_dict(),
+                    'bulk_request_bytes': self.request_bytes.to_dict(),
+                    'bulk_request_docs': self.request_docs.to_dict()
+                }
+            }
+
+    def to_prometheus(self, prefix='es_import'):
+        """
+        输出Prometheus文本格式
+        """
+        lines = [f'# TYPE {prefix}_stage_seconds_total counter']
+        with self._lock:
+            for stage, seconds in self.stage_seconds.items():
+                lines.append(f'{prefix}_stage_seconds_total{{stage="{stage}"}} {seconds}')
+            for name, value in self.counters.items():
+                lines.append(f'# TYPE {prefix}_{name}_total counter')
+                lines.append(f'{prefix}_{name}_total {value}')
+            for name, index in (('clean_cache_field_hits', 0), ('clean_cache_field_misses', 1)):
+                lines.append(f'# TYPE {prefix}_{name}_total counter')
+                for field, counts in self.clean_cache.items():
+                    lines.append(f'{prefix}_{name}_total{{field="{field}"}} {counts[index]}')
+            for name, histogram in (('bulk_request_seconds', self.request_latency),
+                                    ('bulk_request_bytes', self.request_bytes),
+                                    ('bulk_request_docs', self.request_docs)):
+                lines.append(f'# TYPE {prefix}_{name} histogram')
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else bound
+                    lines.append(f'{prefix}_{name}_bucket{{le="{le}"}} {count}')
+                lines.append(f'{prefix}_{name}_sum {histogram.sum}')
+                lines.append(f'{prefix}_{name}_count {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        各阶段耗时的一行摘要，用于导入结束时的日志
+        """
+        names = {'read': '读取解析', 'clean': '清洗', 'serialize': '序列化', 'bulk': 'bulk请求',
+                 'es_took': 'ES处理', 'backoff': '退避等待', 'throttle': '限速等待'}
+        with self._lock:
+            summary = ', '.join(f"{names[stage]} {seconds:.2f} 秒" for stage, seconds in self.stage_seconds.items())
+            hit_rate = self.cache_hit_rate()
+            if hit_rate is not None:
+                summary += f", 清洗缓存命中率 {hit_rate:.1%}（淘汰 {self.counters['clean_cache_evictions']} 次）"
+            return summary
+
+    def write_report(self, report_path, files=None):
+        """
+        写出JSON报告，files为多文件导入时各文件的导入结果
+        """
+        report = self.to_dict()
+        if files is not None:
+            report['files'] = files
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"导入指标报告已保存: {report_path}")
+
+
+class RateLimiter:
+    """
+    全局限速（条/秒），下一次允许发送的时间保存在共享内存中，
+    传给导入进程池的初始化函数后，所有导入进程共用同一个限速
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.next_time = multiprocessing.Value('d', 0.0)
+
+    def reserve(self, amount):
+        """
+        预约发送amount条文档，返回需要等待的秒数
+        """
+        with self.next_time.get_lock():
+            now = time.monotonic()
+            start = max(now, self.next_time.value)
+            self.next_time.value = start + amount / self.rate
+        return start - now
+
+
+def start_metrics_server(metrics, port, host='127.0.0.1'):
+    """
+    在后台线程中启动Prometheus指标接口（GET /metrics），返回服务对象
+    默认只监听本机，需要从其他机器抓取时指定host（如 0.0.0.0）
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"指标接口已启动: http://{host}:{port}/metrics")
+    return server
+
+
+def timed_document_batch(docs, target_index='u2performance_for_test', stable_id=False, compact=None):
+    """
+    在清洗进程中处理一批记录，同时返回耗时和清洗缓存的命中计数，供主进程汇总
+    """
+    started = time.perf_counter()
+    processed_docs = process_document_batch(docs, target_index, stable_id, compact)
+    return processed_docs, time.perf_counter() - started, take_cleaning_cache_counts()
+
+
+class BulkBatchRun:
+    """
+    一个批次的bulk发送过程，同步与异步导入器共用，导入器只负责发送请求和等待：
+    文档预先序列化为NDJSON后直接作为请求体发送，由导入器的batch_sizer决定每个请求包含哪些条目；
+    暂时性失败（429、503、连接失败等）的请求和条目按带抖动的退避用已序列化的内容重试，
+    请求过大（413）时把条数减半后立即重发，只有单条记录仍然过大时才放弃，
+    其余失败和重试耗尽的条目计入失败数，并连同失败原因写入死信文件（dead_letter）
+    """
+
+    def __init__(self, importer, batch, batch_no, target_index='u2performance_for_test'):
+        self.importer = importer
+        self.sizer = importer.batch_sizer
+        self.metrics = importer.metrics
+        self.batch_no = batch_no
+        started = time.perf_counter()
+        self.entries = deque(serialize_bulk_entry(doc, target_index) for doc in batch)
+        self.metrics.add_time('serialize', time.perf_counter() - started)
+        self.payload = b''
+        self.chunk = []
+        self.success_count = 0
+        self.error_count = 0
+        self.dead_lettered = 0
+        self.retries = 0
+        # 收到413后每个请求的最大条数
+        self.max_entries = None
+
+    def take(self):
+        """
+        取出下一个请求包含的条目，返回(请求体, 按全局限速发送前应等待的秒数)，等待时间计入指标
+        """
+        self.payload, self.chunk = self.sizer.take(self.entries, self.max_entries)
+        throttle = 0
+        if self.importer.rate_limiter:
+            throttle = self.importer.rate_limiter.reserve(len(self.chunk))
+            if throttle > 0:
+                self.metrics.add_time('throttle', throttle)
+        return self.payload, throttle
+
+    def retry(self, entries):
+        """
+        把条目放回待发送队列的最前面，返回应等待的秒数，等待时间计入指标
+        """
+        self.retries += 1
+        self.entries.extendleft(reversed(entries))
+        backoff = self.sizer.on_rejected()
+        self.metrics.count('bulk_retries')
+        self.metrics.add_time('backoff', backoff)
+        return backoff
+
+    def on_error(self, error, elapsed):
+        """
+        整个请求抛出异常：可重试时返回应等待的秒数，否则整个请求计入失败并返回None
+        集群繁忙、节点暂时不可用或连接失败时退避重试；413为请求过大，条数减半后立即重发
+        """
+        self.metrics.observe_request(elapsed, len(self.payload), len(self.chunk))
+        if getattr(error, 'status_code', None) == 413 and len(self.chunk) > 1:
+            self.max_entries = len(self.chunk) // 2
+            self.sizer.on_too_large(len(self.payload))
+            logger.warning(f"bulk请求过大（{len(self.chunk)} 条），拆分为每个请求最多 {self.max_entries} 条后重发")
+            self.entries.extendleft(reversed(self.chunk))
+            self.metrics.count('bulk_retries')
+            return 0
+        if is_transient_error(error) and self.retries < BULK_MAX_RETRIES:
+            return self.retry(self.chunk)
+        logger.error(f"批量导入失败: {error}")
+        self.error_count += len(self.chunk)
+        self.dead_lettered += self.importer.give_up(self.chunk, getattr(error, 'status_code', None), str(error))
+        return None
+
+    def on_response(self, response, elapsed):
+        """
+        处理bulk响应：只重试暂时性失败的条目，需要重试时返回应等待的秒数，否则返回None
+        """
+        self.metrics.observe_request(elapsed, len(self.payload), len(self.chunk), response.get('took'))
+        success, retry_entries, failures = self.sizer.split_response(self.chunk, response)
+        self.success_count += success
+        self.error_count += len(failures)
+        self.dead_lettered += self.importer.give_up_failures(failures)
+        if not retry_entries:
+            self.retries = 0
+            return None
+        if self.retries < BULK_MAX_RETRIES:
+            return self.retry(retry_entries)
+        logger.error(f"{len(retry_entries)} 条记录重试 {BULK_MAX_RETRIES} 次后仍被拒绝")
+        self.error_count += len(retry_entries)
+        self.dead_lettered += self.importer.give_up(retry_entries, 429, f"重试 {BULK_MAX_RETRIES} 次后仍被拒绝")
+        return None
+
+    def finish(self):
+        """
+        记录批次结果，返回(成功数, 失败数, 已写入死信文件的失败数)
+        """
+        self.metrics.count('documents_indexed', self.success_count)
+        self.metrics.count('documents_failed', self.error_count)
+        logger.info(f"批次 {self.batch_no}: 成功 {self.success_count} 条，失败 {self.error_count} 条"
+                    + (f"（{self.dead_lettered} 条已写入死信文件）" if self.dead_lettered else ""))
+        return self.success_count, self.error_count, self.dead_lettered
+
+
+class BaseImporter:
+    """
+    同步与异步导入器共用的部分：连接配置、文档清洗和批次组装，不涉及ES请求
+    """
+
+    def __init__(self, metrics=None, rate_limiter=None, dead_letter=None):
+        # 默认每个批次整体发送，import_data根据batch_bytes替换为按字节切分
+        self.batch_sizer = BulkBatchSizer()
+        self.metrics = metrics or IngestMetrics()
+        self.rate_limiter = rate_limiter
+        self.dead_letter = dead_letter
+
+    @staticmethod
+    def build_es_config(es_host='localhost', es_port=9200, es_user=None, es_password=None, max_connections=10):
+        """
+        构建ES连接配置
+        """
+        es_config = {
+            'host': es_host,
+            'port': es_port,
+            'timeout': 30,
+            'max_retries': 3,
+            'retry_on_timeout': True,
+            'maxsize': max_connections
+        }
+        
+        if es_user and es_password:
+            es_config['http_auth'] = (es_user, es_password)
+        
+        return es_config
+
+    def give_up(self, entries, status, error):
+        """
+        放弃重试一组条目，配置了死信文件时连同失败原因写入，返回已写入死信文件的条数
+        """
+        if not self.dead_letter or not entries:
+            return 0
+        try:
+            self.dead_letter.write(entries, status, error)
+        except Exception as e:
+            logger.error(f"写入死信文件失败 {self.dead_letter.path}: {e}")
+            return 0
+        self.metrics.count('documents_dead_lettered', len(entries))
+        return len(entries)
+
+    def give_up_failures(self, failures):
+        """
+        把bulk响应中永久失败的条目按各自的失败原因写入死信文件，返回已写入的条数
+        """
+        if not self.dead_letter or not failures:
+            return 0
+        try:
+            self.dead_letter.write_failures(failures)
+        except Exception as e:
+            logger.error(f"写入死信文件失败 {self.dead_letter.path}: {e}")
+            return 0
+        self.metrics.count('documents_dead_lettered', len(failures))
+        return len(failures)
+
+    @staticmethod
+    def production_settings(index_settings):
+        """
+        从get_settings的返回结果中取出批量加载模式会修改的设置项
+        返回{索引名: {设置项: 原值}}，未显式设置的项为None，恢复时即重置为ES默认值
+        """
+        return {
+            index_name: {key: info['settings'].get(key) for key in BULK_LOAD_SETTINGS}
+            for index_name, info in index_settings.items()
+        }
+
+    def clean_and_validate_data(self, doc_source):
+        """
+        数据清洗和验证，使用正则表达式处理
         """
-        初始化ES连接
+        return clean_document(doc_source)
+
+    def process_document(self, doc, target_index='u2performance_for_test', stable_id=False, compact=None):
         """
-        self.es_config = {
-            'host': es_host,
-            'port': es_port,
-            'timeout': 30,
-            'max_retries': 3,
-            'retry_on_timeout': True
-        }
+        处理单个文档
+        """
+        try:
+            return build_es_document(doc, target_index, stable_id, compact)
+        except Exception as e:
+            logger.error(f"处理文档失败: {type(e).__name__}: {e}")
+            return None
+
+    def open_checkpoint(self, json_file_path, target_index, resume=False):
+        """
+        创建进度文件对象，resume为True时读取已有进度
+        返回(进度对象, 起始字节偏移, 已读取记录数)
+        """
+        checkpoint = ImportCheckpoint(json_file_path, target_index)
+        if resume and checkpoint.load():
+            if checkpoint.completed:
+                logger.info(f"进度文件显示该文件已全部导入完成: {checkpoint.path}")
+            else:
+                logger.info(f"从断点继续: 跳过已完成的 {checkpoint.read} 条记录（字节偏移 {checkpoint.offset}）")
+            return checkpoint, checkpoint.offset, checkpoint.read
+        return checkpoint, 0, 0
+
+    def iter_batches(self, json_file_path, batch_size=1000, target_index='u2performance_for_test', stats=None,
+                     clean_workers=1, start_offset=0, stable_id=False, compact=None, doc_filter=None):
+        """
+        流式读取并处理文档，按batch_size产出批次
+        stats字典用于回传已读取的记录数('read')和最后一个批次结束处的字节偏移('offset')，
+        clean_workers大于1时在进程池中清洗，compact为压缩模式要删除的冗余字段
+        doc_filter对原始记录返回False时在清洗前跳过该记录（增量同步），跳过的记录不计入读取数
+        """
+        if stats is None:
+            stats = {}
+        stats.setdefault('read', 0)
+        stats['offset'] = start_offset
         
-        if es_user and es_password:
-            self.es_config['http_auth'] = (es_user, es_password)
+        documents = iter_json_documents(json_file_path, start_offset=start_offset, with_offsets=True)
+        if doc_filter:
+            documents = ((offset, doc) for offset, doc in documents if doc_filter(doc))
+        if clean_workers > 1:
+            yield from self._iter_batches_in_pool(documents, batch_size, target_index, stats, clean_workers,
+                                                  stable_id, compact)
+            return
+        
+        clock = time.perf_counter
+        read_time = 0.0
+        clean_time = 0.0
+        batch_read = stats['read']
+        batch = []
+        started = clock()
+        for offset, doc in documents:
+            parsed = clock()
+            read_time += parsed - started
+            stats['read'] += 1
+            stats['offset'] = offset
+            processed_doc = self.process_document(doc, target_index, stable_id, compact)
+            if processed_doc:
+                batch.append(processed_doc)
+            
+            if stats['read'] % 1000 == 0:
+                logger.info(f"已处理 {stats['read']} 条记录...")
+            
+            started = clock()
+            clean_time += started - parsed
+            if len(batch) >= batch_size:
+                self._record_read(stats['read'] - batch_read, read_time, clean_time)
+                read_time = clean_time = 0.0
+                batch_read = stats['read']
+                yield batch
+                batch = []
+                started = clock()
+        
+        self._record_read(stats['read'] - batch_read, read_time + clock() - started, clean_time)
+        if batch:
+            yield batch
+
+    def _record_read(self, documents, read_time, clean_time, cache_counts=None):
+        """
+        把一个批次的读取解析和清洗耗时计入指标
+        cache_counts为清洗进程返回的缓存命中计数，不指定时取当前进程的计数
+        """
+        self.metrics.add_time('read', read_time)
+        self.metrics.add_time('clean', clean_time)
+        self.metrics.count('documents_read', documents)
+        self.metrics.add_cache_counts(*(cache_counts or take_cleaning_cache_counts()))
+
+    def _iter_batches_in_pool(self, documents, batch_size, target_index, stats, clean_workers, stable_id=False,
+                              compact=None):
+        """
+        主进程负责读取，原始记录按批次交给进程池清洗，按读取顺序产出清洗后的批次
+        """
+        logger.info(f"并行清洗: 清洗进程 {clean_workers} 个")
+        
+        # 最多预先提交的批次数，避免读取远远快于发送时占用过多内存
+        max_pending = clean_workers * 2
+        pending = deque()
+        raw_batch = []
+        read = stats['read']
+        clock = time.perf_counter
+        read_time = 0.0
+        cache_size = CLEANING_CACHE.max_entries if CLEANING_CACHE else 0
+        with ProcessPoolExecutor(max_workers=clean_workers, initializer=configure_cleaning_cache,
+                                 initargs=(cache_size,)) as executor:
+            started = clock()
+            for offset, doc in documents:
+                read_time += clock() - started
+                read += 1
+                raw_batch.append(doc)
+                
+                if read % 1000 == 0:
+                    logger.info(f"已读取 {read} 条记录...")
+                
+                if len(raw_batch) >= batch_size:
+                    future = executor.submit(timed_document_batch, raw_batch, target_index, stable_id, compact)
+                    pending.append((future, offset, read))
+                    raw_batch = []
+                    if len(pending) >= max_pending:
+                        batch = self._pop_cleaned_batch(pending, stats, read_time)
+                        read_time = 0.0
+                        if batch:
+                            yield batch
+                started = clock()
+            
+            if raw_batch:
+                future = executor.submit(timed_document_batch, raw_batch, target_index, stable_id, compact)
+                pending.append((future, offset, read))
+            
+            while pending:
+                batch = self._pop_cleaned_batch(pending, stats, read_time)
+                read_time = 0.0
+                if batch:
+                    yield batch
+
+    def _pop_cleaned_batch(self, pending, stats, read_time=0.0):
+        """
+        取出最早提交的清洗结果，并更新该批次对应的读取进度
+        清洗阶段的耗时为各清洗进程实际处理的时间之和
+        """
+        future, offset, read = pending.popleft()
+        batch, clean_time, cache_counts = future.result()
+        self._record_read(read - stats['read'], read_time, clean_time, cache_counts)
+        stats['offset'] = offset
+        stats['read'] = read
+        return batch
+
+
+class ESImporter(BaseImporter):
+    def __init__(self, es_host='localhost', es_port=9200, es_user=None, es_password=None, max_connections=10,
+                 metrics=None, rate_limiter=None, dead_letter=None):
+        """
+        初始化ES连接
+        max_connections为每个节点的连接池大小，并行导入时应不小于工作线程数
+        metrics为共享的IngestMetrics实例，不指定时新建；rate_limiter为RateLimiter实例，指定时按条数限速
+        dead_letter为DeadLetterWriter实例，指定时最终失败的记录连同失败原因写入死信文件
+        """
+        super().__init__(metrics, rate_limiter, dead_letter)
+        self.es_config = self.build_es_config(es_host, es_port, es_user, es_password, max_connections)
         
         try:
             self.es = Elasticsearch([self.es_config])
@@ -52,138 +2071,428 @@ class ESImporter:
             logger.error(f"连接Elasticsearch失败: {e}")
             raise
 
-    def clean_and_validate_data(self, doc_source):
+    def create_index_if_not_exists(self, index_name, body=None):
         """
-        数据清洗和验证，使用正则表达式处理
+        如果索引不存在则创建，body默认为INDEX_BODY
         """
-        cleaned_data = {}
-        
-        # 正则表达式模式
-        patterns = {
-            'ip_pattern': re.compile(r'^(\d{1,3}\.){3}\d{1,3}$'),
-            'hostname_pattern': re.compile(r'^[a-zA-Z0-9\-\.]+$'),
-            'timestamp_pattern': re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}'),
-            'email_pattern': re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'),
-            'numeric_pattern': re.compile(r'^-?\d+(\.\d+)?$'),
-            'chinese_pattern': re.compile(r'[\u4e00-\u9fff]+'),
-            'alphanumeric_pattern': re.compile(r'^[a-zA-Z0-9_\-]+$')
-        }
-        
-        for key, value in doc_source.items():
-            if value is None or value == "" or value == "undefined":
-                continue
+        try:
+            if not self.es.indices.exists(index=index_name):
+                self.es.indices.create(index=index_name, body=body or INDEX_BODY)
+                logger.info(f"创建索引: {index_name}")
+            else:
+                logger.info(f"索引已存在: {index_name}")
                 
-            # 转换为字符串进行处理
-            str_value = str(value)
-            
-            # 根据字段名称和内容进行特定处理
-            if key in ['hostip', 'keyword'] and patterns['ip_pattern'].match(str_value):
-                cleaned_data[key] = str_value
-            elif key in ['hostname', 'moname'] and len(str_value) > 0:
-                # 清理主机名中的特殊字符
-                cleaned_value = re.sub(r'[^\w\-\.]', '_', str_value)
-                cleaned_data[key] = cleaned_value
-            elif key in ['@timestamp'] and patterns['timestamp_pattern'].match(str_value):
-                cleaned_data[key] = str_value
-            elif key in ['process_val', 'value', 'ns', 'clock', 'ts', '__PROCESS_TIME__', 'itemid']:
-                # 数值字段处理
+        except Exception as e:
+            logger.error(f"创建索引失败: {e}")
+            raise
+
+    def prepare_target_index(self, target_index, read_alias=None):
+        """
+        准备导入的目标索引，返回导入后用于刷新和强制合并的索引表达式
+        按时间分区时安装索引模板并返回匹配所有分区的通配符，否则创建索引并返回索引名
+        """
+        if is_partitioned_index(target_index):
+            self.install_index_template(target_index, read_alias)
+            return f"{partition_prefix(target_index)}*"
+        self.create_index_if_not_exists(target_index)
+        return target_index
+
+    def install_index_template(self, index_pattern, read_alias=None, body=None):
+        """
+        按时间分区导入时安装索引模板，代替为单个索引内联指定映射
+        新建的分区由模板加入读别名，已存在的分区也在这里加入，查询读别名即可覆盖所有分区
+        """
+        read_alias = read_alias or partition_read_alias(index_pattern)
+        template_name = partition_read_alias(index_pattern)
+        self.es.indices.put_template(name=template_name, body=partition_template_body(index_pattern, read_alias, body))
+        logger.info(f"已安装索引模板 {template_name}: {partition_prefix(index_pattern)}*，读别名 {read_alias}")
+        try:
+            self.es.indices.put_alias(index=f"{partition_prefix(index_pattern)}*", name=read_alias)
+        except NotFoundError:
+            # 还没有任何分区索引
+            pass
+
+    def drop_expired_partitions(self, index_pattern, keep_days, dry_run=False):
+        """
+        删除整个分区都早于keep_days天前的分区索引（按UTC日期），返回删除的索引名列表
+        直接删除整个索引，不使用delete_by_query
+        """
+        prefix = partition_prefix(index_pattern)
+        try:
+            index_names = list(self.es.indices.get_alias(index=f"{prefix}*"))
+        except NotFoundError:
+            index_names = []
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=keep_days)
+        expired = expired_partitions(index_names, index_pattern, cutoff)
+        if not expired:
+            logger.info(f"没有早于 {cutoff} 的分区索引")
+            return []
+        
+        if dry_run:
+            logger.info(f"将删除 {len(expired)} 个早于 {cutoff} 的分区索引（未执行）: {', '.join(expired)}")
+            return expired
+        # 分组删除，避免请求行过长
+        for i in range(0, len(expired), 20):
+            chunk = expired[i:i + 20]
+            self.es.indices.delete(index=','.join(chunk))
+            logger.info(f"已删除分区索引: {', '.join(chunk)}")
+        return expired
+
+    @contextmanager
+    def bulk_load_mode(self, index_name, enabled=True):
+        """
+        批量加载模式：导入期间使用BULK_LOAD_SETTINGS，结束后恢复导入前的设置
+        无论导入是否成功都会恢复；enabled为False时不做任何修改
+        """
+        if not enabled:
+            yield
+            return
+        
+        index_settings = self.es.indices.get_settings(index=index_name, flat_settings=True)
+        original = self.production_settings(index_settings)
+        self.es.indices.put_settings(index=index_name, body=BULK_LOAD_SETTINGS)
+        logger.info(f"已进入批量加载模式: {index_name} {BULK_LOAD_SETTINGS}")
+        try:
+            yield
+        finally:
+            for name, settings in original.items():
                 try:
-                    if '.' in str_value:
-                        cleaned_data[key] = float(value)
-                    else:
-                        cleaned_data[key] = int(value)
-                except (ValueError, TypeError):
-                    logger.warning(f"无法转换数值字段 {key}: {value}")
-                    continue
-            elif key in ['agent', 'mngtorg', 'type', 'componetype', 'appname', 'bizarea', 'vendor']:
-                # 文本字段清理
-                cleaned_value = re.sub(r'[<>"\']', '', str_value)  # 移除潜在的危险字符
-                cleaned_data[key] = cleaned_value.strip()
-            elif key in ['kpi'] and isinstance(value, list):
-                # 数组字段处理
-                cleaned_data[key] = [str(item).strip() for item in value if item]
+                    self.es.indices.put_settings(index=name, body=settings)
+                    logger.info(f"已恢复索引设置: {name} {settings}")
+                except Exception as e:
+                    logger.error(f"恢复索引设置失败，请手动恢复 {name} {settings}: {e}")
+
+    def optimize_index(self, index_name, max_num_segments=1):
+        """
+        强制合并索引段到指定数量，然后执行一次仪表盘聚合查询预热索引
+        """
+        logger.info(f"开始强制合并索引 {index_name} 到 {max_num_segments} 个段...")
+        self.es.indices.forcemerge(index=index_name, max_num_segments=max_num_segments, request_timeout=3600)
+        logger.info(f"强制合并完成: {index_name}")
+        
+        self.es.search(index=index_name, body=WARMUP_QUERY, request_timeout=600)
+        logger.info(f"索引预热完成: {index_name}")
+
+    def bulk_batch(self, batch, batch_no, target_index='u2performance_for_test'):
+        """
+        使用bulk API导入一个批次，返回(成功数, 失败数, 已写入死信文件的失败数)
+        切分请求、解析响应和重试决策见BulkBatchRun，这里只负责发送请求和等待
+        """
+        run = BulkBatchRun(self, batch, batch_no, target_index)
+        while run.entries:
+            payload, throttle = run.take()
+            if throttle > 0:
+                time.sleep(throttle)
+            started = time.perf_counter()
+            try:
+                response = self.es.bulk(body=payload, request_timeout=60)
+            except Exception as e:
+                backoff = run.on_error(e, time.perf_counter() - started)
             else:
-                # 其他字段的通用处理
-                if isinstance(value, str):
-                    cleaned_value = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', str_value)  # 移除控制字符
-                    cleaned_data[key] = cleaned_value.strip()
-                else:
-                    cleaned_data[key] = value
+                backoff = run.on_response(response, time.perf_counter() - started)
+            if backoff is not None:
+                time.sleep(backoff)
+        return run.finish()
+
+    def write_rollup(self, rollup, rollup_index):
+        """
+        把小时汇总写入汇总索引，返回(成功数, 失败数)
+        """
+        self.create_index_if_not_exists(rollup_index, ROLLUP_INDEX_BODY)
+        logger.info(f"开始写入 {len(rollup.buckets)} 条小时汇总到索引 {rollup_index}...")
+        success_count, error_count = self.run_batches(rollup.iter_batches(rollup_index), rollup_index)
+        self.es.indices.refresh(index=rollup_index)
+        logger.info(f"小时汇总写入完成！成功: {success_count} 条，失败: {error_count} 条")
+        return success_count, error_count
+
+    def run_batches(self, batches, target_index='u2performance_for_test', workers=1, max_inflight=None,
+                    on_batch_done=None):
+        """
+        发送所有批次，返回(成功数, 失败数)
+        workers大于1时使用线程池并发发送，同时在途的批次数不超过max_inflight
+        on_batch_done(批次号, 成功数, 失败数, 已写入死信文件的失败数)在主线程中于每个批次完成后调用
+        """
+        success_count = 0
+        error_count = 0
+        
+        if workers <= 1:
+            for batch_no, batch in enumerate(batches, 1):
+                success, failed, dead_lettered = self.bulk_batch(batch, batch_no, target_index)
+                success_count += success
+                error_count += failed
+                if on_batch_done:
+                    on_batch_done(batch_no, success, failed, dead_lettered)
+            return success_count, error_count
         
-        return cleaned_data
+        if not max_inflight or max_inflight < workers:
+            max_inflight = workers * 2
+        logger.info(f"并行导入: 工作线程 {workers} 个，最多 {max_inflight} 个批次在途")
+        
+        pending = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch_no, batch in enumerate(batches, 1):
+                # 在途批次达到上限时，等待至少一个批次完成再继续读取
+                if len(pending) >= max_inflight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        success, failed, dead_lettered = future.result()
+                        success_count += success
+                        error_count += failed
+                        done_batch_no = pending.pop(future)
+                        if on_batch_done:
+                            on_batch_done(done_batch_no, success, failed, dead_lettered)
+                future = executor.submit(self.bulk_batch, batch, batch_no, target_index)
+                pending[future] = batch_no
+            
+            for future in wait(pending).done:
+                success, failed, dead_lettered = future.result()
+                success_count += success
+                error_count += failed
+                if on_batch_done:
+                    on_batch_done(pending[future], success, failed, dead_lettered)
+        
+        return success_count, error_count
 
-    def process_document(self, doc, target_index='u2performance_for_test'):
+    def import_data(self, json_file_path, batch_size=1000, target_index='u2performance_for_test',
+                    workers=1, max_inflight=None, clean_workers=1, checkpoint=False, resume=False,
+                    bulk_load=False, force_merge_segments=None, batch_bytes=None, target_latency_ms=1000,
+                    rollup_index=None, compact=None, dedupe=False, dedupe_capacity=10000000,
+                    dedupe_error_rate=0.0001, rollup=None, read_alias=None, watermark=None, deduplicator=None):
         """
-        处理单个文档
+        导入数据到ES
+        文件以流式方式读取，文档经清洗后直接组成批次发送，不在内存中保留整个文件
+        checkpoint为True时把已确认的进度写入进度文件，resume为True时从进度文件记录的位置继续
+        bulk_load为True时导入期间使用批量加载设置，force_merge_segments指定导入成功后强制合并的段数
+        batch_bytes指定时每个bulk请求按字节数切分，并根据target_latency_ms动态调整
+        rollup_index指定时同时计算小时汇总，导入结束后写入该索引
+        compact指定要精简的冗余字段（见COMPACT_RULES），dedupe为True时用布隆过滤器丢弃重复的采样点
+        rollup传入HourlyRollup实例时只计入汇总、不写入，由调用方合并后写入（多文件导入）
+        deduplicator传入SampleDeduplicator实例时使用该去重过滤器（多文件导入时各进程共用），忽略dedupe的各项参数
+        target_index包含日期格式（如 u2performance-%Y.%m.%d）时按采集时间写入分区索引，
+        此时安装索引模板代替创建索引，分区加入read_alias（默认为前缀，如 u2performance）
+        watermark为HighWatermark实例时只导入晚于水位的记录（增量同步），并为没有_id的记录生成稳定的ID
         """
+        self.batch_sizer = AdaptiveBatchSizer(batch_bytes, target_latency_ms) if batch_bytes else BulkBatchSizer()
+        if not os.path.exists(json_file_path):
+            logger.error(f"文件不存在: {json_file_path}")
+            return False
+        
         try:
-            # 使用指定的索引名称，而不是从文档中获取
-            index_name = target_index
-            doc_id = doc.get('_id')
-            source = doc.get('_source', {})
+            logger.info(f"开始读取文件: {json_file_path}")
+            logger.info(f"目标索引: {target_index}")
             
-            # 数据清洗
-            cleaned_source = self.clean_and_validate_data(source)
+            # 创建索引，按时间分区时安装索引模板
+            index_expression = self.prepare_target_index(target_index, read_alias)
+            if bulk_load and is_partitioned_index(target_index):
+                logger.warning("按时间分区导入时不使用批量加载模式，新建的分区使用索引模板中的配置")
+                bulk_load = False
             
-            # 添加导入时间戳
-            cleaned_source['import_timestamp'] = datetime.now().isoformat()
+            # 边读取边批量导入
+            logger.info(f"开始批量导入到索引 {target_index}...")
             
-            # 构建ES文档 (移除_type字段，因为ES 8.x不支持)
-            es_doc = {
-                '_index': index_name,
-                '_source': cleaned_source
-            }
+            stats = {}
+            tracker = None
+            start_offset = 0
+            if checkpoint or resume:
+                tracker, start_offset, stats['read'] = self.open_checkpoint(json_file_path, target_index, resume)
+            
+            batches = self.iter_batches(json_file_path, batch_size, target_index, stats, clean_workers,
+                                        start_offset=start_offset,
+                                        stable_id=tracker is not None or watermark is not None, compact=compact,
+                                        doc_filter=watermark.is_new if watermark else None)
+            if deduplicator is None and dedupe:
+                deduplicator = SampleDeduplicator(dedupe_capacity, dedupe_error_rate)
+            if deduplicator:
+                batches = deduplicator.track(batches)
+            if tracker:
+                batches = tracker.track(batches, stats)
+            if rollup is not None:
+                batches = rollup.track(batches)
+                rollup_index = None
+            elif rollup_index:
+                if start_offset:
+                    logger.warning("断点续传时小时汇总只包含本次导入的记录，会覆盖之前写入的同一小时的汇总")
+                rollup = HourlyRollup()
+                batches = rollup.track(batches)
+            with self.bulk_load_mode(target_index, enabled=bulk_load):
+                success_count, error_count = self.run_batches(
+                    batches, target_index, workers, max_inflight,
+                    on_batch_done=tracker.batch_done if tracker else None
+                )
+            
+            logger.info(f"共读取到 {stats.get('read', 0)} 条记录")
+            logger.info(f"导入完成！成功: {success_count} 条，失败: {error_count} 条")
+            if deduplicator:
+                logger.info(f"丢弃重复采样 {deduplicator.duplicates} 条")
+            if watermark:
+                watermark.commit()
+                logger.info(f"增量同步: 累计跳过不晚于水位的记录 {watermark.skipped} 条")
+            logger.info(f"各阶段耗时: {self.metrics.summary()}")
+            if tracker:
+                tracker.finish(stats)
             
-            # 如果有ID，则添加
-            if doc_id:
-                es_doc['_id'] = doc_id
+            # 刷新索引
+            self.es.indices.refresh(index=index_expression)
+            
+            if rollup_index:
+                self.write_rollup(rollup, rollup_index)
             
-            return es_doc
+            if force_merge_segments and error_count == 0:
+                self.optimize_index(index_expression, force_merge_segments)
+            
+            return True
             
         except Exception as e:
-            logger.error(f"处理文档失败: {e}")
-            return None
+            logger.error(f"导入数据失败: {e}")
+            return False
 
-    def create_index_if_not_exists(self, index_name):
+    def follow_file(self, json_file_path, batch_size=100, target_index='u2performance_for_test', poll_interval=1.0,
+                    watermark=None, read_alias=None, stop_event=None):
         """
-        如果索引不存在则创建
+        跟踪持续追加的NDJSON文件，新记录凑满batch_size或暂时没有新数据时立即发送
+        每个周期的代价只与新增的记录数有关；watermark用于在启动时跳过已导入的记录
+        stop_event被设置（或按Ctrl+C）时发送剩余的记录后返回 (成功数, 失败数)
         """
+        self.prepare_target_index(target_index, read_alias)
+        logger.info(f"开始跟踪文件: {json_file_path}，每 {poll_interval} 秒检查一次新数据")
+        success_count = 0
+        error_count = 0
+        batch_no = 0
+        batch = []
+        documents = tail_json_lines(json_file_path, poll_interval, stop_event=stop_event)
         try:
-            if not self.es.indices.exists(index=index_name):
-                # 索引映射配置
-                mapping = {
-                    "mappings": {
-                        "properties": {
-                            "hostip": {"type": "ip"},
-                            "hostname": {"type": "keyword"},
-                            "process_val": {"type": "double"},
-                            "value": {"type": "double"},
-                            "ns": {"type": "long"},
-                            "clock": {"type": "long"},
-                            "ts": {"type": "long"},
-                            "__PROCESS_TIME__": {"type": "long"},
-                            "itemid": {"type": "long"},
-                            "@timestamp": {"type": "date"},
-                            "import_timestamp": {"type": "date"},
-                            "agent": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
-                            "mngtorg": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
-                            "type": {"type": "keyword"},
-                            "componetype": {"type": "keyword"},
-                            "appname": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
-                            "bizarea": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
-                            "vendor": {"type": "keyword"},
-                            "kpi": {"type": "keyword"},
-                            "moname": {"type": "text", "fields": {"keyword": {"type": "keyword"}}}
-                        }
-                    },
-                    "settings": {
-                        "number_of_shards": 1,
-                        "number_of_replicas": 0,
-                        "refresh_interval": "1s"
-                    }
-                }
-                
-                self.es.indices.create(index=index_name, body=mapping)
+            for item in documents:
+                if item is not None:
+                    doc = item[1]
+                    self.metrics.count('documents_read')
+                    if watermark and not watermark.is_new(doc):
+                        continue
+                    es_doc = self.process_document(doc, target_index, stable_id=True)
+                    if es_doc:
+                        batch.append(es_doc)
+                    if len(batch) < batch_size:
+                        continue
+                if batch:
+                    batch_no += 1
+                    success, failed, _ = self.bulk_batch(batch, batch_no, target_index)
+                    success_count += success
+                    error_count += failed
+                    batch = []
+                    if watermark:
+                        watermark.commit()
+        except KeyboardInterrupt:
+            logger.info("已停止跟踪")
+        finally:
+            documents.close()
+        if batch:
+            success, failed, _ = self.bulk_batch(batch, batch_no + 1, target_index)
+            success_count += success
+            error_count += failed
+        logger.info(f"跟踪结束！成功: {success_count} 条，失败: {error_count} 条")
+        return success_count, error_count
+
+    def follow_directory(self, directory, batch_size=1000, target_index='u2performance_for_test', poll_interval=1.0,
+                         watermark=None, stop_event=None, **import_options):
+        """
+        监视投递目录，新文件的大小在两次检查之间不再变化后导入，import_options传给import_data
+        启动时目录中已有的文件同样会被导入，其中已导入过的记录由watermark在清洗前跳过
+        """
+        logger.info(f"开始监视目录: {directory}，每 {poll_interval} 秒检查一次新文件")
+        imported = set()
+        sizes = {}
+        try:
+            while stop_event is None or not stop_event.is_set():
+                for json_file_path in expand_input_paths([directory]):
+                    if json_file_path in imported:
+                        continue
+                    try:
+                        size = os.path.getsize(json_file_path)
+                    except OSError:
+                        continue
+                    if sizes.get(json_file_path) != size:
+                        # 第一次发现或仍在写入，下一次检查时再判断
+                        sizes[json_file_path] = size
+                        continue
+                    del sizes[json_file_path]
+                    imported.add(json_file_path)
+                    self.import_data(json_file_path, batch_size, target_index, watermark=watermark, **import_options)
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            logger.info("已停止监视")
+        return len(imported)
+
+    def replay_dead_letters(self, dead_letter_path, batch_size=1000, workers=4, max_inflight=None, batch_bytes=None):
+        """
+        把死信文件中的记录按原索引和_id重新导入，返回 (成功数, 失败数)
+        记录在写入死信文件前已经清洗过，直接序列化发送；仍然失败的记录写入本导入器的死信文件
+        """
+        self.batch_sizer = AdaptiveBatchSizer(batch_bytes) if batch_bytes else BulkBatchSizer()
+        logger.info(f"开始重新导入死信文件: {dead_letter_path}")
+        indices = set()
+        batches = self.iter_replay_batches(dead_letter_path, batch_size, indices)
+        success_count, error_count = self.run_batches(batches, workers=workers, max_inflight=max_inflight)
+        if indices:
+            self.es.indices.refresh(index=','.join(sorted(indices)))
+        logger.info(f"重新导入完成！成功: {success_count} 条，失败: {error_count} 条")
+        return success_count, error_count
+
+    def iter_replay_batches(self, dead_letter_path, batch_size, indices):
+        for batch in iter_dead_letter_batches(dead_letter_path, batch_size, indices):
+            self.metrics.count('documents_read', len(batch))
+            yield batch
+
+class AsyncESImporter(BaseImporter):
+    """
+    基于asyncio的导入器，读取、清洗与bulk请求在同一个事件循环中重叠进行
+    可以直接嵌入已有的asyncio程序:
+        async with AsyncESImporter(es_host='localhost') as importer:
+            await importer.import_data('222.json')
+    """
+
+    def __init__(self, es_host='localhost', es_port=9200, es_user=None, es_password=None, max_connections=10,
+                 metrics=None, rate_limiter=None, dead_letter=None):
+        """
+        初始化ES异步客户端，连接测试在connect()中进行
+        """
+        if AsyncElasticsearch is None:
+            raise ImportError("异步模式需要安装 elasticsearch[async]: pip install 'elasticsearch[async]>=7.0.0,<8.0.0'")
+        
+        super().__init__(metrics, rate_limiter, dead_letter)
+        self.es_config = self.build_es_config(es_host, es_port, es_user, es_password, max_connections)
+        self.es = AsyncElasticsearch([self.es_config])
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def connect(self):
+        """
+        测试ES连接
+        """
+        try:
+            if not await self.es.ping():
+                raise ConnectionError("无法连接到Elasticsearch")
+            logger.info(f"成功连接到Elasticsearch: {self.es_config['host']}:{self.es_config['port']}")
+        except Exception as e:
+            logger.error(f"连接Elasticsearch失败: {e}")
+            raise
+
+    async def close(self):
+        """
+        关闭ES连接
+        """
+        await self.es.close()
+
+    async def create_index_if_not_exists(self, index_name, body=None):
+        """
+        如果索引不存在则创建，body默认为INDEX_BODY
+        """
+        try:
+            if not await self.es.indices.exists(index=index_name):
+                await self.es.indices.create(index=index_name, body=body or INDEX_BODY)
                 logger.info(f"创建索引: {index_name}")
             else:
                 logger.info(f"索引已存在: {index_name}")
@@ -192,10 +2501,136 @@ class ESImporter:
             logger.error(f"创建索引失败: {e}")
             raise
 
-    def import_data(self, json_file_path, batch_size=1000, target_index='u2performance_for_test'):
+    async def install_index_template(self, index_pattern, read_alias=None, body=None):
+        """
+        按时间分区导入时安装索引模板，与ESImporter.install_index_template相同
+        """
+        read_alias = read_alias or partition_read_alias(index_pattern)
+        template_name = partition_read_alias(index_pattern)
+        await self.es.indices.put_template(name=template_name,
+                                           body=partition_template_body(index_pattern, read_alias, body))
+        logger.info(f"已安装索引模板 {template_name}: {partition_prefix(index_pattern)}*，读别名 {read_alias}")
+        try:
+            await self.es.indices.put_alias(index=f"{partition_prefix(index_pattern)}*", name=read_alias)
+        except NotFoundError:
+            pass
+
+    @asynccontextmanager
+    async def bulk_load_mode(self, index_name, enabled=True):
+        """
+        批量加载模式，与ESImporter.bulk_load_mode相同
+        """
+        if not enabled:
+            yield
+            return
+        
+        index_settings = await self.es.indices.get_settings(index=index_name, flat_settings=True)
+        original = self.production_settings(index_settings)
+        await self.es.indices.put_settings(index=index_name, body=BULK_LOAD_SETTINGS)
+        logger.info(f"已进入批量加载模式: {index_name} {BULK_LOAD_SETTINGS}")
+        try:
+            yield
+        finally:
+            for name, settings in original.items():
+                try:
+                    await self.es.indices.put_settings(index=name, body=settings)
+                    logger.info(f"已恢复索引设置: {name} {settings}")
+                except Exception as e:
+                    logger.error(f"恢复索引设置失败，请手动恢复 {name} {settings}: {e}")
+
+    async def optimize_index(self, index_name, max_num_segments=1):
+        """
+        强制合并索引段到指定数量，然后预热索引
+        """
+        logger.info(f"开始强制合并索引 {index_name} 到 {max_num_segments} 个段...")
+        await self.es.indices.forcemerge(index=index_name, max_num_segments=max_num_segments, request_timeout=3600)
+        logger.info(f"强制合并完成: {index_name}")
+        
+        await self.es.search(index=index_name, body=WARMUP_QUERY, request_timeout=600)
+        logger.info(f"索引预热完成: {index_name}")
+
+    async def bulk_batch(self, batch, batch_no, target_index='u2performance_for_test'):
+        """
+        使用异步bulk API导入一个批次，返回(成功数, 失败数, 已写入死信文件的失败数)，与ESImporter.bulk_batch相同
+        """
+        run = BulkBatchRun(self, batch, batch_no, target_index)
+        while run.entries:
+            payload, throttle = run.take()
+            if throttle > 0:
+                await asyncio.sleep(throttle)
+            started = time.perf_counter()
+            try:
+                response = await self.es.bulk(body=payload, request_timeout=60)
+            except Exception as e:
+                backoff = run.on_error(e, time.perf_counter() - started)
+            else:
+                backoff = run.on_response(response, time.perf_counter() - started)
+            if backoff is not None:
+                await asyncio.sleep(backoff)
+        return run.finish()
+
+    async def write_rollup(self, rollup, rollup_index):
+        """
+        把小时汇总写入汇总索引，返回(成功数, 失败数)
+        """
+        await self.create_index_if_not_exists(rollup_index, ROLLUP_INDEX_BODY)
+        logger.info(f"开始写入 {len(rollup.buckets)} 条小时汇总到索引 {rollup_index}...")
+        success_count, error_count = await self.run_batches(rollup.iter_batches(rollup_index), rollup_index)
+        await self.es.indices.refresh(index=rollup_index)
+        logger.info(f"小时汇总写入完成！成功: {success_count} 条，失败: {error_count} 条")
+        return success_count, error_count
+
+    async def run_batches(self, batches, target_index='u2performance_for_test', max_inflight=4,
+                          on_batch_done=None):
+        """
+        发送所有批次，返回(成功数, 失败数)
+        在途请求达到max_inflight时暂停读取，等待至少一个请求完成
+        批次生成器（读取、解析和清洗）在线程池中推进，不阻塞事件循环中的其他协程
+        """
+        success_count = 0
+        error_count = 0
+        pending = {}
+        loop = asyncio.get_running_loop()
+        batches = iter(batches)
+        batch_no = 0
+        
+        while True:
+            batch = await loop.run_in_executor(None, next, batches, None)
+            if batch is None:
+                break
+            batch_no += 1
+            if len(pending) >= max_inflight:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    success, failed, dead_lettered = task.result()
+                    success_count += success
+                    error_count += failed
+                    done_batch_no = pending.pop(task)
+                    if on_batch_done:
+                        on_batch_done(done_batch_no, success, failed, dead_lettered)
+            task = asyncio.ensure_future(self.bulk_batch(batch, batch_no, target_index))
+            pending[task] = batch_no
+        
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            for task in done:
+                success, failed, dead_lettered = task.result()
+                success_count += success
+                error_count += failed
+                if on_batch_done:
+                    on_batch_done(pending[task], success, failed, dead_lettered)
+        
+        return success_count, error_count
+
+    async def import_data(self, json_file_path, batch_size=1000, target_index='u2performance_for_test',
+                          max_inflight=4, checkpoint=False, resume=False, bulk_load=False,
+                          force_merge_segments=None, batch_bytes=None, target_latency_ms=1000, rollup_index=None,
+                          compact=None, dedupe=False, dedupe_capacity=10000000, dedupe_error_rate=0.0001,
+                          read_alias=None):
         """
         导入数据到ES
         """
+        self.batch_sizer = AdaptiveBatchSizer(batch_bytes, target_latency_ms) if batch_bytes else BulkBatchSizer()
         if not os.path.exists(json_file_path):
             logger.error(f"文件不存在: {json_file_path}")
             return False
@@ -204,69 +2639,60 @@ class ESImporter:
             logger.info(f"开始读取文件: {json_file_path}")
             logger.info(f"目标索引: {target_index}")
             
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            if not isinstance(data, list):
-                logger.error("JSON文件格式错误，应该是数组格式")
-                return False
-            
-            logger.info(f"共读取到 {len(data)} 条记录")
-            
-            # 使用指定的索引名称
-            processed_docs = []
-            
-            # 处理文档
-            for i, doc in enumerate(data):
-                processed_doc = self.process_document(doc, target_index)
-                if processed_doc:
-                    processed_docs.append(processed_doc)
-                
-                if (i + 1) % 1000 == 0:
-                    logger.info(f"已处理 {i + 1} 条记录...")
-            
-            # 创建索引
-            self.create_index_if_not_exists(target_index)
+            if is_partitioned_index(target_index):
+                await self.install_index_template(target_index, read_alias)
+                index_expression = f"{partition_prefix(target_index)}*"
+                if bulk_load:
+                    logger.warning("按时间分区导入时不使用批量加载模式，新建的分区使用索引模板中的配置")
+                    bulk_load = False
+            else:
+                await self.create_index_if_not_exists(target_index)
+                index_expression = target_index
             
-            # 批量导入
-            logger.info(f"开始批量导入 {len(processed_docs)} 条记录到索引 {target_index}...")
+            logger.info(f"开始异步批量导入到索引 {target_index}，最多 {max_inflight} 个批次在途...")
             
-            success_count = 0
-            error_count = 0
+            stats = {}
+            tracker = None
+            start_offset = 0
+            if checkpoint or resume:
+                tracker, start_offset, stats['read'] = self.open_checkpoint(json_file_path, target_index, resume)
             
-            for i in range(0, len(processed_docs), batch_size):
-                batch = processed_docs[i:i + batch_size]
-                
-                try:
-                    # 使用bulk API批量导入
-                    success, failed = bulk(
-                        self.es,
-                        batch,
-                        index=target_index,  # 使用指定的索引
-                        chunk_size=batch_size,
-                        request_timeout=60,
-                        max_retries=3,
-                        initial_backoff=2,
-                        max_backoff=600
-                    )
-                    
-                    success_count += success
-                    error_count += len(failed)
-                    
-                    logger.info(f"批次 {i//batch_size + 1}: 成功 {success} 条，失败 {len(failed)} 条")
-                    
-                    # 记录失败的文档
-                    for fail_doc in failed:
-                        logger.error(f"导入失败: {fail_doc}")
-                        
-                except Exception as e:
-                    logger.error(f"批量导入失败: {e}")
-                    error_count += len(batch)
+            batches = self.iter_batches(json_file_path, batch_size, target_index, stats,
+                                        start_offset=start_offset, stable_id=tracker is not None, compact=compact)
+            deduplicator = None
+            if dedupe:
+                deduplicator = SampleDeduplicator(dedupe_capacity, dedupe_error_rate)
+                batches = deduplicator.track(batches)
+            if tracker:
+                batches = tracker.track(batches, stats)
+            rollup = None
+            if rollup_index:
+                if start_offset:
+                    logger.warning("断点续传时小时汇总只包含本次导入的记录，会覆盖之前写入的同一小时的汇总")
+                rollup = HourlyRollup()
+                batches = rollup.track(batches)
+            async with self.bulk_load_mode(target_index, enabled=bulk_load):
+                success_count, error_count = await self.run_batches(
+                    batches, target_index, max_inflight,
+                    on_batch_done=tracker.batch_done if tracker else None
+                )
             
+            logger.info(f"共读取到 {stats.get('read', 0)} 条记录")
             logger.info(f"导入完成！成功: {success_count} 条，失败: {error_count} 条")
+            if deduplicator:
+                logger.info(f"丢弃重复采样 {deduplicator.duplicates} 条")
+            logger.info(f"各阶段耗时: {self.metrics.summary()}")
+            if tracker:
+                tracker.finish(stats)
             
             # 刷新索引
-            self.es.indices.refresh(index=target_index)
+            await self.es.indices.refresh(index=index_expression)
+            
+            if rollup:
+                await self.write_rollup(rollup, rollup_index)
+            
+            if force_merge_segments and error_count == 0:
+                await self.optimize_index(index_expression, force_merge_segments)
             
             return True
             
@@ -274,29 +2700,461 @@ class ESImporter:
             logger.error(f"导入数据失败: {e}")
             return False
 
-def main():
-    parser = argparse.ArgumentParser(description='导入JSON数据到Elasticsearch')
-    parser.add_argument('--file', '-f', default='u2performance_for_test_import2.json', help='JSON文件路径')
+
+def rollup_index_name(args):
+    """
+    根据命令行参数确定小时汇总索引名，未开启汇总时返回None
+    """
+    if args.rollup_index:
+        return args.rollup_index
+    if args.rollup:
+        base = (args.read_alias or partition_read_alias(args.index)) if is_partitioned_index(args.index) else args.index
+        return f"{base}_rollup_1h"
+    return None
+
+
+def load_watermark(importer, args):
+    """
+    根据命令行参数查询增量同步的水位，未开启增量同步时返回None
+    """
+    if not (args.sync or args.follow):
+        return None
+    index_expression = f"{partition_prefix(args.index)}*" if is_partitioned_index(args.index) else args.index
+    return HighWatermark(args.sync_key, args.sync_field).load(importer.es, index_expression)
+
+
+def follow_input(args, metrics, rate_limiter=None):
+    """
+    --follow模式的入口：--file为目录时监视新投递的文件，否则跟踪追加写入的NDJSON文件
+    """
+    importer = ESImporter(
+        es_host=args.host,
+        es_port=args.port,
+        es_user=args.user,
+        es_password=args.password,
+        max_connections=max(10, args.workers),
+        metrics=metrics,
+        rate_limiter=rate_limiter,
+        dead_letter=dead_letter_writer(args)
+    )
+    watermark = load_watermark(importer, args)
+    follow_path = args.file[0]
+    if os.path.isdir(follow_path):
+        importer.follow_directory(
+            follow_path, args.batch_size, args.index, args.poll_interval, watermark,
+            workers=args.workers,
+            max_inflight=args.max_inflight,
+            clean_workers=args.clean_workers,
+            batch_bytes=args.batch_bytes,
+            target_latency_ms=args.target_latency,
+            compact=compact_fields(args),
+            read_alias=args.read_alias
+        )
+        return True
+    _, error_count = importer.follow_file(follow_path, args.batch_size, args.index, args.poll_interval, watermark,
+                                          read_alias=args.read_alias)
+    return error_count == 0
+
+
+def dead_letter_writer(args):
+    """
+    根据命令行参数创建死信文件，--dead-letter为空字符串时不写死信文件
+    """
+    return DeadLetterWriter(args.dead_letter) if args.dead_letter else None
+
+
+def report_dead_letters(args, metrics):
+    """
+    导入结束后提示写入死信文件的记录数
+    """
+    dead_lettered = metrics.counters['documents_dead_lettered']
+    if dead_lettered:
+        logger.warning(f"{dead_lettered} 条失败记录已写入死信文件 {args.dead_letter}，"
+                       f"可使用 import_to_es.py replay {args.dead_letter} 重新导入")
+
+
+def target_index_name(args):
+    """
+    根据命令行参数确定目标索引，按时间分区时为带日期格式的索引名模式
+    """
+    if args.partition:
+        return f"{args.partition_prefix}{PARTITION_FORMATS[args.partition]}"
+    return args.index
+
+
+def compact_fields(args):
+    """
+    根据命令行参数确定要精简的字段，未开启精简时返回None
+    """
+    if args.compact_fields:
+        return tuple(args.compact_fields)
+    if args.compact:
+        return tuple(COMPACT_RULES)
+    return None
+
+
+# 多文件导入时，导入进程共用的全局限速和采样去重过滤器（由进程池初始化函数设置）
+_FILE_WORKER_LIMITER = None
+_FILE_WORKER_DEDUPLICATOR = None
+
+
+def _init_file_worker(rate_limiter, clean_cache_size, deduplicator=None):
+    """
+    多文件导入进程池的初始化函数
+    """
+    global _FILE_WORKER_LIMITER, _FILE_WORKER_DEDUPLICATOR
+    _FILE_WORKER_LIMITER = rate_limiter
+    _FILE_WORKER_DEDUPLICATOR = deduplicator
+    configure_cleaning_cache(clean_cache_size)
+
+
+def import_file_worker(json_file_path, args):
+    """
+    在导入进程中导入一个文件，返回 (文件结果, 指标, 小时汇总)
+    批量加载模式、汇总索引写入和强制合并由主进程在所有文件导入完成后统一处理
+    """
+    metrics = IngestMetrics()
+    rollup = HourlyRollup() if rollup_index_name(args) else None
+    started = time.time()
+    importer = ESImporter(
+        es_host=args.host,
+        es_port=args.port,
+        es_user=args.user,
+        es_password=args.password,
+        max_connections=max(10, args.workers),
+        metrics=metrics,
+        rate_limiter=_FILE_WORKER_LIMITER,
+        dead_letter=dead_letter_writer(args)
+    )
+    watermark = load_watermark(importer, args)
+    success = importer.import_data(
+        json_file_path, args.batch_size, args.index,
+        workers=args.workers,
+        max_inflight=args.max_inflight,
+        clean_workers=args.clean_workers,
+        checkpoint=args.checkpoint,
+        resume=args.resume,
+        batch_bytes=args.batch_bytes,
+        target_latency_ms=args.target_latency,
+        compact=compact_fields(args),
+        rollup=rollup,
+        read_alias=args.read_alias,
+        watermark=watermark,
+        deduplicator=_FILE_WORKER_DEDUPLICATOR
+    )
+    result = {
+        'file': json_file_path,
+        'success': success,
+        'seconds': round(time.time() - started, 3),
+        'documents_read': metrics.counters['documents_read'],
+        'documents_indexed': metrics.counters['documents_indexed'],
+        'documents_failed': metrics.counters['documents_failed']
+    }
+    return result, metrics, rollup
+
+
+def import_files(args, json_file_paths, metrics, rate_limiter=None):
+    """
+    多文件导入：每个导入进程一次处理一个文件，所有进程共用rate_limiter限速和--dedupe的去重过滤器，
+    各进程的指标和小时汇总在主进程中合并，返回 (是否全部成功, 各文件的结果)
+    """
+    file_workers = min(args.file_workers or os.cpu_count() or 1, len(json_file_paths))
+    importer = ESImporter(
+        es_host=args.host,
+        es_port=args.port,
+        es_user=args.user,
+        es_password=args.password,
+        metrics=metrics
+    )
+    # 先在主进程中创建索引（或安装分区索引模板），避免多个导入进程同时创建
+    index_expression = importer.prepare_target_index(args.index, args.read_alias)
+    if args.bulk_load and is_partitioned_index(args.index):
+        logger.warning("按时间分区导入时不使用批量加载模式，新建的分区使用索引模板中的配置")
+        args.bulk_load = False
+    logger.info(f"多文件导入: {len(json_file_paths)} 个文件，导入进程 {file_workers} 个")
+    
+    rollup_index = rollup_index_name(args)
+    rollup = HourlyRollup() if rollup_index else None
+    cache_size = CLEANING_CACHE.max_entries if CLEANING_CACHE else 0
+    deduplicator = None
+    if args.dedupe:
+        deduplicator = SampleDeduplicator(args.dedupe_capacity, args.dedupe_error_rate, shared=True)
+    results = {}
+    with importer.bulk_load_mode(args.index, enabled=args.bulk_load):
+        with ProcessPoolExecutor(max_workers=file_workers, initializer=_init_file_worker,
+                                 initargs=(rate_limiter, cache_size, deduplicator)) as executor:
+            futures = {executor.submit(import_file_worker, path, args): path for path in json_file_paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    result, file_metrics, file_rollup = future.result()
+                except Exception as e:
+                    logger.error(f"导入文件失败 {path}: {e}")
+                    result = {'file': path, 'success': False, 'error': str(e)}
+                else:
+                    metrics.merge(file_metrics)
+                    if rollup is not None:
+                        rollup.merge(file_rollup)
+                results[path] = result
+                logger.info(f"文件导入{'完成' if result['success'] else '失败'} ({len(results)}/{len(json_file_paths)}): "
+                            f"{path}，成功 {result.get('documents_indexed', 0)} 条，"
+                            f"失败 {result.get('documents_failed', 0)} 条")
+    
+    results = [results[path] for path in json_file_paths]
+    failed_files = [result['file'] for result in results if not result['success']]
+    logger.info(f"多文件导入完成！文件 {len(results) - len(failed_files)}/{len(results)} 个成功，"
+                f"文档成功 {metrics.counters['documents_indexed']} 条，失败 {metrics.counters['documents_failed']} 条")
+    logger.info(f"各阶段耗时: {metrics.summary()}")
+    
+    importer.es.indices.refresh(index=index_expression)
+    if rollup is not None:
+        importer.write_rollup(rollup, rollup_index)
+    if args.force_merge and not failed_files and metrics.counters['documents_failed'] == 0:
+        importer.optimize_index(index_expression, args.force_merge)
+    return not failed_files, results
+
+
+async def async_import(args, metrics=None, rate_limiter=None):
+    """
+    --async模式的入口
+    """
+    async with AsyncESImporter(
+        es_host=args.host,
+        es_port=args.port,
+        es_user=args.user,
+        es_password=args.password,
+        max_connections=max(10, args.max_inflight or 4),
+        metrics=metrics,
+        rate_limiter=rate_limiter,
+        dead_letter=dead_letter_writer(args)
+    ) as importer:
+        return await importer.import_data(
+            args.file, args.batch_size, args.index,
+            max_inflight=args.max_inflight or 4,
+            checkpoint=args.checkpoint,
+            resume=args.resume,
+            bulk_load=args.bulk_load,
+            force_merge_segments=args.force_merge,
+            batch_bytes=args.batch_bytes,
+            target_latency_ms=args.target_latency,
+            rollup_index=rollup_index_name(args),
+            compact=compact_fields(args),
+            dedupe=args.dedupe,
+            dedupe_capacity=args.dedupe_capacity,
+            dedupe_error_rate=args.dedupe_error_rate,
+            read_alias=args.read_alias
+        )
+
+
+def replay_main(argv):
+    """
+    replay子命令：重新导入死信文件
+    """
+    parser = argparse.ArgumentParser(prog='import_to_es.py replay', description='重新导入死信文件中的记录')
+    parser.add_argument('dead_letter_file', help='导入时写出的死信文件（NDJSON）')
     parser.add_argument('--host', default='localhost', help='ES主机地址')
     parser.add_argument('--port', type=int, default=9200, help='ES端口')
     parser.add_argument('--user', help='ES用户名')
     parser.add_argument('--password', help='ES密码')
     parser.add_argument('--batch-size', type=int, default=1000, help='批量导入大小')
-    parser.add_argument('--index', '-i', default='u2performance_for_test', help='目标索引名称')
+    parser.add_argument('--batch-bytes', type=int,
+                        help='按字节数切分bulk请求，并根据ES响应动态调整；每个请求最多包含--batch-size条记录')
+    parser.add_argument('--workers', type=int, default=4, help='并发发送bulk请求的工作线程数')
+    parser.add_argument('--max-inflight', type=int, help='同时在途的最大批次数（默认：工作线程数的2倍）')
+    parser.add_argument('--dead-letter',
+                        help='仍然失败的记录写入的死信文件（默认：<死信文件名>.replay.ndjson）')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    
+    if not os.path.exists(args.dead_letter_file):
+        logger.error(f"死信文件不存在: {args.dead_letter_file}")
+        sys.exit(1)
+    output_path = args.dead_letter or f"{os.path.splitext(args.dead_letter_file)[0]}.replay.ndjson"
+    if os.path.abspath(output_path) == os.path.abspath(args.dead_letter_file):
+        logger.error("仍然失败的记录不能写回正在重新导入的死信文件")
+        sys.exit(1)
     
     try:
-        # 创建导入器
         importer = ESImporter(
             es_host=args.host,
             es_port=args.port,
             es_user=args.user,
-            es_password=args.password
+            es_password=args.password,
+            max_connections=max(10, args.workers),
+            dead_letter=DeadLetterWriter(output_path)
         )
+        _, error_count = importer.replay_dead_letters(args.dead_letter_file, args.batch_size, args.workers,
+                                                      args.max_inflight, args.batch_bytes)
+        if error_count:
+            logger.error(f"{importer.dead_letter.count} 条记录仍然失败，已写入死信文件 {output_path}")
+            sys.exit(1)
+        logger.info("死信文件重新导入成功！")
+        sys.exit(0)
+        
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+
+def build_parser():
+    """
+    导入命令的参数解析器，quick_import.py 也用它生成默认参数
+    """
+    parser = argparse.ArgumentParser(description='导入JSON数据到Elasticsearch',
+                                     epilog='重新导入死信文件: import_to_es.py replay <死信文件> [--host ...]')
+    parser.add_argument('--file', '-f', nargs='+', default=['u2performance_for_test_import2.json'],
+                        help='JSON文件路径，可以是多个文件、目录或通配符，支持.gz/.zst压缩文件')
+    parser.add_argument('--host', default='localhost', help='ES主机地址')
+    parser.add_argument('--port', type=int, default=9200, help='ES端口')
+    parser.add_argument('--user', help='ES用户名')
+    parser.add_argument('--password', help='ES密码')
+    parser.add_argument('--batch-size', type=int, default=1000, help='批量导入大小')
+    parser.add_argument('--index', '-i', default='u2performance_for_test', help='目标索引名称')
+    parser.add_argument('--workers', type=int, default=1, help='并发发送bulk请求的工作线程数')
+    parser.add_argument('--max-inflight', type=int, help='同时在途的最大批次数（默认：工作线程数的2倍）')
+    parser.add_argument('--clean-workers', type=int, default=1, help='数据清洗进程数，大于1时使用进程池清洗')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='使用asyncio异步客户端导入（需要elasticsearch[async]）')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='把已确认的导入进度写入进度文件（<文件名>.checkpoint）')
+    parser.add_argument('--resume', action='store_true', help='从进度文件记录的位置继续导入（隐含--checkpoint）')
+    parser.add_argument('--bulk-load', action='store_true',
+                        help='导入期间关闭刷新、副本数置0、translog异步落盘，结束后恢复原设置')
+    parser.add_argument('--force-merge', type=int, metavar='SEGMENTS',
+                        help='导入成功后强制合并到指定段数并预热索引')
+    parser.add_argument('--batch-bytes', type=int,
+                        help='按字节数切分bulk请求（如5242880），并根据ES响应动态调整；此时--batch-size为每批读取的记录数，'
+                             '也是每个请求的记录数上限，需要更大的请求时同时增大--batch-size')
+    parser.add_argument('--target-latency', type=int, default=1000,
+                        help='按字节切分时bulk请求的目标took延迟（毫秒）')
+    parser.add_argument('--rollup', action='store_true',
+                        help='导入时计算 hostname/appcode/kpiid 的小时汇总，写入<索引名>_rollup_1h')
+    parser.add_argument('--rollup-index', help='小时汇总索引名称（指定时隐含--rollup）')
+    parser.add_argument('--partition', choices=list(PARTITION_FORMATS),
+                        help='按clock/@timestamp把文档写入按天或按月的分区索引（如 u2performance-2025.06.08），忽略--index')
+    parser.add_argument('--partition-prefix', default=DEFAULT_PARTITION_PREFIX, help='分区索引名前缀')
+    parser.add_argument('--read-alias', help='分区索引的读别名（默认为前缀去掉末尾的分隔符，如 u2performance）')
+    parser.add_argument('--sync', action='store_true',
+                        help='增量同步：查询目标索引中每个来源已导入的最大时间，跳过不晚于该时间的记录')
+    parser.add_argument('--sync-key', default='itemid', help='增量同步区分来源的字段（默认：itemid）')
+    parser.add_argument('--sync-field', choices=['clock', '__PROCESS_TIME__'], default='clock',
+                        help='增量同步比较的时间字段')
+    parser.add_argument('--follow', action='store_true',
+                        help='持续跟踪：--file为NDJSON文件时导入追加的记录，为目录时导入新投递的文件（隐含--sync）')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='跟踪模式检查新数据的间隔（秒）')
+    parser.add_argument('--file-workers', type=int,
+                        help='多个文件时并行导入的进程数，每个进程一次导入一个文件（默认：CPU核数）')
+    parser.add_argument('--max-docs-per-sec', type=float,
+                        help='全局限速（条/秒），多文件导入时由所有导入进程共享')
+    parser.add_argument('--dead-letter', default=DEFAULT_DEAD_LETTER_FILE,
+                        help=f'最终导入失败的记录连同失败原因写入的死信文件（默认：{DEFAULT_DEAD_LETTER_FILE}，'
+                             f'空字符串表示不写）')
+    parser.add_argument('--metrics-port', type=int, help='导入期间在该端口提供Prometheus格式的指标接口（/metrics）')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='指标接口的监听地址（默认只监听本机，Prometheus在其他机器上时指定 0.0.0.0）')
+    parser.add_argument('--metrics-report', help='导入结束后把分阶段耗时和直方图写入该JSON文件')
+    parser.add_argument('--clean-cache-size', type=int, default=CLEAN_CACHE_SIZE,
+                        help='清洗缓存的最大条目数（按字段名和原始取值计），0表示关闭缓存')
+    parser.add_argument('--compact', action='store_true',
+                        help='去掉与其他字段取值相同的冗余字段（process_val、keyword、kpi、mngtorg）')
+    parser.add_argument('--compact-fields', nargs='+', choices=list(COMPACT_RULES),
+                        help='只精简指定的冗余字段（指定时隐含--compact）')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='按 mo/kpiid/clock 丢弃重复的采样点（布隆过滤器，极少量误判会被当作重复丢弃）')
+    parser.add_argument('--dedupe-capacity', type=int, default=10000000, help='去重布隆过滤器的预计记录数')
+    parser.add_argument('--dedupe-error-rate', type=float, default=0.0001, help='去重布隆过滤器的误判率')
+    return parser
+
+
+def main():
+    configure_logging(LOG_FILE)
+    if len(sys.argv) > 1 and sys.argv[1] == 'replay':
+        replay_main(sys.argv[2:])
+        return
+    
+    args = build_parser().parse_args()
+    args.index = target_index_name(args)
+    
+    configure_cleaning_cache(args.clean_cache_size)
+    log_json_encoder()
+    metrics = IngestMetrics()
+    if args.metrics_port:
+        start_metrics_server(metrics, args.metrics_port, args.metrics_host)
+    
+    try:
+        rate_limiter = RateLimiter(args.max_docs_per_sec) if args.max_docs_per_sec else None
+        file_results = None
+        if (args.sync or args.follow) and args.use_async:
+            logger.warning("增量同步使用同步导入器，忽略 --async")
+            args.use_async = False
+        
+        if args.follow:
+            # 持续跟踪文件或目录
+            if len(args.file) != 1:
+                logger.error("跟踪模式只能指定一个文件或目录")
+                sys.exit(1)
+            success = follow_input(args, metrics, rate_limiter)
+            if args.metrics_report:
+                metrics.write_report(args.metrics_report)
+            report_dead_letters(args, metrics)
+            sys.exit(0 if success else 1)
+        
+        json_file_paths = expand_input_paths(args.file)
+        if not json_file_paths:
+            logger.error(f"没有找到要导入的文件: {' '.join(args.file)}")
+            sys.exit(1)
+        if zstandard is None and any(path.endswith('.zst') for path in json_file_paths):
+            logger.error("读取.zst文件需要安装zstandard: pip install zstandard")
+            sys.exit(1)
+        
+        if len(json_file_paths) > 1:
+            # 多文件导入
+            if args.use_async:
+                logger.warning("多文件导入使用进程池和同步导入器，忽略 --async")
+            success, file_results = import_files(args, json_file_paths, metrics, rate_limiter)
+        elif args.use_async:
+            # 异步导入
+            args.file = json_file_paths[0]
+            success = asyncio.run(async_import(args, metrics, rate_limiter))
+        else:
+            args.file = json_file_paths[0]
+            # 创建导入器
+            importer = ESImporter(
+                es_host=args.host,
+                es_port=args.port,
+                es_user=args.user,
+                es_password=args.password,
+                max_connections=max(10, args.workers),
+                metrics=metrics,
+                rate_limiter=rate_limiter,
+                dead_letter=dead_letter_writer(args)
+            )
+            watermark = load_watermark(importer, args)
+            
+            # 导入数据
+            success = importer.import_data(
+                args.file, args.batch_size, args.index,
+                workers=args.workers,
+                max_inflight=args.max_inflight,
+                clean_workers=args.clean_workers,
+                checkpoint=args.checkpoint,
+                resume=args.resume,
+                bulk_load=args.bulk_load,
+                force_merge_segments=args.force_merge,
+                batch_bytes=args.batch_bytes,
+                target_latency_ms=args.target_latency,
+                rollup_index=rollup_index_name(args),
+                compact=compact_fields(args),
+                dedupe=args.dedupe,
+                dedupe_capacity=args.dedupe_capacity,
+                dedupe_error_rate=args.dedupe_error_rate,
+                read_alias=args.read_alias,
+                watermark=watermark
+            )
         
-        # 导入数据
-        success = importer.import_data(args.file, args.batch_size, args.index)
+        if args.metrics_report:
+            metrics.write_report(args.metrics_report, files=file_results)
+        report_dead_letters(args, metrics)
         
         if success:
             logger.info("数据导入成功！")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分区索引保留策略
+按时间分区导入（import_to_es.py --partition）后，整个分区都早于保留天数的分区索引直接删除，
+不使用delete_by_query，删除的代价与索引大小无关。分区的日期按UTC计算。
+"""
+
+import sys
+import logging
+import argparse
+from import_to_es import ESImporter, PARTITION_FORMATS, DEFAULT_PARTITION_PREFIX, configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description='删除过期的分区索引')
+    parser.add_argument('--host', default='localhost', help='ES主机地址')
+    parser.add_argument('--port', type=int, default=9200, help='ES端口')
+    parser.add_argument('--user', help='ES用户名')
+    parser.add_argument('--password', help='ES密码')
+    parser.add_argument('--partition', choices=list(PARTITION_FORMATS), default='day', help='分区粒度')
+    parser.add_argument('--partition-prefix', default=DEFAULT_PARTITION_PREFIX, help='分区索引名前缀')
+    parser.add_argument('--keep-days', type=int, required=True, help='保留最近多少天的数据')
+    parser.add_argument('--dry-run', action='store_true', help='只列出要删除的分区索引，不执行删除')
+
+    args = parser.parse_args()
+
+    try:
+        importer = ESImporter(es_host=args.host, es_port=args.port, es_user=args.user, es_password=args.password)
+        index_pattern = f"{args.partition_prefix}{PARTITION_FORMATS[args.partition]}"
+        expired = importer.drop_expired_partitions(index_pattern, args.keep_days, dry_run=args.dry_run)
+        logger.info(f"{'待删除' if args.dry_run else '已删除'} {len(expired)} 个分区索引")
+
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
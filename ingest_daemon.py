@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻导入服务
+采集端通过HTTP推送NDJSON（每行一条记录，导出文件格式或只有_source内容均可），服务常驻运行：
+- 启动时连接ES并准备目标索引一次，所有推送共用一个ESImporter和它的连接池；
+- 推送的记录清洗后放入缓冲区，发送线程把多次推送合并为大小合适的bulk请求：
+  凑满 --batch-size 条，或缓冲区中最早的记录已等待 --flush-interval 秒时发送，指定 --batch-bytes 时再按字节切分；
+- 缓冲区（包括发送中的记录）达到 --max-buffer 条时，推送请求最多等待 --push-timeout 秒，
+  仍然没有空间时返回429和Retry-After，由采集端稍后重试；
+- 失败的记录按导入脚本的规则只重试暂时性失败，最终失败的写入死信文件。
+
+接口：
+POST /ingest   推送NDJSON（支持 Content-Encoding: gzip），返回202和接收的条数
+POST /flush    等待缓冲区中的记录全部发送完成
+GET  /stats    缓冲区状态和导入指标（JSON）
+GET  /metrics  Prometheus格式的导入指标
+GET  /health   健康检查
+"""
+
+import json
+import gzip
+import time
+import signal
+import logging
+import argparse
+import threading
+import sys
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+from import_to_es import (ESImporter, BulkBatchSizer, AdaptiveBatchSizer, RateLimiter, IngestMetrics,
+                          COMPACT_RULES, PARTITION_FORMATS, DEFAULT_PARTITION_PREFIX, DEFAULT_DEAD_LETTER_FILE,
+                          target_index_name, compact_fields, dead_letter_writer, log_json_encoder, configure_logging)
+
+logger = logging.getLogger(__name__)
+
+# 单次推送的请求体上限
+MAX_PUSH_BYTES = 64 * 1024 * 1024
+
+
+class IngestService:
+    """
+    缓冲推送的记录，由发送线程合并为bulk请求，通过同一个ESImporter发送
+    可以直接嵌入其他程序：service = IngestService(importer).start(); service.push(body); service.stop()
+    """
+
+    def __init__(self, importer, target_index='u2performance_for_test', batch_size=1000, flush_interval=1.0,
+                 max_buffer=100000, push_timeout=5.0, workers=2, batch_bytes=None, target_latency_ms=1000,
+                 stable_id=False, compact=None):
+        self.importer = importer
+        self.target_index = target_index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.push_timeout = push_timeout
+        self.workers = workers
+        self.stable_id = stable_id
+        self.compact = compact
+        importer.batch_sizer = AdaptiveBatchSizer(batch_bytes, target_latency_ms) if batch_bytes else BulkBatchSizer()
+
+        self.buffer = deque()
+        # 缓冲区中和发送中的记录数，反压按它判断，ES变慢时推送会随之等待
+        self.pending = 0
+        # 缓冲区中最早的记录进入的时间
+        self.oldest = None
+        self.flushing = 0
+        self.stopping = False
+        self.condition = threading.Condition()
+        self.threads = []
+        self.batch_no = 0
+        self.success_count = 0
+        self.error_count = 0
+        self.rejected_pushes = 0
+
+    def start(self):
+        """
+        启动发送线程
+        """
+        for worker_no in range(self.workers):
+            thread = threading.Thread(target=self.run_sender, name=f'ingest-sender-{worker_no}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"导入服务已启动: 目标索引 {self.target_index}，发送线程 {self.workers} 个，"
+                    f"每批 {self.batch_size} 条，最长等待 {self.flush_interval} 秒，缓冲区上限 {self.max_buffer} 条")
+        return self
+
+    def stop(self, timeout=None):
+        """
+        停止接收推送，发送完缓冲区中剩余的记录后返回
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        logger.info(f"导入服务已停止！成功: {self.success_count} 条，失败: {self.error_count} 条")
+
+    def parse(self, body):
+        """
+        解析并清洗NDJSON请求体，返回 (bulk动作列表, 无效的行数)
+        """
+        metrics = self.importer.metrics
+        started = time.perf_counter()
+        docs = []
+        invalid = 0
+        for line in body.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                doc = json.loads(line)
+            except ValueError:
+                invalid += 1
+                continue
+            if not isinstance(doc, dict):
+                invalid += 1
+                continue
+            if '_source' not in doc:
+                doc = {'_source': doc}
+            es_doc = self.importer.process_document(doc, self.target_index, self.stable_id, self.compact)
+            if es_doc:
+                docs.append(es_doc)
+            else:
+                invalid += 1
+        metrics.add_time('clean', time.perf_counter() - started)
+        metrics.count('documents_read', len(docs) + invalid)
+        return docs, invalid
+
+    def offer(self, docs, timeout=None):
+        """
+        把清洗后的记录放入缓冲区，没有空间时最多等待timeout秒（默认push_timeout），返回是否放入
+        """
+        if not docs:
+            return True
+        deadline = time.monotonic() + (self.push_timeout if timeout is None else timeout)
+        with self.condition:
+            # 单次推送超过缓冲区上限时，等缓冲区清空后整体放入，避免永远无法放入
+            while not self.stopping and self.pending and self.pending + len(docs) > self.max_buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected_pushes += 1
+                    return False
+                self.condition.wait(remaining)
+            if self.stopping:
+                return False
+            if not self.buffer:
+                self.oldest = time.monotonic()
+            self.buffer.extend(docs)
+            self.pending += len(docs)
+            self.condition.notify_all()
+        return True
+
+    def push(self, body, timeout=None):
+        """
+        推送一个NDJSON请求体，返回 (是否放入缓冲区, 接收的条数, 无效的行数)
+        """
+        docs, invalid = self.parse(body)
+        return self.offer(docs, timeout), len(docs), invalid
+
+    def flush(self, timeout=None):
+        """
+        立即发送缓冲区中的记录，等待全部发送完成，超时返回False
+        """
+        with self.condition:
+            self.flushing += 1
+            self.condition.notify_all()
+            try:
+                return self.condition.wait_for(lambda: self.pending == 0, timeout)
+            finally:
+                self.flushing -= 1
+
+    def take_batch(self):
+        """
+        取出下一批记录：凑满batch_size条、最早的记录已等待flush_interval秒，或正在flush/停止时取出
+        服务停止且缓冲区为空时返回None
+        """
+        with self.condition:
+            while True:
+                if self.buffer:
+                    waited = time.monotonic() - self.oldest
+                    if (len(self.buffer) >= self.batch_size or waited >= self.flush_interval
+                            or self.flushing or self.stopping):
+                        break
+                    self.condition.wait(self.flush_interval - waited)
+                elif self.stopping:
+                    return None
+                else:
+                    self.condition.wait()
+            buffer = self.buffer
+            batch = [buffer.popleft() for _ in range(min(self.batch_size, len(buffer)))]
+            # 剩余的记录晚于刚取出的记录到达
+            self.oldest = time.monotonic() if buffer else None
+            self.batch_no += 1
+            return self.batch_no, batch
+
+    def run_sender(self):
+        """
+        发送线程：不断取出批次并通过bulk发送
+        """
+        while True:
+            taken = self.take_batch()
+            if taken is None:
+                return
+            batch_no, batch = taken
+            try:
+                success, failed, _ = self.importer.bulk_batch(batch, batch_no, self.target_index)
+            except Exception as e:
+                logger.error(f"批次 {batch_no} 发送失败: {e}")
+                success, failed = 0, len(batch)
+            with self.condition:
+                self.success_count += success
+                self.error_count += failed
+                self.pending -= len(batch)
+                self.condition.notify_all()
+
+    def stats(self):
+        """
+        缓冲区状态和累计结果
+        """
+        with self.condition:
+            return {
+                'buffered': len(self.buffer),
+                'pending': self.pending,
+                'max_buffer': self.max_buffer,
+                'batches': self.batch_no,
+                'documents_indexed': self.success_count,
+                'documents_failed': self.error_count,
+                'rejected_pushes': self.rejected_pushes
+            }
+
+    def to_prometheus(self, prefix='es_import'):
+        """
+        导入指标加上缓冲区状态，Prometheus文本格式
+        """
+        stats = self.stats()
+        lines = [self.importer.metrics.to_prometheus(prefix).rstrip('\n')]
+        for name in ('buffered', 'pending'):
+            lines.append(f'# TYPE {prefix}_ingest_{name}_documents gauge')
+            lines.append(f'{prefix}_ingest_{name}_documents {stats[name]}')
+        lines.append(f'# TYPE {prefix}_ingest_rejected_pushes_total counter')
+        lines.append(f"{prefix}_ingest_rejected_pushes_total {stats['rejected_pushes']}")
+        return '\n'.join(lines) + '\n'
+
+
+class IngestHTTPServer(ThreadingHTTPServer):
+    """
+    多个采集端同时连接时，默认的监听队列（5）会导致连接被重置
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class IngestRequestHandler(BaseHTTPRequestHandler):
+    """
+    导入服务的HTTP接口
+    """
+    protocol_version = 'HTTP/1.1'
+    service = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_body(status, body, 'application/json; charset=UTF-8', headers)
+
+    def read_body(self):
+        """
+        读取请求体，支持Content-Length和chunked两种方式，超过MAX_PUSH_BYTES时返回None
+        """
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            chunks = []
+            size = 0
+            while True:
+                chunk_size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if chunk_size == 0:
+                    # 跳过结尾的trailer
+                    while self.rfile.readline().strip():
+                        pass
+                    break
+                size += chunk_size
+                if size > MAX_PUSH_BYTES:
+                    self.close_connection = True
+                    return None
+                chunks.append(self.rfile.read(chunk_size))
+                self.rfile.readline()
+            body = b''.join(chunks)
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_PUSH_BYTES:
+                self.close_connection = True
+                return None
+            body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        params = dict(parse_qsl(url.query))
+        service = self.service
+        try:
+            if path == '/ingest':
+                body = self.read_body()
+                if body is None:
+                    self.send_json(413, {'error': f'请求体超过 {MAX_PUSH_BYTES} 字节，请分批推送'})
+                    return
+                accepted, count, invalid = service.push(body)
+                if not accepted:
+                    status = 503 if service.stopping else 429
+                    self.send_json(status, {'error': '导入服务正在停止' if service.stopping else '缓冲区已满，请稍后重试'},
+                                   headers={'Retry-After': str(max(1, int(service.flush_interval)))})
+                    return
+                self.send_json(202, {'accepted': count, 'invalid': invalid})
+            elif path == '/flush':
+                timeout = float(params['timeout']) if 'timeout' in params else None
+                flushed = service.flush(timeout)
+                self.send_json(200 if flushed else 504, dict(service.stats(), flushed=flushed))
+            else:
+                self.send_json(404, {'error': f'未知的接口: {path}'})
+        except Exception as e:
+            logger.error(f"处理推送失败: {e}")
+            self.send_json(400, {'error': str(e)})
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip('/')
+        service = self.service
+        if path == '/stats':
+            self.send_json(200, dict(service.stats(), metrics=service.importer.metrics.to_dict()))
+        elif path == '/metrics':
+            self.send_body(200, service.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+        elif path == '/health':
+            self.send_json(503 if service.stopping else 200, {'status': 'stopping' if service.stopping else 'ok'})
+        else:
+            self.send_json(404, {'error': f'未知的接口: {path}'})
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description='常驻导入服务：通过HTTP接收NDJSON推送并批量导入Elasticsearch')
+    parser.add_argument('--host', default='localhost', help='ES主机地址')
+    parser.add_argument('--port', type=int, default=9200, help='ES端口')
+    parser.add_argument('--user', help='ES用户名')
+    parser.add_argument('--password', help='ES密码')
+    parser.add_argument('--listen-host', default='127.0.0.1', help='服务监听地址')
+    parser.add_argument('--listen-port', type=int, default=9280, help='服务监听端口')
+    parser.add_argument('--index', '-i', default='u2performance_for_test', help='目标索引名称')
+    parser.add_argument('--partition', choices=list(PARTITION_FORMATS),
+                        help='按clock/@timestamp把文档写入按天或按月的分区索引，忽略--index')
+    parser.add_argument('--partition-prefix', default=DEFAULT_PARTITION_PREFIX, help='分区索引名前缀')
+    parser.add_argument('--read-alias', help='分区索引的读别名（默认为前缀去掉末尾的分隔符）')
+    parser.add_argument('--batch-size', type=int, default=1000, help='合并后每个批次的最大记录数')
+    parser.add_argument('--batch-bytes', type=int, help='按字节数切分bulk请求，并根据ES响应动态调整')
+    parser.add_argument('--target-latency', type=int, default=1000, help='按字节切分时bulk请求的目标took延迟（毫秒）')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='记录在缓冲区中的最长等待时间（秒）')
+    parser.add_argument('--max-buffer', type=int, default=100000, help='缓冲区（包括发送中的记录）的最大记录数')
+    parser.add_argument('--push-timeout', type=float, default=5.0, help='缓冲区已满时推送请求的最长等待时间（秒）')
+    parser.add_argument('--workers', type=int, default=2, help='并发发送bulk请求的线程数')
+    parser.add_argument('--stable-id', action='store_true',
+                        help='没有_id的记录根据内容生成稳定的ID，采集端重复推送时不产生重复文档')
+    parser.add_argument('--compact', action='store_true',
+                        help='去掉与其他字段取值相同的冗余字段（process_val、keyword、kpi、mngtorg）')
+    parser.add_argument('--compact-fields', nargs='+', choices=list(COMPACT_RULES),
+                        help='只精简指定的冗余字段（指定时隐含--compact）')
+    parser.add_argument('--max-docs-per-sec', type=float, help='限速（条/秒）')
+    parser.add_argument('--dead-letter', default=DEFAULT_DEAD_LETTER_FILE,
+                        help=f'最终导入失败的记录写入的死信文件（默认：{DEFAULT_DEAD_LETTER_FILE}，空字符串表示不写）')
+
+    args = parser.parse_args()
+    args.index = target_index_name(args)
+    log_json_encoder()
+
+    try:
+        importer = ESImporter(
+            es_host=args.host,
+            es_port=args.port,
+            es_user=args.user,
+            es_password=args.password,
+            max_connections=max(10, args.workers),
+            metrics=IngestMetrics(),
+            rate_limiter=RateLimiter(args.max_docs_per_sec) if args.max_docs_per_sec else None,
+            dead_letter=dead_letter_writer(args)
+        )
+        index_expression = importer.prepare_target_index(args.index, args.read_alias)
+        service = IngestService(
+            importer, args.index,
+            batch_size=args.batch_size,
+            flush_interval=args.flush_interval,
+            max_buffer=args.max_buffer,
+            push_timeout=args.push_timeout,
+            workers=args.workers,
+            batch_bytes=args.batch_bytes,
+            target_latency_ms=args.target_latency,
+            stable_id=args.stable_id,
+            compact=compact_fields(args)
+        ).start()
+
+        IngestRequestHandler.service = service
+        server = IngestHTTPServer((args.listen_host, args.listen_port), IngestRequestHandler)
+        # 收到SIGTERM时与Ctrl+C一样停止接收并发送剩余记录
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        logger.info(f"导入服务已监听: http://{args.listen_host}:{args.listen_port}/ingest -> {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        service.stop()
+        importer.es.indices.refresh(index=index_expression)
+        if importer.metrics.counters['documents_dead_lettered']:
+            logger.warning(f"{importer.metrics.counters['documents_dead_lettered']} 条失败记录已写入死信文件 "
+                           f"{args.dead_letter}，可使用 import_to_es.py replay {args.dead_letter} 重新导入")
+
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
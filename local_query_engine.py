@@ -0,0 +1,704 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地查询引擎
+在列式存储（columnar_store.py）上用NumPy向量化分组执行仪表盘使用的查询DSL，返回与ES相同结构的响应：
+- 查询：bool（must/filter/should/must_not）、range、term、terms、exists、ids、match_all；
+- 聚合：terms、composite（terms、histogram、date_histogram来源）、histogram、date_histogram、filter、cardinality、
+  min/max/sum/avg/value_count/stats、top_hits、top_metrics。
+
+可以离线回答 qps_query_7days.txt、qps_query_modified.txt 等查询，
+也可以用 --serve 启动一个只读的本地HTTP服务，代替ES测试仪表盘的查询。
+"""
+
+import re
+import json
+import time
+import fnmatch
+import logging
+import argparse
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from columnar_store import ColumnarStore, ID_COLUMN, np
+from import_to_es import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# date_histogram间隔单位对应的毫秒数
+INTERVAL_UNITS_MS = {'ms': 1, 's': 1000, 'm': 60000, 'h': 3600000, 'd': 86400000}
+
+# calendar_interval的单位名称
+CALENDAR_UNITS = {'second': '1s', 'minute': '1m', 'hour': '1h', 'day': '1d'}
+
+# 本地服务返回的版本号，低于7.14时客户端不检查产品头
+SERVER_VERSION = '7.10.2'
+
+
+def load_query_file(query_file_path):
+    """
+    读取 qps_query_*.txt 格式的查询文件，返回 (method, path, dsl)
+    """
+    with open(query_file_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    start = text.index('{')
+    request_line = text[:start].split()
+    method, path = (request_line + ['GET', '/_search'])[:2] if request_line else ('GET', '/_search')
+    return method, path, json.loads(text[start:])
+
+
+def parse_interval_ms(spec):
+    """
+    解析date_histogram的间隔，返回毫秒数
+    """
+    interval = spec.get('fixed_interval') or spec.get('calendar_interval') or spec.get('interval')
+    if isinstance(interval, (int, float)):
+        return int(interval)
+    interval = CALENDAR_UNITS.get(interval, interval)
+    match = re.match(r'^(\d+)(ms|s|m|h|d)$', str(interval))
+    if not match:
+        raise ValueError(f"不支持的date_histogram间隔: {interval}")
+    return int(match.group(1)) * INTERVAL_UNITS_MS[match.group(2)]
+
+
+def normalize_sort(sort):
+    """
+    把sort的各种写法统一为 [(字段, 是否降序)]
+    """
+    if sort is None:
+        return []
+    if not isinstance(sort, list):
+        sort = [sort]
+    specs = []
+    for item in sort:
+        if isinstance(item, str):
+            specs.append((item, item == '_score'))
+            continue
+        for field, order in item.items():
+            if isinstance(order, dict):
+                order = order.get('order', 'desc' if field == '_score' else 'asc')
+            specs.append((field, order == 'desc'))
+    return specs
+
+
+def source_filter(spec):
+    """
+    把_source参数转换为 (includes, excludes)，返回None表示不返回_source
+    """
+    if spec is None or spec is True:
+        return [], []
+    if spec is False:
+        return None
+    if isinstance(spec, str):
+        return [spec], []
+    if isinstance(spec, list):
+        return spec, []
+    includes = spec.get('includes', spec.get('include', []))
+    excludes = spec.get('excludes', spec.get('exclude', []))
+    return ([includes] if isinstance(includes, str) else includes), ([excludes] if isinstance(excludes, str) else excludes)
+
+
+def to_python(value):
+    """
+    NumPy标量转换为可JSON序列化的Python值
+    """
+    if isinstance(value, np.generic):
+        if isinstance(value, np.datetime64):
+            return None if np.isnat(value) else int(value.astype('datetime64[ms]').astype('int64'))
+        return value.item()
+    return value
+
+
+def group_rows(keys, rows):
+    """
+    按键分组：返回排好序的唯一键，以及每个键对应的行号数组（保持原有顺序）
+    """
+    if len(rows) == 0:
+        return keys[:0], []
+    unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    order = np.argsort(inverse.reshape(-1), kind='stable')
+    return unique_keys, np.split(rows[order], np.cumsum(counts)[:-1])
+
+
+class LocalSearchEngine:
+    """
+    在列式存储上执行ES查询DSL
+    """
+
+    def __init__(self, store, index_name='u2performance_for_test'):
+        self.store = store if isinstance(store, ColumnarStore) else ColumnarStore(store)
+        self.index_name = index_name
+        self.aggregations = {
+            'terms': self.agg_terms,
+            'composite': self.agg_composite,
+            'histogram': self.agg_histogram,
+            'date_histogram': self.agg_date_histogram,
+            'filter': self.agg_filter,
+            'cardinality': self.agg_cardinality,
+            'min': self.agg_metric,
+            'max': self.agg_metric,
+            'sum': self.agg_metric,
+            'avg': self.agg_metric,
+            'value_count': self.agg_metric,
+            'stats': self.agg_metric,
+            'top_hits': self.agg_top_hits,
+            'top_metrics': self.agg_top_metrics,
+        }
+
+    def field(self, name):
+        """
+        text字段的 .keyword 子字段与原字段保存在同一列
+        """
+        if name not in self.store and name.endswith('.keyword') and name[:-8] in self.store:
+            return name[:-8]
+        return name
+
+    def search(self, dsl=None):
+        """
+        执行一个搜索请求，返回ES结构的响应
+        """
+        started = time.time()
+        dsl = dsl or {}
+        rows = np.flatnonzero(self.query_mask(dsl.get('query')))
+
+        offset = dsl.get('from', 0)
+        size = dsl.get('size', 10)
+        hits = self.build_hits(rows, dsl.get('sort'), dsl.get('_source'), offset, size)
+        response = {
+            'took': 0,
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+            'hits': {
+                'total': {'value': int(len(rows)), 'relation': 'eq'},
+                'max_score': None,
+                'hits': hits
+            }
+        }
+        aggs = dsl.get('aggs') or dsl.get('aggregations')
+        if aggs:
+            response['aggregations'] = self.aggregate(aggs, rows)
+        response['took'] = int((time.time() - started) * 1000)
+        return response
+
+    def count(self, dsl=None):
+        """
+        执行 _count 请求
+        """
+        mask = self.query_mask((dsl or {}).get('query'))
+        return {'count': int(mask.sum()), '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}}
+
+    # ---------- 查询 ----------
+
+    def query_mask(self, query):
+        """
+        计算查询匹配的行，返回布尔数组
+        """
+        rows = len(self.store)
+        if not query or 'match_all' in query:
+            return np.ones(rows, dtype=bool)
+        if 'match_none' in query:
+            return np.zeros(rows, dtype=bool)
+
+        kind, body = next(iter(query.items()))
+        if kind == 'bool':
+            return self.bool_mask(body)
+        if kind == 'range':
+            field, conditions = next(iter(body.items()))
+            return self.range_mask(self.field(field), conditions)
+        if kind == 'term':
+            field, value = next(iter(body.items()))
+            if isinstance(value, dict):
+                value = value.get('value')
+            return self.values_mask(self.field(field), [value])
+        if kind == 'terms':
+            field, values = next((key, value) for key, value in body.items() if key != 'boost')
+            return self.values_mask(self.field(field), values)
+        if kind == 'exists':
+            field = self.field(body['field'])
+            return np.asarray(self.store.valid(field)) if field in self.store else np.zeros(rows, dtype=bool)
+        if kind == 'ids':
+            return self.values_mask(ID_COLUMN, body.get('values', []))
+        raise ValueError(f"不支持的查询类型: {kind}")
+
+    def bool_mask(self, body):
+        mask = np.ones(len(self.store), dtype=bool)
+        for occur in ('must', 'filter'):
+            for clause in self.clauses(body.get(occur)):
+                mask &= self.query_mask(clause)
+        for clause in self.clauses(body.get('must_not')):
+            mask &= ~self.query_mask(clause)
+
+        should = self.clauses(body.get('should'))
+        minimum = body.get('minimum_should_match')
+        if minimum is None:
+            minimum = 0 if body.get('must') or body.get('filter') else 1
+        if should and int(minimum) > 0:
+            matched = np.zeros(len(self.store), dtype=np.int32)
+            for clause in should:
+                matched += self.query_mask(clause)
+            mask &= matched >= int(minimum)
+        return mask
+
+    @staticmethod
+    def clauses(value):
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def range_mask(self, field, conditions):
+        if field not in self.store:
+            return np.zeros(len(self.store), dtype=bool)
+        if self.store.kind(field) == 'dictionary':
+            raise ValueError(f"不支持对字符串字段做range查询: {field}")
+
+        column = self.store.column(field)
+        mask = np.asarray(self.store.valid(field)).copy()
+        for op, compare in (('gte', np.greater_equal), ('gt', np.greater),
+                            ('lte', np.less_equal), ('lt', np.less)):
+            if conditions.get(op) is None:
+                continue
+            bound = conditions[op]
+            if column.dtype.kind == 'M':
+                bound = np.datetime64(bound.rstrip('Z') if isinstance(bound, str) else int(bound), 'ms')
+            mask &= compare(column, bound)
+        return mask
+
+    def values_mask(self, field, values):
+        if field not in self.store:
+            return np.zeros(len(self.store), dtype=bool)
+        column = self.store.column(field)
+        if self.store.kind(field) == 'dictionary':
+            codes = [code for code, entry in enumerate(self.store.dictionary(field))
+                     if any(entry == value or (isinstance(entry, list) and value in entry) for value in values)]
+            return np.isin(column, codes)
+        if column.dtype.kind == 'M':
+            values = [np.datetime64(value.rstrip('Z') if isinstance(value, str) else int(value), 'ms')
+                      for value in values]
+        return np.isin(column, values) & self.store.valid(field)
+
+    # ---------- 聚合 ----------
+
+    def aggregate(self, aggs, rows):
+        """
+        在给定的行上执行一组聚合
+        """
+        result = {}
+        for name, spec in aggs.items():
+            sub_aggs = spec.get('aggs') or spec.get('aggregations') or {}
+            kind = next(key for key in spec if key not in ('aggs', 'aggregations', 'meta'))
+            handler = self.aggregations.get(kind)
+            if handler is None:
+                raise ValueError(f"不支持的聚合类型: {kind}")
+            result[name] = handler(kind, spec[kind], rows, sub_aggs)
+        return result
+
+    def bucket(self, key, rows, sub_aggs, **extra):
+        bucket = {'key': key}
+        bucket.update(extra)
+        bucket['doc_count'] = int(len(rows))
+        if sub_aggs:
+            bucket.update(self.aggregate(sub_aggs, rows))
+        return bucket
+
+    def agg_terms(self, kind, spec, rows, sub_aggs):
+        field = self.field(spec['field'])
+        size = spec.get('size', 10)
+        min_doc_count = spec.get('min_doc_count', 1)
+        groups = []
+
+        if field in self.store and len(rows):
+            valid_rows = rows[self.store.valid(field, rows)]
+            keys = np.asarray(self.store.column(field)[valid_rows])
+            unique_keys, row_groups = group_rows(keys, valid_rows)
+            if self.store.kind(field) == 'dictionary':
+                dictionary = self.store.dictionary(field)
+                unique_keys = [dictionary[code] for code in unique_keys]
+            else:
+                unique_keys = [to_python(key) for key in unique_keys]
+            groups = [(key, group) for key, group in zip(unique_keys, row_groups) if len(group) >= min_doc_count]
+
+        # 默认按文档数降序，文档数相同时按键升序
+        orders = spec.get('order', [{'_count': 'desc'}, {'_key': 'asc'}])
+        if isinstance(orders, dict):
+            orders = [{key: value} for key, value in orders.items()]
+        for order in reversed(orders):
+            (target, direction), = order.items()
+            if target in ('_key', '_term'):
+                groups.sort(key=lambda group: group[0], reverse=direction == 'desc')
+            elif target == '_count':
+                groups.sort(key=lambda group: len(group[1]), reverse=direction == 'desc')
+            else:
+                raise ValueError(f"不支持的terms排序: {target}")
+
+        selected = groups[:size]
+        return {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': int(sum(len(group) for _, group in groups[size:])),
+            'buckets': [self.bucket(key, group, sub_aggs) for key, group in selected]
+        }
+
+    def agg_composite(self, kind, spec, rows, sub_aggs):
+        """
+        composite聚合（terms、histogram、date_histogram来源），按键排序后分页，after为上一页返回的after_key
+        """
+        sources = []
+        for source in spec['sources']:
+            (name, body), = source.items()
+            (source_kind, params), = body.items()
+            if source_kind not in ('terms', 'histogram', 'date_histogram'):
+                raise ValueError(f"不支持的composite来源类型: {source_kind}")
+            sources.append((name, source_kind, params, params.get('order', 'asc') == 'desc'))
+
+        # 逐个来源细分，缺少任一来源字段的文档不进入任何桶
+        groups = [((), rows)]
+        for _, source_kind, params, _ in sources:
+            next_groups = []
+            for key, members in groups:
+                keys, valid_rows, decode = self.composite_keys(source_kind, params, members)
+                unique_keys, row_groups = group_rows(keys, valid_rows)
+                next_groups.extend((key + (value,), group) for value, group in zip(decode(unique_keys), row_groups))
+            groups = next_groups
+
+        for position in reversed(range(len(sources))):
+            groups.sort(key=lambda group: group[0][position], reverse=sources[position][3])
+        after = spec.get('after')
+        if after:
+            after_key = tuple(after.get(source[0]) for source in sources)
+            groups = [group for group in groups if self.composite_after(group[0], after_key, sources)]
+
+        names = [source[0] for source in sources]
+        page = groups[:spec.get('size', 10)]
+        result = {'buckets': [self.bucket(dict(zip(names, key)), group, sub_aggs) for key, group in page]}
+        if page:
+            result['after_key'] = dict(zip(names, page[-1][0]))
+        return result
+
+    def composite_keys(self, source_kind, params, rows):
+        """
+        composite来源在各行上的键，返回 (键数组, 有效行号, 把唯一键转换为桶键的函数)
+        """
+        field = self.field(params['field'])
+        if source_kind == 'terms':
+            if field not in self.store:
+                return np.empty(0), rows[:0], list
+            valid_rows = rows[self.store.valid(field, rows)]
+            keys = np.asarray(self.store.column(field)[valid_rows])
+            if self.store.kind(field) == 'dictionary':
+                dictionary = self.store.dictionary(field)
+                return keys, valid_rows, lambda codes: [dictionary[code] for code in codes]
+            return keys, valid_rows, lambda values: [to_python(value) for value in values]
+
+        values, valid_rows = self.numeric_values(field, rows)
+        if source_kind == 'date_histogram':
+            interval = parse_interval_ms(params)
+            keys = (values // interval * interval).astype('int64')
+        else:
+            interval = params['interval']
+            keys = (np.floor(values / interval) * interval).astype(float)
+        return keys, valid_rows, lambda values: [to_python(value) for value in values]
+
+    @staticmethod
+    def composite_after(key, after_key, sources):
+        """
+        判断composite的键是否排在after_key之后
+        """
+        for value, after_value, source in zip(key, after_key, sources):
+            if value == after_value:
+                continue
+            return value < after_value if source[3] else value > after_value
+        return False
+
+    def numeric_values(self, field, rows):
+        """
+        返回行对应的有效数值及其行号，时间字段转换为毫秒
+        """
+        if field not in self.store or len(rows) == 0:
+            return np.empty(0), rows[:0]
+        valid_rows = rows[self.store.valid(field, rows)]
+        values = np.asarray(self.store.column(field)[valid_rows])
+        if values.dtype.kind == 'M':
+            values = values.astype('datetime64[ms]').astype('int64')
+        return values, valid_rows
+
+    def histogram_buckets(self, keys, valid_rows, interval, offset, spec, sub_aggs, key_as_string=None):
+        """
+        histogram与date_histogram共用的分桶逻辑，min_doc_count为0时补齐空桶
+        """
+        min_doc_count = spec.get('min_doc_count', 0)
+        unique_keys, row_groups = group_rows(keys, valid_rows)
+        groups = dict(zip(unique_keys.tolist(), row_groups))
+
+        bucket_keys = sorted(groups)
+        if min_doc_count == 0:
+            bounds = spec.get('extended_bounds') or {}
+            candidates = bucket_keys + [key for key in (bounds.get('min'), bounds.get('max')) if key is not None]
+            if candidates:
+                first = (min(candidates) - offset) // interval * interval + offset
+                count = int((max(candidates) - first) // interval) + 1
+                bucket_keys = [first + i * interval for i in range(count)]
+
+        empty = valid_rows[:0]
+        buckets = []
+        for key in bucket_keys:
+            group = groups.get(key, empty)
+            if len(group) < min_doc_count:
+                continue
+            extra = {'key_as_string': key_as_string(key)} if key_as_string else {}
+            buckets.append(self.bucket(key, group, sub_aggs, **extra))
+        return {'buckets': buckets}
+
+    def agg_histogram(self, kind, spec, rows, sub_aggs):
+        interval = spec['interval']
+        offset = spec.get('offset', 0)
+        values, valid_rows = self.numeric_values(self.field(spec['field']), rows)
+        keys = (np.floor((values - offset) / interval) * interval + offset).astype(float)
+        return self.histogram_buckets(keys, valid_rows, interval, offset, spec, sub_aggs)
+
+    def agg_date_histogram(self, kind, spec, rows, sub_aggs):
+        interval = parse_interval_ms(spec)
+        values, valid_rows = self.numeric_values(self.field(spec['field']), rows)
+        keys = (values // interval * interval).astype('int64')
+        key_as_string = lambda key: np.datetime_as_string(np.datetime64(int(key), 'ms'), unit='ms') + 'Z'
+        return self.histogram_buckets(keys, valid_rows, interval, 0, spec, sub_aggs, key_as_string)
+
+    def agg_filter(self, kind, spec, rows, sub_aggs):
+        matched = rows[self.query_mask(spec)[rows]]
+        result = {'doc_count': int(len(matched))}
+        if sub_aggs:
+            result.update(self.aggregate(sub_aggs, matched))
+        return result
+
+    def agg_cardinality(self, kind, spec, rows, sub_aggs):
+        field = self.field(spec['field'])
+        if field not in self.store or len(rows) == 0:
+            return {'value': 0}
+        valid_rows = rows[self.store.valid(field, rows)]
+        return {'value': int(len(np.unique(self.store.column(field)[valid_rows])))}
+
+    def agg_metric(self, kind, spec, rows, sub_aggs):
+        field = self.field(spec['field'])
+        if kind == 'value_count':
+            count = 0
+            if field in self.store and len(rows):
+                count = int(np.count_nonzero(self.store.valid(field, rows)))
+            return {'value': count}
+
+        values, _ = self.numeric_values(field, rows)
+        count = len(values)
+        total = float(values.sum()) if count else 0.0
+        stats = {
+            'count': count,
+            'min': float(values.min()) if count else None,
+            'max': float(values.max()) if count else None,
+            'avg': total / count if count else None,
+            'sum': total
+        }
+        if kind == 'stats':
+            return stats
+        return {'value': stats[kind]}
+
+    def agg_top_hits(self, kind, spec, rows, sub_aggs):
+        hits = self.build_hits(rows, spec.get('sort'), spec.get('_source'), spec.get('from', 0), spec.get('size', 3))
+        return {
+            'hits': {
+                'total': {'value': int(len(rows)), 'relation': 'eq'},
+                'max_score': None,
+                'hits': hits
+            }
+        }
+
+    def agg_top_metrics(self, kind, spec, rows, sub_aggs):
+        """
+        按sort取前size个文档的指标字段
+        """
+        metrics = spec['metrics'] if isinstance(spec['metrics'], list) else [spec['metrics']]
+        fields = [metric['field'] for metric in metrics]
+        sorted_rows, sort_fields = self.sort_rows(rows, spec.get('sort'))
+        top = []
+        for row in sorted_rows[:spec.get('size', 1)]:
+            top.append({
+                'sort': [self.sort_value(field, row) for field in sort_fields],
+                'metrics': {field: self.sort_value(self.field(field), row) for field in fields}
+            })
+        return {'top': top}
+
+    # ---------- 命中文档 ----------
+
+    def sort_key(self, field, rows, descending):
+        """
+        计算一个排序字段的数值键，缺失值总是排在最后
+        """
+        if field not in self.store:
+            return np.zeros(len(rows))
+        column = np.asarray(self.store.column(field)[rows])
+        valid = self.store.valid(field, rows)
+        if self.store.kind(field) == 'dictionary':
+            dictionary = self.store.dictionary(field)
+            rank = np.empty(len(dictionary), dtype=np.int64)
+            rank[sorted(range(len(dictionary)), key=lambda code: str(dictionary[code]))] = np.arange(len(dictionary))
+            key = np.where(valid, rank[np.where(valid, column, 0)], 0).astype(float)
+        elif column.dtype.kind == 'M':
+            key = column.astype('datetime64[ms]').astype('int64').astype(float)
+        else:
+            key = column.astype(float)
+        if descending:
+            key = -key
+        key[~valid] = np.inf
+        return key
+
+    def sort_rows(self, rows, sort):
+        """
+        按sort排序行号，排序键相同时保持原有顺序
+        """
+        specs = [(self.field(field), descending) for field, descending in normalize_sort(sort)
+                 if field not in ('_score', '_doc')]
+        if not specs or len(rows) == 0:
+            return rows, []
+        keys = [self.sort_key(field, rows, descending) for field, descending in reversed(specs)]
+        return rows[np.lexsort(keys)], [field for field, _ in specs]
+
+    def sort_value(self, field, row):
+        if field not in self.store:
+            return None
+        if not self.store.valid(field, row):
+            return None
+        value = self.store.column(field)[row]
+        if self.store.kind(field) == 'dictionary':
+            return self.store.dictionary(field)[value]
+        return to_python(value)
+
+    def build_hits(self, rows, sort, source_spec, offset, size):
+        """
+        生成 hits.hits 列表
+        """
+        if size <= 0 or len(rows) == 0:
+            return []
+        sorted_rows, sort_fields = self.sort_rows(rows, sort)
+        filters = source_filter(source_spec)
+
+        fields = None
+        if filters is not None and filters[0] and not any('*' in pattern for pattern in filters[0]):
+            fields = set(filters[0])
+
+        hits = []
+        for row in sorted_rows[offset:offset + size]:
+            hit = {
+                '_index': self.index_name,
+                '_type': '_doc',
+                '_id': self.store.document_id(row),
+                '_score': None if sort_fields else 1.0
+            }
+            if filters is not None:
+                includes, excludes = filters
+                source = self.store.document(row, fields=fields)
+                hit['_source'] = {
+                    key: value for key, value in source.items()
+                    if (not includes or any(fnmatch.fnmatchcase(key, pattern) for pattern in includes))
+                    and not any(fnmatch.fnmatchcase(key, pattern) for pattern in excludes)
+                }
+            if sort_fields:
+                hit['sort'] = [self.sort_value(field, row) for field in sort_fields]
+            hits.append(hit)
+        return hits
+
+
+class LocalSearchHandler(BaseHTTPRequestHandler):
+    """
+    只读的本地ES服务：支持 /、/<索引>、/_search、/_count
+    """
+    protocol_version = 'HTTP/1.1'
+    engine = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw) if raw.strip() else None
+
+    def handle_request(self):
+        path = urlsplit(self.path).path.rstrip('/') or '/'
+        try:
+            body = self.read_body()
+            if path == '/':
+                self.send_json(200, {
+                    'name': 'local-query-engine',
+                    'cluster_name': 'local',
+                    'version': {'number': SERVER_VERSION, 'build_flavor': 'default'},
+                    'tagline': 'You Know, for Search'
+                })
+            elif path.endswith('/_search') and self.command in ('GET', 'POST'):
+                started = time.time()
+                response = self.engine.search(body)
+                logger.info(f"{self.command} {path} {int((time.time() - started) * 1000)}ms")
+                self.send_json(200, response)
+            elif path.endswith('/_count') and self.command in ('GET', 'POST'):
+                self.send_json(200, self.engine.count(body))
+            elif self.command == 'HEAD' and path.count('/') == 1:
+                self.send_json(200, {})
+            else:
+                self.send_json(400, {'error': f"本地服务不支持该请求: {self.command} {path}"})
+        except Exception as e:
+            logger.error(f"处理请求失败: {self.command} {self.path}: {e}")
+            self.send_json(400 if isinstance(e, ValueError) else 500, {'error': str(e)})
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_HEAD = handle_request
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description='在列式存储上执行ES查询DSL')
+    parser.add_argument('--store', '-s', required=True, help='列式存储目录（由columnar_store.py生成）')
+    parser.add_argument('--query', '-q', help='查询文件，如 qps_query_7days.txt')
+    parser.add_argument('--output', '-o', help='响应输出文件，默认输出到控制台')
+    parser.add_argument('--index', '-i', default='u2performance_for_test', help='响应中的索引名称')
+    parser.add_argument('--serve', action='store_true', help='启动本地HTTP服务代替ES')
+    parser.add_argument('--listen-host', default='127.0.0.1', help='本地服务监听地址')
+    parser.add_argument('--listen-port', type=int, default=9201, help='本地服务监听端口')
+
+    args = parser.parse_args()
+
+    if not args.query and not args.serve:
+        parser.error('请指定 --query 或 --serve')
+
+    try:
+        engine = LocalSearchEngine(args.store, index_name=args.index)
+
+        if args.query:
+            _, _, dsl = load_query_file(args.query)
+            response = engine.search(dsl)
+            logger.info(f"查询完成: 命中 {response['hits']['total']['value']} 条, 耗时 {response['took']}ms")
+            text = json.dumps(response, ensure_ascii=False, indent=2)
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            else:
+                print(text)
+
+        if args.serve:
+            LocalSearchHandler.engine = engine
+            server = ThreadingHTTPServer((args.listen_host, args.listen_port), LocalSearchHandler)
+            logger.info(f"本地查询服务已启动: http://{args.listen_host}:{args.listen_port} ({len(engine.store)} 条记录)")
+            server.serve_forever()
+
+    except KeyboardInterrupt:
+        logger.info("本地查询服务已停止")
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
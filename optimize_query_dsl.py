@@ -0,0 +1,645 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+仪表盘查询DSL优化工具
+把 qps_query_7days.txt、qps_query_modified.txt 这类聚合查询改写为代价更低的等价查询：
+- 查询不需要评分（size为0或显式排序）时，must中的条件移入filter上下文，可以被缓存；
+- 作用在秒级时间字段（clock）上的histogram改为在对应的日期字段（@timestamp）上使用fixed_interval的date_histogram，
+  date_histogram已废弃的interval改为fixed_interval/calendar_interval；
+- 顶层 size 很大的terms改为composite聚合，按after_key分页取完，不再被size截断；
+- 只为了画值而取回多条文档的top_hits（如每小时 size 100）改为stats和top_metrics（最新值），
+  非数值的描述字段保留为 size 1 的top_hits（直方图桶内不再重复取回）。
+
+改写后的查询写入 <原文件名>_optimized.txt，并在ES或本地查询引擎（local_query_engine.py）上分别执行原查询和改写后的查询，
+比较耗时和结果：桶、文档数和各指标逐项比较，原查询因size截断造成的差异单独列出。
+"""
+
+import os
+import re
+import copy
+import json
+import time
+import logging
+import argparse
+import statistics
+import sys
+from elasticsearch import Elasticsearch
+from import_to_es import BaseImporter, INDEX_BODY
+from local_query_engine import LocalSearchEngine, load_query_file, normalize_sort, source_filter
+
+logger = logging.getLogger(__name__)
+
+# 数值类型的字段可以由指标聚合返回
+NUMERIC_TYPES = {'long', 'integer', 'short', 'byte', 'double', 'float', 'half_float', 'scaled_float'}
+
+# 秒级时间字段对应的日期字段，histogram改为date_histogram时使用
+DEFAULT_DATE_FIELDS = {'clock': '@timestamp'}
+
+# 顶层terms的size达到该值时改为composite分页
+TERMS_SIZE_LIMIT = 500
+
+# composite每页的桶数
+COMPOSITE_PAGE_SIZE = 500
+
+# 不影响评分即可移入filter的查询不需要判断类型：只有不使用评分时才改写
+HISTOGRAM_KINDS = ('histogram', 'date_histogram')
+BUCKET_KINDS = ('terms', 'composite') + HISTOGRAM_KINDS
+METRIC_KINDS = ('min', 'max', 'sum', 'avg', 'value_count', 'cardinality')
+
+# 改写时写入聚合meta的键，比较结果时据此把改写后的聚合与原聚合对应起来
+OPTIMIZER_META = 'dsl_optimizer'
+
+CALENDAR_INTERVALS = {'minute', 'hour', 'day', 'week', 'month', 'quarter', 'year', '1w', '1M', '1q', '1y'}
+
+# 浮点数比较的相对误差
+FLOAT_TOLERANCE = 1e-9
+
+
+def agg_kind(spec):
+    return next(key for key in spec if key not in ('aggs', 'aggregations', 'meta'))
+
+
+def sub_aggs_key(spec):
+    return next((key for key in ('aggs', 'aggregations') if key in spec), None)
+
+
+def flatten_mapping(properties, prefix=''):
+    """
+    把映射展开为 {字段名: 类型}，包括 .keyword 等子字段
+    """
+    types = {}
+    for name, spec in properties.items():
+        field = f"{prefix}{name}"
+        if 'properties' in spec:
+            types.update(flatten_mapping(spec['properties'], f"{field}."))
+            continue
+        types[field] = spec.get('type', 'object')
+        for sub_name, sub_spec in spec.get('fields', {}).items():
+            types[f"{field}.{sub_name}"] = sub_spec.get('type')
+    return types
+
+
+def format_interval(seconds):
+    """
+    秒数转换为fixed_interval的写法，如 3600 -> 1h
+    """
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+class DslOptimizer:
+    """
+    按规则改写聚合查询，optimize返回 (改写后的DSL, 改写说明列表)
+    """
+
+    def __init__(self, field_types, date_fields=None, terms_size_limit=TERMS_SIZE_LIMIT,
+                 composite_size=COMPOSITE_PAGE_SIZE):
+        self.field_types = field_types
+        self.date_fields = DEFAULT_DATE_FIELDS if date_fields is None else date_fields
+        self.terms_size_limit = terms_size_limit
+        self.composite_size = composite_size
+        self.notes = []
+
+    def is_numeric(self, field):
+        return self.field_types.get(field) in NUMERIC_TYPES
+
+    def optimize(self, dsl):
+        self.notes = []
+        dsl = copy.deepcopy(dsl)
+        aggs_key = sub_aggs_key(dsl)
+        sort = dsl.get('sort')
+        uses_score = (dsl.get('size', 10) > 0 and (not sort or any(field == '_score' for field, _ in normalize_sort(sort)))) \
+            or (aggs_key is not None and self.aggs_use_score(dsl[aggs_key]))
+        if dsl.get('query') and not uses_score:
+            dsl['query'] = self.rewrite_query(dsl['query'])
+        if aggs_key:
+            dsl[aggs_key] = self.rewrite_aggs(dsl[aggs_key], None, '')
+        return dsl, list(self.notes)
+
+    def aggs_use_score(self, aggs):
+        """
+        是否有按评分排序的top_hits（没有sort时按_score排序）
+        """
+        for spec in aggs.values():
+            kind = agg_kind(spec)
+            if kind == 'top_hits':
+                sort = spec[kind].get('sort')
+                if not sort or any(field == '_score' for field, _ in normalize_sort(sort)):
+                    return True
+            sub_key = sub_aggs_key(spec)
+            if sub_key and self.aggs_use_score(spec[sub_key]):
+                return True
+        return False
+
+    def rewrite_query(self, query):
+        """
+        不使用评分时，must中的条件全部移入filter（不计算评分，结果可以进入节点查询缓存）
+        """
+        if 'bool' not in query:
+            self.notes.append("查询条件放入bool.filter（filter上下文，不计算评分）")
+            return {'bool': {'filter': [query]}}
+        body = dict(query['bool'])
+        must = body.pop('must', None)
+        if not must:
+            return query
+        must = must if isinstance(must, list) else [must]
+        existing = body.get('filter', [])
+        body['filter'] = (existing if isinstance(existing, list) else [existing]) + must
+        self.notes.append(f"bool.must中的 {len(must)} 个条件移入bool.filter（filter上下文，不计算评分）")
+        return {'bool': body}
+
+    def rewrite_aggs(self, aggs, parent_kind, path):
+        result = {}
+        for name, spec in aggs.items():
+            kind = agg_kind(spec)
+            label = f"{path}{name}"
+            if kind == 'top_hits':
+                result.update(self.rewrite_top_hits(name, spec, parent_kind, label))
+                continue
+            if kind == 'histogram':
+                spec = self.rewrite_histogram(spec, label)
+            elif kind == 'date_histogram':
+                spec = self.rewrite_date_interval(spec, label)
+            elif kind == 'terms':
+                spec = self.rewrite_terms(name, spec, parent_kind, label)
+            kind = agg_kind(spec)
+            sub_key = sub_aggs_key(spec)
+            if sub_key:
+                spec = dict(spec)
+                spec[sub_key] = self.rewrite_aggs(spec[sub_key], kind, f"{label} > ")
+            result[name] = spec
+        return result
+
+    def rewrite_histogram(self, spec, label):
+        """
+        秒级时间字段上的histogram改为日期字段上的date_histogram（fixed_interval）
+        """
+        params = spec['histogram']
+        target = self.date_fields.get(params.get('field'))
+        interval = params.get('interval')
+        offset = params.get('offset', 0)
+        if (not target or not interval or float(interval) != int(interval) or float(offset) != int(offset)
+                or 'missing' in params or 'script' in params):
+            return spec
+        new_params = {'field': target, 'fixed_interval': format_interval(int(interval))}
+        if offset:
+            new_params['offset'] = f"{int(offset)}s"
+        for key in ('min_doc_count', 'order', 'keyed'):
+            if key in params:
+                new_params[key] = params[key]
+        for key in ('extended_bounds', 'hard_bounds'):
+            if key in params:
+                new_params[key] = {bound: int(value * 1000) for bound, value in params[key].items()}
+        new_spec = {'date_histogram': new_params,
+                    'meta': dict(spec.get('meta', {}), **{OPTIMIZER_META: {'from': 'histogram', 'key_scale': 1000}})}
+        new_spec.update((key, value) for key, value in spec.items() if key not in ('histogram', 'meta'))
+        self.notes.append(f"{label}: {params['field']} 上间隔 {interval} 的histogram改为 {target} 上 "
+                          f"fixed_interval {new_params['fixed_interval']} 的date_histogram（桶的key变为毫秒）")
+        return new_spec
+
+    def rewrite_date_interval(self, spec, label):
+        """
+        date_histogram已废弃的interval改为fixed_interval或calendar_interval
+        """
+        params = spec['date_histogram']
+        interval = params.get('interval')
+        if interval is None:
+            return spec
+        params = dict(params)
+        del params['interval']
+        if isinstance(interval, (int, float)):
+            params['fixed_interval'] = f"{int(interval)}ms"
+        elif interval in CALENDAR_INTERVALS:
+            params['calendar_interval'] = interval
+        else:
+            params['fixed_interval'] = interval
+        kind = 'calendar_interval' if 'calendar_interval' in params else 'fixed_interval'
+        self.notes.append(f"{label}: date_histogram的interval改为 {kind} {params[kind]}")
+        return dict(spec, date_histogram=params)
+
+    def rewrite_terms(self, name, spec, parent_kind, label):
+        """
+        顶层size很大的terms改为composite分页；嵌套的terms不能改为composite，只给出提示
+        """
+        params = spec['terms']
+        size = params.get('size', 10)
+        if size < self.terms_size_limit:
+            return spec
+        if parent_kind is not None:
+            self.notes.append(f"{label}: 嵌套的terms size {size} 可能截断（composite只能作为顶层聚合），"
+                              f"请检查响应中的sum_other_doc_count")
+            return spec
+        orders = params.get('order', [])
+        orders = [{key: value} for key, value in orders.items()] if isinstance(orders, dict) else orders
+        direction = 'asc'
+        unsupported = [key for key in ('include', 'exclude', 'missing', 'script', 'min_doc_count') if key in params]
+        for order in orders:
+            (target, value), = order.items()
+            if target in ('_key', '_term'):
+                direction = value
+            else:
+                unsupported.append(f'order {target}')
+        if unsupported:
+            self.notes.append(f"{label}: terms size {size} 使用了 {', '.join(unsupported)}，不改为composite")
+            return spec
+        page_size = min(self.composite_size, size)
+        new_spec = {
+            'composite': {'size': page_size, 'sources': [{name: {'terms': {'field': params['field'], 'order': direction}}}]},
+            'meta': dict(spec.get('meta', {}), **{OPTIMIZER_META: {'from': 'terms', 'size': size}})
+        }
+        new_spec.update((key, value) for key, value in spec.items() if key not in ('terms', 'meta'))
+        self.notes.append(f"{label}: terms size {size} 改为composite分页（每页 {page_size} 个桶，用after_key取下一页），"
+                          f"桶按 {params['field']} {direction} 排序，不再被size截断")
+        return new_spec
+
+    def rewrite_top_hits(self, name, spec, parent_kind, label):
+        """
+        取回多条文档只为得到数值的top_hits改为stats和top_metrics
+        数值字段各用一个stats，最新值用top_metrics；非数值的描述字段在非直方图桶中保留为size 1的top_hits
+        """
+        params = spec['top_hits']
+        size = params.get('size', 3)
+        sort = normalize_sort(params.get('sort'))
+        filters = source_filter(params.get('_source'))
+        if size <= 1 or not sort or not self.is_numeric(sort[0][0]) or not filters or not filters[0]:
+            return {name: spec}
+        includes = filters[0]
+        sort_field = sort[0][0]
+        numeric = [field for field in includes if self.is_numeric(field) and field != sort_field]
+        if not numeric:
+            return {name: spec}
+
+        # 排序字段由top_metrics的sort返回，对应的日期字段可以由它换算
+        derived = {sort_field, self.date_fields.get(sort_field)}
+        descriptive = [field for field in includes if field not in numeric and field not in derived]
+        rewritten = {}
+        if descriptive and parent_kind not in HISTOGRAM_KINDS:
+            rewritten[name] = {'top_hits': {'sort': params['sort'], '_source': {'includes': descriptive}, 'size': 1}}
+        for field in numeric:
+            rewritten[f"{name}__{field}_stats"] = {
+                'stats': {'field': field},
+                'meta': {OPTIMIZER_META: {'from': 'top_hits', 'name': name, 'field': field, 'role': 'stats'}}
+            }
+        rewritten[f"{name}__latest"] = {
+            'top_metrics': {'metrics': [{'field': field} for field in numeric], 'sort': {sort_field: 'desc'}},
+            'meta': {OPTIMIZER_META: {'from': 'top_hits', 'name': name, 'role': 'latest'}}
+        }
+        kept = f"，描述字段 {', '.join(descriptive)} 保留为size 1的top_hits" if name in rewritten else ''
+        self.notes.append(f"{label}: top_hits size {size} 改为 {', '.join(numeric)} 的stats和按 {sort_field} 取最新值的"
+                          f"top_metrics{kept}；需要逐点数据时请改用更细的date_histogram")
+        return rewritten
+
+
+def bucket_key(bucket, meta):
+    """
+    比较用的桶key：composite取来源的值，由histogram改写的date_histogram换算回秒，整数值的浮点数转为整数
+    """
+    key = bucket['key']
+    if isinstance(key, dict):
+        key = next(iter(key.values())) if len(key) == 1 else tuple(key.values())
+    scale = meta.get('key_scale')
+    if scale:
+        key = key // scale
+    if isinstance(key, float) and key.is_integer():
+        key = int(key)
+    return key
+
+
+def numeric_hit_values(hits, field):
+    return [hit.get('_source', {}).get(field) for hit in hits
+            if isinstance(hit.get('_source', {}).get(field), (int, float))]
+
+
+def flatten_response(aggs_spec, aggs_response, path=(), facts=None, truncated=None):
+    """
+    把聚合响应展开为 {路径: 值} 的事实表，便于比较结构不同但含义相同的两个响应
+    top_hits展开为条数、数值字段的min/max/avg、最新值和第一条命中的描述字段，与改写后的stats/top_metrics对应；
+    truncated收集因size截断而不完整的路径
+    """
+    facts = {} if facts is None else facts
+    truncated = set() if truncated is None else truncated
+    for name, spec in aggs_spec.items():
+        node = (aggs_response or {}).get(name)
+        if node is None:
+            continue
+        kind = agg_kind(spec)
+        meta = spec.get('meta', {}).get(OPTIMIZER_META, {})
+        sub_spec = spec.get(sub_aggs_key(spec) or '', {})
+        if kind in BUCKET_KINDS:
+            if node.get('sum_other_doc_count'):
+                truncated.add(path + (name,))
+            for bucket in node.get('buckets', []):
+                bucket_path = path + (name, ('key', bucket_key(bucket, meta)))
+                facts[bucket_path + ('doc_count',)] = bucket['doc_count']
+                flatten_response(sub_spec, bucket, bucket_path, facts, truncated)
+        elif kind == 'filter':
+            facts[path + (name, 'doc_count')] = node['doc_count']
+            flatten_response(sub_spec, node, path + (name,), facts, truncated)
+        elif kind == 'top_hits':
+            flatten_top_hits(spec[kind], node, path + (name,), facts, truncated)
+        elif kind == 'stats' and meta.get('role') == 'stats':
+            target = path + (meta['name'],)
+            facts[target + ('count',)] = node['count']
+            for stat in ('min', 'max', 'avg'):
+                facts[target + (meta['field'], stat)] = node[stat]
+        elif kind == 'top_metrics':
+            target = path + (meta.get('name', name),)
+            top = node.get('top') or []
+            for field, value in (top[0]['metrics'].items() if top else []):
+                facts[target + ('latest', field)] = value
+        elif kind == 'stats':
+            for stat in ('count', 'min', 'max', 'avg', 'sum'):
+                facts[path + (name, stat)] = node.get(stat)
+        elif kind in METRIC_KINDS:
+            facts[path + (name, 'value')] = node.get('value')
+    return facts, truncated
+
+
+def flatten_top_hits(params, node, path, facts, truncated):
+    hits = node['hits']['hits']
+    total = node['hits']['total']
+    total = total['value'] if isinstance(total, dict) else total
+    if params.get('size', 3) <= 1:
+        for field, value in (hits[0].get('_source', {}).items() if hits else []):
+            facts[path + ('hit', field)] = value
+        return
+
+    facts[path + ('count',)] = total
+    if total > len(hits):
+        truncated.add(path)
+    if not hits:
+        return
+    numeric_fields = {field for hit in hits for field, value in hit.get('_source', {}).items()
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)}
+    for field, value in hits[0].get('_source', {}).items():
+        if field not in numeric_fields:
+            facts[path + ('hit', field)] = value
+
+    sort = normalize_sort(params.get('sort'))
+    sort_field = sort[0][0] if sort else None
+    latest_clock = max((hit['_source'].get(sort_field) for hit in hits
+                        if isinstance(hit.get('_source', {}).get(sort_field), (int, float))), default=None)
+    for field in numeric_fields - {sort_field}:
+        values = numeric_hit_values(hits, field)
+        if values:
+            facts[path + (field, 'min')] = min(values)
+            facts[path + (field, 'max')] = max(values)
+            facts[path + (field, 'avg')] = sum(values) / len(values)
+        if latest_clock is not None:
+            # 最新时间上有多条文档时，其中任何一条的值都算一致
+            facts[path + ('latest', field)] = sorted(
+                value for hit in hits if hit['_source'].get(sort_field) == latest_clock
+                for value in numeric_hit_values([hit], field))
+
+
+def same_value(expected, actual):
+    if isinstance(expected, list) and not isinstance(actual, list):
+        return any(same_value(candidate, actual) for candidate in expected)
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)) \
+            and not isinstance(expected, bool) and not isinstance(actual, bool):
+        return abs(expected - actual) <= FLOAT_TOLERANCE * max(1.0, abs(expected), abs(actual))
+    return expected == actual
+
+
+def path_label(path):
+    return '/'.join(str(part[1]) if isinstance(part, tuple) else str(part) for part in path)
+
+
+def path_pattern(path):
+    return '/'.join('*' if isinstance(part, tuple) else str(part) for part in path)
+
+
+def compare_responses(original_spec, original, optimized_spec, optimized):
+    """
+    比较原查询和改写后查询的聚合结果，返回比较摘要
+    """
+    original_facts, truncated = flatten_response(original_spec, original.get('aggregations'))
+    optimized_facts, _ = flatten_response(optimized_spec, optimized.get('aggregations'))
+
+    def is_truncated(path):
+        return any(path[:len(prefix)] == prefix for prefix in truncated)
+
+    matched = 0
+    different = []
+    truncated_differences = []
+    only_original = {}
+    only_optimized = {}
+    for path in sorted(set(original_facts) | set(optimized_facts), key=path_label):
+        in_original = path in original_facts
+        in_optimized = path in optimized_facts
+        if in_original and in_optimized:
+            if same_value(original_facts[path], optimized_facts[path]):
+                matched += 1
+                continue
+            entry = {'path': path_label(path), 'original': original_facts[path], 'optimized': optimized_facts[path]}
+        elif path[-1] == 'doc_count':
+            # 只有一边有的桶
+            entry = {'path': path_label(path), 'original': original_facts.get(path), 'optimized': optimized_facts.get(path)}
+        else:
+            target = only_original if in_original else only_optimized
+            target[path_pattern(path)] = target.get(path_pattern(path), 0) + 1
+            continue
+        (truncated_differences if is_truncated(path) else different).append(entry)
+
+    return {
+        'matched': matched,
+        'different': different,
+        'truncated_in_original': truncated_differences,
+        'truncated_paths': sorted(path_label(path) for path in truncated),
+        'only_original': only_original,
+        'only_optimized': only_optimized
+    }
+
+
+class QueryRunner:
+    """
+    在ES或本地查询引擎上执行查询，composite聚合按after_key翻页取完
+    """
+
+    def __init__(self, es=None, engine=None):
+        self.es = es
+        self.engine = engine
+
+    def search(self, index, dsl):
+        if self.engine is not None:
+            return self.engine.search(copy.deepcopy(dsl))
+        # 关闭分片请求缓存，避免重复执行时直接返回缓存的聚合结果
+        return self.es.search(index=index, body=dsl, request_cache=False, request_timeout=600)
+
+    def execute(self, index, dsl):
+        """
+        执行一个查询，返回 (合并翻页后的响应, 请求次数, ES的took之和)
+        """
+        response = self.search(index, dsl)
+        requests = 1
+        took = response.get('took', 0)
+        aggs = dsl.get(sub_aggs_key(dsl) or '', {})
+        for name, spec in aggs.items():
+            if agg_kind(spec) != 'composite':
+                continue
+            node = response['aggregations'][name]
+            page = node
+            while page.get('after_key') and len(page['buckets']) >= spec['composite'].get('size', 10):
+                page_spec = copy.deepcopy(spec)
+                page_spec['composite']['after'] = page['after_key']
+                page_dsl = {key: value for key, value in dsl.items() if key not in ('aggs', 'aggregations')}
+                page_dsl.update(size=0, aggs={name: page_spec})
+                page_response = self.search(index, page_dsl)
+                requests += 1
+                took += page_response.get('took', 0)
+                page = page_response['aggregations'][name]
+                node['buckets'].extend(page['buckets'])
+            node.pop('after_key', None)
+        return response, requests, took
+
+    def benchmark(self, index, dsl, repeat=3):
+        """
+        执行repeat次，返回 (最后一次的响应, 耗时统计)
+        """
+        seconds = []
+        tooks = []
+        response = None
+        requests = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response, requests, took = self.execute(index, dsl)
+            seconds.append(time.perf_counter() - started)
+            tooks.append(took)
+        return response, {
+            'requests': requests,
+            'median_ms': round(statistics.median(seconds) * 1000, 1),
+            'min_ms': round(min(seconds) * 1000, 1),
+            'median_took_ms': statistics.median(tooks),
+            'response_bytes': len(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        }
+
+
+def write_query_file(path, method, request_path, dsl):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"{method} {request_path}\n")
+        f.write(json.dumps(dsl, ensure_ascii=False, indent=2))
+        f.write('\n')
+
+
+def index_from_path(request_path):
+    parts = request_path.strip('/').split('/')
+    return parts[0] if len(parts) > 1 and not parts[0].startswith('_') else None
+
+
+def optimize_file(query_file_path, optimizer, runner=None, output_dir=None, repeat=3, index=None):
+    """
+    改写一个查询文件并写出 <文件名>_optimized.txt，指定runner时执行两个版本并比较，返回报告
+    """
+    method, request_path, dsl = load_query_file(query_file_path)
+    optimized, notes = optimizer.optimize(dsl)
+    stem, ext = os.path.splitext(os.path.basename(query_file_path))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir or os.path.dirname(query_file_path) or '.', f"{stem}_optimized{ext or '.txt'}")
+    write_query_file(output_path, method, request_path, optimized)
+    logger.info(f"{query_file_path}: {len(notes)} 处改写 -> {output_path}")
+    for note in notes:
+        logger.info(f"  - {note}")
+
+    report = {'file': query_file_path, 'optimized_file': output_path, 'rewrites': notes}
+    if runner is None:
+        return report
+
+    index = index or index_from_path(request_path)
+    original_response, original_timing = runner.benchmark(index, dsl, repeat)
+    optimized_response, optimized_timing = runner.benchmark(index, optimized, repeat)
+    comparison = compare_responses(dsl.get(sub_aggs_key(dsl) or '', {}), original_response,
+                                   optimized.get(sub_aggs_key(optimized) or '', {}), optimized_response)
+    report.update(original=original_timing, optimized=optimized_timing, comparison=comparison)
+
+    speedup = original_timing['median_ms'] / optimized_timing['median_ms'] if optimized_timing['median_ms'] else None
+    logger.info(f"  原查询: {original_timing['median_ms']} ms（took {original_timing['median_took_ms']} ms，"
+                f"响应 {original_timing['response_bytes']} 字节）；改写后: {optimized_timing['median_ms']} ms"
+                f"（{optimized_timing['requests']} 次请求，took {optimized_timing['median_took_ms']} ms，"
+                f"响应 {optimized_timing['response_bytes']} 字节）" + (f"，{speedup:.1f} 倍" if speedup else ''))
+    logger.info(f"  结果比较: 一致 {comparison['matched']} 项，不一致 {len(comparison['different'])} 项，"
+                f"原查询截断造成的差异 {len(comparison['truncated_in_original'])} 项")
+    return report
+
+
+def log_comparison(report, max_list=20):
+    comparison = report.get('comparison')
+    if not comparison:
+        return
+    for entry in comparison['different'][:max_list]:
+        logger.warning(f"  不一致 {entry['path']}: 原查询 {entry['original']}，改写后 {entry['optimized']}")
+    if comparison['truncated_paths']:
+        logger.warning(f"  原查询被size截断: {', '.join(comparison['truncated_paths'][:max_list])}")
+    for title, key in (('只有原查询返回', 'only_original'), ('只有改写后返回', 'only_optimized')):
+        for pattern, count in list(comparison[key].items())[:max_list]:
+            logger.info(f"  {title}: {pattern}（{count} 处）")
+
+
+def parse_date_fields(items):
+    fields = {}
+    for item in items:
+        match = re.match(r'^([^=]+)=(.+)$', item)
+        if not match:
+            raise ValueError(f"--date-field 格式应为 秒级字段=日期字段: {item}")
+        fields[match.group(1)] = match.group(2)
+    return fields
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='改写仪表盘聚合查询并比较改写前后的耗时和结果')
+    parser.add_argument('queries', nargs='+', help='查询文件，如 qps_query_7days.txt qps_query_modified.txt')
+    parser.add_argument('--host', help='在ES上执行并比较（不指定 --host 和 --store 时只改写）')
+    parser.add_argument('--port', type=int, default=9200, help='ES端口')
+    parser.add_argument('--user', help='ES用户名')
+    parser.add_argument('--password', help='ES密码')
+    parser.add_argument('--store', help='在本地查询引擎上执行并比较，指定列式存储目录（由columnar_store.py生成）')
+    parser.add_argument('--index', '-i', help='目标索引，默认取查询文件中的路径')
+    parser.add_argument('--repeat', type=int, default=3, help='每个查询执行的次数，取中位数')
+    parser.add_argument('--output-dir', help='改写后查询文件的目录，默认与原文件相同')
+    parser.add_argument('--terms-size-limit', type=int, default=TERMS_SIZE_LIMIT,
+                        help='顶层terms的size达到该值时改为composite分页')
+    parser.add_argument('--composite-size', type=int, default=COMPOSITE_PAGE_SIZE, help='composite每页的桶数')
+    parser.add_argument('--date-field', nargs='+', default=[f"{key}={value}" for key, value in DEFAULT_DATE_FIELDS.items()],
+                        help='秒级时间字段与日期字段的对应关系，如 clock=@timestamp')
+    parser.add_argument('--max-list', type=int, default=20, help='日志中最多列出的差异条数')
+    parser.add_argument('--report', '-o', help='把改写说明、耗时和比较结果保存为JSON文件')
+
+    args = parser.parse_args()
+
+    try:
+        field_types = flatten_mapping(INDEX_BODY['mappings']['properties'])
+        runner = None
+        if args.store:
+            runner = QueryRunner(engine=LocalSearchEngine(args.store, index_name=args.index or 'u2performance_for_test'))
+        elif args.host:
+            es = Elasticsearch([BaseImporter.build_es_config(args.host, args.port, args.user, args.password)])
+            if not es.ping():
+                raise ConnectionError("无法连接到Elasticsearch")
+            runner = QueryRunner(es=es)
+            if args.index:
+                # 使用目标索引的实际映射判断字段类型
+                for info in es.indices.get_mapping(index=args.index).values():
+                    field_types.update(flatten_mapping(info['mappings'].get('properties', {})))
+
+        optimizer = DslOptimizer(field_types, parse_date_fields(args.date_field), args.terms_size_limit,
+                                 args.composite_size)
+        reports = []
+        for query_file_path in args.queries:
+            report = optimize_file(query_file_path, optimizer, runner, args.output_dir, args.repeat, args.index)
+            log_comparison(report, args.max_list)
+            reports.append(report)
+
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(reports, f, ensure_ascii=False, indent=2, default=str)
+            logger.info(f"报告已保存: {args.report}")
+
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
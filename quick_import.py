@@ -3,12 +3,16 @@
 """
 快速导入脚本 - 简化版本
 用于快速将u2performance_for_test_import2.json导入到本地ES
+也可以在命令行中指定要导入的文件、目录或通配符，如: python quick_import.py exports/ "daily/*.json.gz"
 """
 
 import subprocess
+import glob
 import sys
 import os
 
+DEFAULT_FILE = "u2performance_for_test_import2.json"
+
 def check_dependencies():
     """检查依赖是否安装"""
     try:
@@ -45,27 +49,30 @@ def check_es_connection():
         print(f"✗ ES连接检查失败: {e}")
         return False
 
-def run_import():
-    """运行导入"""
+def run_import(files):
+    """运行导入（使用导入脚本的多文件模式，多个文件由进程池并行导入，共用限速，最后汇总结果）"""
     print("开始导入数据...")
     try:
-        result = subprocess.run([
-            sys.executable, "import_to_es.py",
-            "--file", "u2performance_for_test_import2.json",
-            "--host", "localhost",
-            "--port", "9200",
-            "--batch-size", "1000",
-            "--index", "u2performance_for_test"
-        ], capture_output=True, text=True)
+        from import_to_es import (IngestMetrics, LOG_FILE, build_parser, configure_logging, expand_input_paths,
+                                  import_files, report_dead_letters, target_index_name)
+        configure_logging(LOG_FILE)
+        args = build_parser().parse_args(["--file", *files])
+        args.index = target_index_name(args)
+        metrics = IngestMetrics()
+        success, results = import_files(args, expand_input_paths(files), metrics)
+        report_dead_letters(args, metrics)
         
-        if result.returncode == 0:
-            print("✓ 数据导入成功！")
-            print(result.stdout)
-            return True
-        else:
+        for result in results:
+            mark = "✓" if result['success'] else "✗"
+            print(f"{mark} {result['file']}: 成功 {result.get('documents_indexed', 0)} 条，"
+                  f"失败 {result.get('documents_failed', 0)} 条")
+        print(f"合计: 成功 {metrics.counters['documents_indexed']} 条，失败 {metrics.counters['documents_failed']} 条")
+        if not success:
             print("✗ 数据导入失败！")
-            print(result.stderr)
             return False
+        
+        print("✓ 数据导入成功！")
+        return True
     except Exception as e:
         print(f"✗ 导入过程出错: {e}")
         return False
@@ -76,8 +83,10 @@ def main():
     print("=" * 50)
     
     # 检查文件是否存在
-    if not os.path.exists("u2performance_for_test_import2.json"):
-        print("✗ u2performance_for_test_import2.json 文件不存在")
+    files = sys.argv[1:] or [DEFAULT_FILE]
+    missing = [path for path in files if not os.path.exists(path) and not glob.glob(path)]
+    if missing:
+        print(f"✗ {', '.join(missing)} 文件不存在")
         return
     
     # 检查依赖
@@ -91,7 +100,7 @@ def main():
         return
     
     # 运行导入
-    if run_import():
+    if run_import(files):
         print("\n🎉 导入完成！")
         print("您可以通过以下方式查看数据：")
         print("1. 访问 http://localhost:9200/_cat/indices 查看索引")
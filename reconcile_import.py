@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入结果核对工具
+把整个索引与导出文件逐条比较，代替 test_import.py 只抽查10条的做法：
+- 索引端用切片的point-in-time + search_after并行扫描（ES 7.10以下自动改用切片scroll），
+  源文件端按批次交给清洗进程，与导入时相同地清洗（以及精简、生成稳定ID）后计算内容摘要；
+- 第一遍只按分区（clock所在的小时/天，或hostname）汇总条数和与顺序无关的内容哈希，内存只与分区数有关；
+- 第二遍只重新读取哈希不一致的分区，按_id列出索引中缺少、多出和内容不同的文档。
+
+两端同时进行，核对耗时与读取一遍数据相当。
+"""
+
+import json
+import heapq
+import hashlib
+import logging
+import argparse
+import sys
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from elasticsearch import Elasticsearch, TransportError
+from import_to_es import (BaseImporter, COMPACT_RULES, build_es_document, iter_json_documents, expand_input_paths,
+                          is_partitioned_index, partition_prefix)
+
+logger = logging.getLogger(__name__)
+
+# 分区方式：(字段, 桶大小秒数)，桶大小为None时按字段取值分区
+PARTITION_FIELDS = {
+    'hour': ('clock', 3600),
+    'day': ('clock', 86400),
+    'hostname': ('hostname', None)
+}
+
+# 导入时添加、与源文件无关的字段，不参与内容比较
+DEFAULT_IGNORE_FIELDS = ('import_timestamp',)
+
+# 分区哈希按2^64取模累加，与文档顺序无关，重复的文档也会被计入
+HASH_MODULUS = 1 << 64
+
+# 没有分区字段的文档所在的分区
+MISSING_PARTITION = '-'
+
+
+def partition_of(source, partition_by):
+    """
+    文档所在的分区
+    """
+    field, size = PARTITION_FIELDS[partition_by]
+    value = source.get(field)
+    if value is None or value == '':
+        return MISSING_PARTITION
+    if size is None:
+        return str(value)
+    try:
+        return int(value) // size * size
+    except (TypeError, ValueError):
+        return MISSING_PARTITION
+
+
+def partition_label(partition, partition_by):
+    """
+    日志和报告中显示的分区名称，按时间分区时为UTC时间
+    """
+    if isinstance(partition, int):
+        fmt = '%Y-%m-%dT%H:00Z' if partition_by == 'hour' else '%Y-%m-%d'
+        return datetime.fromtimestamp(partition, timezone.utc).strftime(fmt)
+    return partition
+
+
+def partition_query(partitions, partition_by):
+    """
+    只匹配指定分区的查询，用于第二遍扫描
+    """
+    field, size = PARTITION_FIELDS[partition_by]
+    clauses = []
+    for partition in partitions:
+        if partition == MISSING_PARTITION:
+            clauses.append({'bool': {'must_not': {'exists': {'field': field}}}})
+        elif size is None:
+            clauses.append({'term': {field: partition}})
+        else:
+            clauses.append({'range': {field: {'gte': partition, 'lt': partition + size}}})
+    return {'bool': {'should': clauses, 'minimum_should_match': 1}}
+
+
+def content_digest(source, ignore_fields=DEFAULT_IGNORE_FIELDS):
+    """
+    文档内容的64位摘要，键顺序和忽略的字段不影响结果
+    """
+    content = {key: value for key, value in source.items() if key not in ignore_fields}
+    payload = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return int.from_bytes(hashlib.blake2b(payload.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def document_key(doc_id, digest):
+    """
+    比较时的文档键：有_id时为_id，否则为内容摘要
+    """
+    return doc_id if doc_id else f"#{digest:016x}"
+
+
+def fingerprint(key, digest):
+    return int.from_bytes(hashlib.blake2b(f"{key}\0{digest:016x}".encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class PartitionSummary:
+    """
+    各分区的文档数和内容哈希（_id与内容摘要的指纹之和）
+    """
+
+    def __init__(self):
+        self.partitions = {}
+
+    def add(self, partition, key, digest):
+        entry = self.partitions.get(partition)
+        if entry is None:
+            entry = self.partitions[partition] = [0, 0]
+        entry[0] += 1
+        entry[1] = (entry[1] + fingerprint(key, digest)) % HASH_MODULUS
+
+    def merge(self, other):
+        for partition, (count, hash_sum) in other.partitions.items():
+            entry = self.partitions.get(partition)
+            if entry is None:
+                self.partitions[partition] = [count, hash_sum]
+            else:
+                entry[0] += count
+                entry[1] = (entry[1] + hash_sum) % HASH_MODULUS
+
+    @property
+    def count(self):
+        return sum(count for count, _ in self.partitions.values())
+
+    def differing(self, other):
+        """
+        与另一端条数或内容哈希不同的分区
+        """
+        return sorted((partition for partition in set(self.partitions) | set(other.partitions)
+                       if self.partitions.get(partition) != other.partitions.get(partition)), key=str)
+
+
+def source_records(docs, options, partitions=None):
+    """
+    按导入时的方式处理一批源记录，产出 (分区, 文档键, 内容摘要)
+    partitions指定时只产出这些分区中的记录
+    """
+    for doc in docs:
+        try:
+            es_doc = build_es_document(doc, options['target_index'], options['stable_id'], options['compact'])
+        except Exception as e:
+            logger.error(f"处理源记录失败: {e}")
+            continue
+        source = es_doc['_source']
+        partition = partition_of(source, options['partition_by'])
+        if partitions is not None and partition not in partitions:
+            continue
+        digest = content_digest(source, options['ignore_fields'])
+        yield partition, document_key(es_doc.get('_id'), digest), digest
+
+
+def summarize_source_batch(docs, options, partitions=None):
+    """
+    在工作进程中处理一批源记录：第一遍返回分区汇总，第二遍（指定partitions）返回明细列表
+    """
+    records = source_records(docs, options, partitions)
+    if partitions is not None:
+        return list(records)
+    summary = PartitionSummary()
+    for record in records:
+        summary.add(*record)
+    return summary
+
+
+def iter_index_hits(es, options, slice_id, pit_id=None, query=None):
+    """
+    扫描索引的一个切片，逐条产出命中的文档
+    pit_id指定时使用point-in-time + search_after，否则使用scroll
+    """
+    body = {'size': options['page_size'], 'query': query or {'match_all': {}}}
+    if options['slices'] > 1:
+        body['slice'] = {'id': slice_id, 'max': options['slices']}
+    keep_alive = options['keep_alive']
+
+    if pit_id:
+        body['pit'] = {'id': pit_id, 'keep_alive': keep_alive}
+        body['sort'] = ['_shard_doc']
+        while True:
+            response = es.search(body=body, request_timeout=120)
+            hits = response['hits']['hits']
+            yield from hits
+            if len(hits) < options['page_size']:
+                return
+            body['pit']['id'] = response.get('pit_id', body['pit']['id'])
+            body['search_after'] = hits[-1]['sort']
+
+    body['sort'] = ['_doc']
+    response = es.search(index=options['index'], body=body, scroll=keep_alive, request_timeout=120)
+    scroll_id = response.get('_scroll_id')
+    try:
+        while response['hits']['hits']:
+            yield from response['hits']['hits']
+            response = es.scroll(scroll_id=scroll_id, scroll=keep_alive, request_timeout=120)
+            scroll_id = response.get('_scroll_id', scroll_id)
+    finally:
+        if scroll_id:
+            try:
+                es.clear_scroll(scroll_id=scroll_id)
+            except TransportError:
+                pass
+
+
+def scan_index_slice(options, slice_id, pit_id=None, partitions=None):
+    """
+    在工作进程中扫描索引的一个切片：第一遍返回分区汇总，第二遍（指定partitions）返回明细列表
+    """
+    es = Elasticsearch([options['es_config']])
+    query = partition_query(partitions, options['partition_by']) if partitions is not None else None
+    summary = PartitionSummary()
+    records = []
+    for hit in iter_index_hits(es, options, slice_id, pit_id, query):
+        source = hit.get('_source', {})
+        partition = partition_of(source, options['partition_by'])
+        digest = content_digest(source, options['ignore_fields'])
+        if partitions is None:
+            summary.add(partition, hit['_id'], digest)
+        elif partition in partitions:
+            records.append((partition, hit['_id'], digest))
+    return summary if partitions is None else records
+
+
+class ImportReconciler:
+    """
+    核对索引与源文件：两端并行读取，先比较分区汇总，再只对不一致的分区列出差异
+    """
+
+    def __init__(self, es_config, index, json_file_paths, partition_by='hour', slices=4, source_workers=4,
+                 page_size=5000, batch_size=5000, stable_id=False, compact=None, ignore_fields=DEFAULT_IGNORE_FIELDS,
+                 keep_alive='5m', max_drilldown_partitions=50):
+        self.es_config = es_config
+        self.es = Elasticsearch([es_config])
+        self.json_file_paths = json_file_paths
+        self.slices = slices
+        self.source_workers = source_workers
+        self.batch_size = batch_size
+        self.max_drilldown_partitions = max_drilldown_partitions
+        self.options = {
+            'es_config': es_config,
+            'index': index,
+            'target_index': index,
+            'partition_by': partition_by,
+            'slices': slices,
+            'page_size': page_size,
+            'stable_id': stable_id,
+            'compact': compact,
+            'ignore_fields': tuple(ignore_fields),
+            'keep_alive': keep_alive
+        }
+
+    def open_pit(self):
+        """
+        打开point-in-time，ES或客户端不支持时返回None（改用scroll）
+        """
+        try:
+            return self.es.open_point_in_time(index=self.options['index'], keep_alive=self.options['keep_alive'])['id']
+        except (AttributeError, TransportError) as e:
+            logger.warning(f"无法打开point-in-time，改用切片scroll扫描: {e}")
+            return None
+
+    def close_pit(self, pit_id):
+        if pit_id:
+            try:
+                self.es.close_point_in_time(body={'id': pit_id})
+            except TransportError as e:
+                logger.warning(f"关闭point-in-time失败: {e}")
+
+    def iter_source_batches(self):
+        batch = []
+        for json_file_path in self.json_file_paths:
+            for doc in iter_json_documents(json_file_path):
+                batch.append(doc)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def collect(self, partitions=None):
+        """
+        两端同时读取：索引的各个切片和源文件的各个批次在同一个进程池中处理，
+        在途的源文件批次不超过工作进程数的2倍。返回 (索引端结果列表, 源文件端结果列表)
+        """
+        pit_id = self.open_pit()
+        index_results = []
+        source_results = []
+        try:
+            with ProcessPoolExecutor(max_workers=self.slices + self.source_workers) as executor:
+                index_futures = [executor.submit(scan_index_slice, self.options, slice_id, pit_id, partitions)
+                                 for slice_id in range(self.slices)]
+                pending = set()
+                for batch in self.iter_source_batches():
+                    if len(pending) >= self.source_workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        source_results.extend(future.result() for future in done)
+                    pending.add(executor.submit(summarize_source_batch, batch, self.options, partitions))
+                source_results.extend(future.result() for future in wait(pending).done)
+                index_results = [future.result() for future in index_futures]
+        finally:
+            self.close_pit(pit_id)
+        return index_results, source_results
+
+    def summarize(self):
+        """
+        第一遍：两端的分区汇总
+        """
+        index_results, source_results = self.collect()
+        index_summary = PartitionSummary()
+        source_summary = PartitionSummary()
+        for summary in index_results:
+            index_summary.merge(summary)
+        for summary in source_results:
+            source_summary.merge(summary)
+        return index_summary, source_summary
+
+    def drill_down(self, partitions):
+        """
+        第二遍：列出指定分区中索引缺少、多出和内容不同的文档，以及源文件中重复的_id
+        （ES中同一_id只保留最后写入的一条，源文件中重复时以最后一条为准）
+        """
+        index_results, source_results = self.collect(set(partitions))
+        index_docs = {}
+        for records in index_results:
+            for partition, key, digest in records:
+                index_docs[key] = (partition, digest)
+        source_docs = {}
+        duplicates = []
+        for records in source_results:
+            for partition, key, digest in records:
+                if key in source_docs:
+                    duplicates.append(key)
+                source_docs[key] = (partition, digest)
+
+        def label(partition):
+            return partition_label(partition, self.options['partition_by'])
+
+        missing = [{'_id': key, 'partition': label(partition)} for key, (partition, _) in source_docs.items()
+                   if key not in index_docs]
+        extra = [{'_id': key, 'partition': label(partition)} for key, (partition, _) in index_docs.items()
+                 if key not in source_docs]
+        different = [{'_id': key, 'partition': label(partition)} for key, (partition, digest) in source_docs.items()
+                     if key in index_docs and index_docs[key][1] != digest]
+        return {'missing_in_index': missing, 'extra_in_index': extra, 'different': different,
+                'duplicate_ids_in_source': sorted(set(duplicates))}
+
+    def run(self):
+        """
+        执行核对，返回报告
+        """
+        partition_by = self.options['partition_by']
+        logger.info(f"开始核对: 索引 {self.options['index']}（{self.slices} 个切片）与 "
+                    f"{len(self.json_file_paths)} 个源文件，按 {partition_by} 分区")
+        index_summary, source_summary = self.summarize()
+        differing = index_summary.differing(source_summary)
+        report = {
+            'index': self.options['index'],
+            'files': self.json_file_paths,
+            'partition_by': partition_by,
+            'source_count': source_summary.count,
+            'index_count': index_summary.count,
+            'partitions': len(set(index_summary.partitions) | set(source_summary.partitions)),
+            'differing_partitions': [
+                {'partition': partition_label(partition, partition_by),
+                 'source_count': source_summary.partitions.get(partition, [0, 0])[0],
+                 'index_count': index_summary.partitions.get(partition, [0, 0])[0]}
+                for partition in differing
+            ]
+        }
+        logger.info(f"源文件 {report['source_count']} 条，索引 {report['index_count']} 条，"
+                    f"{report['partitions']} 个分区中 {len(differing)} 个不一致")
+        if not differing:
+            return report
+
+        if len(differing) > self.max_drilldown_partitions:
+            # 不一致的分区过多时，优先检查条数相差最多的分区
+            logger.warning(f"不一致的分区过多，只列出条数相差最多的 {self.max_drilldown_partitions} 个分区中的差异")
+            differing = heapq.nlargest(
+                self.max_drilldown_partitions, differing,
+                key=lambda partition: abs(source_summary.partitions.get(partition, [0, 0])[0]
+                                          - index_summary.partitions.get(partition, [0, 0])[0]))
+        report['details'] = self.drill_down(differing)
+        report['details']['partitions_checked'] = [partition_label(partition, partition_by) for partition in differing]
+        return report
+
+
+def log_report(report, max_list=20):
+    """
+    把核对结果输出到日志，每类差异最多列出max_list条
+    """
+    for entry in report['differing_partitions'][:max_list]:
+        logger.info(f"  分区 {entry['partition']}: 源文件 {entry['source_count']} 条，索引 {entry['index_count']} 条")
+    details = report.get('details')
+    if not details:
+        return
+    names = {'missing_in_index': '索引中缺少', 'extra_in_index': '索引中多出', 'different': '内容不同',
+             'duplicate_ids_in_source': '源文件中重复的_id'}
+    for name, title in names.items():
+        items = details[name]
+        if not items:
+            continue
+        logger.warning(f"{title}: {len(items)} 条")
+        for item in items[:max_list]:
+            logger.warning(f"  {item}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='核对Elasticsearch索引与导出文件是否一致')
+    parser.add_argument('--file', '-f', nargs='+', required=True, help='源文件，可以是多个文件、目录或通配符')
+    parser.add_argument('--index', '-i', default='u2performance_for_test',
+                        help='要核对的索引、别名或通配符（按时间分区导入时可以使用带日期格式的索引名）')
+    parser.add_argument('--host', default='localhost', help='ES主机地址')
+    parser.add_argument('--port', type=int, default=9200, help='ES端口')
+    parser.add_argument('--user', help='ES用户名')
+    parser.add_argument('--password', help='ES密码')
+    parser.add_argument('--partition-by', choices=list(PARTITION_FIELDS), default='hour', help='分区方式')
+    parser.add_argument('--slices', type=int, default=4, help='索引端并行扫描的切片数')
+    parser.add_argument('--source-workers', type=int, default=4, help='源文件端的处理进程数')
+    parser.add_argument('--page-size', type=int, default=5000, help='每次search_after取回的文档数')
+    parser.add_argument('--stable-id', action='store_true',
+                        help='源记录没有_id时按导入时的方式生成稳定的ID（导入时使用了--checkpoint/--resume/--sync）')
+    parser.add_argument('--compact', action='store_true', help='导入时使用了--compact')
+    parser.add_argument('--compact-fields', nargs='+', choices=list(COMPACT_RULES), help='导入时使用的--compact-fields')
+    parser.add_argument('--ignore-fields', nargs='+', default=list(DEFAULT_IGNORE_FIELDS), help='不参与内容比较的字段')
+    parser.add_argument('--max-drilldown-partitions', type=int, default=50, help='最多列出差异明细的分区数')
+    parser.add_argument('--max-list', type=int, default=20, help='日志中每类差异最多列出的条数')
+    parser.add_argument('--report', '-o', help='把完整的核对结果保存为JSON文件')
+
+    args = parser.parse_args()
+
+    try:
+        json_file_paths = expand_input_paths(args.file)
+        if not json_file_paths:
+            logger.error(f"没有找到源文件: {' '.join(args.file)}")
+            sys.exit(1)
+        index = f"{partition_prefix(args.index)}*" if is_partitioned_index(args.index) else args.index
+        compact = tuple(args.compact_fields) if args.compact_fields else (tuple(COMPACT_RULES) if args.compact else None)
+
+        reconciler = ImportReconciler(
+            BaseImporter.build_es_config(args.host, args.port, args.user, args.password),
+            index, json_file_paths,
+            partition_by=args.partition_by,
+            slices=args.slices,
+            source_workers=args.source_workers,
+            page_size=args.page_size,
+            stable_id=args.stable_id,
+            compact=compact,
+            ignore_fields=args.ignore_fields,
+            max_drilldown_partitions=args.max_drilldown_partitions
+        )
+        report = reconciler.run()
+        log_report(report, args.max_list)
+
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            logger.info(f"核对结果已保存: {args.report}")
+
+        if report['differing_partitions']:
+            logger.error("索引与源文件不一致！")
+            sys.exit(1)
+        logger.info("索引与源文件一致")
+
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟ES服务
+实现导入流程用到的接口（_bulk、索引创建、_settings、_refresh、_forcemerge等），不保存文档，只统计请求，
+用于在没有ES集群的环境中压测导入脚本。可以注入固定延迟和429（集群繁忙）响应：
+- latency_ms / jitter_ms：每个bulk请求的处理延迟；
+- reject_rate：整个bulk请求返回429的比例；
+- item_reject_rate：bulk响应中单条文档返回429的比例；
+- item_error_rate：bulk响应中单条文档返回400（mapper_parsing_exception，不可重试）的比例；
+- max_content_length：请求体超过该字节数时返回413，对应ES的http.max_content_length。
+
+GET /_stub/stats 返回统计信息，POST /_stub/reset 清零统计。
+bulk写入的索引计入文档数，GET <索引>/_alias 可以列出这些索引，DELETE 支持逗号分隔的多个索引。
+PUT _template/<名称> 和 PUT <索引>/_alias/<别名> 记录在 templates、aliases 中，便于测试检查。
+"""
+
+import json
+import time
+import fnmatch
+import itertools
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+STUB_VERSION = '7.17.0'
+
+REJECTED_ERROR = {
+    'type': 'es_rejected_execution_exception',
+    'reason': 'rejected execution (injected by stub server)'
+}
+
+MAPPING_ERROR = {
+    'type': 'mapper_parsing_exception',
+    'reason': 'failed to parse (injected by stub server)'
+}
+
+
+class StubState:
+    """
+    模拟服务的索引、配置和统计信息
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, reject_rate=0.0, item_reject_rate=0.0, item_error_rate=0.0, seed=0,
+                 max_content_length=None):
+        self.latency_ms = latency_ms
+        self.max_content_length = max_content_length
+        self.jitter_ms = jitter_ms
+        self.reject_rate = reject_rate
+        self.item_reject_rate = item_reject_rate
+        self.item_error_rate = item_error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        # 自动生成的_id用计数器而不是self.rng，不影响按种子重现的注入序列
+        self.auto_ids = itertools.count(1)
+        self.indices = {}
+        # 模板名 -> 模板内容，别名 -> 加入该别名的索引表达式
+        self.templates = {}
+        self.aliases = {}
+        # 正在处理的bulk请求数，用于统计最大并发数
+        self.active_requests = 0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {
+                'bulk_requests': 0,
+                'bulk_bytes': 0,
+                'rejected_requests': 0,
+                'too_large_requests': 0,
+                'indexed_docs': 0,
+                'rejected_docs': 0,
+                'failed_docs': 0,
+                'max_request_bytes': 0,
+                'max_concurrent_requests': 0
+            }
+            self.doc_counts = {}
+
+    def random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def auto_id(self):
+        """
+        为没有_id的文档生成唯一的_id
+        """
+        with self.lock:
+            return f"stub-{next(self.auto_ids):012d}"
+
+    def handle_bulk(self, default_index, body):
+        """
+        处理bulk请求体，返回 (状态码, 响应)
+        """
+        with self.lock:
+            self.active_requests += 1
+            self.stats['max_concurrent_requests'] = max(self.stats['max_concurrent_requests'], self.active_requests)
+        try:
+            return self.process_bulk(default_index, body)
+        finally:
+            with self.lock:
+                self.active_requests -= 1
+
+    def process_bulk(self, default_index, body):
+        started = time.time()
+        delay = self.latency_ms + (self.random() * self.jitter_ms if self.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000)
+
+        with self.lock:
+            self.stats['bulk_requests'] += 1
+            self.stats['bulk_bytes'] += len(body)
+            self.stats['max_request_bytes'] = max(self.stats['max_request_bytes'], len(body))
+
+        if self.max_content_length and len(body) > self.max_content_length:
+            with self.lock:
+                self.stats['too_large_requests'] += 1
+            return 413, {'error': {'type': 'content_too_long_exception',
+                                   'reason': f'request body is too large: {len(body)} > {self.max_content_length}'},
+                         'status': 413}
+
+        if self.reject_rate and self.random() < self.reject_rate:
+            with self.lock:
+                self.stats['rejected_requests'] += 1
+            return 429, {'error': dict(REJECTED_ERROR, root_cause=[REJECTED_ERROR]), 'status': 429}
+
+        lines = body.split(b'\n')
+        items = []
+        errors = False
+        indexed = {}
+        rejected = 0
+        failed = 0
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            i += 1
+            if not line.strip():
+                continue
+            action = json.loads(line)
+            op, meta = next(iter(action.items()))
+            if op != 'delete':
+                i += 1
+            index = meta.get('_index') or default_index
+            doc_id = meta.get('_id') or self.auto_id()
+            if self.item_reject_rate and self.random() < self.item_reject_rate:
+                errors = True
+                rejected += 1
+                items.append({op: {'_index': index, '_type': '_doc', '_id': doc_id, 'status': 429,
+                                   'error': REJECTED_ERROR}})
+                continue
+            if self.item_error_rate and self.random() < self.item_error_rate:
+                errors = True
+                failed += 1
+                items.append({op: {'_index': index, '_type': '_doc', '_id': doc_id, 'status': 400,
+                                   'error': MAPPING_ERROR}})
+                continue
+            indexed[index] = indexed.get(index, 0) + 1
+            items.append({op: {'_index': index, '_type': '_doc', '_id': doc_id, '_version': 1, 'result': 'created',
+                               '_shards': {'total': 1, 'successful': 1, 'failed': 0}, 'status': 201}})
+
+        with self.lock:
+            self.stats['indexed_docs'] += sum(indexed.values())
+            self.stats['rejected_docs'] += rejected
+            self.stats['failed_docs'] += failed
+            for index, count in indexed.items():
+                self.doc_counts[index] = self.doc_counts.get(index, 0) + count
+
+        return 200, {'took': int((time.time() - started) * 1000), 'errors': errors, 'items': items}
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """
+    模拟ES的HTTP接口
+    """
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def handle_request(self):
+        path = urlsplit(self.path).path.strip('/')
+        parts = path.split('/') if path else []
+        body = self.read_body()
+        state = self.state
+        endpoint = parts[-1] if parts else ''
+
+        if not parts:
+            self.send_json(200, {
+                'name': 'stub-es',
+                'cluster_name': 'stub',
+                'version': {'number': STUB_VERSION, 'build_flavor': 'default'},
+                'tagline': 'You Know, for Search'
+            })
+        elif path == '_stub/stats':
+            with state.lock:
+                self.send_json(200, dict(state.stats, doc_counts=dict(state.doc_counts)))
+        elif path == '_stub/reset':
+            state.reset()
+            self.send_json(200, {'acknowledged': True})
+        elif parts[0] == '_template' and len(parts) == 2 and self.command == 'PUT':
+            with state.lock:
+                state.templates[parts[1]] = json.loads(body or b'{}')
+            self.send_json(200, {'acknowledged': True})
+        elif len(parts) == 3 and parts[1] in ('_alias', '_aliases') and self.command == 'PUT':
+            with state.lock:
+                state.aliases.setdefault(parts[2], set()).add(parts[0])
+            self.send_json(200, {'acknowledged': True})
+        elif endpoint == '_bulk':
+            status, response = state.handle_bulk(parts[0] if len(parts) > 1 else None, body)
+            self.send_json(status, response)
+        elif endpoint == '_settings':
+            index = parts[0]
+            with state.lock:
+                settings = state.indices.setdefault(index, {})
+                if self.command == 'PUT':
+                    update = json.loads(body or b'{}')
+                    if isinstance(update.get('index'), dict):
+                        update = {f'index.{key}': value for key, value in update['index'].items()}
+                    for key, value in update.items():
+                        if value is None:
+                            settings.pop(key, None)
+                        else:
+                            settings[key] = str(value)
+                    self.send_json(200, {'acknowledged': True})
+                else:
+                    self.send_json(200, {index: {'settings': dict(settings)}})
+        elif endpoint == '_count':
+            with state.lock:
+                count = sum(state.doc_counts.get(index, 0) for index in parts[0].split(',')) if len(parts) > 1 \
+                    else sum(state.doc_counts.values())
+            self.send_json(200, {'count': count, '_shards': {'total': 1, 'successful': 1, 'failed': 0}})
+        elif endpoint == '_alias' and self.command == 'GET':
+            # 列出匹配的索引（包括bulk写入时自动创建的索引），用于分区索引保留策略
+            with state.lock:
+                names = set(state.indices) | set(state.doc_counts)
+            matched = sorted(name for name in names
+                             if any(fnmatch.fnmatchcase(name, pattern) for pattern in parts[0].split(',')))
+            if matched:
+                self.send_json(200, {name: {'aliases': {}} for name in matched})
+            else:
+                self.send_json(404, {'error': {'type': 'index_not_found_exception', 'reason': f'no such index [{parts[0]}]'},
+                                     'status': 404})
+        elif endpoint == '_search':
+            self.send_json(200, {'took': 0, 'timed_out': False,
+                                 '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+                                 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []}})
+        elif endpoint.startswith('_'):
+            # _refresh、_forcemerge、_alias等接口直接确认
+            self.send_json(200, {'acknowledged': True, '_shards': {'total': 1, 'successful': 1, 'failed': 0}})
+        elif len(parts) == 1:
+            index = parts[0]
+            with state.lock:
+                if self.command == 'HEAD':
+                    self.send_json(200 if index in state.indices else 404, {})
+                elif self.command == 'PUT':
+                    state.indices[index] = {}
+                    self.send_json(200, {'acknowledged': True, 'shards_acknowledged': True, 'index': index})
+                elif self.command == 'DELETE':
+                    for name in index.split(','):
+                        state.indices.pop(name, None)
+                        state.doc_counts.pop(name, None)
+                    self.send_json(200, {'acknowledged': True})
+                else:
+                    self.send_json(200, {index: {}})
+        else:
+            self.send_json(200, {'acknowledged': True})
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_PUT = handle_request
+    do_DELETE = handle_request
+    do_HEAD = handle_request
+
+
+class StubESServer:
+    """
+    在后台线程中运行模拟服务，port为0时自动选择空闲端口
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        handler = type('BoundStubRequestHandler', (StubRequestHandler,), {'state': StubState(**options)})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.state = handler.state
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='模拟ES服务（用于导入压测）')
+    parser.add_argument('--listen-host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--listen-port', type=int, default=9200, help='监听端口')
+    parser.add_argument('--latency-ms', type=float, default=0, help='每个bulk请求的固定延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='在固定延迟之上增加的随机延迟上限（毫秒）')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='整个bulk请求返回429的比例')
+    parser.add_argument('--item-reject-rate', type=float, default=0.0, help='单条文档返回429的比例')
+    parser.add_argument('--item-error-rate', type=float, default=0.0, help='单条文档返回400（不可重试）的比例')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    parser.add_argument('--max-content-length', type=int, help='请求体超过该字节数时返回413')
+
+    args = parser.parse_args()
+
+    server = StubESServer(args.listen_host, args.listen_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          reject_rate=args.reject_rate, item_reject_rate=args.item_reject_rate,
+                          item_error_rate=args.item_error_rate, seed=args.seed,
+                          max_content_length=args.max_content_length)
+    logger.info(f"模拟ES服务已启动: http://{server.host}:{server.port}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("模拟ES服务已停止")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试bulk发送：同步与异步导入器在请求被拒绝、条目被拒绝和永久失败时的结果一致
+"""
+
+import json
+import asyncio
+import threading
+import pytest
+import import_to_es
+from import_to_es import ESImporter, AsyncESImporter, AdaptiveBatchSizer, DeadLetterWriter
+from stub_es_server import StubESServer
+
+STUB_OPTIONS = {'reject_rate': 0.2, 'item_reject_rate': 0.05, 'item_error_rate': 0.02, 'seed': 11}
+
+
+def make_batch(size=400):
+    return [{'_index': 'bulk_test', '_id': str(i), '_source': {'value': i}} for i in range(size)]
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    """
+    缩短退避时间，避免测试等待
+    """
+    monkeypatch.setattr(import_to_es, 'BULK_INITIAL_BACKOFF', 0.01)
+
+
+def check_result(result, stub, importer, batch):
+    success, failed, dead_lettered = result
+    stats = stub.state.stats
+    assert success + failed == len(batch)
+    assert success == stats['indexed_docs']
+    assert dead_lettered == failed == importer.dead_letter.count
+    assert importer.metrics.counters['bulk_retries'] > 0
+
+
+def test_sync_bulk_batch(tmp_path):
+    batch = make_batch()
+    with StubESServer(**STUB_OPTIONS) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port,
+                              dead_letter=DeadLetterWriter(str(tmp_path / 'dead.ndjson')))
+        check_result(importer.bulk_batch(batch, 1, 'bulk_test'), stub, importer, batch)
+
+
+def test_async_bulk_batch(tmp_path):
+    pytest.importorskip('aiohttp')
+    batch = make_batch()
+
+    async def run(stub):
+        async with AsyncESImporter(es_host=stub.host, es_port=stub.port,
+                                   dead_letter=DeadLetterWriter(str(tmp_path / 'dead.ndjson'))) as importer:
+            return importer, await importer.bulk_batch(batch, 1, 'bulk_test')
+
+    with StubESServer(**STUB_OPTIONS) as stub:
+        importer, result = asyncio.run(run(stub))
+        check_result(result, stub, importer, batch)
+
+
+def test_async_import_does_not_block_event_loop():
+    """
+    读取批次期间事件循环中的其他任务继续运行：批次生成器等待另一个任务设置的事件，
+    生成器在事件循环线程中执行时该任务无法运行，等待超时
+    """
+    pytest.importorskip('aiohttp')
+    heartbeat = threading.Event()
+    blocked = []
+
+    def batches():
+        for batch_no in range(1, 4):
+            heartbeat.clear()
+            if not heartbeat.wait(2):
+                blocked.append(batch_no)
+            yield make_batch(50)
+
+    async def beat(finished):
+        while not finished.is_set():
+            heartbeat.set()
+            await asyncio.sleep(0.01)
+
+    async def run(stub):
+        finished = asyncio.Event()
+        beater = asyncio.ensure_future(beat(finished))
+        async with AsyncESImporter(es_host=stub.host, es_port=stub.port) as importer:
+            result = await importer.run_batches(batches(), 'bulk_test')
+        finished.set()
+        await beater
+        return result
+
+    with StubESServer() as stub:
+        assert asyncio.run(run(stub)) == (150, 0)
+    assert blocked == []
+
+
+@pytest.mark.parametrize('batch_bytes', [None, 64 * 1024])
+def test_too_large_requests_are_split(tmp_path, batch_bytes):
+    """
+    请求过大（413）时拆小后重发，而不是原样重试后写入死信文件；单条记录仍然过大时才写入死信文件
+    """
+    batch = make_batch(400)
+    batch.append({'_index': 'bulk_test', '_id': 'huge', '_source': {'value': 'x' * 8192}})
+    with StubESServer(max_content_length=4096) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port,
+                              dead_letter=DeadLetterWriter(str(tmp_path / 'dead.ndjson')))
+        if batch_bytes:
+            importer.batch_sizer = AdaptiveBatchSizer(batch_bytes)
+        success, failed, dead_lettered = importer.bulk_batch(batch, 1, 'bulk_test')
+        assert stub.state.stats['too_large_requests'] > 0
+
+    assert (success, failed, dead_lettered) == (400, 1, 1)
+    with open(tmp_path / 'dead.ndjson', encoding='utf-8') as f:
+        assert [json.loads(line)['_id'] for line in f] == ['huge']
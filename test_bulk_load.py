@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量加载模式：导入期间使用BULK_LOAD_SETTINGS，结束后无论成功与否都恢复导入前的设置；
+指定段数时只在没有失败的导入之后强制合并并预热
+"""
+
+import os
+import pytest
+import import_to_es
+from import_to_es import ESImporter, BULK_LOAD_SETTINGS
+from stub_es_server import StubESServer
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+INDEX = 'bulk_load_test'
+
+PRODUCTION = {'index.refresh_interval': '30s', 'index.number_of_replicas': '1'}
+
+EXPECTED_BULK_LOAD = {key: str(value) for key, value in BULK_LOAD_SETTINGS.items()}
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(import_to_es, 'BULK_INITIAL_BACKOFF', 0.01)
+
+
+def record_settings(importer, stub, seen, fail_on=None):
+    """
+    每个批次发送时记录索引当时的设置，fail_on指定时在该批次抛出异常
+    """
+    bulk_batch = importer.bulk_batch
+
+    def recording_bulk_batch(batch, batch_no, target_index):
+        seen.append(dict(stub.state.indices[INDEX]))
+        if batch_no == fail_on:
+            raise RuntimeError('模拟的导入失败')
+        return bulk_batch(batch, batch_no, target_index)
+
+    importer.bulk_batch = recording_bulk_batch
+
+
+def record_calls(monkeypatch, importer, calls):
+    for name in ('forcemerge', 'refresh'):
+        original = getattr(importer.es.indices, name)
+
+        def spy(*args, _name=name, _original=original, **kwargs):
+            calls.append((_name, kwargs.get('index'), kwargs.get('max_num_segments')))
+            return _original(*args, **kwargs)
+
+        monkeypatch.setattr(importer.es.indices, name, spy)
+
+
+def test_bulk_load_settings_are_applied_and_restored(monkeypatch):
+    seen = []
+    calls = []
+    with StubESServer() as stub:
+        stub.state.indices[INDEX] = dict(PRODUCTION)
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        record_settings(importer, stub, seen)
+        record_calls(monkeypatch, importer, calls)
+        assert importer.import_data(SAMPLE_FILE, batch_size=500, target_index=INDEX, bulk_load=True,
+                                    force_merge_segments=1)
+        assert stub.state.indices[INDEX] == PRODUCTION
+        assert stub.state.stats['indexed_docs'] == 2000
+
+    assert len(seen) == 4
+    assert all(settings == EXPECTED_BULK_LOAD for settings in seen)
+    # 先刷新，再按指定段数强制合并
+    assert calls == [('refresh', INDEX, None), ('forcemerge', INDEX, 1)]
+
+
+def test_settings_restored_when_import_fails():
+    seen = []
+    with StubESServer() as stub:
+        stub.state.indices[INDEX] = dict(PRODUCTION)
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        record_settings(importer, stub, seen, fail_on=2)
+        assert not importer.import_data(SAMPLE_FILE, batch_size=500, target_index=INDEX, bulk_load=True)
+        assert stub.state.indices[INDEX] == PRODUCTION
+    assert seen == [EXPECTED_BULK_LOAD, EXPECTED_BULK_LOAD]
+
+
+def test_new_index_is_reset_to_defaults():
+    """
+    导入前没有显式设置的项在结束后被重置（设为null），使用索引模板或ES的默认值
+    """
+    seen = []
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        stub.state.indices.pop(INDEX, None)
+        record_settings(importer, stub, seen)
+        assert importer.import_data(SAMPLE_FILE, batch_size=1000, target_index=INDEX, bulk_load=True)
+        assert stub.state.indices[INDEX] == {}
+    assert seen == [EXPECTED_BULK_LOAD, EXPECTED_BULK_LOAD]
+
+
+def test_force_merge_skipped_after_failures(monkeypatch):
+    calls = []
+    with StubESServer(item_error_rate=0.01, seed=2) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        record_calls(monkeypatch, importer, calls)
+        assert importer.import_data(SAMPLE_FILE, batch_size=500, target_index=INDEX, force_merge_segments=1)
+        assert stub.state.stats['failed_docs'] > 0
+    assert [call[0] for call in calls] == ['refresh']
+
+
+def test_bulk_load_mode_disabled_changes_nothing():
+    with StubESServer() as stub:
+        stub.state.indices[INDEX] = dict(PRODUCTION)
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        with importer.bulk_load_mode(INDEX, enabled=False):
+            assert stub.state.indices[INDEX] == PRODUCTION
+        with importer.bulk_load_mode(INDEX):
+            assert stub.state.indices[INDEX] == EXPECTED_BULK_LOAD
+        assert stub.state.indices[INDEX] == PRODUCTION
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试断点续传：有记录写入死信文件的批次同样推进进度，续传时不重复导入、不重复写入死信
+"""
+
+import json
+import pytest
+from import_to_es import ESImporter, DeadLetterWriter, ImportCheckpoint, iter_dead_letter_batches
+from stub_es_server import StubESServer
+
+TOTAL_DOCS = 2000
+BATCH_SIZE = 100
+
+
+def write_export(path):
+    """
+    生成NDJSON格式的导出文件
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(TOTAL_DOCS):
+            f.write(json.dumps({'_source': {
+                'hostname': f"host-{i % 50}",
+                'value': i * 0.5,
+                'clock': 1749398400 + i,
+                '@timestamp': f"2025-06-08T16:{i // 60 % 60:02d}:{i % 60:02d}.000Z"
+            }}) + '\n')
+
+
+def count_lines(path):
+    if not path.exists():
+        return 0
+    with open(path, 'rb') as f:
+        return sum(1 for line in f if line.strip())
+
+
+class InterruptedImporter(ESImporter):
+    """
+    发送完前几个批次后模拟按下Ctrl+C
+    """
+    stop_after = 5
+
+    def bulk_batch(self, batch, batch_no, target_index='u2performance_for_test'):
+        if batch_no > self.stop_after:
+            raise KeyboardInterrupt
+        return super().bulk_batch(batch, batch_no, target_index)
+
+
+def test_resume_after_dead_lettered_failures(tmp_path):
+    """
+    部分记录永久失败并写入死信文件后中断，续传只导入剩余的记录
+    """
+    export_path = tmp_path / 'export.json'
+    dead_letter_path = tmp_path / 'dead.ndjson'
+    write_export(export_path)
+
+    with StubESServer(item_error_rate=0.05, seed=7) as stub:
+        importer = InterruptedImporter(es_host=stub.host, es_port=stub.port,
+                                       dead_letter=DeadLetterWriter(str(dead_letter_path)))
+        with pytest.raises(KeyboardInterrupt):
+            importer.import_data(str(export_path), BATCH_SIZE, 'checkpoint_test', checkpoint=True)
+        first_failed = stub.state.stats['failed_docs']
+        assert first_failed > 0
+        assert count_lines(dead_letter_path) == first_failed
+
+        checkpoint = ImportCheckpoint(str(export_path), 'checkpoint_test')
+        assert checkpoint.load()
+        assert checkpoint.read == InterruptedImporter.stop_after * BATCH_SIZE
+        assert not checkpoint.completed
+
+        importer = ESImporter(es_host=stub.host, es_port=stub.port,
+                              dead_letter=DeadLetterWriter(str(dead_letter_path)))
+        assert importer.import_data(str(export_path), BATCH_SIZE, 'checkpoint_test', resume=True)
+        stats = stub.state.stats
+
+    # 每条记录恰好发送一次，死信文件中没有重复的记录
+    assert stats['indexed_docs'] + stats['failed_docs'] == TOTAL_DOCS
+    assert count_lines(dead_letter_path) == stats['failed_docs']
+    ids = [doc['_id'] for batch in iter_dead_letter_batches(str(dead_letter_path)) for doc in batch]
+    assert len(ids) == len(set(ids)) == stats['failed_docs']
+
+    checkpoint = ImportCheckpoint(str(export_path), 'checkpoint_test')
+    assert checkpoint.load()
+    assert checkpoint.completed
+    assert checkpoint.read == TOTAL_DOCS
+
+
+def test_checkpoint_stops_at_failures_without_dead_letter(tmp_path):
+    """
+    没有配置死信文件时，失败的记录没有保存，进度停在第一个有失败的批次之前
+    """
+    export_path = tmp_path / 'export.json'
+    write_export(export_path)
+
+    with StubESServer(item_error_rate=0.05, seed=7) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        assert importer.import_data(str(export_path), BATCH_SIZE, 'checkpoint_test', checkpoint=True)
+
+    checkpoint = ImportCheckpoint(str(export_path), 'checkpoint_test')
+    checkpoint.load()
+    assert not checkpoint.completed
+    assert checkpoint.read < TOTAL_DOCS
+
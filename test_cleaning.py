@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试数据清洗：查表清洗的结果与原逐字段判断的实现一致，清洗缓存的并发安全和淘汰顺序
+"""
+
+import os
+import re
+import sys
+import threading
+import pytest
+import import_to_es
+from import_to_es import CleaningCache, clean_document, iter_json_documents, _clean_hostname
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+# 原实现中用到的正则表达式
+IP_PATTERN = re.compile(r'^(\d{1,3}\.){3}\d{1,3}$')
+TIMESTAMP_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+
+# 覆盖各分支边界情况的记录：不合法的IP和时间戳、无法转换的数值、非数组的kpi、控制字符等
+EDGE_CASES = [
+    {'hostip': 'not-an-ip', 'keyword': '10.0.0.1', 'hostname': 'host name!<>', 'moname': '网络|主机',
+     '@timestamp': '2025/06/08 00:00:00', 'value': 'abc', 'clock': '1749398400', 'ts': 1.5,
+     'appname': ' <app>"name\' ', 'kpi': 'cpu', 'kpiname': 'CPU\x00使用率\x7f ', 'extra': 12, 'empty': '',
+     'missing': None, 'undef': 'undefined'},
+    {'hostip': 10, 'kpi': ['a ', '', None, 0, 'b'], 'process_val': '3.25', 'itemid': None,
+     '@timestamp': '2025-06-08T00:00:00.000Z', 'vendor': ['x'], 'nested': {'a': 1}, 'flag': False},
+]
+
+
+def baseline_clean(doc_source):
+    """
+    改为查表分派之前的clean_and_validate_data，作为比较的基准
+    """
+    cleaned_data = {}
+    for key, value in doc_source.items():
+        if value is None or value == "" or value == "undefined":
+            continue
+        str_value = str(value)
+        if key in ['hostip', 'keyword'] and IP_PATTERN.match(str_value):
+            cleaned_data[key] = str_value
+        elif key in ['hostname', 'moname'] and len(str_value) > 0:
+            cleaned_data[key] = re.sub(r'[^\w\-\.]', '_', str_value)
+        elif key in ['@timestamp'] and TIMESTAMP_PATTERN.match(str_value):
+            cleaned_data[key] = str_value
+        elif key in ['process_val', 'value', 'ns', 'clock', 'ts', '__PROCESS_TIME__', 'itemid']:
+            try:
+                if '.' in str_value:
+                    cleaned_data[key] = float(value)
+                else:
+                    cleaned_data[key] = int(value)
+            except (ValueError, TypeError):
+                continue
+        elif key in ['agent', 'mngtorg', 'type', 'componetype', 'appname', 'bizarea', 'vendor']:
+            cleaned_data[key] = re.sub(r'[<>"\']', '', str_value).strip()
+        elif key in ['kpi'] and isinstance(value, list):
+            cleaned_data[key] = [str(item).strip() for item in value if item]
+        else:
+            if isinstance(value, str):
+                cleaned_data[key] = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', str_value).strip()
+            else:
+                cleaned_data[key] = value
+    return cleaned_data
+
+
+@pytest.mark.parametrize('cache_size', [0, 16])
+def test_clean_document_matches_baseline(monkeypatch, cache_size):
+    """
+    样例文件和边界记录经clean_document清洗后与原实现完全相同（包括字段顺序），开启和关闭清洗缓存时都一样
+    """
+    monkeypatch.setattr(import_to_es, 'CLEANING_CACHE', CleaningCache(cache_size) if cache_size else None)
+    sources = [doc.get('_source', {}) for doc in iter_json_documents(SAMPLE_FILE)] + EDGE_CASES
+    assert len(sources) > len(EDGE_CASES)
+    for source in sources:
+        expected = baseline_clean(source)
+        cleaned = clean_document(source)
+        assert cleaned == expected
+        assert list(cleaned) == list(expected)
+        assert [type(value) for value in cleaned.values()] == [type(value) for value in expected.values()]
+
+
+def test_cleaning_cache_concurrent_eviction():
+    """
+    多个线程同时读写一个很小的缓存，不应出现异常，结果与直接清洗相同
+    缩短线程切换间隔，让淘汰与读取更容易交错
+    """
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    cache = CleaningCache(max_entries=16)
+    errors = []
+
+    def worker(seed):
+        try:
+            for i in range(5000):
+                value = f"host-{(seed * 7919 + i) % 200}!"
+                assert cache.clean('hostname', value, _clean_hostname) == _clean_hostname('hostname', value, value)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert errors == []
+    assert len(cache.entries) <= 16
+    counts, evictions = cache.take_counts()
+    assert sum(hits + misses for hits, misses in counts.values()) == 8 * 5000
+    assert evictions > 0
+
+
+def test_cleaning_cache_keeps_recently_used_entries():
+    """
+    按最近使用淘汰：反复命中的取值不会被新取值挤出
+    """
+    cache = CleaningCache(max_entries=3)
+    cache.clean('hostname', 'hot', _clean_hostname)
+    for i in range(10):
+        cache.clean('hostname', f"cold-{i}", _clean_hostname)
+        cache.clean('hostname', 'hot', _clean_hostname)
+    assert ('hostname', 'hot') in cache.entries
+
+
+def test_only_dimension_fields_are_cached(monkeypatch):
+    """
+    @timestamp等每条记录都不同的字段不进入缓存
+    """
+    cache = CleaningCache(max_entries=100)
+    monkeypatch.setattr(import_to_es, 'CLEANING_CACHE', cache)
+    for i in range(50):
+        clean_document({'hostname': 'a.b', '@timestamp': f"2025-06-08T00:00:{i:02d}.000Z", 'appname': 'app'})
+    assert {key for key, _ in cache.entries} == {'hostname', 'appname'}
+
+
+def test_cleaning_cache_does_not_hold_lock_while_cleaning():
+    """
+    一个线程清洗未命中的取值时，其他线程仍然可以读写缓存
+    """
+    cache = CleaningCache(max_entries=100)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_handler(key, value, str_value):
+        started.set()
+        release.wait(5)
+        return _clean_hostname(key, value, str_value)
+
+    slow = threading.Thread(target=cache.clean, args=('hostname', 'slow host', slow_handler))
+    slow.start()
+    try:
+        assert started.wait(5)
+        other = threading.Thread(target=cache.clean, args=('hostname', 'other host', _clean_hostname))
+        other.start()
+        other.join(2)
+        assert not other.is_alive()
+    finally:
+        release.set()
+        slow.join()
+    assert cache.entries[('hostname', 'slow host')] == 'slow_host'
+    assert cache.entries[('hostname', 'other host')] == 'other_host'
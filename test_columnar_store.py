@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试列式存储的输出目录：只覆盖之前生成的列式存储，其他已存在的路径需要指定overwrite
+"""
+
+import pytest
+from columnar_store import ColumnarStoreWriter, ColumnarStore
+
+
+def write_store(path, hostnames, **options):
+    writer = ColumnarStoreWriter(str(path), **options)
+    for i, hostname in enumerate(hostnames):
+        writer.add({'hostname': hostname, 'clock': 1749398400 + i})
+    return writer.close()
+
+
+def test_refuses_non_store_directory(tmp_path):
+    """
+    不为空且不是列式存储的目录不会被删除
+    """
+    output = tmp_path / 'data'
+    output.mkdir()
+    (output / 'notes.txt').write_text('keep me', encoding='utf-8')
+    with pytest.raises(FileExistsError):
+        ColumnarStoreWriter(str(output))
+    assert (output / 'notes.txt').read_text(encoding='utf-8') == 'keep me'
+
+
+def test_refuses_existing_file(tmp_path):
+    output = tmp_path / 'data.columns'
+    output.write_text('keep me', encoding='utf-8')
+    with pytest.raises(FileExistsError):
+        ColumnarStoreWriter(str(output))
+    assert output.read_text(encoding='utf-8') == 'keep me'
+
+
+def test_empty_directory_and_previous_store(tmp_path):
+    """
+    空目录直接使用，之前生成的列式存储重新生成
+    """
+    output = tmp_path / 'store'
+    output.mkdir()
+    write_store(output, ['a', 'b', 'c'])
+    meta = write_store(output, ['d', 'e'])
+    assert meta['rows'] == 2
+    assert ColumnarStore(str(output)).values('hostname').tolist() == ['d', 'e']
+
+
+def test_overwrite_removes_existing_directory(tmp_path):
+    output = tmp_path / 'data'
+    output.mkdir()
+    (output / 'notes.txt').write_text('old', encoding='utf-8')
+    write_store(output, ['a'], overwrite=True)
+    assert not (output / 'notes.txt').exists()
+    assert ColumnarStore(str(output)).rows == 1
+
+
+@pytest.mark.parametrize('values', [
+    ['a', 5, '5', {'x': 1}, 'a', [1, '2'], 5.5, True],
+    [5, 'a', '5', 5, None, 'b'],
+])
+def test_mixed_types_in_dictionary_column(tmp_path, values):
+    """
+    同一列先后出现字符串和其他类型的值时按JSON保存，读回的值和类型不变
+    """
+    output = tmp_path / 'store'
+    write_store(output, values)
+    assert ColumnarStore(str(output)).values('hostname').tolist() == values
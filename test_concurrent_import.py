@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试并发导入：多个工作线程同时发送bulk请求，在途批次数受max_inflight限制，
+每个批次的成功和失败都被统计且只统计一次
+"""
+
+import os
+import pytest
+import import_to_es
+from import_to_es import ESImporter
+from stub_es_server import StubESServer
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+INDEX = 'concurrent_test'
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(import_to_es, 'BULK_INITIAL_BACKOFF', 0.01)
+
+
+def make_batches(count, size, progress):
+    """
+    产出批次并记录已读取的批次数
+    """
+    for batch_no in range(count):
+        progress['read'] += 1
+        progress['max_ahead'] = max(progress['max_ahead'], progress['read'] - progress['done'])
+        yield [{'_index': INDEX, '_id': f"{batch_no}-{i}", '_source': {'value': i}} for i in range(size)]
+
+
+@pytest.mark.parametrize('workers, max_inflight', [(4, 6), (3, None)])
+def test_workers_account_every_batch(workers, max_inflight):
+    progress = {'read': 0, 'done': 0, 'max_ahead': 0}
+    finished = {}
+
+    def on_batch_done(batch_no, success, failed, dead_lettered):
+        progress['done'] += 1
+        assert batch_no not in finished
+        finished[batch_no] = (success, failed)
+
+    with StubESServer(latency_ms=30, reject_rate=0.1, item_error_rate=0.03, seed=4) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port, max_connections=workers)
+        success, failed = importer.run_batches(make_batches(24, 50, progress), INDEX, workers=workers,
+                                               max_inflight=max_inflight, on_batch_done=on_batch_done)
+        stats = stub.state.stats
+
+    assert sorted(finished) == list(range(1, 25))
+    assert success == sum(result[0] for result in finished.values()) == stats['indexed_docs']
+    assert failed == sum(result[1] for result in finished.values()) == stats['failed_docs']
+    assert success + failed == 24 * 50
+    assert stats['rejected_requests'] > 0
+    assert 1 < stats['max_concurrent_requests'] <= workers
+    # 读取批次的进度最多领先已完成的批次 max_inflight+1 个（正在等待提交的一个）
+    assert progress['max_ahead'] <= (max_inflight or workers * 2) + 1
+
+
+def test_import_data_with_workers():
+    with StubESServer(latency_ms=5) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port, max_connections=4)
+        assert importer.import_data(SAMPLE_FILE, batch_size=100, target_index=INDEX, workers=4, max_inflight=8)
+        assert stub.state.stats['indexed_docs'] == 2000
+        assert stub.state.stats['bulk_requests'] == 20
+        assert stub.state.stats['max_concurrent_requests'] > 1
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试死信文件：永久失败的记录计入已写入死信的条数，重新导入时跳过重复的记录
+"""
+
+import json
+from import_to_es import ESImporter, DeadLetterWriter, iter_dead_letter_batches
+from stub_es_server import StubESServer
+
+
+def test_bulk_batch_reports_dead_lettered(tmp_path):
+    """
+    bulk_batch返回的失败数与写入死信文件的条数一致
+    """
+    dead_letter_path = tmp_path / 'dead.ndjson'
+    batch = [{'_index': 'dead_letter_test', '_id': str(i), '_source': {'value': i}} for i in range(500)]
+    with StubESServer(item_error_rate=0.05, seed=3) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port,
+                              dead_letter=DeadLetterWriter(str(dead_letter_path)))
+        success, failed, dead_lettered = importer.bulk_batch(batch, 1, 'dead_letter_test')
+        assert failed == stub.state.stats['failed_docs'] > 0
+
+    assert success + failed == len(batch)
+    assert dead_lettered == failed == importer.dead_letter.count
+    with open(dead_letter_path, encoding='utf-8') as f:
+        assert sum(1 for _ in f) == failed
+
+
+def test_bulk_batch_without_dead_letter(tmp_path):
+    """
+    没有配置死信文件时，失败的记录不计入已写入死信的条数
+    """
+    batch = [{'_index': 'dead_letter_test', '_id': str(i), '_source': {'value': i}} for i in range(200)]
+    with StubESServer(item_error_rate=0.1, seed=3) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        success, failed, dead_lettered = importer.bulk_batch(batch, 1, 'dead_letter_test')
+
+    assert failed > 0
+    assert dead_lettered == 0
+
+
+def test_replay_skips_duplicate_dead_letters(tmp_path):
+    """
+    同一记录在死信文件中出现多次时只重新导入一次
+    """
+    dead_letter_path = tmp_path / 'dead.ndjson'
+    with open(dead_letter_path, 'w', encoding='utf-8') as f:
+        for doc_id in ('a', 'b', 'a', 'c', 'b'):
+            f.write(json.dumps({'_index': 'replay_test', '_id': doc_id, '_source': {'value': 1},
+                                'status': 400, 'error': 'mapper_parsing_exception'}) + '\n')
+        f.write(json.dumps({'_index': 'other_index', '_id': 'a', '_source': {'value': 1}}) + '\n')
+
+    batches = list(iter_dead_letter_batches(str(dead_letter_path), batch_size=2))
+    assert [(doc['_index'], doc['_id']) for batch in batches for doc in batch] == [
+        ('replay_test', 'a'), ('replay_test', 'b'), ('replay_test', 'c'), ('other_index', 'a')]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试采样去重：多文件导入的各导入进程共用去重过滤器；缺少zstandard时给出明确的提示
+"""
+
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+import import_to_es
+from import_to_es import SampleDeduplicator, open_input_file
+
+
+def make_batches(start, stop, batch_size=100):
+    """
+    生成clock从start到stop的采样批次
+    """
+    docs = [{'_source': {'mo': 'mo-1', 'kpiid': 'kpi-1', 'clock': clock}} for clock in range(start, stop)]
+    return [docs[i:i + batch_size] for i in range(0, len(docs), batch_size)]
+
+
+def dedupe_in_worker(start, stop):
+    """
+    在导入进程中用进程池初始化时传入的过滤器去重，返回保留的采样数
+    """
+    deduplicator = import_to_es._FILE_WORKER_DEDUPLICATOR
+    return sum(len(batch) for batch in deduplicator.track(make_batches(start, stop)))
+
+
+def test_shared_deduplicator_across_processes():
+    """
+    两个导入进程分别处理相互重叠的文件，重叠部分只保留一次
+    """
+    deduplicator = SampleDeduplicator(capacity=100000, error_rate=0.0001, shared=True)
+    with ProcessPoolExecutor(max_workers=2, initializer=import_to_es._init_file_worker,
+                             initargs=(None, 0, deduplicator)) as executor:
+        kept = list(executor.map(dedupe_in_worker, (0, 5000), (10000, 15000)))
+    assert sum(kept) == 15000
+
+
+def test_local_deduplicator_drops_repeated_batches():
+    """
+    单个进程中重复的批次整批丢弃
+    """
+    deduplicator = SampleDeduplicator(capacity=10000)
+    kept = list(deduplicator.track(make_batches(0, 1000) + make_batches(500, 1500)))
+    assert sum(len(batch) for batch in kept) == 1500
+    assert deduplicator.duplicates == 500
+
+
+def test_zst_without_zstandard(tmp_path, monkeypatch):
+    """
+    没有安装zstandard时读取.zst文件给出安装提示
+    """
+    path = tmp_path / 'export.json.zst'
+    path.write_bytes(b'')
+    monkeypatch.setattr(import_to_es, 'zstandard', None)
+    with pytest.raises(ImportError, match='pip install zstandard'):
+        open_input_file(str(path))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试降采样：点数不超过宽度、保留首尾两点，minmax保留每个时间桶的最小值和最大值，
+LTTB前的min/max预选只在预选出的点中选择，没有数据的主机返回空序列
+"""
+
+import pytest
+from downsample_service import DownsamplingService, downsample_indices, lttb_indices, minmax_indices
+from es_cache_proxy import TTLCache
+
+np = pytest.importorskip('numpy')
+
+START = 1749398400
+
+
+def make_series(n, seed=0):
+    """
+    时间间隔不均匀、带尖峰的序列
+    """
+    rng = np.random.default_rng(seed)
+    x = START + np.cumsum(rng.integers(1, 120, n)).astype(np.float64)
+    y = np.cumsum(rng.normal(0, 1, n))
+    if n > 10:
+        y[rng.integers(0, n, 5)] += rng.choice([-50, 50], 5)
+    return x, y
+
+
+def series_range(x):
+    return (int(x[0]), int(x[-1]) + 1) if len(x) else (START, START + 3600)
+
+
+def reference_minmax(x, y, buckets, start, end):
+    """
+    逐个时间桶取第一个最小值和第一个最大值的参考实现
+    """
+    n = len(x)
+    if n <= 2 * buckets + 2:
+        return list(range(n))
+    span = max(end - start, 1)
+    members = {}
+    for i in range(n):
+        bucket = min(max(int((x[i] - start) * buckets // span), 0), buckets - 1)
+        members.setdefault(bucket, []).append(i)
+    selected = {0, n - 1}
+    for indices in members.values():
+        values = [y[i] for i in indices]
+        selected.add(indices[values.index(min(values))])
+        selected.add(indices[values.index(max(values))])
+    return sorted(selected)
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 7, 500, 20000])
+@pytest.mark.parametrize('width', [4, 9, 800])
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_point_count_and_endpoints(n, width, method):
+    x, y = make_series(n, seed=n)
+    start, end = series_range(x)
+    indices = downsample_indices(x, y, width, method, start, end)
+    assert len(indices) <= min(n, width)
+    assert np.all(np.diff(indices) > 0)
+    if n:
+        assert indices[0] == 0
+        assert indices[-1] == n - 1
+    if n <= width:
+        assert list(indices) == list(range(n))
+
+
+@pytest.mark.parametrize('n, buckets', [(50, 30), (1000, 10), (20000, 399)])
+def test_minmax_matches_reference(n, buckets):
+    x, y = make_series(n, seed=buckets)
+    start, end = series_range(x)
+    assert minmax_indices(x, y, buckets, start, end).tolist() == reference_minmax(x, y, buckets, start, end)
+
+
+def test_minmax_preserves_extremes():
+    """
+    整个序列的最小值和最大值以及每个时间桶的极值都被保留，包括范围之外被截到首尾桶的点
+    """
+    x, y = make_series(20000, seed=4)
+    start, end = int(x[100]), int(x[-100])
+    width = 200
+    indices = downsample_indices(x, y, width, 'minmax', start, end)
+    assert len(indices) <= width
+    kept = set(y[indices].tolist())
+    assert y.min() in kept and y.max() in kept
+
+    buckets = (width - 2) // 2
+    bucket = np.clip(((x - start) * buckets // (end - start)).astype(np.int64), 0, buckets - 1)
+    for b in np.unique(bucket):
+        values = y[bucket == b]
+        assert values.min() in kept and values.max() in kept
+
+
+def test_lttb_preselects_with_minmax():
+    x, y = make_series(20000, seed=9)
+    start, end = series_range(x)
+    width = 100
+    candidates = minmax_indices(x, y, width * 4 // 2, start, end)
+    indices = downsample_indices(x, y, width, 'lttb', start, end, minmax_ratio=4)
+    assert len(indices) == width
+    assert set(indices.tolist()) <= set(candidates.tolist())
+    assert indices.tolist() == candidates[lttb_indices(x[candidates], y[candidates], width)].tolist()
+
+    full = downsample_indices(x, y, width, 'lttb', start, end, minmax_ratio=0)
+    assert full.tolist() == lttb_indices(x, y, width).tolist()
+    # 点数不超过 宽度*倍数 时不预选
+    short_x, short_y = x[:400], y[:400]
+    assert downsample_indices(short_x, short_y, width, 'lttb', start, end, minmax_ratio=4).tolist() == \
+        lttb_indices(short_x, short_y, width).tolist()
+
+
+class FakeES:
+    """
+    按composite聚合的after_key分页返回 (hostname, clock) 的平均值
+    """
+
+    def __init__(self, points):
+        self.points = points
+        self.requests = 0
+
+    def search(self, index, body, request_timeout=None):
+        self.requests += 1
+        filters = body['query']['bool']['filter']
+        hosts = filters[0]['terms']['hostname']
+        bounds = filters[2]['range']['clock']
+        composite = body['aggs']['points']['composite']
+        keys = sorted((host, clock) for host in hosts for clock, _ in self.points.get(host, [])
+                      if bounds['gte'] <= clock < bounds['lt'])
+        if 'after' in composite:
+            after = (composite['after']['hostname'], composite['after']['clock'])
+            keys = [key for key in keys if key > after]
+        page = keys[:composite['size']]
+        values = {(host, clock): value for host in hosts for clock, value in self.points.get(host, [])}
+        buckets = [{'key': {'hostname': host, 'clock': clock}, 'value': {'value': values[(host, clock)]}}
+                   for host, clock in page]
+        result = {'buckets': buckets}
+        if buckets:
+            result['after_key'] = buckets[-1]['key']
+        return {'aggregations': {'points': result}}
+
+
+def make_service(es, **options):
+    return DownsamplingService(es, 'u2performance_for_test', TTLCache(100), TTLCache(100), **options)
+
+
+def test_query_returns_empty_series_for_host_without_points():
+    x, y = make_series(3000, seed=2)
+    es = FakeES({'host-a': list(zip(x.astype(int).tolist(), y.tolist()))})
+    service = make_service(es, snap_seconds=0, page_size=700)
+    start, end = int(x[0]), int(x[-1]) + 1
+    for method in ('lttb', 'minmax'):
+        response = service.query(['host-a', 'host-b'], 'kpi', start, end, width=50, method=method)
+        series = {entry['host']: entry for entry in response['series']}
+        assert series['host-b'] == {'host': 'host-b', 'raw_points': 0, 'points': []}
+        points = series['host-a']['points']
+        assert series['host-a']['raw_points'] == 3000
+        assert len(points) <= 50
+        assert points[0] == [int(x[0]) * 1000, y[0]]
+        assert points[-1] == [int(x[-1]) * 1000, y[-1]]
+    # 原始序列已缓存，换算法时不再查询ES
+    assert es.requests == 5
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试查询缓存代理：拆分后合并的聚合结果与直接查询一致，历史部分的缓存键在一天内不变
+"""
+
+import os
+import pytest
+import es_cache_proxy
+from es_cache_proxy import CachingSearchProxy, TTLCache, is_mergeable, sub_aggs
+from columnar_store import ColumnarStoreWriter
+from import_to_es import HourlyRollup
+from local_query_engine import LocalSearchEngine, load_query_file
+from zabbix_doc_generator import SampleProfile, ZabbixDocumentGenerator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUERY_FILES = ['qps_query_7days.txt', 'qps_query_modified.txt', 'qps_query_rollup.txt']
+
+DAY = 86400
+DAY_START = 1749340800  # 2025-06-08T00:00:00Z
+
+
+class LocalES:
+    """
+    用本地查询引擎代替ES，记录收到的查询
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.requests = []
+        self.transport = self
+
+    def perform_request(self, method, path, params=None, body=None):
+        self.requests.append(body)
+        return self.engine.search(body)
+
+
+@pytest.fixture
+def local_es(tmp_path):
+    """
+    前一天主要是a、b两台主机的记录，当天主要是c，按天分别取前2个与整体的前2个不同
+    """
+    writer = ColumnarStoreWriter(str(tmp_path / 'store'))
+    counts = [(DAY_START - DAY, {'a': 10, 'b': 9, 'c': 1}), (DAY_START, {'a': 1, 'b': 1, 'c': 10})]
+    for start, hosts in counts:
+        offset = 0
+        for hostname, count in hosts.items():
+            for _ in range(count):
+                writer.add({'hostname': hostname, 'value': float(offset), 'clock': start + offset * 600})
+                offset += 1
+    writer.close()
+    return LocalES(LocalSearchEngine(str(tmp_path / 'store')))
+
+
+def make_proxy(es, monkeypatch, now):
+    monkeypatch.setattr(es_cache_proxy.time, 'time', lambda: now)
+    return CachingSearchProxy(es, TTLCache(), ttl=DAY, tail_ttl=10)
+
+
+def range_query(aggs):
+    return {
+        'size': 0,
+        'query': {'bool': {'filter': [{'range': {'clock': {'gte': DAY_START - DAY, 'lte': DAY_START + DAY - 1}}}]}},
+        'aggs': aggs
+    }
+
+
+def test_terms_falls_back_when_size_below_cardinality(local_es, monkeypatch):
+    dsl = range_query({'hosts': {'terms': {'field': 'hostname', 'size': 2},
+                                 'aggs': {'total': {'sum': {'field': 'value'}}}}})
+    proxy = make_proxy(local_es, monkeypatch, DAY_START + 6 * 3600)
+    direct = local_es.engine.search(dsl)
+    response = proxy.search('/_search', {}, dsl)
+    assert response['aggregations'] == direct['aggregations']
+    assert [bucket['key'] for bucket in response['aggregations']['hosts']['buckets']] == ['a', 'c']
+
+    # 之后同一查询不再拆分
+    local_es.requests.clear()
+    proxy.cache = TTLCache()
+    proxy.search('/_search', {}, dsl)
+    assert len(local_es.requests) == 1
+
+
+def test_terms_merged_when_size_covers_cardinality(local_es, monkeypatch):
+    dsl = range_query({'hosts': {'terms': {'field': 'hostname', 'size': 10}}})
+    proxy = make_proxy(local_es, monkeypatch, DAY_START + 6 * 3600)
+    response = proxy.search('/_search', {}, dsl)
+    assert response['aggregations'] == local_es.engine.search(dsl)['aggregations']
+    assert len(local_es.requests) == 2
+
+
+def test_date_histogram_split_matches_direct(local_es, monkeypatch):
+    dsl = range_query({'per_hour': {
+        'date_histogram': {'field': 'clock', 'fixed_interval': '1h', 'min_doc_count': 0},
+        'aggs': {'total': {'sum': {'field': 'value'}}, 'peak': {'max': {'field': 'value'}}}
+    }})
+    proxy = make_proxy(local_es, monkeypatch, DAY_START + 6 * 3600)
+    response = proxy.search('/_search', {}, dsl)
+    assert response['aggregations'] == local_es.engine.search(dsl)['aggregations']
+
+
+def test_historical_key_stable_within_day(local_es, monkeypatch):
+    """
+    一天之内的多次刷新只重新查询最新部分，历史部分命中缓存
+    """
+    dsl = range_query({'total': {'sum': {'field': 'value'}}})
+    proxy = make_proxy(local_es, monkeypatch, DAY_START + 3600)
+    first = proxy.search('/_search', {}, dsl)
+    for hour in (5, 12, 23):
+        monkeypatch.setattr(es_cache_proxy.time, 'time', lambda: DAY_START + hour * 3600)
+        local_es.requests.clear()
+        assert proxy.search('/_search', {}, dsl)['aggregations'] == first['aggregations']
+        clock_range = es_cache_proxy.find_clock_ranges(local_es.requests[0]['query'])[0]
+        assert len(local_es.requests) == 1 and clock_range['gte'] == DAY_START
+
+
+class DashboardES:
+    """
+    按请求路径把仪表盘查询分派到原始数据或小时汇总的本地查询引擎
+    """
+
+    def __init__(self, raw, rollup):
+        self.raw = raw
+        self.rollup = rollup
+        self.requests = []
+        self.transport = self
+
+    def engine(self, path):
+        return self.rollup if 'rollup' in path else self.raw
+
+    def perform_request(self, method, path, params=None, body=None):
+        self.requests.append(body)
+        return self.engine(path).search(body)
+
+
+@pytest.fixture(scope='module')
+def dashboard_es(tmp_path_factory):
+    """
+    按222.json生成6台主机从开始到DASHBOARD_NOW的采样，以及对应的小时汇总
+    """
+    profile = SampleProfile(os.path.join(HERE, '222.json'))
+    generator = ZabbixDocumentGenerator(profile, hosts=6, kpis=4, kpis_per_host=2, apps=3, seed=5)
+    steps = (DASHBOARD_NOW - profile.start_clock) // profile.step
+    sources = [doc['_source'] for doc in generator.generate(steps * len(generator.series))]
+
+    root = tmp_path_factory.mktemp('dashboard')
+    raw_writer = ColumnarStoreWriter(str(root / 'raw'))
+    rollup = HourlyRollup()
+    for source in sources:
+        raw_writer.add(source)
+        rollup.add(source)
+    raw_writer.close()
+    rollup_writer = ColumnarStoreWriter(str(root / 'rollup'))
+    for action in rollup.iter_actions('u2performance_for_test_rollup_1h'):
+        rollup_writer.add(action['_source'])
+    rollup_writer.close()
+    return DashboardES(LocalSearchEngine(str(root / 'raw')), LocalSearchEngine(str(root / 'rollup')))
+
+
+# 采样结束的时间：数据开始后第二个整天的6点，历史部分到当天0点为止
+DASHBOARD_NOW = 1749513600 + 6 * 3600
+
+
+@pytest.mark.parametrize('query_file', QUERY_FILES)
+def test_dashboard_queries_are_split(dashboard_es, monkeypatch, query_file):
+    """
+    仪表盘查询拆成历史部分和最新部分，合并结果与直接查询相同；同一天内再次查询时历史部分命中缓存
+    """
+    _, path, dsl = load_query_file(os.path.join(HERE, query_file))
+    proxy = make_proxy(dashboard_es, monkeypatch, DASHBOARD_NOW)
+    closed_until = proxy.closed_until()
+    assert is_mergeable(sub_aggs(dsl), closed_until)
+
+    dashboard_es.requests.clear()
+    response = proxy.search(path, {}, dsl)
+    assert response['aggregations'] == dashboard_es.engine(path).search(dsl)['aggregations']
+    ranges = [es_cache_proxy.find_clock_ranges(body['query'])[0] for body in dashboard_es.requests]
+    assert [clock_range.get('lte') for clock_range in ranges][0] == closed_until - 1
+    assert ranges[1]['gte'] == closed_until
+    assert response['aggregations']['group_by_device']['buckets']
+
+    monkeypatch.setattr(es_cache_proxy.time, 'time', lambda: DASHBOARD_NOW + 3600)
+    dashboard_es.requests.clear()
+    proxy.search(path, {}, dsl)
+    assert len(dashboard_es.requests) == 1
+    assert es_cache_proxy.find_clock_ranges(dashboard_es.requests[0]['query'])[0]['gte'] == closed_until
+
+
+def test_bucket_local_aggs_need_aligned_histogram():
+    """
+    按clock以外的字段排序的top_hits只有在与拆分点对齐的clock直方图中才能拆分
+    """
+    aggs = {'per_hour': {'histogram': {'field': 'clock', 'interval': 3600},
+                         'aggs': {'latest': {'top_hits': {'sort': [{'value': 'desc'}], 'size': 1}},
+                                  'hosts': {'cardinality': {'field': 'hostname'}}}}}
+    assert is_mergeable(aggs, DAY_START)
+    assert not is_mergeable(aggs, DAY_START + 1800)
+    assert not is_mergeable(aggs['per_hour']['aggs'], DAY_START)
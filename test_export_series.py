@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试序列导出：时间段与桶边界对齐，按时间段并行翻页导出的行与直接按 (主机, 小时) 汇总的结果一致，
+每个组合只导出一次
+"""
+
+import os
+import csv
+import threading
+from collections import defaultdict
+import pytest
+from columnar_store import ColumnarStoreWriter
+from export_series import CsvSeriesWriter, SeriesExporter, format_hour, split_windows
+from local_query_engine import LocalSearchEngine
+from zabbix_doc_generator import SampleProfile, ZabbixDocumentGenerator
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+
+class LocalES:
+    """
+    用本地查询引擎代替ES，记录每次请求的查询
+    """
+
+    def __init__(self, engine, fail_after=None):
+        self.engine = engine
+        self.fail_after = fail_after
+        self.bodies = []
+        self.lock = threading.Lock()
+
+    def search(self, index, body, request_timeout=None):
+        with self.lock:
+            self.bodies.append(body)
+            if self.fail_after is not None and len(self.bodies) > self.fail_after:
+                raise ConnectionError('模拟的请求失败')
+        return self.engine.search(body)
+
+
+class ListWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+
+
+@pytest.fixture(scope='module')
+def sources():
+    generator = ZabbixDocumentGenerator(SampleProfile(SAMPLE_FILE), hosts=5, kpis=2, kpis_per_host=1, apps=2, seed=3)
+    return [doc['_source'] for doc in generator.generate(5 * 200)]
+
+
+@pytest.fixture(scope='module')
+def engine(sources, tmp_path_factory):
+    path = tmp_path_factory.mktemp('export') / 'store'
+    writer = ColumnarStoreWriter(str(path))
+    for source in sources:
+        writer.add(source)
+    writer.close()
+    return LocalSearchEngine(str(path))
+
+
+def expected_rows(sources, start, end, interval=3600):
+    groups = defaultdict(list)
+    for source in sources:
+        if start <= source['clock'] < end:
+            groups[(source['hostname'], source['clock'] // interval * interval)].append(source)
+    rows = []
+    for (hostname, clock), docs in groups.items():
+        values = [doc['value'] for doc in docs]
+        rows.append({
+            'hostname': hostname,
+            '@timestamp': format_hour(clock),
+            'clock': clock,
+            'count': len(docs),
+            'min': min(values),
+            'max': max(values),
+            'avg': pytest.approx(sum(values) / len(values)),
+            'last': max(docs, key=lambda doc: doc['clock'])['value']
+        })
+    return sorted(rows, key=lambda row: (row['hostname'], row['clock']))
+
+
+@pytest.mark.parametrize('start, end, interval, partitions', [
+    (1749398400, 1749398400 + 86400, 3600, 4),
+    (1749398400 + 1234, 1749398400 + 86400 + 17, 3600, 5),
+    (1749398400 + 1234, 1749398400 + 2000, 3600, 8),
+    (1749398400, 1749398400 + 7 * 86400, 86400, 3),
+    (1749398401, 1749398400 + 3600 * 10, 600, 100),
+])
+def test_split_windows_are_aligned_and_contiguous(start, end, interval, partitions):
+    windows = split_windows(start, end, interval, partitions)
+    assert 1 <= len(windows) <= partitions
+    assert windows[0][0] == start
+    assert windows[-1][1] == end
+    for (low, high), (next_low, _) in zip(windows, windows[1:]):
+        assert high == next_low
+        assert high % interval == 0
+    assert all(low < high for low, high in windows)
+
+
+def test_to_row():
+    exporter = SeriesExporter(None, 'u2performance_for_test')
+    bucket = {
+        'key': {'hostname': 'host-a', 'hour': 1749398400.0},
+        'doc_count': 6,
+        'value_stats': {'count': 6, 'min': 1.0, 'max': 4.0, 'avg': 2.5, 'sum': 15.0},
+        'latest': {'top': [{'sort': [1749401400], 'metrics': {'value': 3.0}}]}
+    }
+    assert exporter.to_row(bucket) == {
+        'hostname': 'host-a', '@timestamp': '2025-06-08T16:00:00.000Z', 'clock': 1749398400,
+        'count': 6, 'min': 1.0, 'max': 4.0, 'avg': 2.5, 'last': 3.0
+    }
+    bucket['latest'] = {'top': []}
+    bucket['value_stats'] = {'count': 0, 'min': None, 'max': None, 'avg': None, 'sum': 0.0}
+    row = exporter.to_row(bucket)
+    assert row['last'] is None and row['min'] is None
+    assert list(row) == exporter.columns
+
+
+@pytest.mark.parametrize('page_size, concurrency, partitions', [(7, 3, 5), (1000, 1, 1), (5, 4, 40)])
+def test_export_pages_through_every_window(sources, engine, page_size, concurrency, partitions):
+    """
+    开始和结束时间不在整点时，时间段的范围过滤只包含 [start, end) 内的文档
+    """
+    start = min(source['clock'] for source in sources) + 1800
+    end = max(source['clock'] for source in sources) - 1500
+    es = LocalES(engine)
+    exporter = SeriesExporter(es, 'u2performance_for_test', page_size=page_size, concurrency=concurrency)
+    writer = ListWriter()
+    stats = exporter.export(writer, start, end, partitions=partitions)
+
+    expected = expected_rows(sources, start, end)
+    assert sorted(writer.rows, key=lambda row: (row['hostname'], row['clock'])) == expected
+    assert stats['rows'] == len(expected)
+    assert stats['windows'] == len(split_windows(start, end, 3600, partitions))
+    assert stats['requests'] == len(es.bodies)
+    # 每个时间段翻到不满一页为止：请求数不少于页数，也不超过页数加时间段数
+    assert stats['pages'] <= stats['requests'] <= stats['pages'] + stats['windows']
+    assert any('after' in body['aggs']['series']['composite'] for body in es.bodies) == (page_size < len(expected))
+
+
+def test_export_uses_index_bounds_and_writes_csv(sources, engine, tmp_path):
+    es = LocalES(engine)
+    exporter = SeriesExporter(es, 'u2performance_for_test', page_size=50, concurrency=2)
+    path = tmp_path / 'series.csv'
+    writer = CsvSeriesWriter(str(path), exporter.columns)
+    try:
+        stats = exporter.export(writer)
+    finally:
+        writer.close()
+
+    expected = expected_rows(sources, min(source['clock'] for source in sources),
+                             max(source['clock'] for source in sources) + 1)
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert stats['rows'] == len(rows) == len(expected)
+    assert sorted((row['hostname'], int(row['clock']), int(row['count'])) for row in rows) == \
+        [(row['hostname'], row['clock'], row['count']) for row in expected]
+
+
+def test_export_stops_when_a_request_fails(engine, sources):
+    es = LocalES(engine, fail_after=3)
+    exporter = SeriesExporter(es, 'u2performance_for_test', page_size=5, concurrency=2)
+    start = min(source['clock'] for source in sources)
+    with pytest.raises(ConnectionError):
+        exporter.export(ListWriter(), start, start + 86400, partitions=4)
+    assert exporter.stop.is_set()
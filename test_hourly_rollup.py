@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试小时汇总：按 (hostname, appcode, kpiid, 小时) 计算的min/max/avg/last/count与直接汇总一致，
+分开计算再合并的结果与一次计算相同，导入时写入汇总索引
+"""
+
+import os
+import json
+from collections import defaultdict
+import pytest
+from import_to_es import ESImporter, HourlyRollup, clean_document
+from stub_es_server import StubESServer
+from zabbix_doc_generator import SampleProfile, ZabbixDocumentGenerator
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+ROLLUP_INDEX = 'u2performance_for_test_rollup_1h'
+
+
+@pytest.fixture(scope='module')
+def docs():
+    generator = ZabbixDocumentGenerator(SampleProfile(SAMPLE_FILE), hosts=3, kpis=3, kpis_per_host=2, apps=2, seed=6)
+    return list(generator.generate(6 * 60))
+
+
+def expected_rollups(sources):
+    groups = defaultdict(list)
+    for source in sources:
+        key = (source['hostname'], source['appcode'], source['kpiid'], source['clock'] // 3600 * 3600)
+        groups[key].append(source)
+    expected = {}
+    for (hostname, appcode, kpiid, clock), group in groups.items():
+        values = [source['value'] for source in group]
+        last = max(group, key=lambda source: source['clock'])
+        expected[f"{hostname}|{appcode}|{kpiid}|{clock}"] = {
+            'hostname': hostname, 'appcode': appcode, 'kpiid': kpiid, 'clock': clock,
+            'min': min(values), 'max': max(values), 'sum': pytest.approx(sum(values)),
+            'avg': pytest.approx(sum(values) / len(values)), 'count': len(values),
+            'last': last['value'], 'last_clock': last['clock']
+        }
+    return expected
+
+
+def rollup_of(sources):
+    rollup = HourlyRollup()
+    for source in sources:
+        rollup.add(source)
+    return rollup
+
+
+def actions_by_id(rollup):
+    return {action['_id']: action for action in rollup.iter_actions(ROLLUP_INDEX)}
+
+
+def test_rollup_matches_direct_aggregation(docs):
+    sources = [clean_document(doc['_source']) for doc in docs]
+    actions = actions_by_id(rollup_of(sources))
+    expected = expected_rollups(sources)
+    assert set(actions) == set(expected)
+    for doc_id, action in actions.items():
+        assert action['_index'] == ROLLUP_INDEX
+        source = action['_source']
+        assert {key: source[key] for key in expected[doc_id]} == expected[doc_id]
+        assert source['@timestamp'].endswith(':00:00.000Z')
+
+
+def test_merged_rollups_equal_single_pass(docs):
+    """
+    多文件导入时各进程分别汇总后合并，顺序不同、同一小时跨两个文件时结果不变
+    """
+    sources = [clean_document(doc['_source']) for doc in docs]
+    whole = rollup_of(sources)
+    first, second = rollup_of(sources[1::2]), rollup_of(sources[::2])
+    second.merge(first)
+    assert second.buckets == whole.buckets
+
+
+def test_rollup_skips_records_without_value_or_clock():
+    rollup = HourlyRollup()
+    rollup.add({'hostname': 'a', 'clock': 7200, 'value': 'n/a'})
+    rollup.add({'hostname': 'a', 'value': 1.0})
+    rollup.add({'clock': 7200, 'value': 1.0})
+    assert rollup.buckets == {}
+    # value缺失时取process_val
+    rollup.add({'hostname': 'a', 'clock': 7300, 'process_val': 2.0})
+    rollup.add({'hostname': 'a', 'clock': 7250, 'value': 5.0})
+    [bucket] = rollup.buckets.values()
+    assert (bucket['min'], bucket['max'], bucket['count'], bucket['last'], bucket['last_clock']) == (2.0, 5.0, 2, 2.0, 7300)
+
+
+def test_import_writes_rollup_index(docs, tmp_path):
+    path = tmp_path / 'docs.json'
+    path.write_text(json.dumps(docs, ensure_ascii=False), encoding='utf-8')
+    expected = expected_rollups([clean_document(doc['_source']) for doc in docs])
+
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        assert importer.import_data(str(path), batch_size=100, target_index='rollup_source', rollup_index=ROLLUP_INDEX)
+        assert stub.state.doc_counts == {'rollup_source': len(docs), ROLLUP_INDEX: len(expected)}
+        assert ROLLUP_INDEX in stub.state.indices
+
+
+def test_rollup_ids_are_stable(docs):
+    """
+    重复导入同一批数据时汇总文档的_id相同，覆盖而不是重复
+    """
+    sources = [clean_document(doc['_source']) for doc in docs]
+    assert list(actions_by_id(rollup_of(sources))) == list(actions_by_id(rollup_of(sources)))
+    assert set(actions_by_id(rollup_of(reversed(sources)))) == set(actions_by_id(rollup_of(sources)))
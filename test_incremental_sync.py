@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试增量同步：水位按来源从索引中分页取回，不晚于水位的记录在清洗前跳过，
+本轮导入的记录在commit后才提高水位；--follow跟踪追加写入的NDJSON文件和投递目录
+"""
+
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+import pytest
+from columnar_store import ColumnarStoreWriter
+from import_to_es import ESImporter, HighWatermark, clean_document
+from local_query_engine import LocalSearchEngine
+from stub_es_server import StubESServer
+from zabbix_doc_generator import SampleProfile, ZabbixDocumentGenerator
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+INDEX = 'sync_test'
+
+
+class LocalES:
+    """
+    用本地查询引擎回答水位查询
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.requests = 0
+
+    def search(self, index, body, request_timeout=None):
+        self.requests += 1
+        return self.engine.search(body)
+
+
+@pytest.fixture(scope='module')
+def docs():
+    generator = ZabbixDocumentGenerator(SampleProfile(SAMPLE_FILE), hosts=4, kpis=3, kpis_per_host=2, apps=2, seed=8)
+    return list(generator.generate(8 * 50))
+
+
+def latest_by_item(docs):
+    latest = defaultdict(int)
+    for doc in docs:
+        source = doc['_source']
+        latest[str(source['itemid'])] = max(latest[str(source['itemid'])], source['clock'])
+    return dict(latest)
+
+
+def write_json(path, docs):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(docs, f, ensure_ascii=False)
+    return str(path)
+
+
+def append_lines(path, docs):
+    with open(path, 'a', encoding='utf-8') as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False) + '\n')
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_load_pages_through_every_source(docs, tmp_path):
+    imported = docs[:300]
+    writer = ColumnarStoreWriter(str(tmp_path / 'store'))
+    for doc in imported:
+        writer.add(clean_document(doc['_source']))
+    writer.close()
+    es = LocalES(LocalSearchEngine(str(tmp_path / 'store')))
+
+    watermark = HighWatermark().load(es, INDEX, page_size=3)
+    assert watermark.marks == latest_by_item(imported)
+    assert es.requests >= len(watermark.marks) // 3
+
+
+def test_is_new_skips_until_commit():
+    def doc(itemid, clock):
+        return {'_source': {'itemid': itemid, 'clock': clock}}
+
+    watermark = HighWatermark()
+    watermark.marks = {'1': 100}
+
+    assert not watermark.is_new(doc(1, 100))
+    assert not watermark.is_new(doc('1', 50))
+    assert watermark.is_new(doc(1, 101))
+    # 同一轮中顺序不严格的记录不会被本轮的记录挡住
+    assert watermark.is_new(doc(2, 300))
+    assert watermark.is_new(doc(2, 200))
+    # 缺少来源或时间、时间不是整数的记录总是导入
+    assert watermark.is_new({'_source': {'clock': 1}})
+    assert watermark.is_new({'_source': {'itemid': 1}})
+    assert watermark.is_new(doc(1, 'n/a'))
+    assert watermark.skipped == 2
+    assert watermark.marks == {'1': 100}
+
+    watermark.commit()
+    assert watermark.marks == {'1': 101, '2': 300}
+    assert not watermark.is_new(doc(2, 300))
+    assert watermark.is_new(doc(2, 301))
+
+
+def test_sync_imports_only_newer_records(docs, tmp_path):
+    path = write_json(tmp_path / 'docs.json', docs)
+    watermark = HighWatermark()
+    watermark.marks = latest_by_item(docs[:300])
+    newer = sum(1 for doc in docs if doc['_source']['clock'] > watermark.marks[str(doc['_source']['itemid'])])
+
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        assert importer.import_data(path, batch_size=64, target_index=INDEX, watermark=watermark)
+        assert stub.state.stats['indexed_docs'] == newer == len(docs) - 300
+        assert watermark.skipped == 300
+        assert watermark.marks == latest_by_item(docs)
+
+        # 再次同步同一个文件时全部跳过
+        assert importer.import_data(path, batch_size=64, target_index=INDEX, watermark=watermark)
+        assert stub.state.stats['indexed_docs'] == newer
+        assert watermark.skipped == 300 + len(docs)
+
+
+def test_follow_file_indexes_appended_lines(docs, tmp_path):
+    path = tmp_path / 'tail.ndjson'
+    append_lines(path, docs[:100])
+    watermark = HighWatermark()
+    watermark.marks = latest_by_item(docs[:40])
+    stop = threading.Event()
+
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        result = []
+        follower = threading.Thread(target=lambda: result.append(importer.follow_file(
+            str(path), batch_size=25, target_index=INDEX, poll_interval=0.02, watermark=watermark, stop_event=stop)))
+        follower.start()
+        try:
+            assert wait_until(lambda: stub.state.stats['indexed_docs'] == 60)
+
+            # 一行分两次写入时，等到整行写完才处理
+            line = json.dumps(docs[100], ensure_ascii=False)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line[:20])
+                f.flush()
+                time.sleep(0.1)
+                f.write(line[20:] + '\n')
+            append_lines(path, docs[101:130])
+            assert wait_until(lambda: stub.state.stats['indexed_docs'] == 90)
+        finally:
+            stop.set()
+            follower.join(10)
+
+    assert result == [(90, 0)]
+    assert watermark.skipped == 40
+    assert watermark.marks == latest_by_item(docs[:130])
+
+
+def test_follow_directory_imports_settled_files(docs, tmp_path):
+    directory = tmp_path / 'drop'
+    directory.mkdir()
+    write_json(directory / 'first.json', docs[:150])
+    watermark = HighWatermark()
+    stop = threading.Event()
+
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        result = []
+        watcher = threading.Thread(target=lambda: result.append(importer.follow_directory(
+            str(directory), batch_size=50, target_index=INDEX, poll_interval=0.05, watermark=watermark,
+            stop_event=stop)))
+        watcher.start()
+        try:
+            assert wait_until(lambda: stub.state.stats['indexed_docs'] == 150)
+            # 与已导入文件重叠的新文件只导入较新的记录
+            write_json(directory / 'second.json', docs[100:250])
+            assert wait_until(lambda: stub.state.stats['indexed_docs'] == 250)
+        finally:
+            stop.set()
+            watcher.join(10)
+
+    assert result == [2]
+    assert watermark.skipped == 50
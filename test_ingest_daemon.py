@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试实时导入服务：多个采集端并发推送时不丢记录
+"""
+
+import sys
+import json
+import threading
+import http.client
+import import_to_es
+from import_to_es import ESImporter, IngestMetrics, configure_cleaning_cache
+from ingest_daemon import IngestService, IngestHTTPServer, IngestRequestHandler
+from stub_es_server import StubESServer
+
+CLIENTS = 8
+PUSHES_PER_CLIENT = 20
+DOCS_PER_PUSH = 50
+
+
+def make_body(client_no, push_no):
+    """
+    生成一次推送的NDJSON请求体，主机名取值多于缓存容量，迫使缓存不断淘汰
+    """
+    lines = []
+    for i in range(DOCS_PER_PUSH):
+        seq = (client_no * PUSHES_PER_CLIENT + push_no) * DOCS_PER_PUSH + i
+        lines.append(json.dumps({
+            'hostname': f"host-{seq % 300}.example",
+            'moname': f"网络|host-{seq % 300}",
+            'appname': f"app-{seq % 40}",
+            'hostip': f"10.0.{seq % 250}.{seq % 200}",
+            'value': seq * 0.5,
+            'clock': 1749398400 + seq,
+            '@timestamp': f"2025-06-08T16:{seq // 60 % 60:02d}:{seq % 60:02d}.000Z"
+        }, ensure_ascii=False))
+    return '\n'.join(lines).encode('utf-8')
+
+
+def test_concurrent_pushes_are_not_dropped(monkeypatch):
+    """
+    8个采集端同时推送，清洗缓存很小时也不应有记录被当作无效丢弃
+    """
+    monkeypatch.setattr(import_to_es, 'CLEANING_CACHE', None)
+    configure_cleaning_cache(16)
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    results = []
+    errors = []
+
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port, max_connections=4, metrics=IngestMetrics())
+        service = IngestService(importer, 'ingest_test', batch_size=500, flush_interval=0.1, workers=2).start()
+        handler = type('BoundIngestRequestHandler', (IngestRequestHandler,), {'service': service})
+        server = IngestHTTPServer(('127.0.0.1', 0), handler)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+
+        def client(client_no):
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=30)
+            try:
+                for push_no in range(PUSHES_PER_CLIENT):
+                    connection.request('POST', '/ingest', make_body(client_no, push_no),
+                                       {'Content-Type': 'application/x-ndjson'})
+                    response = connection.getresponse()
+                    results.append((response.status, json.loads(response.read())))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        try:
+            clients = [threading.Thread(target=client, args=(client_no,)) for client_no in range(CLIENTS)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            assert service.flush(30)
+        finally:
+            sys.setswitchinterval(switch_interval)
+            server.shutdown()
+            server.server_close()
+            service.stop(30)
+            monkeypatch.setattr(import_to_es, 'CLEANING_CACHE', None)
+
+        total = CLIENTS * PUSHES_PER_CLIENT * DOCS_PER_PUSH
+        assert errors == []
+        assert all(status == 202 for status, _ in results)
+        assert sum(payload['invalid'] for _, payload in results) == 0
+        assert sum(payload['accepted'] for _, payload in results) == total
+        assert service.stats()['documents_indexed'] == total
+        assert stub.state.doc_counts.get('ingest_test') == total
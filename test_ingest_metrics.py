@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试导入指标：计数和直方图与模拟ES服务统计的请求一致，Prometheus接口的输出可以解析，
+多进程导入的指标合并后不丢失
+"""
+
+import os
+import re
+import json
+import pickle
+import urllib.error
+import urllib.request
+import pytest
+import import_to_es
+from import_to_es import ESImporter, IngestMetrics, METRIC_STAGES, start_metrics_server
+from stub_es_server import StubESServer
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+SAMPLE_LINE = re.compile(r'^([a-z_]+)(\{([a-z]+)="([^"]*)"\})? (\S+)$')
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(import_to_es, 'BULK_INITIAL_BACKOFF', 0.01)
+
+
+@pytest.fixture(scope='module')
+def imported_metrics():
+    """
+    通过模拟ES服务导入222.json，返回导入器的指标和服务的统计
+    """
+    with StubESServer(latency_ms=2, reject_rate=0.2, seed=5) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        assert importer.import_data(SAMPLE_FILE, batch_size=250, target_index='metrics_test')
+        return importer.metrics, dict(stub.state.stats)
+
+
+def parse_prometheus(text):
+    """
+    把文本格式解析为 {(名称, 标签值): 数值}，同时检查每一行的格式
+    """
+    samples = {}
+    types = {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            types[name] = kind
+            continue
+        match = SAMPLE_LINE.match(line)
+        assert match, line
+        name, _, _, label, value = match.groups()
+        samples[(name, label)] = float(value)
+    return samples, types
+
+
+def test_counters_match_stub(imported_metrics):
+    metrics, stats = imported_metrics
+    counters = metrics.counters
+    assert counters['documents_read'] == counters['documents_indexed'] == 2000
+    assert counters['documents_failed'] == 0
+    # 被拒绝的请求同样计入请求数、字节数和直方图，重试另行计数
+    assert counters['bulk_requests'] == stats['bulk_requests']
+    assert counters['bulk_bytes'] == stats['bulk_bytes']
+    assert counters['bulk_retries'] == stats['rejected_requests'] > 0
+    assert metrics.request_latency.count == metrics.request_bytes.count == counters['bulk_requests']
+    assert metrics.request_bytes.sum == stats['bulk_bytes']
+    assert metrics.request_docs.sum > 2000
+    assert metrics.stage_seconds['backoff'] > 0
+    assert set(metrics.stage_seconds) == set(METRIC_STAGES)
+    assert all(seconds >= 0 for seconds in metrics.stage_seconds.values())
+
+
+def test_metrics_endpoint(imported_metrics):
+    metrics, _ = imported_metrics
+    server = start_metrics_server(metrics, 0)
+    try:
+        host, port = server.server_address[:2]
+        assert host == '127.0.0.1'
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            text = response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://{host}:{port}/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    samples, types = parse_prometheus(text)
+    assert samples[('es_import_documents_indexed_total', None)] == 2000
+    assert samples[('es_import_bulk_retries_total', None)] == metrics.counters['bulk_retries']
+    for stage in METRIC_STAGES:
+        assert samples[('es_import_stage_seconds_total', stage)] == pytest.approx(metrics.stage_seconds[stage])
+
+    for name in ('bulk_request_seconds', 'bulk_request_bytes', 'bulk_request_docs'):
+        assert types[f'es_import_{name}'] == 'histogram'
+        buckets = [value for (sample, _), value in samples.items() if sample == f'es_import_{name}_bucket']
+        assert buckets == sorted(buckets)
+        assert samples[(f'es_import_{name}_bucket', '+Inf')] == samples[(f'es_import_{name}_count', None)]
+    assert samples[('es_import_bulk_request_docs_sum', None)] == metrics.request_docs.sum
+
+
+def test_merge_after_pickling(imported_metrics):
+    """
+    多文件导入时各进程的指标序列化后传回主进程合并
+    """
+    metrics, _ = imported_metrics
+    total = IngestMetrics()
+    for _ in range(2):
+        total.merge(pickle.loads(pickle.dumps(metrics)))
+    assert total.counters['documents_indexed'] == 4000
+    assert total.request_latency.count == 2 * metrics.request_latency.count
+    assert total.stage_seconds['bulk'] == pytest.approx(2 * metrics.stage_seconds['bulk'])
+    assert total.started <= metrics.started
+
+
+def test_write_report(imported_metrics, tmp_path):
+    metrics, _ = imported_metrics
+    path = tmp_path / 'report.json'
+    metrics.write_report(str(path), files=[{'file': '222.json', 'success': True}])
+    report = json.loads(path.read_text(encoding='utf-8'))
+    assert report['counters']['documents_indexed'] == 2000
+    assert report['files'] == [{'file': '222.json', 'success': True}]
+    histogram = report['histograms']['bulk_request_docs']
+    assert histogram['buckets']['+Inf'] == histogram['count'] == metrics.counters['bulk_requests']
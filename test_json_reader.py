@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试流式读取导出文件：JSON数组与NDJSON、跨块边界的元素、断点续传的字节偏移和格式错误的输入
+"""
+
+import io
+import os
+import gzip
+import json
+import pytest
+import import_to_es
+from import_to_es import iter_json_documents
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+DOCS = [
+    {'_id': '1', '_source': {'hostname': '主机-01', 'value': 12.5, 'clock': 1749398400}},
+    {'_id': '2', '_source': {'hostname': 'host-02', 'value': -3, 'kpi': ['CPU使用率', '']}},
+    {'_id': '3', '_source': {'moname': '网络|交换机', 'value': 1e-5, 'text': 'a,b]c"}'}},
+    7,
+    {'_id': '4', '_source': {}},
+]
+
+
+def write_array(path, docs, prefix=b''):
+    path.write_bytes(prefix + json.dumps(docs, ensure_ascii=False, indent=1).encode('utf-8'))
+    return str(path)
+
+
+def write_ndjson(path, docs):
+    lines = [json.dumps(doc, ensure_ascii=False) for doc in docs]
+    path.write_bytes(('\n'.join(lines[:2]) + '\n\n' + '\n'.join(lines[2:]) + '\n').encode('utf-8'))
+    return str(path)
+
+
+def test_sample_array_matches_json_load():
+    with open(SAMPLE_FILE, encoding='utf-8') as f:
+        expected = json.load(f)
+    assert list(iter_json_documents(SAMPLE_FILE, chunk_size=4096)) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 8, 13, 64])
+def test_elements_across_chunk_boundaries(tmp_path, chunk_size):
+    """
+    元素、多字节UTF-8字符和数值在块边界被截断时都能正确解析
+    """
+    path = write_array(tmp_path / 'docs.json', DOCS, prefix=b'\xef\xbb\xbf  \n')
+    assert list(iter_json_documents(path, chunk_size=chunk_size)) == DOCS
+
+
+def test_ndjson(tmp_path):
+    path = write_ndjson(tmp_path / 'docs.ndjson', DOCS)
+    assert list(iter_json_documents(path)) == DOCS
+
+
+def test_empty_inputs(tmp_path):
+    (tmp_path / 'empty.json').write_bytes(b'  \n')
+    (tmp_path / 'array.json').write_bytes(b'[ ]')
+    assert list(iter_json_documents(str(tmp_path / 'empty.json'))) == []
+    assert list(iter_json_documents(str(tmp_path / 'array.json'))) == []
+
+
+@pytest.mark.parametrize('name', ['docs.json', 'docs.ndjson', 'docs.json.gz'])
+def test_resume_from_every_offset(tmp_path, name):
+    """
+    从任一产出的偏移继续读取，得到的正好是其后的记录
+    """
+    path = tmp_path / name
+    if name.endswith('.ndjson'):
+        write_ndjson(path, DOCS)
+    elif name.endswith('.gz'):
+        with gzip.open(path, 'wb') as f:
+            f.write(json.dumps(DOCS, ensure_ascii=False).encode('utf-8'))
+    else:
+        write_array(path, DOCS)
+
+    results = list(iter_json_documents(str(path), chunk_size=7, with_offsets=True))
+    assert [doc for _, doc in results] == DOCS
+    offsets = [offset for offset, _ in results]
+    assert offsets == sorted(offsets)
+    for i, offset in enumerate(offsets):
+        assert list(iter_json_documents(str(path), chunk_size=5, start_offset=offset)) == DOCS[i + 1:]
+
+
+def test_malformed_ndjson_line(tmp_path):
+    path = tmp_path / 'bad.ndjson'
+    path.write_bytes(b'{"a": 1}\n{"a": \n{"a": 3}\n')
+    with pytest.raises(ValueError, match='字节偏移 9'):
+        list(iter_json_documents(str(path)))
+
+
+def test_truncated_array(tmp_path):
+    path = tmp_path / 'truncated.json'
+    path.write_bytes(b'[{"a": 1}, {"a": 2}')
+    with pytest.raises(ValueError):
+        list(iter_json_documents(str(path), chunk_size=4))
+
+
+class CountingBytesIO(io.BytesIO):
+    """
+    记录已读取的字节数
+    """
+
+    consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+
+def test_malformed_array_element_stops_buffering(monkeypatch):
+    """
+    格式错误的数组元素不会使读取一直缓存到文件末尾
+    """
+    body = b'[{"a": 1}, {"a": tru}, ' + b', '.join(b'{"b": %d}' % i for i in range(100000)) + b']'
+    stream = CountingBytesIO(body)
+    monkeypatch.setattr(import_to_es, 'open_input_file', lambda path: stream)
+    documents = iter_json_documents('bad.json', chunk_size=1024, with_offsets=True, max_document_chars=4096)
+    assert next(documents) == (9, {'a': 1})
+    with pytest.raises(ValueError, match='字节偏移 11 处的数组元素超过 4096 个字符'):
+        next(documents)
+    assert stream.consumed < 8192 < len(body)
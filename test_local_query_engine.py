@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试本地查询引擎：在222.json构建的列式存储上执行 qps_query_*.txt，
+桶的键和指标与直接遍历清洗后文档算出的结果一致
+"""
+
+import os
+from collections import defaultdict
+import pytest
+from columnar_store import ColumnarStoreWriter, MAPPING_KINDS
+from import_to_es import ROLLUP_INDEX_BODY, HourlyRollup, clean_document, iter_json_documents
+from local_query_engine import LocalSearchEngine, load_query_file
+from zabbix_doc_generator import SampleProfile, ZabbixDocumentGenerator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_FILE = os.path.join(HERE, '222.json')
+
+
+def build_store(path, sources, kinds=None):
+    writer = ColumnarStoreWriter(str(path), kinds=kinds)
+    for source in sources:
+        writer.add(source)
+    writer.close()
+    return LocalSearchEngine(str(path))
+
+
+def load_query(name):
+    return load_query_file(os.path.join(HERE, name))[2]
+
+
+def matching(sources, dsl):
+    """
+    按查询中clock的range条件筛选文档
+    """
+    body = dsl['query']['bool']
+    clauses = body.get('must') or body.get('filter')
+    bounds = clauses[0]['range']['clock']
+    return [source for source in sources if bounds['gte'] <= source['clock'] <= bounds['lte']]
+
+
+def group_by(sources, field):
+    groups = defaultdict(list)
+    for source in sources:
+        groups[source[field]].append(source)
+    return groups
+
+
+def hour_keys(sources):
+    """
+    interval为3600、min_doc_count为0的clock直方图应有的全部桶键
+    """
+    clocks = [source['clock'] for source in sources]
+    first = min(clocks) - min(clocks) % 3600
+    return list(range(first, max(clocks) + 1, 3600))
+
+
+@pytest.fixture(scope='module')
+def sample_sources():
+    return [clean_document(doc['_source']) for doc in iter_json_documents(SAMPLE_FILE)]
+
+
+@pytest.fixture(scope='module')
+def raw_engine(sample_sources, tmp_path_factory):
+    return build_store(tmp_path_factory.mktemp('engine') / 'raw', sample_sources)
+
+
+@pytest.fixture(scope='module')
+def rollup_engine(sample_sources, tmp_path_factory):
+    rollup = HourlyRollup()
+    for source in sample_sources:
+        rollup.add(source)
+    actions = rollup.iter_actions('u2performance_for_test_rollup_1h')
+    kinds = {field: MAPPING_KINDS[mapping['type']]
+             for field, mapping in ROLLUP_INDEX_BODY['mappings']['properties'].items()
+             if mapping.get('type') in MAPPING_KINDS}
+    return build_store(tmp_path_factory.mktemp('engine') / 'rollup', (action['_source'] for action in actions), kinds)
+
+
+def test_7days_query(raw_engine, sample_sources):
+    """
+    按主机分组，每小时一个桶，桶内top_hits按clock升序
+    """
+    dsl = load_query('qps_query_7days.txt')
+    sources = matching(sample_sources, dsl)
+    response = raw_engine.search(dsl)
+
+    assert response['hits']['total']['value'] == len(sources)
+    assert response['hits']['hits'] == []
+    devices = response['aggregations']['group_by_device']['buckets']
+    expected = group_by(sources, 'hostname')
+    assert [(bucket['key'], bucket['doc_count']) for bucket in devices] == \
+        sorted(((key, len(docs)) for key, docs in expected.items()), key=lambda item: (-item[1], item[0]))
+
+    include = set(dsl['aggs']['group_by_device']['aggs']['latest_info']['top_hits']['_source']['include'])
+    for device in devices:
+        docs = sorted(expected[device['key']], key=lambda source: source['clock'])
+        latest = device['latest_info']['hits']['hits']
+        assert len(latest) == 1
+        assert latest[0]['_source'] == {key: value for key, value in docs[0].items() if key in include}
+
+        hourly = defaultdict(list)
+        for source in docs:
+            hourly[source['clock'] - source['clock'] % 3600].append(source)
+        buckets = device['time_series']['buckets']
+        assert [bucket['key'] for bucket in buckets] == hour_keys(docs)
+        for bucket in buckets:
+            in_hour = hourly.get(bucket['key'], [])
+            assert bucket['doc_count'] == len(in_hour)
+            hits = bucket['values']['hits']['hits']
+            assert [(hit['_source']['clock'], hit['_source']['value']) for hit in hits] == \
+                [(source['clock'], source['value']) for source in in_hour[:100]]
+
+
+def test_modified_query(raw_engine, sample_sources):
+    """
+    按appcode分组，组内按hostip再分组，cardinality统计设备数
+    """
+    dsl = load_query('qps_query_modified.txt')
+    sources = matching(sample_sources, dsl)
+    response = raw_engine.search(dsl)
+
+    expected = group_by(sources, 'appcode')
+    apps = response['aggregations']['group_by_device']['buckets']
+    assert [(bucket['key'], bucket['doc_count']) for bucket in apps] == \
+        [(key, len(expected[key])) for key in sorted(expected)]
+
+    for app in apps:
+        docs = sorted(expected[app['key']], key=lambda source: source['clock'])
+        assert app['device_count']['value'] == len({source['hostip'] for source in docs})
+        latest = app['latest_info']['hits']['hits']
+        assert [hit['_source']['clock'] for hit in latest] == [docs[-1]['clock']]
+
+        hosts = group_by(docs, 'hostip')
+        host_buckets = app['hostip_values']['buckets']
+        assert [(bucket['key'], bucket['doc_count']) for bucket in host_buckets] == \
+            [(key, len(hosts[key])) for key in sorted(hosts)]
+        for bucket in host_buckets:
+            hits = bucket['all_values']['hits']['hits']
+            assert bucket['all_values']['hits']['total']['value'] == len(hosts[bucket['key']])
+            assert [hit['_source']['clock'] for hit in hits] == [source['clock'] for source in hosts[bucket['key']][:100]]
+
+
+def test_rollup_query(rollup_engine, sample_sources):
+    """
+    小时汇总索引上的min/max/sum/count与按小时直接汇总原始文档的结果一致，
+    top_metrics取每小时最后一个采样值
+    """
+    dsl = load_query('qps_query_rollup.txt')
+    sources = matching(sample_sources, dsl)
+    response = rollup_engine.search(dsl)
+
+    devices = response['aggregations']['group_by_device']['buckets']
+    expected = group_by(sources, 'hostname')
+    assert sorted(bucket['key'] for bucket in devices) == sorted(expected)
+
+    for device in devices:
+        docs = expected[device['key']]
+        hourly = defaultdict(list)
+        for source in docs:
+            hourly[source['clock'] - source['clock'] % 3600].append(source)
+        buckets = device['time_series']['buckets']
+        assert [bucket['key'] for bucket in buckets] == hour_keys(docs)
+        assert device['doc_count'] == len(hourly)
+        for bucket in buckets:
+            in_hour = hourly[bucket['key']]
+            values = [source['value'] for source in in_hour]
+            assert bucket['doc_count'] == 1
+            assert bucket['min_value']['value'] == min(values)
+            assert bucket['max_value']['value'] == max(values)
+            assert bucket['sum_value']['value'] == pytest.approx(sum(values))
+            assert bucket['sample_count']['value'] == len(values)
+            last = max(in_hour, key=lambda source: source['clock'])
+            assert bucket['last_value']['top'][0]['metrics'] == {'last': last['value']}
+            assert bucket['last_value']['top'][0]['sort'] == [last['clock']]
+
+
+def test_terms_and_cardinality_over_hosts(tmp_path):
+    """
+    多台主机、多个应用时terms的桶键、doc_count排序和cardinality
+    """
+    generator = ZabbixDocumentGenerator(SampleProfile(SAMPLE_FILE), hosts=7, kpis=3, kpis_per_host=2, apps=3, seed=11)
+    sources = [doc['_source'] for doc in generator.generate(7 * 2 * 30)]
+    engine = build_store(tmp_path / 'hosts', sources)
+
+    aggs = {
+        'apps': {
+            'terms': {'field': 'appcode', 'size': 2},
+            'aggs': {'hosts': {'cardinality': {'field': 'hostip'}}}
+        },
+        'all_hosts': {'cardinality': {'field': 'hostname'}}
+    }
+    response = engine.search({'size': 0, 'aggs': aggs})['aggregations']
+
+    apps = group_by(sources, 'appcode')
+    ranked = sorted(apps, key=lambda key: (-len(apps[key]), key))
+    assert [(bucket['key'], bucket['doc_count']) for bucket in response['apps']['buckets']] == \
+        [(key, len(apps[key])) for key in ranked[:2]]
+    assert response['apps']['sum_other_doc_count'] == sum(len(apps[key]) for key in ranked[2:])
+    for bucket in response['apps']['buckets']:
+        assert bucket['hosts']['value'] == len({source['hostip'] for source in apps[bucket['key']]})
+    assert response['all_hosts']['value'] == 7
+
+    hostnames = sorted(group_by(sources, 'hostname'))[:2]
+    count = engine.count({'query': {'terms': {'hostname': hostnames}}})['count']
+    assert count == sum(1 for source in sources if source['hostname'] in hostnames)
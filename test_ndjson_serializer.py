@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试NDJSON请求体：安装与未安装orjson时序列化结果相同，请求体按序列化后的字节原样发送
+"""
+
+import os
+import json
+import pytest
+import import_to_es
+from import_to_es import ESImporter, build_es_document, encode_json, iter_json_documents, serialize_bulk_entry
+from stub_es_server import StubESServer
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+INDEX = 'ndjson_test'
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    """
+    分别使用orjson和标准库json序列化
+    """
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(import_to_es, 'orjson', None)
+    monkeypatch.setattr(import_to_es, 'BULK_INITIAL_BACKOFF', 0.01)
+    return request.param
+
+
+@pytest.fixture(scope='module')
+def es_docs():
+    return [build_es_document(doc, INDEX) for doc in iter_json_documents(SAMPLE_FILE)]
+
+
+def parse_entry(entry):
+    assert entry.endswith(b'\n') and entry.count(b'\n') == 2
+    action, source = entry.decode('utf-8').splitlines()
+    return json.loads(action), json.loads(source)
+
+
+def test_entries_round_trip(encoder, es_docs):
+    for es_doc in es_docs[:200]:
+        action, source = parse_entry(serialize_bulk_entry(es_doc, INDEX))
+        assert action == {'index': {'_index': INDEX, '_id': es_doc['_id']}}
+        assert source == es_doc['_source']
+
+
+def test_entry_without_id_and_special_characters(encoder):
+    es_doc = {'_index': 'idx-中文', '_id': 'a"b\\c\n', '_source': {'appname': '互联网服务域', 'value': 1.5, 'tags': [1, None]}}
+    entry = serialize_bulk_entry(es_doc, INDEX)
+    assert parse_entry(entry) == ({'index': {'_index': 'idx-中文', '_id': 'a"b\\c\n'}}, es_doc['_source'])
+    # 非ASCII字符直接以UTF-8写出，不转义
+    assert '互联网服务域'.encode('utf-8') in entry
+
+    del es_doc['_id'], es_doc['_index']
+    assert parse_entry(serialize_bulk_entry(es_doc, INDEX)) == ({'index': {'_index': INDEX}}, es_doc['_source'])
+
+
+def test_encode_json_falls_back_for_big_integers(encoder):
+    value = {'big': 1 << 70, 'text': '值'}
+    assert json.loads(encode_json(value)) == value
+
+
+def test_encoders_produce_identical_bytes(monkeypatch, es_docs):
+    pytest.importorskip('orjson')
+    fast = [serialize_bulk_entry(es_doc, INDEX) for es_doc in es_docs]
+    monkeypatch.setattr(import_to_es, 'orjson', None)
+    assert [serialize_bulk_entry(es_doc, INDEX) for es_doc in es_docs] == fast
+
+
+def test_request_body_is_sent_as_serialized(encoder, es_docs):
+    batch = es_docs[:500]
+    expected_bytes = sum(len(serialize_bulk_entry(es_doc, INDEX)) for es_doc in batch)
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        assert importer.bulk_batch(batch, 1, INDEX)[:2] == (500, 0)
+        assert stub.state.stats['bulk_bytes'] == expected_bytes
+        assert stub.state.stats['bulk_requests'] == 1
+
+
+def test_rejected_requests_resend_the_same_body(encoder, es_docs):
+    batch = es_docs[:300]
+    expected_bytes = sum(len(serialize_bulk_entry(es_doc, INDEX)) for es_doc in batch)
+    with StubESServer(reject_rate=0.5, seed=1) as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        assert importer.bulk_batch(batch, 1, INDEX)[:2] == (300, 0)
+        stats = stub.state.stats
+        assert stats['rejected_requests'] > 0
+        assert stats['bulk_bytes'] == expected_bytes * stats['bulk_requests']
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试查询DSL优化：改写仪表盘查询后在本地查询引擎上执行，结果与原查询一致
+"""
+
+import os
+import pytest
+from columnar_store import convert_files, ColumnarStoreWriter
+from import_to_es import INDEX_BODY
+from local_query_engine import LocalSearchEngine, load_query_file
+from optimize_query_dsl import DslOptimizer, QueryRunner, optimize_file, flatten_mapping, DEFAULT_DATE_FIELDS
+from zabbix_doc_generator import SampleProfile, ZabbixDocumentGenerator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_FILE = os.path.join(HERE, '222.json')
+
+
+def make_optimizer(composite_size=2):
+    return DslOptimizer(flatten_mapping(INDEX_BODY['mappings']['properties']), DEFAULT_DATE_FIELDS,
+                        composite_size=composite_size)
+
+
+def agg_kinds(aggs):
+    """
+    列出聚合树中出现的所有聚合类型
+    """
+    kinds = set()
+    for spec in aggs.values():
+        kinds.update(key for key in spec if key not in ('aggs', 'aggregations', 'meta'))
+        kinds.update(agg_kinds(spec.get('aggs') or spec.get('aggregations') or {}))
+    return kinds
+
+
+@pytest.fixture(scope='module')
+def sample_runner(tmp_path_factory):
+    store = tmp_path_factory.mktemp('optimize') / 'store'
+    convert_files([SAMPLE_FILE], str(store))
+    return QueryRunner(engine=LocalSearchEngine(str(store)))
+
+
+@pytest.mark.parametrize('query_file, expected_kinds', [
+    ('qps_query_7days.txt', {'composite', 'date_histogram', 'stats', 'top_metrics'}),
+    ('qps_query_modified.txt', {'composite', 'stats', 'top_metrics'}),
+    ('qps_query_rollup.txt', {'composite', 'date_histogram'}),
+])
+def test_rewritten_queries_match_original(sample_runner, tmp_path, query_file, expected_kinds):
+    """
+    terms改为composite、histogram改为date_histogram、top_hits改为stats/top_metrics后结果不变；
+    只有原查询因top_hits的size截断而不完整的部分可以不同
+    """
+    output_dir = tmp_path / 'out' / 'nested'
+    report = optimize_file(os.path.join(HERE, query_file), make_optimizer(), sample_runner, str(output_dir), repeat=1)
+
+    _, _, original = load_query_file(os.path.join(HERE, query_file))
+    _, _, optimized = load_query_file(report['optimized_file'])
+    assert os.path.dirname(report['optimized_file']) == str(output_dir)
+    assert expected_kinds <= agg_kinds(optimized['aggs']) - agg_kinds(original['aggs'])
+
+    comparison = report['comparison']
+    assert comparison['matched'] > 0
+    assert comparison['only_optimized'] == {}
+    truncated = comparison['truncated_paths']
+    assert all(any(entry['path'].startswith(path) for path in truncated) for entry in comparison['different'])
+
+
+def test_composite_pages_cover_all_hosts(tmp_path):
+    """
+    多台主机时composite按after_key分页取完，结果与原terms查询一致
+    """
+    generator = ZabbixDocumentGenerator(SampleProfile(SAMPLE_FILE), hosts=7, kpis=2, kpis_per_host=1, apps=2, seed=3)
+    writer = ColumnarStoreWriter(str(tmp_path / 'store'))
+    for doc in generator.generate(7 * 6 * 24):
+        writer.add(doc['_source'])
+    writer.close()
+    runner = QueryRunner(engine=LocalSearchEngine(str(tmp_path / 'store')))
+
+    report = optimize_file(os.path.join(HERE, 'qps_query_7days.txt'), make_optimizer(composite_size=3), runner,
+                           str(tmp_path / 'out'), repeat=1)
+    assert report['optimized']['requests'] == 3
+    assert report['comparison']['different'] == []
+    assert report['comparison']['only_optimized'] == {}
+    assert report['comparison']['matched'] > 0
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试按时间分区导入：分区索引名按UTC日期划分，导入时安装索引模板和读别名，
+保留策略只删除整个分区都早于保留天数的分区索引
+"""
+
+import os
+import sys
+import json
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+import pytest
+import index_retention
+from import_to_es import ESImporter, expired_partitions, partition_index_name
+from stub_es_server import StubESServer
+from zabbix_doc_generator import SampleProfile, ZabbixDocumentGenerator
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+DAY_PATTERN = 'u2performance-%Y.%m.%d'
+
+
+def utc_day(clock, fmt='%Y.%m.%d'):
+    return datetime.fromtimestamp(clock, timezone.utc).strftime(fmt)
+
+
+def write_docs(path, docs):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(docs, f, ensure_ascii=False)
+    return str(path)
+
+
+def test_partition_index_name_uses_utc_date():
+    midnight = int(datetime(2025, 6, 9, tzinfo=timezone.utc).timestamp())
+    assert partition_index_name(DAY_PATTERN, {'clock': midnight - 1}) == 'u2performance-2025.06.08'
+    assert partition_index_name(DAY_PATTERN, {'clock': midnight}) == 'u2performance-2025.06.09'
+    assert partition_index_name('u2performance-%Y.%m', {'clock': midnight}) == 'u2performance-2025.06'
+    # 没有clock时取@timestamp
+    assert partition_index_name(DAY_PATTERN, {'@timestamp': '2025-06-08T23:59:59.000Z'}) == 'u2performance-2025.06.08'
+    # 都没有时写入当天的分区
+    assert partition_index_name(DAY_PATTERN, {}) == f"u2performance-{utc_day(int(time.time()))}"
+
+
+def test_expired_partitions_need_whole_partition_before_cutoff():
+    names = ['u2performance-2025.06.07', 'u2performance-2025.06.08', 'u2performance-2025.06.09',
+             'u2performance-2025.05', 'u2performance-rollup_1h', 'u2performance_for_test', 'other-2025.01.01']
+    cutoff = date(2025, 6, 9)
+    assert expired_partitions(names, DAY_PATTERN, cutoff) == ['u2performance-2025.06.07', 'u2performance-2025.06.08']
+    # 按月分区时，6月的分区在7月1日之后才整个早于截止日期
+    assert expired_partitions(names + ['u2performance-2025.06'], 'u2performance-%Y.%m', cutoff) == \
+        ['u2performance-2025.05']
+    assert expired_partitions(['u2performance-2025.06'], 'u2performance-%Y.%m', date(2025, 7, 1)) == \
+        ['u2performance-2025.06']
+
+
+def test_import_routes_documents_to_daily_partitions(tmp_path):
+    generator = ZabbixDocumentGenerator(SampleProfile(SAMPLE_FILE), hosts=3, kpis=2, kpis_per_host=1, apps=2, seed=1)
+    docs = list(generator.generate(3 * 400))
+    path = write_docs(tmp_path / 'docs.json', docs)
+    expected = Counter(f"u2performance-{utc_day(doc['_source']['clock'])}" for doc in docs)
+    assert len(expected) > 1
+
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        assert importer.import_data(path, batch_size=200, target_index=DAY_PATTERN)
+        assert stub.state.doc_counts == dict(expected)
+        template = stub.state.templates['u2performance']
+        assert template['index_patterns'] == ['u2performance-*']
+        assert template['aliases'] == {'u2performance': {}}
+        assert 'clock' in template['mappings']['properties']
+
+        # 再次导入时已存在的分区也加入读别名
+        assert importer.import_data(path, batch_size=200, target_index=DAY_PATTERN, read_alias='qps_read')
+        assert stub.state.templates['u2performance']['aliases'] == {'qps_read': {}}
+        assert stub.state.aliases['qps_read'] == {'u2performance-*'}
+
+
+@pytest.fixture
+def partitioned_stub(tmp_path):
+    """
+    今天、1天前、3天前、5天前和10天前各一个分区，另有一个汇总索引
+    """
+    now = int(time.time())
+    docs = [{'_id': str(days), '_source': {'clock': now - days * 86400, 'hostname': 'host-a', 'value': 1.0}}
+            for days in (0, 1, 3, 5, 10)]
+    with StubESServer() as stub:
+        importer = ESImporter(es_host=stub.host, es_port=stub.port)
+        assert importer.import_data(write_docs(tmp_path / 'docs.json', docs), target_index=DAY_PATTERN)
+        stub.state.indices['u2performance-rollup_1h'] = {}
+        yield stub, importer, {days: f"u2performance-{utc_day(now - days * 86400)}" for days in (0, 1, 3, 5, 10)}
+
+
+def test_drop_expired_partitions(partitioned_stub):
+    stub, importer, names = partitioned_stub
+    expected = [names[10], names[5]]
+    assert importer.drop_expired_partitions(DAY_PATTERN, keep_days=3, dry_run=True) == sorted(expected)
+    assert set(names.values()) <= set(stub.state.doc_counts)
+
+    assert importer.drop_expired_partitions(DAY_PATTERN, keep_days=3) == sorted(expected)
+    remaining = set(stub.state.doc_counts) | set(stub.state.indices)
+    assert remaining == {names[0], names[1], names[3], 'u2performance-rollup_1h'}
+    assert importer.drop_expired_partitions(DAY_PATTERN, keep_days=3) == []
+
+
+def test_index_retention_command(partitioned_stub, monkeypatch):
+    stub, _, names = partitioned_stub
+    monkeypatch.setattr(sys, 'argv', ['index_retention.py', '--host', stub.host, '--port', str(stub.port),
+                                      '--keep-days', '1'])
+    index_retention.main()
+    assert set(stub.state.doc_counts) == {names[0], names[1]}
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试导入结果核对：分区汇总与文档顺序无关，分区查询只匹配对应分区，
+第二遍按_id列出索引中缺少、多出、内容不同的文档和源文件中重复的_id
+"""
+
+import os
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import reconcile_import
+from columnar_store import ColumnarStoreWriter
+from import_to_es import build_es_document, clean_document, iter_json_documents
+from local_query_engine import LocalSearchEngine
+from reconcile_import import (ImportReconciler, PartitionSummary, MISSING_PARTITION, content_digest, partition_of,
+                              partition_query, source_records, summarize_source_batch)
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '222.json')
+
+INDEX = 'u2performance_for_test'
+
+
+class FakeES:
+    """
+    只支持核对时用到的接口：按切片返回hits，point-in-time时按search_after分页，否则一次scroll取完
+    """
+
+    hits = []
+    supports_pit = True
+
+    def __init__(self, hosts):
+        pass
+
+    def open_point_in_time(self, index, keep_alive):
+        if not self.supports_pit:
+            raise AttributeError('open_point_in_time')
+        return {'id': 'pit'}
+
+    def close_point_in_time(self, body):
+        pass
+
+    def slice_hits(self, body):
+        hits = [dict(hit, sort=[position]) for position, hit in enumerate(self.hits)]
+        if 'slice' in body:
+            hits = [hit for hit in hits if hit['sort'][0] % body['slice']['max'] == body['slice']['id']]
+        return hits
+
+    def search(self, body, index=None, scroll=None, request_timeout=None):
+        hits = self.slice_hits(body)
+        if 'pit' in body:
+            after = body.get('search_after', [-1])[0]
+            page = [hit for hit in hits if hit['sort'][0] > after][:body['size']]
+            return {'pit_id': 'pit', 'hits': {'hits': page}}
+        return {'_scroll_id': 'scroll', 'hits': {'hits': hits}}
+
+    def scroll(self, scroll_id, scroll, request_timeout=None):
+        return {'_scroll_id': scroll_id, 'hits': {'hits': []}}
+
+    def clear_scroll(self, scroll_id):
+        pass
+
+
+@pytest.fixture(scope='module')
+def sample_docs():
+    docs = list(iter_json_documents(SAMPLE_FILE))
+    return docs[:300]
+
+
+def summary_of(records):
+    summary = PartitionSummary()
+    for record in records:
+        summary.add(*record)
+    return summary
+
+
+def test_partition_summary_ignores_order_and_batching(sample_docs):
+    options = {'target_index': INDEX, 'stable_id': False, 'compact': None, 'partition_by': 'hour',
+               'ignore_fields': ('import_timestamp',)}
+    records = list(source_records(sample_docs, options))
+    whole = summary_of(records)
+
+    shuffled = records[:]
+    random.Random(3).shuffle(shuffled)
+    merged = PartitionSummary()
+    for start in range(0, len(shuffled), 70):
+        merged.merge(summary_of(shuffled[start:start + 70]))
+    assert merged.partitions == whole.partitions
+    assert merged.count == len(sample_docs)
+    assert summarize_source_batch(sample_docs, options).partitions == whole.partitions
+    assert whole.differing(merged) == []
+
+    partition, key, digest = records[0]
+    changed = summary_of(records[1:] + [(partition, key, digest + 1)])
+    assert changed.differing(whole) == [partition]
+    assert changed.count == whole.count
+
+    duplicated = summary_of(records + [records[-1]])
+    assert duplicated.differing(whole) == [records[-1][0]]
+    assert duplicated.partitions[records[-1][0]][0] == whole.partitions[records[-1][0]][0] + 1
+
+
+def test_content_digest_ignores_key_order_and_import_timestamp():
+    source = {'clock': 1, 'value': 2.5, 'hostname': 'a'}
+    reordered = {'hostname': 'a', 'value': 2.5, 'clock': 1, 'import_timestamp': '2025-01-01T00:00:00'}
+    assert content_digest(source) == content_digest(reordered)
+    assert content_digest(source) != content_digest(dict(source, value=2.6))
+
+
+@pytest.mark.parametrize('partition_by', ['hour', 'day', 'hostname'])
+def test_partition_query_matches_partition_of(tmp_path, sample_docs, partition_by):
+    """
+    分区查询在本地查询引擎上只匹配partition_of归入这些分区的文档，包括没有分区字段的文档
+    """
+    sources = [clean_document(doc['_source']) for doc in sample_docs]
+    sources[5].pop('clock')
+    sources[6].pop('hostname')
+    sources[7]['hostname'] = 'other-host'
+    writer = ColumnarStoreWriter(str(tmp_path / 'store'))
+    for source in sources:
+        writer.add(source)
+    writer.close()
+    engine = LocalSearchEngine(str(tmp_path / 'store'))
+
+    partitions = [partition_of(source, partition_by) for source in sources]
+    chosen = {partitions[7], MISSING_PARTITION}
+    count = engine.count({'query': partition_query(chosen, partition_by)})['count']
+    assert count == sum(1 for partition in partitions if partition in chosen)
+    assert count < len(sources)
+
+
+@pytest.mark.parametrize('supports_pit', [True, False])
+def test_drill_down_lists_missing_extra_different_and_duplicates(tmp_path, monkeypatch, sample_docs, supports_pit):
+    source_docs = [dict(doc) for doc in sample_docs]
+    duplicate = dict(source_docs[120])
+    source_docs.append(duplicate)
+    source_file = tmp_path / 'source.json'
+    source_file.write_text(json.dumps(source_docs, ensure_ascii=False), encoding='utf-8')
+
+    hits = [build_es_document(doc, INDEX) for doc in sample_docs]
+    missing = hits.pop(10)
+    hits[40]['_source']['value'] += 1
+    different = hits[40]
+    extra = build_es_document({'_id': 'extra-doc', '_source': dict(sample_docs[200]['_source'])}, INDEX)
+    hits.append(extra)
+
+    monkeypatch.setattr(FakeES, 'hits', hits)
+    monkeypatch.setattr(FakeES, 'supports_pit', supports_pit)
+    monkeypatch.setattr(reconcile_import, 'Elasticsearch', FakeES)
+    monkeypatch.setattr(reconcile_import, 'ProcessPoolExecutor', ThreadPoolExecutor)
+
+    reconciler = ImportReconciler({'host': 'localhost', 'port': 9200}, INDEX, [str(source_file)],
+                                  slices=3, source_workers=2, page_size=25, batch_size=64)
+    report = reconciler.run()
+
+    assert report['source_count'] == len(source_docs)
+    assert report['index_count'] == len(hits)
+    labels = {reconcile_import.partition_label(partition_of(hit['_source'], 'hour'), 'hour')
+              for hit in (missing, different, extra, build_es_document(duplicate, INDEX))}
+    assert {entry['partition'] for entry in report['differing_partitions']} == labels
+
+    details = report['details']
+    assert [item['_id'] for item in details['missing_in_index']] == [missing['_id']]
+    assert [item['_id'] for item in details['extra_in_index']] == ['extra-doc']
+    assert [item['_id'] for item in details['different']] == [different['_id']]
+    assert details['duplicate_ids_in_source'] == [duplicate['_id']]
+    assert sorted(details['partitions_checked']) == sorted(labels)
+
+
+def test_matching_index_needs_no_drill_down(tmp_path, monkeypatch, sample_docs):
+    source_file = tmp_path / 'source.json'
+    source_file.write_text(json.dumps(sample_docs, ensure_ascii=False), encoding='utf-8')
+    hits = [build_es_document(doc, INDEX) for doc in reversed(sample_docs)]
+    monkeypatch.setattr(FakeES, 'hits', hits)
+    monkeypatch.setattr(reconcile_import, 'Elasticsearch', FakeES)
+    monkeypatch.setattr(reconcile_import, 'ProcessPoolExecutor', ThreadPoolExecutor)
+
+    report = ImportReconciler({'host': 'localhost', 'port': 9200}, INDEX, [str(source_file)], slices=2).run()
+    assert report['differing_partitions'] == []
+    assert 'details' not in report
+    assert report['source_count'] == report['index_count'] == len(sample_docs)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试模拟ES服务：相同种子下注入的失败序列可以重现，与文档是否带_id无关
+"""
+
+import json
+import threading
+from stub_es_server import StubState
+
+
+def make_body(size, with_ids):
+    lines = []
+    for i in range(size):
+        meta = {'_index': 'stub_test', '_id': str(i)} if with_ids else {'_index': 'stub_test'}
+        lines.append(json.dumps({'index': meta}))
+        lines.append(json.dumps({'value': i}))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def statuses(response):
+    return [item['index']['status'] for item in response['items']]
+
+
+def test_auto_ids_do_not_change_injection_sequence():
+    with_ids = StubState(item_reject_rate=0.1, item_error_rate=0.05, seed=7)
+    without_ids = StubState(item_reject_rate=0.1, item_error_rate=0.05, seed=7)
+    _, expected = with_ids.handle_bulk('stub_test', make_body(500, True))
+    _, response = without_ids.handle_bulk('stub_test', make_body(500, False))
+    assert statuses(response) == statuses(expected)
+
+
+def test_concurrent_auto_ids_are_unique():
+    state = StubState(item_error_rate=0.05, seed=7)
+    ids = []
+
+    def worker():
+        _, response = state.handle_bulk('stub_test', make_body(500, False))
+        ids.extend(item['index']['_id'] for item in response['items'])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == len(ids) == 8 * 500
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Zabbix性能数据生成工具
+以导出文件（默认 222.json）中的记录为样本，生成任意数量的同结构记录，用于压测导入和查询：
+- 字段顺序、固定字段取值、字符串长度和字符类别与样本一致；
+- 主机、KPI、应用系统的数量可以指定，每台主机属于一个应用系统并采集若干KPI；
+- 采集间隔、value取值范围取自样本，记录按时间顺序输出。
+
+222.json 只包含一台主机的一个KPI，因此主机、KPI和应用系统的数量由参数决定。
+"""
+
+import os
+import json
+import random
+import string
+import statistics
+import logging
+import argparse
+import sys
+from datetime import datetime, timezone
+from import_to_es import iter_json_documents, configure_logging
+
+logger = logging.getLogger(__name__)
+
+ID_CHARS = string.ascii_letters + string.digits
+
+# 默认的设备规模
+DEFAULT_HOSTS = 500
+DEFAULT_KPIS = 20
+DEFAULT_KPIS_PER_HOST = 5
+DEFAULT_APPS = 50
+
+
+def random_like(rng, text, pool=''):
+    """
+    生成与text长度和字符类别相同的随机字符串：数字换数字，字母换同大小写字母，
+    中文换pool中的中文，其余字符（分隔符等）保持不变
+    """
+    result = []
+    for char in text:
+        if char.isdigit():
+            result.append(rng.choice(string.digits))
+        elif char.isascii() and char.isupper():
+            result.append(rng.choice(string.ascii_uppercase))
+        elif char.isascii() and char.islower():
+            result.append(rng.choice(string.ascii_lowercase))
+        elif '一' <= char <= '鿿' and pool:
+            result.append(rng.choice(pool))
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def random_uuid(rng):
+    return '%08x-%04x-%04x-%04x-%012x' % (rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(16),
+                                          rng.getrandbits(16), rng.getrandbits(48))
+
+
+class SampleProfile:
+    """
+    从样本文件中提取生成记录所需的信息
+    """
+
+    def __init__(self, sample_path, max_samples=10000):
+        sources = []
+        for doc in iter_json_documents(sample_path):
+            sources.append(doc.get('_source', {}))
+            if len(sources) >= max_samples:
+                break
+        if not sources:
+            raise ValueError(f"样本文件中没有记录: {sample_path}")
+
+        self.template = sources[0]
+        values = [source['value'] for source in sources if isinstance(source.get('value'), (int, float))]
+        self.value_min = min(values) if values else 0.0
+        self.value_max = max(values) if values else 100.0
+
+        clocks = sorted({source['clock'] for source in sources if isinstance(source.get('clock'), int)})
+        steps = [b - a for a, b in zip(clocks, clocks[1:])]
+        self.step = int(statistics.median(steps)) if steps else 60
+        self.start_clock = clocks[0] if clocks else 1749398400
+
+        # 样本中出现过的中文字符，用于生成同类的中文名称
+        self.cjk_pool = ''.join(sorted({char for source in sources[:100] for value in source.values()
+                                        if isinstance(value, str) for char in value if '一' <= char <= '鿿'}))
+
+
+class ZabbixDocumentGenerator:
+    """
+    按样本生成导出格式的记录（含 _index/_type/_id/_score/_source）
+    """
+
+    def __init__(self, profile, hosts=DEFAULT_HOSTS, kpis=DEFAULT_KPIS, kpis_per_host=DEFAULT_KPIS_PER_HOST,
+                 apps=DEFAULT_APPS, seed=0):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.kpis_per_host = min(kpis_per_host, kpis)
+        template = profile.template
+        rng = self.rng
+        pool = profile.cjk_pool
+
+        self.apps = []
+        for _ in range(apps):
+            appcode = random_like(rng, template.get('appcode', 'APP_CODE'))
+            bizarea = random_like(rng, template.get('bizarea', '业务区域'), pool)
+            self.apps.append({'appcode': appcode, 'bizarea': bizarea, 'appname': f"{bizarea}（{appcode}）"})
+
+        self.kpis = [{'kpiid': random_uuid(rng), 'kpiname': random_like(rng, template.get('kpiname', '指标名称'), pool)}
+                     for _ in range(kpis)]
+
+        componetype = template.get('componetype', '')
+        self.hosts = []
+        for host_no in range(hosts):
+            app = self.apps[host_no % apps]
+            hostname = random_like(rng, template.get('hostname', 'HOST-0001'))
+            hostip = f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+            self.hosts.append(dict(app, hostname=hostname, hostip=hostip, keyword=hostip, mo=random_uuid(rng),
+                                   moname=f"{componetype}|{app['bizarea']}_{hostname}"))
+
+        # 每个序列是一台主机的一个KPI
+        self.series = []
+        for host_no, host in enumerate(self.hosts):
+            for j in range(self.kpis_per_host):
+                kpi = self.kpis[(host_no * 7 + j) % kpis]
+                self.series.append((host, kpi, rng.randint(100000, 999999)))
+
+    def __iter__(self):
+        return self.generate()
+
+    def generate(self, count=None):
+        """
+        按时间顺序生成count条记录，count为None时无限生成
+        """
+        template = self.profile.template
+        rng = self.rng
+        value_min, value_max = self.profile.value_min, self.profile.value_max
+        produced = 0
+        clock = self.profile.start_clock
+        while True:
+            timestamp = datetime.fromtimestamp(clock, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            for host, kpi, itemid in self.series:
+                if count is not None and produced >= count:
+                    return
+                value = round(rng.uniform(value_min, value_max), 4)
+                source = dict(template)
+                source.update(host)
+                source.update(kpi)
+                source.update({
+                    'kpi': [kpi['kpiid'], kpi['kpiname']],
+                    'itemid': itemid,
+                    'ns': rng.randint(100000000, 999999999),
+                    'process_val': value,
+                    'value': value,
+                    'clock': clock,
+                    'ts': clock * 1000,
+                    '__PROCESS_TIME__': clock * 1000 + rng.randint(0, 60000),
+                    '@timestamp': timestamp
+                })
+                yield {
+                    '_index': 'u2performance_for_test',
+                    '_type': '_doc',
+                    '_id': ''.join(rng.choices(ID_CHARS, k=20)),
+                    '_score': None,
+                    '_source': source
+                }
+                produced += 1
+            clock += self.profile.step
+
+
+def write_documents(documents, output_path, output_format='ndjson'):
+    """
+    流式写出记录，ndjson每行一条，json为与导出文件相同的数组格式，返回写出的条数
+    """
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        if output_format == 'json':
+            f.write('[')
+        for doc in documents:
+            line = json.dumps(doc, ensure_ascii=False)
+            if output_format == 'json':
+                f.write(('\n' if count == 0 else ',\n') + line)
+            else:
+                f.write(line + '\n')
+            count += 1
+        if output_format == 'json':
+            f.write('\n]\n')
+    return count
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description='按样本生成Zabbix性能数据')
+    parser.add_argument('--count', '-n', type=int, required=True, help='生成的记录数')
+    parser.add_argument('--output', '-o', required=True, help='输出文件路径')
+    parser.add_argument('--format', choices=['ndjson', 'json'], default='ndjson', help='输出格式')
+    parser.add_argument('--sample', default='222.json', help='样本文件路径')
+    parser.add_argument('--hosts', type=int, default=DEFAULT_HOSTS, help='主机数量')
+    parser.add_argument('--kpis', type=int, default=DEFAULT_KPIS, help='KPI种类数量')
+    parser.add_argument('--kpis-per-host', type=int, default=DEFAULT_KPIS_PER_HOST, help='每台主机采集的KPI数量')
+    parser.add_argument('--apps', type=int, default=DEFAULT_APPS, help='应用系统数量')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子，相同种子生成相同数据')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.sample):
+        logger.error(f"样本文件不存在: {args.sample}")
+        sys.exit(1)
+
+    try:
+        generator = ZabbixDocumentGenerator(SampleProfile(args.sample), hosts=args.hosts, kpis=args.kpis,
+                                            kpis_per_host=args.kpis_per_host, apps=args.apps, seed=args.seed)
+        count = write_documents(generator.generate(args.count), args.output, args.format)
+        size = os.path.getsize(args.output)
+        logger.info(f"生成完成: {count} 条记录, {size / 1024 / 1024:.2f} MB -> {args.output}")
+
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()